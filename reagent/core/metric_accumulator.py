@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import torch
+from reagent.core.tracker import Observer
+
+
+logger = logging.getLogger(__name__)
+
+
+class MetricAccumulator:
+    """
+    Running sums of scalar metrics (e.g., losses), kept as tensors on the
+    device they are computed on, so that recording a value doesn't wait for
+    the device. The means since the last flush are copied to the host
+    together and sent to the observers of each key every `flush_interval`
+    steps, if set, and on `flush()`; e.g., flush at epoch end with
+    `EpochEndObserver(lambda epoch: accumulator.flush())`.
+    """
+
+    def __init__(
+        self, observers: Iterable[Observer] = (), flush_interval: Optional[int] = None
+    ):
+        self.observers: Dict[str, List[Observer]] = {}
+        for observer in observers:
+            self.add_observer(observer)
+        self.flush_interval = flush_interval
+        self.reset()
+
+    def add_observer(self, observer: Observer) -> "MetricAccumulator":
+        for key in observer.get_observing_keys():
+            self.observers.setdefault(key, []).append(observer)
+        return self
+
+    def reset(self) -> None:
+        self.sums: Dict[str, torch.Tensor] = {}
+        # The counts are known on the host; they don't need a sync
+        self.counts: Dict[str, int] = {}
+        self.num_steps = 0
+
+    def add(self, **values) -> None:
+        """
+        Records one step. Each value is a one-element tensor or a number;
+        None values are skipped.
+        """
+        for key, value in values.items():
+            if value is None:
+                continue
+            value = torch.as_tensor(value).detach().reshape(()).double()
+            if key in self.sums:
+                self.sums[key] = self.sums[key] + value
+            else:
+                self.sums[key] = value
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.num_steps += 1
+        if self.flush_interval and self.num_steps >= self.flush_interval:
+            self.flush()
+
+    def means(self) -> Dict[str, float]:
+        """ The means since the last flush, copied to the host at once """
+        if not self.sums:
+            return {}
+        keys = list(self.sums)
+        device = self.sums[keys[0]].device
+        sums = torch.stack([self.sums[k].to(device) for k in keys]).cpu().tolist()
+        return {k: s / self.counts[k] for k, s in zip(keys, sums)}
+
+    def flush(self) -> Dict[str, float]:
+        """ Sends the means to the observers, resets and returns the means """
+        means = self.means()
+        logger.debug(f"Flushing {self.num_steps} steps: {means}")
+        for key, mean in means.items():
+            for observer in self.observers.get(key, []):
+                observer.update(key, mean)
+        self.reset()
+        return means
@@ -10,12 +10,71 @@ import torch.nn as nn
 from reagent.core.tracker import observable
 from reagent.models.seq2slate import Seq2SlateMode
 from reagent.types import PreprocessedTrainingBatch
-from sklearn.metrics import average_precision_score, dcg_score, ndcg_score
 
 
 logger = logging.getLogger(__name__)
 
 
+def _ranked_relevance(y_true: torch.Tensor, y_score: torch.Tensor) -> torch.Tensor:
+    """ y_true of each row, in the descending order of y_score """
+    return y_true.gather(1, torch.argsort(y_score, dim=1, descending=True))
+
+
+def _log2_discount(slate_size: int, y_true: torch.Tensor) -> torch.Tensor:
+    return 1.0 / torch.log2(
+        torch.arange(slate_size, dtype=y_true.dtype, device=y_true.device) + 2
+    )
+
+
+def batch_dcg_score(y_true: torch.Tensor, y_score: torch.Tensor) -> torch.Tensor:
+    """
+    DCG of each row of the [batch_size, slate_size] matrices, as
+    `sklearn.metrics.dcg_score` of that row. The scores of a row are assumed
+    to be distinct.
+    """
+    return (
+        _ranked_relevance(y_true, y_score) * _log2_discount(y_true.shape[1], y_true)
+    ).sum(dim=1)
+
+
+def batch_ndcg_score(y_true: torch.Tensor, y_score: torch.Tensor) -> torch.Tensor:
+    """
+    NDCG of each row, as `sklearn.metrics.ndcg_score` of that row; rows
+    without relevant items score 0.
+    """
+    dcg = batch_dcg_score(y_true, y_score)
+    ideal_dcg = (
+        torch.sort(y_true, dim=1, descending=True)[0]
+        * _log2_discount(y_true.shape[1], y_true)
+    ).sum(dim=1)
+    return torch.where(
+        ideal_dcg == 0,
+        torch.zeros_like(dcg),
+        dcg / ideal_dcg.masked_fill(ideal_dcg == 0, 1),
+    )
+
+
+def batch_average_precision_score(
+    y_true: torch.Tensor, y_score: torch.Tensor
+) -> torch.Tensor:
+    """
+    Average precision of each row for the binary (0/1) relevance `y_true`, as
+    `sklearn.metrics.average_precision_score` of that row; rows without
+    relevant items score 0, so that they don't make the batch mean NaN. The
+    scores of a row are assumed to be distinct.
+    """
+    hits = _ranked_relevance(y_true, y_score)
+    precision = hits.cumsum(dim=1) / torch.arange(
+        1, hits.shape[1] + 1, dtype=hits.dtype, device=hits.device
+    )
+    num_hits = hits.sum(dim=1)
+    return torch.where(
+        num_hits == 0,
+        torch.zeros_like(num_hits),
+        (precision * hits).sum(dim=1) / num_hits.masked_fill(num_hits == 0, 1),
+    )
+
+
 @dataclass
 class ListwiseRankingMetrics:
     ndcg: Optional[float] = 0.0
@@ -72,31 +131,32 @@ class RankingListwiseEvaluator:
         # shape: batch_size, tgt_seq_len
         ranking_output = self.seq2slate_net(eval_input, mode=Seq2SlateMode.RANK_MODE)
         # pyre-fixme[16]: `int` has no attribute `cpu`.
-        ranked_idx = (ranking_output.ranked_tgt_out_idx - 2).cpu().numpy()
-        logged_idx = (eval_input.tgt_out_idx - 2).cpu().numpy()
-        score_bar = np.arange(self.slate_size, 0, -1)
-
-        batch_dcg = []
-        batch_ndcg = []
-        batch_mean_ap = []
-        for i in range(batch_size):
-            ranked_scores = np.zeros(self.slate_size)
-            ranked_scores[ranked_idx[i]] = score_bar
-            truth_scores = np.zeros(self.slate_size)
-            truth_scores[logged_idx[i]] = eval_input.position_reward[i].cpu().numpy()
-            # average_precision_score accepts 1D arrays
-            # dcg & ndcg accepts 2D arrays
-            batch_mean_ap.append(average_precision_score(truth_scores, ranked_scores))
-            ranked_scores = np.expand_dims(ranked_scores, axis=0)
-            truth_scores = np.expand_dims(truth_scores, axis=0)
-            batch_dcg.append(dcg_score(truth_scores, ranked_scores))
-            batch_ndcg.append(ndcg_score(truth_scores, ranked_scores))
+        ranked_idx = ranking_output.ranked_tgt_out_idx - 2
+        logged_idx = eval_input.tgt_out_idx - 2
+        position_reward = eval_input.position_reward.double()
+        score_bar = torch.arange(
+            self.slate_size, 0, -1, dtype=torch.double, device=position_reward.device
+        ).repeat(batch_size, 1)
+
+        ranked_scores = torch.zeros_like(score_bar).scatter_(1, ranked_idx, score_bar)
+        truth_scores = torch.zeros_like(position_reward).scatter_(
+            1, logged_idx, position_reward
+        )
+        # One copy to host for all the metrics
+        dcg, ndcg, mean_ap = (
+            torch.stack(
+                [
+                    batch_dcg_score(truth_scores, ranked_scores),
+                    batch_ndcg_score(truth_scores, ranked_scores),
+                    batch_average_precision_score(truth_scores, ranked_scores),
+                ]
+            )
+            .mean(dim=1, keepdim=True)
+            .cpu()
+        )
 
         self.notify_observers(
-            cross_entropy_loss=ce_loss,
-            dcg=torch.mean(torch.tensor(batch_dcg)).reshape(1),
-            ndcg=torch.mean(torch.tensor(batch_ndcg)).reshape(1),
-            mean_ap=torch.mean(torch.tensor(batch_mean_ap)).reshape(1),
+            cross_entropy_loss=ce_loss, dcg=dcg, ndcg=ndcg, mean_ap=mean_ap
         )
 
     @torch.no_grad()
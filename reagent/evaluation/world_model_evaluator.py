@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import torch
+from reagent.core.metric_accumulator import MetricAccumulator
 from reagent.training.world_model.mdnrnn_trainer import MDNRNNTrainer
 from reagent.types import FeatureData, PreprocessedMemoryNetworkInput
 
@@ -14,13 +15,29 @@ logger = logging.getLogger(__name__)
 class LossEvaluator(object):
     """ Evaluate losses on data pages """
 
-    def __init__(self, trainer: MDNRNNTrainer, state_dim: int) -> None:
+    def __init__(
+        self,
+        trainer: MDNRNNTrainer,
+        state_dim: int,
+        metric_accumulator: Optional[MetricAccumulator] = None,
+    ) -> None:
+        """
+        :param metric_accumulator: if set, `evaluate()` records the losses in
+            it and returns them as detached tensors, without waiting for the
+            device
+        """
         self.trainer = trainer
         self.state_dim = state_dim
+        self.metric_accumulator = metric_accumulator
 
     def evaluate(self, tdp: PreprocessedMemoryNetworkInput) -> Dict[str, float]:
         self.trainer.memory_network.mdnrnn.eval()
         losses = self.trainer.get_loss(tdp, state_dim=self.state_dim)
+        if self.metric_accumulator is not None:
+            detached_losses = {k: loss.detach() for k, loss in losses.items()}
+            self.metric_accumulator.add(**detached_losses)
+            self.trainer.memory_network.mdnrnn.train()
+            return detached_losses
         detached_losses = {
             "loss": losses["loss"].cpu().detach().item(),
             "gmm": losses["gmm"].cpu().detach().item(),
@@ -193,8 +210,6 @@ class FeatureSensitivityEvaluator(object):
         self.trainer.memory_network.mdnrnn.eval()
 
         seq_len, batch_size, state_dim = batch.next_state.float_features.size()
-        state_feature_num = self.state_feature_num
-        feature_sensitivity = torch.zeros(state_feature_num)
 
         # the input of world_model has seq-len as the first dimension
         mdnrnn_output = self.trainer.memory_network(
@@ -215,8 +230,25 @@ class FeatureSensitivityEvaluator(object):
             == (seq_len, batch_size, self.trainer.params.num_gaussians, state_dim)
         )
 
+        feature_sensitivity = self.compute_feature_sensitivity(
+            predicted_next_state_means, shuffled_predicted_next_state_means
+        )
+
+        self.trainer.memory_network.mdnrnn.train()
+        logger.info(
+            "**** Debug tool feature sensitivity ****: {}".format(feature_sensitivity)
+        )
+        return {"feature_sensitivity": feature_sensitivity.numpy()}
+
+    def compute_feature_sensitivity(
+        self,
+        predicted_next_state_means: torch.Tensor,
+        shuffled_predicted_next_state_means: torch.Tensor,
+    ) -> torch.Tensor:
+        state_dim = predicted_next_state_means.shape[3]
+        feature_sensitivity = torch.zeros(self.state_feature_num)
         state_feature_boundaries = self.sorted_state_feature_start_indices + [state_dim]
-        for i in range(state_feature_num):
+        for i in range(self.state_feature_num):
             boundary_start, boundary_end = (
                 state_feature_boundaries[i],
                 state_feature_boundaries[i + 1],
@@ -235,9 +267,178 @@ class FeatureSensitivityEvaluator(object):
                 )
             )
             feature_sensitivity[i] = abs_diff.cpu().detach().item()
+        return feature_sensitivity
+
+
+class BatchedFeatureSensitivityEvaluator(FeatureSensitivityEvaluator):
+    """
+    Same as FeatureSensitivityEvaluator; the per-feature deviations are
+    reduced in one go and copied to the host once
+    """
+
+    def compute_feature_sensitivity(
+        self,
+        predicted_next_state_means: torch.Tensor,
+        shuffled_predicted_next_state_means: torch.Tensor,
+    ) -> torch.Tensor:
+        state_dim = predicted_next_state_means.shape[3]
+        abs_diff = torch.abs(
+            shuffled_predicted_next_state_means - predicted_next_state_means
+        )
+        # Sum the components of each feature, then average over the rest
+        feature_index = _feature_index(
+            self.sorted_state_feature_start_indices, state_dim, abs_diff.device
+        )
+        feature_abs_diff = abs_diff.new_zeros(
+            abs_diff.shape[:3] + (self.state_feature_num,)
+        ).index_add_(3, feature_index, abs_diff)
+        return feature_abs_diff.mean(dim=(0, 1, 2)).detach().cpu()
+
+
+class BatchedFeatureImportanceEvaluator(FeatureImportanceEvaluator):
+    """
+    Same as FeatureImportanceEvaluator but, instead of one forward pass per
+    feature, the masked variants of the batch are concatenated along the batch
+    dimension and go through the MDN-RNN together, in chunks of at most
+    `max_batch_size` examples. The losses are copied to the host once.
+    """
+
+    def __init__(
+        self,
+        trainer: MDNRNNTrainer,
+        discrete_action: bool,
+        state_feature_num: int,
+        action_feature_num: int,
+        sorted_action_feature_start_indices: List[int],
+        sorted_state_feature_start_indices: List[int],
+        max_batch_size: Optional[int] = None,
+    ) -> None:
+        """
+        :param max_batch_size: the maximum number of examples in a forward pass;
+            at least one variant is evaluated at a time. If None, all the
+            variants are evaluated in a single forward pass.
+        """
+        super().__init__(
+            trainer,
+            discrete_action,
+            state_feature_num,
+            action_feature_num,
+            sorted_action_feature_start_indices,
+            sorted_state_feature_start_indices,
+        )
+        self.max_batch_size = max_batch_size
+
+    def masked_variants(self, batch: PreprocessedMemoryNetworkInput):
+        """
+        Yields the (state, action) of the original batch followed by those of
+        the batch with each action and then each state feature masked
+        """
+        state_features = batch.state.float_features
+        action_features = batch.action
+        seq_len, batch_size, state_dim = state_features.size()
+        action_dim = action_features.size()[2]
+        yield state_features, action_features
+
+        action_feature_boundaries = self.sorted_action_feature_start_indices + [
+            action_dim
+        ]
+        flat_action_features = action_features.reshape(
+            (batch_size * seq_len, action_dim)
+        )
+        for i in range(self.action_feature_num):
+            if self.discrete_action:
+                assert action_dim == self.action_feature_num
+                masked_action_features = torch.zeros_like(action_features)
+                masked_action_features[:, :, i] = 1
+            else:
+                boundary_start, boundary_end = (
+                    action_feature_boundaries[i],
+                    action_feature_boundaries[i + 1],
+                )
+                masked_action_features = action_features.clone()
+                masked_action_features[
+                    :, :, boundary_start:boundary_end
+                ] = self.compute_median_feature_value(
+                    flat_action_features[:, boundary_start:boundary_end]
+                )
+            yield state_features, masked_action_features
+
+        state_feature_boundaries = self.sorted_state_feature_start_indices + [state_dim]
+        flat_state_features = state_features.reshape((batch_size * seq_len, state_dim))
+        for i in range(self.state_feature_num):
+            boundary_start, boundary_end = (
+                state_feature_boundaries[i],
+                state_feature_boundaries[i + 1],
+            )
+            masked_state_features = state_features.clone()
+            masked_state_features[
+                :, :, boundary_start:boundary_end
+            ] = self.compute_median_feature_value(
+                flat_state_features[:, boundary_start:boundary_end]
+            )
+            yield masked_state_features, action_features
+
+    def evaluate(self, batch: PreprocessedMemoryNetworkInput):
+        """ Calculate feature importance: setting each state/action feature to
+        the mean value and observe loss increase. """
+
+        self.trainer.memory_network.mdnrnn.eval()
+        seq_len, batch_size, state_dim = batch.state.float_features.size()
+        if self.max_batch_size is None:
+            variants_per_chunk = 1 + self.action_feature_num + self.state_feature_num
+        else:
+            variants_per_chunk = max(1, self.max_batch_size // batch_size)
+
+        def evaluate_chunk(chunk):
+            num_variants = len(chunk)
+            states, actions = zip(*chunk)
+
+            def tile(x):
+                # Repeat along the batch dimension
+                return x.repeat(1, num_variants, *([1] * (x.dim() - 2)))
+
+            chunk_batch = PreprocessedMemoryNetworkInput(
+                state=FeatureData(float_features=torch.cat(states, dim=1)),
+                action=torch.cat(actions, dim=1),
+                next_state=FeatureData(
+                    float_features=tile(batch.next_state.float_features)
+                ),
+                reward=tile(batch.reward),
+                time_diff=torch.ones(seq_len, batch_size * num_variants),
+                not_terminal=tile(batch.not_terminal),
+                step=None,
+            )
+            return self.trainer.get_grouped_loss(
+                chunk_batch, num_groups=num_variants, state_dim=state_dim
+            )["loss"].detach()
+
+        losses = []
+        chunk = []
+        with torch.no_grad():
+            for variant in self.masked_variants(batch):
+                chunk.append(variant)
+                if len(chunk) == variants_per_chunk:
+                    losses.append(evaluate_chunk(chunk))
+                    chunk = []
+            if chunk:
+                losses.append(evaluate_chunk(chunk))
+        losses = torch.cat(losses).cpu()
+        feature_importance = losses[1:] - losses[0]
 
         self.trainer.memory_network.mdnrnn.train()
         logger.info(
-            "**** Debug tool feature sensitivity ****: {}".format(feature_sensitivity)
+            "**** Debug tool feature importance ****: {}".format(feature_importance)
         )
-        return {"feature_sensitivity": feature_sensitivity.numpy()}
+        return {"feature_loss_increase": feature_importance.numpy()}
+
+
+def _feature_index(
+    sorted_feature_start_indices: List[int], dim: int, device: torch.device
+) -> torch.Tensor:
+    """ The feature each of the `dim` components belongs to """
+    feature_lengths = torch.tensor(
+        sorted_feature_start_indices[1:] + [dim], device=device
+    ) - torch.tensor(sorted_feature_start_indices, device=device)
+    return torch.repeat_interleave(
+        torch.arange(len(sorted_feature_start_indices), device=device), feature_lengths,
+    )
@@ -4,6 +4,7 @@
 import torch
 from reagent import types as rlt
 from reagent.models.base import ModelBase
+from reagent.models.fused_embedding_bag import FusedEmbeddingBagCollection
 
 
 class EmbeddingBagConcat(ModelBase):
@@ -17,24 +18,42 @@ class EmbeddingBagConcat(ModelBase):
         state_dim: int,
         model_feature_config: rlt.ModelFeatureConfig,
         embedding_dim: int,
+        fused: bool = False,
     ):
+        """
+        Args:
+            fused: look up all the id-list features at once with a
+                `FusedEmbeddingBagCollection` instead of one
+                `torch.nn.EmbeddingBag` per feature; the output is the same
+        """
         super().__init__()
         assert state_dim > 0, "state_dim must be > 0, got {}".format(state_dim)
         self.state_dim = state_dim
+        self.id_list_feature_names = [
+            id_list_feature.name
+            for id_list_feature in model_feature_config.id_list_feature_configs
+        ]
+        num_embeddings = {
+            id_list_feature.name: len(
+                model_feature_config.id_mapping_config[
+                    id_list_feature.id_mapping_name
+                ].ids
+            )
+            for id_list_feature in model_feature_config.id_list_feature_configs
+        }
 
-        self.embedding_bags = torch.nn.ModuleDict(
-            {
-                id_list_feature.name: torch.nn.EmbeddingBag(
-                    len(
-                        model_feature_config.id_mapping_config[
-                            id_list_feature.id_mapping_name
-                        ].ids
-                    ),
-                    embedding_dim,
-                )
-                for id_list_feature in model_feature_config.id_list_feature_configs
-            }
-        )
+        self.fused = fused and len(num_embeddings) > 0
+        if self.fused:
+            self.embedding_bags = FusedEmbeddingBagCollection(
+                num_embeddings, embedding_dim
+            )
+        else:
+            self.embedding_bags = torch.nn.ModuleDict(
+                {
+                    name: torch.nn.EmbeddingBag(num_rows, embedding_dim)
+                    for name, num_rows in num_embeddings.items()
+                }
+            )
 
         self._output_dim = (
             state_dim
@@ -50,11 +69,16 @@ class EmbeddingBagConcat(ModelBase):
             float_features=torch.randn(1, self.state_dim),
             id_list_features={
                 k: (torch.zeros(1, dtype=torch.long), torch.ones(1, dtype=torch.long))
-                for k in self.embedding_bags
+                for k in self.id_list_feature_names
             },
         )
 
     def forward(self, state: rlt.FeatureData):
+        if self.fused:
+            return torch.cat(
+                [self.embedding_bags(state.id_list_features), state.float_features],
+                dim=1,
+            )
         embeddings = [
             m(state.id_list_features[name][1], state.id_list_features[name][0])
             for name, m in self.embedding_bags.items()
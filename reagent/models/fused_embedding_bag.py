@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+from typing import Dict, List, Tuple
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class FusedEmbeddingBagCollection(nn.Module):
+    """
+    A collection of embedding bags, one per id-list feature, looked up in one
+    go. The tables are packed into one weight matrix; the ids of each feature
+    are shifted by the offset of its table and all the bags go through a
+    single `embedding_bag` call.
+
+    The output, and the gradient w.r.t. each table, is the same as that of
+    `torch.nn.EmbeddingBag` per feature, concatenated along dim 1 in the
+    order of `num_embeddings`.
+    """
+
+    def __init__(
+        self, num_embeddings: Dict[str, int], embedding_dim: int, mode: str = "mean",
+    ):
+        """
+        Args:
+            num_embeddings: the name of the features and the size of their
+                tables, in the output order
+        """
+        super().__init__()
+        self.feature_names: List[str] = list(num_embeddings.keys())
+        self.embedding_dim = embedding_dim
+        self.mode = mode
+        self.table_offsets: List[int] = []
+        num_rows = 0
+        for name in self.feature_names:
+            self.table_offsets.append(num_rows)
+            num_rows += num_embeddings[name]
+        self.num_embeddings = dict(num_embeddings)
+        self.weight = nn.Parameter(torch.empty(num_rows, embedding_dim))
+        # Same as initializing a torch.nn.EmbeddingBag per table, in order
+        with torch.no_grad():
+            for name in self.feature_names:
+                self.table_weight(name).normal_()
+
+    def table_weight(self, name: str) -> torch.Tensor:
+        """ A view of the table of feature `name` """
+        start = self.table_offsets[self.feature_names.index(name)]
+        return self.weight[start : start + self.num_embeddings[name]]
+
+    def forward(
+        self, id_list_features: Dict[str, Tuple[torch.Tensor, torch.Tensor]]
+    ) -> torch.Tensor:
+        """
+        Args:
+            id_list_features: (offsets, ids) of each feature, with the same
+                number of bags (batch size)
+
+        Returns:
+            (batch size, number of features * embedding_dim) tensor
+        """
+        all_offsets = []
+        all_ids = []
+        num_ids = None
+        for name, table_offset in zip(self.feature_names, self.table_offsets):
+            offsets, ids = id_list_features[name]
+            if num_ids is None:
+                all_offsets.append(offsets)
+                num_ids = ids.shape[0]
+            else:
+                all_offsets.append(offsets + num_ids)
+                num_ids = num_ids + ids.shape[0]
+            all_ids.append(ids + table_offset)
+        offsets = torch.cat(all_offsets)
+        ids = torch.cat(all_ids)
+
+        embeddings = F.embedding_bag(ids, self.weight, offsets, mode=self.mode)
+        # (num features * batch size, dim) -> (batch size, num features * dim)
+        return (
+            embeddings.view(len(self.feature_names), -1, self.embedding_dim)
+            .transpose(0, 1)
+            .reshape(-1, len(self.feature_names) * self.embedding_dim)
+        )
@@ -17,6 +17,8 @@ class FullyConnectedWithEmbedding(DiscreteDQNWithIdListNetBuilder):
     activations: List[str] = field(default_factory=lambda: ["relu", "relu"])
     embedding_dim: int = 64
     dropout_ratio: float = 0.0
+    # Look up all the id-list features in one embedding bag call
+    fused_embedding_bags: bool = False
 
     def __post_init_post_parse__(self):
         super().__init__()
@@ -36,6 +38,7 @@ class FullyConnectedWithEmbedding(DiscreteDQNWithIdListNetBuilder):
             state_dim=state_dim,
             model_feature_config=state_feature_config,
             embedding_dim=self.embedding_dim,
+            fused=self.fused_embedding_bags,
         )
         return models.Sequential(  # type: ignore
             embedding_concat,
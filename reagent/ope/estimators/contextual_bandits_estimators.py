@@ -5,11 +5,13 @@ from dataclasses import dataclass
 from typing import Iterable, Optional, Sequence, Union
 
 import numpy as np
+import torch
 from reagent.ope.estimators.estimator import Estimator, EstimatorResults
 from reagent.ope.estimators.types import (
     Action,
     ActionDistribution,
     ActionSpace,
+    BatchedValues,
     Reward,
     Values,
 )
@@ -25,6 +27,24 @@ class ActionRewards(Values[Action]):
         return Action(k)
 
 
+class BatchedActionRewards(BatchedValues[Action]):
+    def _new_key(self, k: int) -> Action:
+        return Action(k)
+
+    def _new_values(self, values: Tensor) -> ActionRewards:
+        return ActionRewards(values)
+
+
+def _action_values(values: Values, action_space: ActionSpace) -> Tensor:
+    """
+    Values in action index order: as is if indexed, else by action of the
+    action space
+    """
+    if values.is_sequence:
+        return values.tensor
+    return torch.tensor([values[a] for a in action_space], dtype=torch.double)
+
+
 class BanditsModel(ABC):
     @abstractmethod
     def _action_rewards(self, context) -> ActionRewards:
@@ -38,9 +58,29 @@ class BanditsModel(ABC):
         """
         pass
 
+    def _batch_action_rewards(
+        self, contexts: Sequence, action_space: ActionSpace
+    ) -> Tensor:
+        """
+        Calculate rewards of all actions for a batch of contexts, one context
+        at a time by default; models able to predict in batch override it
+        Args:
+            contexts: task specific contexts
+            action_space: actions, in the column order of the rewards
+
+        Returns: rewards, [len(contexts), num_actions]
+
+        """
+        return torch.stack(
+            [_action_values(self._action_rewards(c), action_space) for c in contexts]
+        )
+
     def __call__(self, context) -> ActionRewards:
         return self._action_rewards(context)
 
+    def batch(self, contexts: Sequence, action_space: ActionSpace) -> Tensor:
+        return self._batch_action_rewards(contexts, action_space)
+
 
 @dataclass(frozen=True)
 class LogSample:
@@ -74,6 +114,128 @@ class BanditsEstimatorInput:
     ground_truth_model: Optional[BanditsModel] = None
 
 
+@dataclass(frozen=True)
+class BatchedBanditsEstimatorInput:
+    """
+    Columnar BanditsEstimatorInput: N samples of num_logs logs, with actions
+    indexed in [0, num_actions)
+    """
+
+    num_logs: int
+    # log of each sample, [N]
+    log_ids: Tensor
+    # [N]
+    logged_actions: Tensor
+    logged_rewards: Tensor
+    target_actions: Tensor
+    # [N, num_actions]
+    logged_propensities: Tensor
+    target_propensities: Tensor
+    # rewards of each action from the target and ground truth models,
+    # [N, num_actions]
+    target_rewards: Optional[Tensor] = None
+    ground_truth_rewards: Optional[Tensor] = None
+
+    def log_averages(self, values: Tensor) -> Tensor:
+        """
+        Average of the sample values by log, 0.0 for logs without samples
+        Args:
+            values: [N]
+
+        Returns:
+            averages, [num_logs]
+        """
+        totals = torch.zeros(self.num_logs, dtype=values.dtype, device=values.device)
+        totals.index_add_(0, self.log_ids, values)
+        counts = torch.zeros_like(totals)
+        counts.index_add_(0, self.log_ids, torch.ones_like(values))
+        return torch.where(counts > 0, totals / counts, torch.zeros_like(totals))
+
+    def action_values(self, values: Tensor, actions: Tensor) -> Tensor:
+        """
+        Value of the given action of each sample
+        Args:
+            values: [N, num_actions]
+            actions: [N]
+
+        Returns:
+            values, [N]
+        """
+        return values.gather(1, actions.unsqueeze(1)).squeeze(1)
+
+    def ground_truths(self) -> Optional[Tensor]:
+        if self.ground_truth_rewards is None:
+            return None
+        return self.log_averages(
+            self.action_values(self.ground_truth_rewards, self.target_actions)
+        )
+
+    @staticmethod
+    def from_input(
+        input: BanditsEstimatorInput, device=None
+    ) -> "BatchedBanditsEstimatorInput":
+        """
+        Convert per-sample input, querying the models once for all contexts
+        """
+        action_space = input.action_space
+        log_ids = []
+        contexts = []
+        logged_actions = []
+        logged_rewards = []
+        target_actions = []
+        logged_propensities = []
+        target_propensities = []
+        num_logs = 0
+        for log in input.logs:
+            for sample in log.samples:
+                log_ids.append(num_logs)
+                contexts.append(sample.context)
+                logged_actions.append(action_space.index_of(sample.logged_action))
+                logged_rewards.append(sample.logged_reward)
+                target_actions.append(action_space.index_of(sample.target_action))
+                logged_propensities.append(
+                    _action_values(sample.logged_propensities, action_space)
+                )
+                target_propensities.append(
+                    _action_values(sample.target_propensities, action_space)
+                )
+            num_logs += 1
+
+        def stack(values) -> Tensor:
+            if len(values) == 0:
+                return torch.zeros(
+                    (0, len(action_space)), dtype=torch.double, device=device
+                )
+            return torch.stack(values).to(device=device)
+
+        def rewards(model: Optional[BanditsModel]) -> Optional[Tensor]:
+            if model is None:
+                return None
+            if len(contexts) == 0:
+                return stack([])
+            return model.batch(contexts, action_space).to(
+                dtype=torch.double, device=device
+            )
+
+        return BatchedBanditsEstimatorInput(
+            num_logs=num_logs,
+            log_ids=torch.tensor(log_ids, dtype=torch.long, device=device),
+            logged_actions=torch.tensor(
+                logged_actions, dtype=torch.long, device=device
+            ),
+            logged_rewards=torch.tensor(
+                logged_rewards, dtype=torch.double, device=device
+            ),
+            target_actions=torch.tensor(
+                target_actions, dtype=torch.long, device=device
+            ),
+            logged_propensities=stack(logged_propensities),
+            target_propensities=stack(target_propensities),
+            target_rewards=rewards(input.target_model),
+            ground_truth_rewards=rewards(input.ground_truth_model),
+        )
+
+
 class DMEstimator(Estimator):
     """
     Estimating using Direct Method (DM), assuming a reward model is trained
@@ -81,6 +243,8 @@ class DMEstimator(Estimator):
 
     def evaluate(self, input: BanditsEstimatorInput, **kwargs) -> EstimatorResults:
         self.reset()
+        if isinstance(input, BatchedBanditsEstimatorInput):
+            return self._evaluate_batch(input)
         for log in input.logs:
             log_reward = RunningAverage()
             tgt_reward = RunningAverage()
@@ -96,6 +260,15 @@ class DMEstimator(Estimator):
             )
         return self.results
 
+    def _evaluate_batch(self, input: BatchedBanditsEstimatorInput) -> EstimatorResults:
+        tgt_rewards = input.action_values(input.target_rewards, input.target_actions)
+        self._append_estimates(
+            input.log_averages(input.logged_rewards),
+            input.log_averages(tgt_rewards),
+            input.ground_truths(),
+        )
+        return self.results
+
 
 class IPSEstimator(Estimator):
     """
@@ -108,6 +281,8 @@ class IPSEstimator(Estimator):
 
     def evaluate(self, input: BanditsEstimatorInput, **kwargs) -> EstimatorResults:
         self.reset()
+        if isinstance(input, BatchedBanditsEstimatorInput):
+            return self._evaluate_batch(input)
         for log in input.logs:
             log_reward = RunningAverage()
             tgt_reward = RunningAverage()
@@ -127,6 +302,20 @@ class IPSEstimator(Estimator):
             )
         return self.results
 
+    def _weights(self, input: BatchedBanditsEstimatorInput) -> Tensor:
+        return self._weight_clamper(
+            input.action_values(input.target_propensities, input.logged_actions)
+            / input.action_values(input.logged_propensities, input.logged_actions)
+        )
+
+    def _evaluate_batch(self, input: BatchedBanditsEstimatorInput) -> EstimatorResults:
+        self._append_estimates(
+            input.log_averages(input.logged_rewards),
+            input.log_averages(input.logged_rewards * self._weights(input)),
+            input.ground_truths(),
+        )
+        return self.results
+
 
 class DoublyRobustEstimator(IPSEstimator):
     """
@@ -137,6 +326,8 @@ class DoublyRobustEstimator(IPSEstimator):
 
     def evaluate(self, input: BanditsEstimatorInput, **kwargs) -> EstimatorResults:
         self.reset()
+        if isinstance(input, BatchedBanditsEstimatorInput):
+            return self._evaluate_batch(input)
         for log in input.logs:
             log_reward = RunningAverage()
             tgt_reward = RunningAverage()
@@ -158,3 +349,13 @@ class DoublyRobustEstimator(IPSEstimator):
                 log_reward.average, tgt_reward.average, gt_reward.average
             )
         return self.results
+
+    def _evaluate_batch(self, input: BatchedBanditsEstimatorInput) -> EstimatorResults:
+        r1 = input.action_values(input.target_rewards, input.logged_actions)
+        r2 = input.action_values(input.target_rewards, input.target_actions)
+        self._append_estimates(
+            input.log_averages(input.logged_rewards),
+            input.log_averages((input.logged_rewards - r1) * self._weights(input) + r2),
+            input.ground_truths(),
+        )
+        return self.results
@@ -4,40 +4,70 @@ import logging
 import math
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Optional, Tuple, Union
+from typing import Iterable, Optional, Tuple, Union
 
 import torch
+from reagent.ope.utils import Reservoir, RunningStats
 from torch import Tensor
 
 
 class ResultDiffs:
-    def __init__(self, diffs: Tensor):
+    """
+    RMSE, bias and variance of differences, from the differences, or in O(1)
+    from their running stats when the differences aren't retained
+    """
+
+    def __init__(
+        self, diffs: Optional[Tensor] = None, stats: Optional[RunningStats] = None
+    ):
+        if diffs is None and stats is None:
+            raise ValueError("Either diffs or stats must be given")
         self._diffs = diffs
+        self._stats = stats
         self._rmse = None
         self._bias = None
         self._variance = None
 
+    @property
+    def stats(self) -> RunningStats:
+        if self._stats is None:
+            self._stats = RunningStats().add_batch(self._diffs)
+        return self._stats
+
+    @property
+    def samples(self) -> int:
+        return self._diffs.shape[0] if self._diffs is not None else self._stats.count
+
     @property
     def rmse(self) -> Tensor:
         if self._rmse is None:
-            self._rmse = (self._diffs ** 2.0).mean().sqrt()
+            if self._diffs is not None:
+                self._rmse = (self._diffs ** 2.0).mean().sqrt()
+            else:
+                self._rmse = torch.tensor(self._stats.rms)
         return self._rmse
 
     @property
     def bias(self) -> Tensor:
         if self._bias is None:
-            self._bias = self._diffs.mean()
+            if self._diffs is not None:
+                self._bias = self._diffs.mean()
+            else:
+                self._bias = torch.tensor(self._stats.mean)
         return self._bias
 
     @property
     def variance(self) -> Tensor:
         if self._variance is None:
-            self._variance = self._diffs.var()
+            if self._diffs is not None:
+                self._variance = self._diffs.var()
+            else:
+                self._variance = torch.tensor(self._stats.variance)
         return self._variance
 
     def __repr__(self):
         return (
-            f"samples={self._diffs.shape[0]}, rmse={self.rmse.item()}"
+            f"samples={self.samples}, rmse={self.rmse.item()}"
             f", bias={self.bias}, variance={self.variance}"
         )
 
@@ -65,35 +95,106 @@ class EstimatorResults:
         return repr
 
 
+def merge_results(results: Iterable[EstimatorResults]) -> EstimatorResults:
+    """
+    Results of an estimator over consecutive parts of a log, as one result,
+    e.g., of jobs run in parallel; the diffs are merged from their stats
+    Args:
+        results: results of the parts, in order
+
+    Returns:
+        results of the whole log, with ground truths if every part has them
+    """
+    results = list(results)
+    logs = torch.cat([r.logs for r in results])
+    estimates = torch.cat([r.estimates for r in results])
+    ground_truths = None
+    log_gt_diffs = None
+    if all(r.ground_truths is not None for r in results):
+        ground_truths = torch.cat([r.ground_truths for r in results])
+        if all(r.estimate_log_diffs is not None for r in results):
+            log_gt_diffs = ResultDiffs(stats=RunningStats())
+            for r in results:
+                log_gt_diffs.stats.merge(r.estimate_log_diffs.stats)
+    estimate_log_diffs = ResultDiffs(stats=RunningStats())
+    for r in results:
+        estimate_log_diffs.stats.merge(r.estimate_gt_diffs.stats)
+    return EstimatorResults(
+        logs, estimates, ground_truths, log_gt_diffs, estimate_log_diffs
+    )
+
+
 class Estimator(ABC):
     """
     Estimator interface
+
+    Estimates are accumulated as running stats of the logged, estimated and
+    ground truth values and of their differences, in constant memory; the
+    values themselves are all retained, or a uniform sample of them, see
+    retain()
     """
 
     def __init__(self, device=None):
         self._device = device
-        self._logs = []  # logged values
-        self._estimates = []  # estimated values
-        self._ground_truths = []  # ground truth values
+        # (log, estimate, ground truth) of each retained estimate
+        self._retained = Reservoir()
+        self._log_stats = RunningStats()
+        self._estimate_stats = RunningStats()
+        self._ground_truth_stats = RunningStats()
+        self._estimate_log_diff_stats = RunningStats()
+        self._log_gt_diff_stats = RunningStats()
         self._results = None
 
     def reset(self):
-        self._logs.clear()
-        self._estimates.clear()
-        self._ground_truths.clear()
+        self._retained.clear()
+        self._log_stats = RunningStats()
+        self._estimate_stats = RunningStats()
+        self._ground_truth_stats = RunningStats()
+        self._estimate_log_diff_stats = RunningStats()
+        self._log_gt_diff_stats = RunningStats()
         self._results = None
 
+    def retain(
+        self, max_values: Optional[int], seed: Optional[int] = None
+    ) -> "Estimator":
+        """
+        Sets how many of the appended values are retained, as a uniform sample
+        (reservoir sampling), all of them if max_values is None; the stats
+        and results diffs always cover all of them. Resets the estimator
+        Args:
+            max_values: max number of retained values
+            seed: seed of the sampling
+
+        Returns:
+            the estimator
+        """
+        self._retained = Reservoir(max_values, seed)
+        self.reset()
+        return self
+
     @property
     def logged_values(self):
-        return self._logs
+        return [v[0] for v in self._retained.values]
 
     @property
     def estimated_values(self):
-        return self._estimates
+        return [v[1] for v in self._retained.values]
 
     @property
     def ground_truth_values(self):
-        return self._ground_truths
+        return [v[2] for v in self._retained.values if v[2] is not None]
+
+    @property
+    def log_stats(self) -> RunningStats:
+        return self._log_stats
+
+    @property
+    def estimate_stats(self) -> RunningStats:
+        return self._estimate_stats
+
+    @property
+    def ground_truth_stats(self) -> RunningStats:
+        return self._ground_truth_stats
 
     def _append_estimate(
         self,
@@ -103,39 +204,73 @@ class Estimator(ABC):
     ):
         if math.isnan(estimate) or math.isinf(estimate):
             return
-        logging.info(
-            f"  Append estimate [{len(self._estimates) + 1}]: "
-            f"{log}, {estimate}, {ground_truth}"
+        logging.debug(
+            "  Append estimate [%d]: %s, %s, %s",
+            self._estimate_stats.count + 1,
+            log,
+            estimate,
+            ground_truth,
         )
-        self._logs.append(log)
-        self._estimates.append(estimate)
+        self._retained.add((log, estimate, ground_truth))
+        self._log_stats.add(log)
+        self._estimate_stats.add(estimate)
+        self._estimate_log_diff_stats.add(float(estimate) - float(log))
         if ground_truth is not None:
-            self._ground_truths.append(ground_truth)
+            self._ground_truth_stats.add(ground_truth)
+            self._log_gt_diff_stats.add(float(log) - float(ground_truth))
+        self._results = None
+
+    def _append_estimates(
+        self, logs: Tensor, estimates: Tensor, ground_truths: Optional[Tensor] = None
+    ):
+        """
+        Append the estimates of a batch of episodes, given as tensors
+        """
+        valid = torch.isfinite(estimates)
+        logs = logs[valid].double()
+        estimates = estimates[valid].double()
+        self._log_stats.add_batch(logs)
+        self._estimate_stats.add_batch(estimates)
+        self._estimate_log_diff_stats.add_batch(estimates - logs)
+        if ground_truths is None:
+            for log, estimate in zip(logs.tolist(), estimates.tolist()):
+                self._retained.add((log, estimate, None))
+        else:
+            ground_truths = ground_truths[valid].double()
+            self._ground_truth_stats.add_batch(ground_truths)
+            self._log_gt_diff_stats.add_batch(logs - ground_truths)
+            for v in zip(logs.tolist(), estimates.tolist(), ground_truths.tolist()):
+                self._retained.add(v)
         self._results = None
 
     @property
     def results(self) -> EstimatorResults:
+        """
+        Retained values, and diffs of all the values, computed from their
+        stats
+        """
         if self._results is None:
+            values = self._retained.values
             logs_tensor = torch.tensor(
-                self._logs, dtype=torch.float, device=self._device
+                [v[0] for v in values], dtype=torch.float, device=self._device
             )
             estimates_tensor = torch.tensor(
-                self._estimates, dtype=torch.float, device=self._device
+                [v[1] for v in values], dtype=torch.float, device=self._device
             )
-            if len(self._ground_truths) == len(self._estimates):
+            if self._ground_truth_stats.count == self._estimate_stats.count:
                 ground_truths_tensor = torch.tensor(
-                    self._ground_truths, dtype=torch.float, device=self._device
+                    [v[2] for v in values], dtype=torch.float, device=self._device
                 )
-                log_gt_diff = logs_tensor - ground_truths_tensor
+                log_gt_diffs = ResultDiffs(stats=self._log_gt_diff_stats)
             else:
                 ground_truths_tensor = None
-                log_gt_diff = None
+                log_gt_diffs = None
             self._results = EstimatorResults(
                 logs_tensor,
                 estimates_tensor,
                 ground_truths_tensor,
-                ResultDiffs(log_gt_diff) if log_gt_diff is not None else None,
-                ResultDiffs(estimates_tensor - logs_tensor),
+                log_gt_diffs,
+                ResultDiffs(stats=self._estimate_log_diff_stats),
             )
         return self._results
 
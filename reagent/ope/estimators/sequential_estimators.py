@@ -1,13 +1,12 @@
 #!/usr/bin/env python3
 
 import logging
+import operator
 import random
 import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum
-from functools import reduce
-from itertools import count, zip_longest
 from typing import Iterable, Mapping, Optional, Sequence, Tuple, Union
 
 import numpy as np
@@ -87,6 +86,25 @@ class RLPolicy(ABC):
     def __call__(self, state: State) -> ActionDistribution:
         return self.action_dist(state)
 
+    def action_dists(self, states: Sequence[State]) -> Tensor:
+        """
+        Action probabilities of a batch of states, one state at a time by
+        default; policies able to run in batch override it
+        Args:
+            states:
+
+        Returns:
+            probabilities, [len(states), num_actions], in action index order
+        """
+        rows = []
+        for s in states:
+            dist = self.action_dist(s)
+            if dist.is_sequence:
+                rows.append(dist.tensor)
+            else:
+                rows.append(torch.tensor([dist[a] for a in self._action_space]))
+        return torch.stack(rows)
+
     @property
     def action_space(self):
         return self._action_space
@@ -157,6 +175,23 @@ class ValueFunction(ABC):
     def reset(self):
         pass
 
+    def state_action_values(
+        self, states: Sequence[State], actions: Sequence[Action]
+    ) -> Tensor:
+        """
+        Values of a batch of state-action pairs, one at a time by default
+        """
+        return torch.tensor(
+            [self.state_action_value(s, a) for s, a in zip(states, actions)],
+            dtype=torch.double,
+        )
+
+    def state_values(self, states: Sequence[State]) -> Tensor:
+        """
+        Values of a batch of states, one at a time by default
+        """
+        return torch.tensor([self.state_value(s) for s in states], dtype=torch.double)
+
     def __call__(self, state: State, action: Optional[Action] = None) -> float:
         return (
             self.state_action_value(state, action)
@@ -175,6 +210,131 @@ class RLEstimatorInput:
     horizon: int = -1
 
 
+@dataclass(frozen=True)
+class PaddedTrajectories:
+    """
+    MDPs of a log as [num_episodes, horizon] tensors, padded after the end of
+    shorter episodes, with the episodes of each initial state in contiguous
+    rows. Actions are indexed in [0, num_actions)
+    """
+
+    # (initial state, first row, end row, horizon) of each initial state
+    groups: Sequence[Tuple[State, int, int, int]]
+    # distinct last states of the transitions with an action
+    states: Sequence[State]
+    # index in states of the last state of each transition
+    state_ids: Tensor
+    actions: Tensor
+    action_probs: Tensor
+    rewards: Tensor
+    # transitions, i.e., not padding
+    mask: Tensor
+    # transitions with an action
+    action_mask: Tensor
+
+    @staticmethod
+    def from_log(log: Mapping[State, Sequence[Mdp]]) -> "PaddedTrajectories":
+        groups = []
+        mdps = []
+        for state, state_mdps in log.items():
+            horizon = max((len(mdp) for mdp in state_mdps), default=0)
+            groups.append((state, len(mdps), len(mdps) + len(state_mdps), horizon))
+            mdps.extend(state_mdps)
+        horizon = max((g[3] for g in groups), default=0)
+        state_index = {}
+        # positions and values of the transitions, and of those with an action
+        rows, cols, rewards = [], [], []
+        action_rows, action_cols = [], []
+        state_ids, actions, action_probs = [], [], []
+        for i, mdp in enumerate(mdps):
+            for j, t in enumerate(mdp):
+                if t is None:
+                    continue
+                rows.append(i)
+                cols.append(j)
+                rewards.append(t.reward)
+                if t.action is not None:
+                    action_rows.append(i)
+                    action_cols.append(j)
+                    state_ids.append(
+                        state_index.setdefault(t.last_state, len(state_index))
+                    )
+                    actions.append(operator.index(t.action))
+                    action_probs.append(t.action_prob)
+
+        def padded(values, indices, dtype, fill=0) -> Tensor:
+            t = torch.full((len(mdps), horizon), fill, dtype=dtype)
+            t[indices] = torch.tensor(values, dtype=dtype)
+            return t
+
+        indices = (
+            torch.tensor(rows, dtype=torch.long),
+            torch.tensor(cols, dtype=torch.long),
+        )
+        action_indices = (
+            torch.tensor(action_rows, dtype=torch.long),
+            torch.tensor(action_cols, dtype=torch.long),
+        )
+        return PaddedTrajectories(
+            groups=groups,
+            states=list(state_index.keys()),
+            state_ids=padded(state_ids, action_indices, torch.long),
+            actions=padded(actions, action_indices, torch.long),
+            action_probs=padded(action_probs, action_indices, torch.double),
+            rewards=padded(rewards, indices, torch.double),
+            mask=padded([True] * len(rows), indices, torch.bool, False),
+            action_mask=padded(
+                [True] * len(action_rows), action_indices, torch.bool, False
+            ),
+        )
+
+    def _distinct(self, mask: Tensor) -> Tensor:
+        # distinct (state id, action) pairs of the masked transitions
+        pairs = torch.stack([self.state_ids[mask], self.actions[mask]], dim=1)
+        return torch.unique(pairs, dim=0)
+
+    def target_probabilities(self, policy: RLPolicy, mask: Tensor) -> Tensor:
+        """
+        Target policy probability of each masked transition's action, one
+        policy query per distinct state, 1.0 elsewhere
+        """
+        probs = torch.ones(self.state_ids.shape, dtype=torch.double)
+        state_ids = torch.unique(self.state_ids[mask])
+        if state_ids.shape[0] == 0:
+            return probs
+        queried = policy.action_dists([self.states[i] for i in state_ids.tolist()])
+        dists = torch.zeros((len(self.states), queried.shape[1]), dtype=torch.double)
+        dists[state_ids] = queried.to(dtype=torch.double)
+        probs[mask] = dists[self.state_ids[mask], self.actions[mask]]
+        return probs
+
+    def values(self, value_function: ValueFunction) -> Tuple[Tensor, Tensor]:
+        """
+        State-action and state values of each transition with an action, one
+        query per distinct state-action pair and state, 0.0 elsewhere
+        """
+        qs = torch.zeros(self.state_ids.shape, dtype=torch.double)
+        vs = torch.zeros(self.state_ids.shape, dtype=torch.double)
+        mask = self.action_mask
+        pairs = self._distinct(mask)
+        if pairs.shape[0] == 0:
+            return qs, vs
+        num_actions = self.actions.max().item() + 1
+        pair_values = torch.zeros((len(self.states), num_actions), dtype=torch.double)
+        pair_values[pairs[:, 0], pairs[:, 1]] = value_function.state_action_values(
+            [self.states[i] for i in pairs[:, 0].tolist()],
+            [Action(a) for a in pairs[:, 1].tolist()],
+        ).to(dtype=torch.double)
+        state_ids = torch.unique(pairs[:, 0])
+        state_values = torch.zeros(len(self.states), dtype=torch.double)
+        state_values[state_ids] = value_function.state_values(
+            [self.states[i] for i in state_ids.tolist()]
+        ).to(dtype=torch.double)
+        qs[mask] = pair_values[self.state_ids[mask], self.actions[mask]]
+        vs[mask] = state_values[self.state_ids[mask]]
+        return qs, vs
+
+
 class RLEstimator(Estimator):
     def _log_reward(self, gamma: float, mdps: Sequence[Mdp]) -> float:
         avg = RunningAverage()
@@ -187,6 +347,20 @@ class RLEstimator(Estimator):
             avg.add(r)
         return avg.average
 
+    @staticmethod
+    def _log_rewards(gamma: float, rewards: Tensor) -> Tensor:
+        """
+        Discounted return of each episode
+        Args:
+            rewards: padded rewards, [num_episodes, horizon]
+
+        Returns:
+            returns, [num_episodes]
+        """
+        discount = torch.full((rewards.shape[1],), gamma, dtype=rewards.dtype)
+        discount[0] = 1.0
+        return (rewards * discount.cumprod(0)).sum(1)
+
 
 class DMEstimator(RLEstimator):
     """
@@ -228,30 +402,24 @@ class IPSEstimator(RLEstimator):
         )
         self._weighted = weighted
 
-    def _calc_weights(
-        self,
-        episodes: int,
-        horizon: int,
-        mdp_transitions: Iterable[Iterable[Transition]],
-        policy: RLPolicy,
-    ) -> torch.Tensor:
-        pi_e = torch.ones((episodes, horizon))
-        pi_b = torch.ones((episodes, horizon))
-        mask = torch.ones((episodes, horizon))
-        j = 0
-        for ts in mdp_transitions:
-            i = 0
-            for t in ts:
-                if t is not None and t.action is not None and t.action_prob > 0.0:
-                    pi_e[i, j] = policy(t.last_state)[t.action]
-                    pi_b[i, j] = t.action_prob
-                else:
-                    mask[i, j] = 0.0
-                i += 1
-            j += 1
-        pi_e = pi_e.to(device=self._device)
-        pi_b = pi_b.to(device=self._device)
-        mask = mask.to(device=self._device)
+    def _calc_weights(self, pi_e: Tensor, pi_b: Tensor, mask: Tensor) -> Tensor:
+        """
+        Per-decision importance weights of the episodes of an initial state,
+        normalized at each step
+        Args:
+            pi_e: target policy probabilities of the logged actions
+            pi_b: logged action probabilities
+            mask: transitions with a logged action probability; pi_e and pi_b
+                are 1.0 elsewhere
+            all in [num_episodes, horizon]
+
+        Returns:
+            weights, [num_episodes, horizon]
+        """
+        episodes = pi_e.shape[0]
+        pi_e = pi_e.to(dtype=torch.float, device=self._device)
+        pi_b = pi_b.to(dtype=torch.float, device=self._device)
+        mask = mask.to(dtype=torch.float, device=self._device)
         rho = pi_e.div_(pi_b).cumprod(1).mul_(mask)
         if self._weighted:
             weight = rho.sum(0)
@@ -261,36 +429,50 @@ class IPSEstimator(RLEstimator):
         ws = rho / weight
         return self._weight_clamper(ws)
 
+    def _discount(self, gamma: float, horizon: int) -> Tensor:
+        discount = torch.full((horizon,), gamma, device=self._device)
+        discount[0] = 1.0
+        return discount.cumprod(0)
+
+    def _state_weights(
+        self, input: RLEstimatorInput, trajectories: PaddedTrajectories
+    ) -> Iterable[Tuple[State, slice, int, Tensor]]:
+        """
+        Yields the initial state, its episodes (rows), horizon and weights
+        """
+        mask = trajectories.action_mask & (trajectories.action_probs > 0.0)
+        pi_e = trajectories.target_probabilities(input.target_policy, mask)
+        pi_b = torch.where(
+            mask, trajectories.action_probs, torch.ones_like(trajectories.action_probs)
+        )
+        for state, start, end, horizon in trajectories.groups:
+            episodes = slice(start, end)
+            yield state, episodes, horizon, self._calc_weights(
+                pi_e[episodes, :horizon],
+                pi_b[episodes, :horizon],
+                mask[episodes, :horizon],
+            )
+
     def evaluate(self, input: RLEstimatorInput, **kwargs) -> EstimatorResults:
         logging.info(f"{self}: start evaluating")
         stime = time.process_time()
         self.reset()
-        for state, mdps in input.log.items():
-            n = len(mdps)
-            horizon = len(reduce(lambda a, b: a if len(a) > len(b) else b, mdps))
-            weights = self._calc_weights(
-                n, horizon, zip_longest(*mdps), input.target_policy
+        trajectories = PaddedTrajectories.from_log(input.log)
+        log_rewards = self._log_rewards(input.gamma, trajectories.rewards)
+        for state, episodes, horizon, weights in self._state_weights(
+            input, trajectories
+        ):
+            discount = self._discount(input.gamma, horizon)
+            rewards = trajectories.rewards[episodes, :horizon].to(
+                dtype=torch.float, device=self._device
             )
-            discount = torch.full((horizon,), input.gamma, device=self._device)
-            discount[0] = 1.0
-            discount = discount.cumprod(0)
-            rewards = torch.zeros((n, horizon))
-            j = 0
-            for ts in zip_longest(*mdps):
-                i = 0
-                for t in ts:
-                    if t is not None:
-                        rewards[i, j] = t.reward
-                    i += 1
-                j += 1
-            rewards = rewards.to(device=self._device)
             estimate = weights.mul(rewards).sum(0).mul(discount).sum().item()
             if input.ground_truth is not None:
                 ground_truth = input.ground_truth(state)
             else:
                 ground_truth = None
             self._append_estimate(
-                self._log_reward(input.gamma, mdps), estimate, ground_truth
+                log_rewards[episodes].mean().item(), estimate, ground_truth
             )
         logging.info(
             f"{self}: finishing evaluating["
@@ -307,39 +489,59 @@ class DREstimator(IPSEstimator):
     Doubly Robust estimator
     """
 
+    def _state_dr_tensors(
+        self, input: RLEstimatorInput, trajectories: PaddedTrajectories
+    ) -> Iterable[Tuple[State, slice, Tensor, Tensor, Tensor, Tensor, Tensor, Tensor]]:
+        """
+        Yields the initial state, its episodes (rows), and their weights, last
+        step weights, discounts, rewards, state-action and state values
+        """
+        qs, vs = trajectories.values(input.value_function)
+        rs = torch.where(
+            trajectories.action_mask,
+            trajectories.rewards,
+            torch.zeros_like(trajectories.rewards),
+        )
+        for state, episodes, horizon, ws in self._state_weights(input, trajectories):
+            n = ws.shape[0]
+            last_ws = torch.zeros((n, horizon), device=self._device)
+            last_ws[:, 0] = 1.0 / n
+            last_ws[:, 1:] = ws[:, :-1]
+            yield (
+                state,
+                episodes,
+                ws,
+                last_ws,
+                self._discount(input.gamma, horizon),
+                *(
+                    t[episodes, :horizon].to(dtype=torch.float, device=self._device)
+                    for t in (rs, qs, vs)
+                ),
+            )
+
     def evaluate(self, input: RLEstimatorInput, **kwargs) -> EstimatorResults:
         logging.info(f"{self}: start evaluating")
         stime = time.process_time()
         self.reset()
-        for state, mdps in input.log.items():
-            n = len(mdps)
-            horizon = len(reduce(lambda a, b: a if len(a) > len(b) else b, mdps))
-            ws = self._calc_weights(n, horizon, zip_longest(*mdps), input.target_policy)
-            last_ws = torch.zeros((n, horizon), device=self._device)
-            last_ws[:, 0] = 1.0 / n
-            last_ws[:, 1:] = ws[:, :-1]
-            discount = torch.full((horizon,), input.gamma, device=self._device)
-            discount[0] = 1.0
-            discount = discount.cumprod(0)
-            rs = torch.zeros((n, horizon))
-            vs = torch.zeros((n, horizon))
-            qs = torch.zeros((n, horizon))
-            for ts, j in zip(zip_longest(*mdps), count()):
-                for t, i in zip(ts, count()):
-                    if t is not None and t.action is not None:
-                        qs[i, j] = input.value_function(t.last_state, t.action)
-                        vs[i, j] = input.value_function(t.last_state)
-                        rs[i, j] = t.reward
-            vs = vs.to(device=self._device)
-            qs = qs.to(device=self._device)
-            rs = rs.to(device=self._device)
+        trajectories = PaddedTrajectories.from_log(input.log)
+        log_rewards = self._log_rewards(input.gamma, trajectories.rewards)
+        for (
+            state,
+            episodes,
+            ws,
+            last_ws,
+            discount,
+            rs,
+            qs,
+            vs,
+        ) in self._state_dr_tensors(input, trajectories):
             estimate = ((ws * (rs - qs) + last_ws * vs).sum(0) * discount).sum().item()
             if input.ground_truth is not None:
                 ground_truth = input.ground_truth(state)
             else:
                 ground_truth = None
             self._append_estimate(
-                self._log_reward(input.gamma, mdps), estimate, ground_truth
+                log_rewards[episodes].mean().item(), estimate, ground_truth
             )
         logging.info(
             f"{self}: finishing evaluating["
@@ -348,7 +550,7 @@ class DREstimator(IPSEstimator):
         return self.results
 
 
-class MAGICEstimator(IPSEstimator):
+class MAGICEstimator(DREstimator):
     """
     Algorithm from https://arxiv.org/abs/1604.00923, appendix G.3
     """
@@ -371,28 +573,19 @@ class MAGICEstimator(IPSEstimator):
             f"loss_threshold[{loss_threhold}], "
             f"lr[{lr}]"
         )
-        for state, mdps in input.log.items():
-            n = len(mdps)
-            horizon = len(reduce(lambda a, b: a if len(a) > len(b) else b, mdps))
-            ws = self._calc_weights(n, horizon, zip_longest(*mdps), input.target_policy)
-            last_ws = torch.zeros((n, horizon), device=self._device)
-            last_ws[:, 0] = 1.0 / n
-            last_ws[:, 1:] = ws[:, :-1]
-            discount = torch.full((horizon,), input.gamma, device=self._device)
-            discount[0] = 1.0
-            discount = discount.cumprod(0)
-            rs = torch.zeros((n, horizon))
-            vs = torch.zeros((n, horizon))
-            qs = torch.zeros((n, horizon))
-            for ts, j in zip(zip_longest(*mdps), count()):
-                for t, i in zip(ts, count()):
-                    if t is not None and t.action is not None:
-                        qs[i, j] = input.value_function(t.last_state, t.action)
-                        vs[i, j] = input.value_function(t.last_state)
-                        rs[i, j] = t.reward
-            vs = vs.to(device=self._device)
-            qs = qs.to(device=self._device)
-            rs = rs.to(device=self._device)
+        trajectories = PaddedTrajectories.from_log(input.log)
+        log_rewards = self._log_rewards(input.gamma, trajectories.rewards)
+        for (
+            state,
+            episodes,
+            ws,
+            last_ws,
+            discount,
+            rs,
+            qs,
+            vs,
+        ) in self._state_dr_tensors(input, trajectories):
+            n, horizon = ws.shape
             wdrs = ((ws * (rs - qs) + last_ws * vs) * discount).cumsum(1)
             wdr = wdrs[:, -1].sum(0)
             next_vs = torch.zeros((n, horizon), device=self._device)
@@ -400,30 +593,25 @@ class MAGICEstimator(IPSEstimator):
             gs = wdrs + ws * next_vs * discount
             gs_normal = gs.sub(torch.mean(gs, 0))
             omiga = n * torch.einsum("ij,ik->jk", gs_normal, gs_normal) / (n - 1.0)
-            resample_wdrs = torch.zeros((num_resamples,))
-            for i in range(num_resamples):
-                samples = random.choices(range(n), k=n)
-                sws = ws[samples, :]
-                last_sws = last_ws[samples, :]
-                srs = rs[samples, :]
-                svs = vs[samples, :]
-                sqs = qs[samples, :]
-                resample_wdrs[i] = (
-                    ((sws * (srs - sqs) + last_sws * svs).sum(0) * discount)
-                    .sum()
-                    .item()
-                )
-            resample_wdrs, _ = resample_wdrs.to(device=self._device).sort(0)
+            # number of times each episode is drawn in each resample
+            samples = torch.tensor(
+                [random.choices(range(n), k=n) for _ in range(num_resamples)],
+                dtype=torch.long,
+                device=self._device,
+            )
+            counts = torch.zeros((num_resamples, n), device=self._device)
+            counts.scatter_add_(1, samples, torch.ones_like(counts))
+            resample_wdrs = (
+                torch.mm(counts, ws * (rs - qs) + last_ws * vs) * discount
+            ).sum(1)
+            resample_wdrs, _ = resample_wdrs.sort(0)
             lb = torch.min(wdr, resample_wdrs[int(round(0.05 * num_resamples))])
             ub = torch.max(wdr, resample_wdrs[int(round(0.95 * num_resamples)) - 1])
-            b = torch.tensor(
-                list(
-                    map(
-                        lambda a: a - ub if a > ub else (a - lb if a < lb else 0.0),
-                        gs.sum(0),
-                    )
-                ),
-                device=self._device,
+            gs_total = gs.sum(0)
+            b = torch.where(
+                gs_total > ub,
+                gs_total - ub,
+                torch.where(gs_total < lb, gs_total - lb, torch.zeros_like(gs_total)),
             )
             b.unsqueeze_(0)
             bb = b * b.t()
@@ -450,7 +638,7 @@ class MAGICEstimator(IPSEstimator):
             else:
                 ground_truth = None
             self._append_estimate(
-                self._log_reward(input.gamma, mdps), estimate, ground_truth
+                log_rewards[episodes].mean().item(), estimate, ground_truth
             )
         logging.info(
             f"{self}: finishing evaluating["
@@ -4,6 +4,7 @@ import logging
 import math
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from enum import Enum
 from typing import (
     Generic,
     Iterable,
@@ -243,6 +244,251 @@ def make_slot_item_distributions(
         return SlateSlotItemExpectations(dict(zip(slots, dists[: len(slots)])))
 
 
+# Max number of (sample, item) keys drawn at once when sampling slates
+SAMPLE_CHUNK_SIZE = 1 << 22
+
+
+def sample_slates(probabilities: Tensor, slate_size: int, num_samples: int) -> Tensor:
+    """
+    Sample slates, item by item without replacement, each item with
+    probability proportional to its weight in the remaining items, all at once
+    with the Gumbel-top-k trick
+    Args:
+        probabilities: item probabilities (or weights), [item_size]
+        slate_size:
+        num_samples:
+
+    Returns:
+        item indices of the slates, [num_samples, slate_size]
+    """
+    probabilities = probabilities.to(dtype=torch.double)
+    # log(p) + Gumbel noise; -log(Exp(1)) is Gumbel(0, 1)
+    noise = torch.empty(
+        (num_samples, probabilities.shape[0]),
+        dtype=torch.double,
+        device=probabilities.device,
+    ).exponential_()
+    keys = probabilities.log() - noise.log()
+    return keys.topk(slate_size, dim=1).indices
+
+
+def sample_slot_item_slates(slot_probabilities: Tensor, num_samples: int) -> Tensor:
+    """
+    Sample slates, slot by slot without replacement, the item of each slot with
+    probability proportional to its weight in the slot's remaining items
+    Args:
+        slot_probabilities: item probabilities (or weights) of each slot,
+            [slate_size, item_size]
+        num_samples:
+
+    Returns:
+        item indices of the slates, [num_samples, slate_size]
+    """
+    slate_size, item_size = slot_probabilities.shape
+    log_probabilities = slot_probabilities.to(dtype=torch.double).log()
+    device = slot_probabilities.device
+    rows = torch.arange(num_samples, device=device)
+    noise = torch.empty((num_samples, item_size), dtype=torch.double, device=device)
+    samples = torch.empty((num_samples, slate_size), dtype=torch.long, device=device)
+    for i in range(slate_size):
+        keys = log_probabilities[i] - noise.exponential_().log()
+        if i > 0:
+            keys[rows.unsqueeze(1), samples[:, :i]] = float("-inf")
+        samples[:, i] = keys.argmax(dim=1)
+    return samples
+
+
+def slot_item_counts(samples: Tensor, item_size: int) -> Tensor:
+    """
+    Count how many times each item is in each slot of the slates
+    Args:
+        samples: item indices of slates, [num_samples, slate_size]
+        item_size:
+
+    Returns:
+        counts, [slate_size, item_size]
+    """
+    slate_size = samples.shape[1]
+    offsets = torch.arange(slate_size, device=samples.device) * item_size
+    indices = (samples + offsets).flatten()
+    counts = torch.zeros(
+        slate_size * item_size, dtype=torch.double, device=samples.device
+    )
+    counts.scatter_add_(
+        0,
+        indices,
+        torch.ones(indices.shape[0], dtype=torch.double, device=samples.device),
+    )
+    return counts.view(slate_size, item_size)
+
+
+def sample_slot_item_expectations(
+    sampler, slate_size: int, item_size: int, num_samples: int
+) -> Tensor:
+    """
+    Monte Carlo estimate of the probability of each item in each slot
+    Args:
+        sampler: returns the given number of slates, [num, slate_size]
+        slate_size:
+        item_size:
+        num_samples:
+
+    Returns:
+        probabilities, [slate_size, item_size]
+    """
+    chunk_size = max(1, SAMPLE_CHUNK_SIZE // item_size)
+    dm = torch.zeros((slate_size, item_size), dtype=torch.double)
+    for start in range(0, num_samples, chunk_size):
+        samples = sampler(min(chunk_size, num_samples - start))
+        dm += slot_item_counts(samples, item_size).to(device=dm.device)
+    return dm / num_samples
+
+
+def subset_dp_slot_item_expectations(slot_probabilities: Tensor) -> Tensor:
+    """
+    Exact probability of each item in each slot, when the item of each slot is
+    sampled from the slot's probabilities renormalized over the items not in
+    the previous slots. Dynamic programming over the set of items in the
+    previous slots (the order within the set doesn't matter), so the cost is
+    in C(item_size, slate_size - 1) * item_size instead of the number of
+    slates, item_size! / (item_size - slate_size)!
+    Args:
+        slot_probabilities: item probabilities (or weights) of each slot,
+            [slate_size, item_size]
+
+    Returns:
+        probabilities, [slate_size, item_size]
+    """
+    slate_size, item_size = slot_probabilities.shape
+    probs = slot_probabilities.to(dtype=torch.double).clamp(min=0.0)
+    probs = probs / probs.sum(dim=1, keepdim=True)
+    dm = torch.zeros((slate_size, item_size), dtype=torch.double)
+    # sets of items in the previous slots (sorted), and their probabilities
+    subsets = torch.zeros((1, 0), dtype=torch.long)
+    subset_probs = torch.ones(1, dtype=torch.double)
+    for slot in range(slate_size):
+        available = torch.ones((subsets.shape[0], item_size), dtype=torch.bool)
+        available[torch.arange(subsets.shape[0]).unsqueeze(1), subsets] = False
+        weights = probs[slot] * available
+        rest = weights.sum(dim=1, keepdim=True)
+        transitions = subset_probs.unsqueeze(1) * torch.where(
+            rest > 0.0, weights / rest, torch.zeros_like(weights)
+        )
+        dm[slot] = transitions.sum(dim=0)
+        if slot + 1 < slate_size:
+            rows, items = (transitions > 0.0).nonzero(as_tuple=True)
+            next_subsets = torch.cat((subsets[rows], items.unsqueeze(1)), dim=1)
+            subsets, inverse = torch.unique(
+                next_subsets.sort(dim=1).values, dim=0, return_inverse=True
+            )
+            subset_probs = torch.zeros(subsets.shape[0], dtype=torch.double)
+            subset_probs.index_add_(0, inverse, transitions[rows, items])
+    return dm
+
+
+def _race_slot_item_expectations(
+    weights: Tensor, slate_size: int, step: float
+) -> Tensor:
+    # Trapezoidal rule over log(t), which covers all the time scales 1 / weight
+    positive = weights[weights > 0.0]
+    start = math.log(1.0e-17 / positive.max().item())
+    stop = math.log(45.0 / positive.min().item())
+    t = torch.arange(start, stop + step, step, dtype=torch.double).exp()
+    t = t.unsqueeze(1)
+    # probability of each item being picked before t, [num_points, item_size]
+    picked = -torch.expm1(-weights * t)
+    # probability of k of the other items being picked before t, for each
+    # item, [num_points, item_size, slate_size]
+    num_picked = torch.zeros(
+        (t.shape[0], weights.shape[0], slate_size), dtype=torch.double
+    )
+    num_picked[:, :, 0] = 1.0
+    for j in range(weights.shape[0]):
+        q = picked[:, j].view(-1, 1, 1)
+        excluded = num_picked[:, j].clone()
+        shifted = num_picked[:, :, :-1] * q
+        num_picked *= 1.0 - q
+        num_picked[:, :, 1:] += shifted
+        num_picked[:, j] = excluded
+    # density of each item being picked at t, w.r.t. log(t)
+    density = weights * t * torch.exp(-weights * t)
+    return step * torch.einsum("tn,tnk->kn", density, num_picked)
+
+
+def quadrature_slot_item_expectations(
+    probabilities: Tensor,
+    slate_size: int,
+    tolerance: float = 1.0e-10,
+    max_halvings: int = 8,
+) -> Tensor:
+    """
+    Probability of each item in each slot, when the slate is sampled item by
+    item without replacement (Plackett-Luce), up to the given tolerance.
+    Sampling this way ranks the items as a race where item i finishes at time
+    T_i ~ Exp(probability_i); so the probability of item i in slot k is
+        integral of p_i exp(-p_i t) P(k other items finished by t) dt
+    The second factor is a Poisson binomial probability, computed exactly, and
+    the integral is computed with the trapezoidal rule, halving the step until
+    two estimates differ by less than `tolerance`. The cost is in
+    item_size^2 * slate_size per point.
+    Args:
+        probabilities: item probabilities (or weights), [item_size]
+        slate_size:
+        tolerance: max absolute difference between the last two estimates
+        max_halvings: max number of step halvings
+
+    Returns:
+        probabilities, [slate_size, item_size]
+    """
+    weights = probabilities.to(dtype=torch.double).clamp(min=0.0)
+    weights = weights / weights.sum()
+    step = 0.5
+    dm = _race_slot_item_expectations(weights, slate_size, step)
+    for _ in range(max_halvings):
+        step /= 2
+        last_dm = dm
+        dm = _race_slot_item_expectations(weights, slate_size, step)
+        if (dm - last_dm).abs().max().item() < tolerance:
+            return dm
+    logging.warning(
+        f"Slot item expectations didn't converge to {tolerance} in "
+        f"{max_halvings} step halvings"
+    )
+    return dm
+
+
+def slate_probabilities(
+    item_probabilities: Tensor, slot_mask: Optional[Tensor] = None
+) -> Tensor:
+    """
+    Probability of each slate sampled item by item without replacement, same
+    as SlateItemProbabilities.slate_probability() for a batch of slates
+    Args:
+        item_probabilities: (normalized) probability of the item in each slot
+            of each slate, [num_slates, slate_size]
+        slot_mask: False for padding slots, [num_slates, slate_size]
+
+    Returns:
+        probabilities, [num_slates]
+    """
+    remaining = 1.0 - (torch.cumsum(item_probabilities, dim=1) - item_probabilities)
+    ratios = item_probabilities / remaining
+    if slot_mask is not None:
+        ratios = torch.where(slot_mask, ratios, torch.ones_like(ratios))
+    return ratios.prod(dim=1)
+
+
+class SlotItemExpectationMode(Enum):
+    # SUBSET_DP for small slates and item sets; otherwise QUADRATURE for
+    # SlateItemProbabilities and SAMPLE for SlateSlotItemProbabilities
+    AUTO = "auto"
+    ENUMERATE = "enumerate"
+    SAMPLE = "sample"
+    SUBSET_DP = "subset_dp"
+    # Plackett-Luce only, i.e., SlateItemProbabilities
+    QUADRATURE = "quadrature"
+
+
 class SlateItemProbabilities(SlateItemValues):
     """
     Probabilities of each item being selected into the slate
@@ -252,9 +498,11 @@ class SlateItemProbabilities(SlateItemValues):
         self,
         values: Union[Mapping[SlateItem, float], Sequence[float], np.ndarray, Tensor],
         greedy: bool = False,
+        expectation_mode: SlotItemExpectationMode = SlotItemExpectationMode.AUTO,
     ):
         super().__init__(values)
         self._greedy = greedy
+        self._expectation_mode = expectation_mode
         self._slot_item_expectations = None
 
     def _new_key(self, k: int) -> SlateItem:
@@ -310,25 +558,41 @@ class SlateItemProbabilities(SlateItemValues):
                 ds[item] = 1.0
         else:
             self._normalize()
-            if (len(slots) < 5 and len(self) < 47) or (
-                len(slots) < 6 and len(self) < 19
-            ):
+            mode = self._expectation_mode
+            if mode == SlotItemExpectationMode.AUTO:
+                if (len(slots) < 5 and len(self) < 47) or (
+                    len(slots) < 6 and len(self) < 19
+                ):
+                    mode = SlotItemExpectationMode.SUBSET_DP
+                else:
+                    mode = SlotItemExpectationMode.QUADRATURE
+            if mode == SlotItemExpectationMode.ENUMERATE:
                 self._calculate_expectations(slots)
-            else:
+            elif mode == SlotItemExpectationMode.SAMPLE:
                 self._sample_expectations(slots, 20000)
+            else:
+                if mode == SlotItemExpectationMode.SUBSET_DP:
+                    dm = subset_dp_slot_item_expectations(
+                        self._probabilities.repeat((slate_size, 1))
+                    )
+                else:
+                    dm = quadrature_slot_item_expectations(
+                        self._probabilities, slate_size
+                    )
+                self._slot_item_expectations = make_slot_item_distributions(
+                    slots, [self.replace(vs) for vs in dm]
+                )
         return self._slot_item_expectations
 
     def _sample_expectations(self, slots: SlateSlots, num_samples: int):
         slate_size = len(slots)
         item_size = len(self)
-        dm = torch.zeros((slate_size, item_size), dtype=torch.double)
-        ri = torch.arange(slate_size)
-        ws = self._probabilities.repeat((num_samples, 1))
-        for _ in range(item_size):
-            samples = torch.multinomial(ws, slate_size)
-            for sample in samples:
-                dm[ri, sample] += 1
-        dm /= num_samples * item_size
+        dm = sample_slot_item_expectations(
+            lambda n: sample_slates(self._probabilities, slate_size, n),
+            slate_size,
+            item_size,
+            num_samples * item_size,
+        )
         self._slot_item_expectations = make_slot_item_distributions(
             slots, [self.replace(vs) for vs in dm]
         )
@@ -379,9 +643,17 @@ class SlateSlotItemProbabilities(SlateSlotItemValues):
             MutableMapping[SlateSlot, SlateItemValues], MutableSequence[SlateItemValues]
         ],
         greedy: bool = False,
+        expectation_mode: SlotItemExpectationMode = SlotItemExpectationMode.AUTO,
     ):
+        """
+        Args:
+            expectation_mode: how slot item expectations are calculated;
+                ENUMERATE is the same as SUBSET_DP, QUADRATURE isn't supported
+        """
         super().__init__(values)
         self._greedy = greedy
+        assert expectation_mode != SlotItemExpectationMode.QUADRATURE
+        self._expectation_mode = expectation_mode
         self._slot_item_distributions = None
         self._slot_item_expectations = None
 
@@ -438,57 +710,36 @@ class SlateSlotItemProbabilities(SlateSlotItemValues):
                 self.slots, dists
             )
         else:
-            if (slate_size < 5 and item_size < 47) or (
-                slate_size < 6 and item_size < 19
-            ):
-                self._calculate_expectations()
-            else:
+            mode = self._expectation_mode
+            if mode == SlotItemExpectationMode.AUTO:
+                if (slate_size < 5 and item_size < 47) or (
+                    slate_size < 6 and item_size < 19
+                ):
+                    mode = SlotItemExpectationMode.SUBSET_DP
+                else:
+                    mode = SlotItemExpectationMode.SAMPLE
+            if mode == SlotItemExpectationMode.SAMPLE:
                 self._sample_expectations(20000 * item_size)
+            else:
+                self._calculate_expectations()
         return self._slot_item_expectations
 
     def _sample_expectations(self, num_samples: int):
         slate_size = len(self.slots)
         item_size = len(self._values[0])
-        dm = torch.zeros((slate_size, item_size), dtype=torch.double)
-        ri = torch.arange(slate_size)
-        for _ in range(num_samples):
-            ps = self.values_tensor()
-            sample = []
-            for i in range(slate_size):
-                item = ps[i].multinomial(1)
-                sample.append(item)
-                ps[torch.arange(i + 1, slate_size), item] = 0.0
-            dm[ri, sample] += 1
-        dm /= num_samples
+        ps = self.values_tensor()
+        dm = sample_slot_item_expectations(
+            lambda n: sample_slot_item_slates(ps, n),
+            slate_size,
+            item_size,
+            num_samples,
+        )
         self._slot_item_expectations = make_slot_item_distributions(
             self.slots, [ivs.replace(vs) for ivs, vs in zip(self._values, dm)]
         )
 
     def _calculate_expectations(self):
-        slate_size = len(self.slots)
-        item_size = len(self._values[0])
-        dm = torch.zeros((slate_size, item_size), dtype=torch.double)
-        self._values[0]._normalize()
-        dm[0] = self._values[0]._probabilities
-        buffer = [({}, 1.0, 0.0, 1.0)]
-        for d, probs in zip(dm[1:], self._values[1:]):
-            next_buffer = []
-            for b in buffer:
-                for i, i_prob in enumerate(probs):
-                    if i in b[0]:
-                        continue
-                    b1 = b[1] * i_prob / (1.0 - b[2])
-                    b2 = b[2] + i_prob
-                    b3 = b1 / (1.0 - b2)
-                    next_buffer.append(({*b[0], i}, b1, b2, b3))
-            for i, i_prob in enumerate(probs):
-                p = 0.0
-                for b in next_buffer:
-                    if i in b[0]:
-                        continue
-                    p += b[3] * i_prob
-                d[i] = p
-            buffer = next_buffer
+        dm = subset_dp_slot_item_expectations(self.values_tensor())
         self._slot_item_expectations = make_slot_item_distributions(
             self.slots, [its.replace(vs) for its, vs in zip(self._values, dm)]
         )
@@ -569,6 +820,12 @@ class SlateMetric(ABC):
     def slot_values(self, rewards: SlateSlotValues) -> SlateSlotValues:
         return rewards
 
+    def slot_values_tensor(self, rewards: Tensor) -> Tensor:
+        """
+        Same as slot_values(), on a tensor of slot rewards, [..., slate_size]
+        """
+        return rewards
+
 
 class DCGSlateMetric(SlateMetric):
     _weights: Tensor = None
@@ -594,6 +851,9 @@ class DCGSlateMetric(SlateMetric):
     def slot_values(self, rewards: SlateSlotValues) -> SlateSlotValues:
         return rewards.replace(torch.pow(2.0, rewards.values) - 1.0)
 
+    def slot_values_tensor(self, rewards: Tensor) -> Tensor:
+        return torch.pow(2.0, rewards) - 1.0
+
 
 class NDCGSlateMetric(DCGSlateMetric):
     def __init__(self, item_rewards: SlateItemValues, device=None):
@@ -753,12 +1013,333 @@ class SlateEstimatorInput:
             e.validate()
 
 
+@dataclass(frozen=True)
+class BatchedSlateEstimatorInput:
+    """
+    Columnar SlateEstimatorInput: N logged samples of E episodes, with slates
+    of at most L slots over at most M items per episode. Smaller slates and
+    item sets are zero padded; per-episode data not available for an episode,
+    e.g., its target slot item expectations, is a NaN row
+    """
+
+    # only its slot_values_tensor() is used, slot weights are in slot_weights
+    metric: SlateMetric
+    # episode of each sample, [N]
+    episode_ids: Tensor
+    # item index in each slot of each logged slate, [N, L]
+    log_slates: Tensor
+    # logged reward in each slot, [N, L]
+    log_rewards: Tensor
+    # False for padding slots, [E, L]
+    slot_mask: Tensor
+    # metric slot weights of each episode, [E, L]
+    slot_weights: Tensor
+    # slot examination probabilities, used by PBM, [N, L]
+    slot_probabilities: Optional[Tensor] = None
+    # probabilities of the logged slates, <= 0 if not available, [N]
+    log_slate_probabilities: Optional[Tensor] = None
+    tgt_slate_probabilities: Optional[Tensor] = None
+    # [E, L, M]
+    log_slot_item_expectations: Optional[Tensor] = None
+    tgt_slot_item_expectations: Optional[Tensor] = None
+    # item rewards from the target model, used by DM, [E, M]
+    tgt_item_rewards: Optional[Tensor] = None
+    gt_item_rewards: Optional[Tensor] = None
+
+    @property
+    def num_episodes(self) -> int:
+        return self.slot_weights.shape[0]
+
+    def validate(self):
+        num_samples, slate_size = self.log_slates.shape
+        assert self.episode_ids.shape == (num_samples,)
+        assert self.log_rewards.shape == (num_samples, slate_size)
+        assert self.slot_mask.shape == (self.num_episodes, slate_size)
+        assert self.slot_weights.shape == (self.num_episodes, slate_size)
+        for t in (self.slot_probabilities,):
+            assert t is None or t.shape == (num_samples, slate_size)
+        for t in (self.log_slate_probabilities, self.tgt_slate_probabilities):
+            assert t is None or t.shape == (num_samples,)
+        for t in (self.log_slot_item_expectations, self.tgt_slot_item_expectations):
+            assert t is None or t.shape[:2] == (self.num_episodes, slate_size)
+
+    def episode_totals(self, values: Tensor, mask: Tensor) -> Tuple[Tensor, Tensor]:
+        """
+        Sum and number of the sample values where mask is True, by episode
+        Args:
+            values: [N]
+            mask: [N]
+
+        Returns:
+            Tuple of totals and counts, [E]
+        """
+        totals = torch.zeros(
+            self.num_episodes, dtype=values.dtype, device=values.device
+        )
+        totals.index_add_(
+            0, self.episode_ids, torch.where(mask, values, torch.zeros_like(values))
+        )
+        counts = torch.zeros_like(totals)
+        counts.index_add_(0, self.episode_ids, mask.to(dtype=values.dtype))
+        return totals, counts
+
+    def log_metric_rewards(self) -> Tensor:
+        """
+        Metric of each logged slate, [N]
+        """
+        values = self.metric.slot_values_tensor(self.log_rewards)
+        values = torch.where(
+            self.slot_mask[self.episode_ids], values, torch.zeros_like(values)
+        )
+        return (values * self.slot_weights[self.episode_ids]).sum(dim=1)
+
+    def expected_metric_rewards(self, item_rewards: Optional[Tensor]) -> Tensor:
+        """
+        Metric of each episode's expected slot rewards under the target slot
+        item expectations, NaN if either isn't available
+        Args:
+            item_rewards: [E, M]
+
+        Returns:
+            metric values, [E]
+        """
+        if item_rewards is None or self.tgt_slot_item_expectations is None:
+            return torch.full(
+                (self.num_episodes,),
+                float("nan"),
+                dtype=self.slot_weights.dtype,
+                device=self.slot_weights.device,
+            )
+        slot_rewards = torch.einsum(
+            "elm,em->el", self.tgt_slot_item_expectations, item_rewards
+        )
+        values = self.metric.slot_values_tensor(slot_rewards)
+        values = torch.where(self.slot_mask, values, torch.zeros_like(values))
+        return (values * self.slot_weights).sum(dim=1)
+
+    def ground_truths(self) -> Tensor:
+        """
+        Ground truth metric of each episode, 0.0 if not available, [E]
+        """
+        gts = self.expected_metric_rewards(self.gt_item_rewards)
+        return torch.where(torch.isnan(gts), torch.zeros_like(gts), gts)
+
+    @staticmethod
+    def _available(values: Optional[Tensor], num_episodes: int) -> Tensor:
+        if values is None:
+            return torch.zeros(num_episodes, dtype=torch.bool)
+        return ~torch.isnan(values.reshape(num_episodes, -1)[:, 0])
+
+    @property
+    def log_expectations_available(self) -> Tensor:
+        return self._available(self.log_slot_item_expectations, self.num_episodes)
+
+    @property
+    def tgt_expectations_available(self) -> Tensor:
+        return self._available(self.tgt_slot_item_expectations, self.num_episodes)
+
+    def slot_item_values(self, slot_item_values: Tensor) -> Tensor:
+        """
+        Per-episode slot item values of the items in each logged slate
+        Args:
+            slot_item_values: [E, L, M]
+
+        Returns:
+            values, 0.0 for padding slots, [N, L]
+        """
+        slots = torch.arange(self.log_slates.shape[1], device=self.log_slates.device)
+        values = slot_item_values[
+            self.episode_ids.unsqueeze(1), slots.unsqueeze(0), self.log_slates
+        ]
+        return torch.where(
+            self.slot_mask[self.episode_ids], values, torch.zeros_like(values)
+        )
+
+    @staticmethod
+    def from_input(
+        input: SlateEstimatorInput, device=None
+    ) -> "BatchedSlateEstimatorInput":
+        """
+        Convert per-sample input, calling the target model and computing slot
+        item expectations once per episode
+        """
+        episodes = list(input.episodes)
+        assert len(episodes) > 0
+        for e in episodes:
+            e.validate()
+        metric = episodes[0].metric
+        slate_size = max(len(e.context.slots) for e in episodes)
+        item_size = max(len(e.items) for e in episodes)
+
+        def episode_tensor(*shape) -> Tensor:
+            return torch.full((len(episodes), *shape), float("nan"), dtype=torch.double)
+
+        def pad(values: Tensor, size: int) -> Tensor:
+            padded = torch.zeros(size, dtype=torch.double)
+            padded[: values.shape[0]] = values
+            return padded
+
+        slot_mask = torch.zeros((len(episodes), slate_size), dtype=torch.bool)
+        slot_weights = torch.zeros((len(episodes), slate_size), dtype=torch.double)
+        log_expects = episode_tensor(slate_size, item_size)
+        tgt_expects = episode_tensor(slate_size, item_size)
+        tgt_item_rewards = episode_tensor(item_size)
+        gt_item_rewards = episode_tensor(item_size)
+        # item probabilities of episodes whose slate probabilities are computed
+        # in batch, i.e., sampled by SlateItemProbabilities (non-greedy)
+        log_item_probs = episode_tensor(item_size)
+        tgt_item_probs = episode_tensor(item_size)
+        episode_ids = []
+        log_slates = []
+        log_rewards = []
+        slot_probs = []
+        log_slate_probs = []
+        tgt_slate_probs = []
+        for e, episode in enumerate(episodes):
+            assert (
+                type(episode.metric).slot_values_tensor
+                is type(metric).slot_values_tensor
+            ), "Episodes must have the same metric slot values"
+            slots = episode.context.slots
+            items = episode.items
+            slot_mask[e, : len(slots)] = True
+            slot_weights[e] = pad(episode.metric.slot_weights(slots).values, slate_size)
+            for dest, expects in (
+                (log_expects, episode.log_slot_item_expectations(slots)),
+                (tgt_expects, episode.tgt_slot_expectations(slots)),
+            ):
+                if expects is not None:
+                    dest[e] = 0.0
+                    dest[e, : len(slots), : len(items)] = expects.values_tensor()
+            if input.tgt_model is not None:
+                tgt_item_rewards[e] = pad(
+                    input.tgt_model.item_rewards(episode.context).values, item_size
+                )
+            if episode.gt_item_rewards is not None:
+                gt_item_rewards[e] = pad(episode.gt_item_rewards.values, item_size)
+            in_batch = []
+            for dest, slot_item_probs, item_probs in (
+                (
+                    log_item_probs,
+                    episode._log_slot_item_probabilities,
+                    episode._log_item_probabilities,
+                ),
+                (
+                    tgt_item_probs,
+                    episode._tgt_slot_item_probabilities,
+                    episode._tgt_item_probabilities,
+                ),
+            ):
+                in_batch.append(
+                    slot_item_probs is None
+                    and item_probs is not None
+                    and not item_probs._greedy
+                )
+                if in_batch[-1]:
+                    probs = item_probs.values.clamp(min=0.0)
+                    dest[e] = pad(probs / probs.sum(), item_size)
+            for sample in episode.samples:
+                episode_ids.append(e)
+                log_slates.append(
+                    [items.index_of(i) for i in sample.log_slate.items]
+                    + [0] * (slate_size - len(slots))
+                )
+                log_rewards.append(pad(sample.log_rewards.values, slate_size))
+                slot_probs.append(
+                    None
+                    if sample.slot_probabilities is None
+                    else pad(sample.slot_probabilities.values, slate_size)
+                )
+                # probabilities from other distributions one sample at a time
+                log_prob = sample.log_slate_probability
+                if log_prob <= 0.0 and not in_batch[0]:
+                    log_prob = episode.log_slate_probability(sample.log_slate)
+                log_slate_probs.append(log_prob)
+                tgt_prob = sample.tgt_slate_probability
+                if tgt_prob <= 0.0 and not in_batch[1]:
+                    tgt_prob = episode.tgt_slate_probability(sample.log_slate)
+                tgt_slate_probs.append(tgt_prob)
+        episode_ids = torch.tensor(episode_ids, dtype=torch.long)
+        log_slates = torch.tensor(log_slates, dtype=torch.long)
+        sample_slot_mask = slot_mask[episode_ids]
+
+        def fill_slate_probabilities(probs, item_probs: Tensor) -> Tensor:
+            probs = torch.tensor(probs, dtype=torch.double)
+            batched = slate_probabilities(
+                item_probs[episode_ids.unsqueeze(1), log_slates], sample_slot_mask
+            )
+            return torch.where(
+                (probs > 0.0) | torch.isnan(batched), probs, batched.to(probs.dtype)
+            )
+
+        slot_probabilities = None
+        if any(p is not None for p in slot_probs):
+            slot_probabilities = torch.stack(
+                [
+                    torch.ones(slate_size, dtype=torch.double) if p is None else p
+                    for p in slot_probs
+                ]
+            )
+        return BatchedSlateEstimatorInput(
+            metric=metric,
+            episode_ids=episode_ids.to(device=device),
+            log_slates=log_slates.to(device=device),
+            log_rewards=torch.stack(log_rewards).to(device=device),
+            slot_mask=slot_mask.to(device=device),
+            slot_weights=slot_weights.to(device=device),
+            slot_probabilities=None
+            if slot_probabilities is None
+            else slot_probabilities.to(device=device),
+            log_slate_probabilities=fill_slate_probabilities(
+                log_slate_probs, log_item_probs
+            ).to(device=device),
+            tgt_slate_probabilities=fill_slate_probabilities(
+                tgt_slate_probs, tgt_item_probs
+            ).to(device=device),
+            log_slot_item_expectations=log_expects.to(device=device),
+            tgt_slot_item_expectations=tgt_expects.to(device=device),
+            tgt_item_rewards=None
+            if input.tgt_model is None
+            else tgt_item_rewards.to(device=device),
+            gt_item_rewards=gt_item_rewards.to(device=device),
+        )
+
+
+def _batched_ips_estimates(
+    input: BatchedSlateEstimatorInput,
+    log_rewards: Tensor,
+    log_mask: Tensor,
+    weights: Tensor,
+    mask: Tensor,
+    weighted: bool,
+) -> Tuple[Tensor, Tensor, Tensor]:
+    """
+    Per-episode logged average and (weighted) importance sampling estimate
+    Args:
+        log_rewards: metric of each logged slate, [N]
+        log_mask: samples in the logged average, [N]
+        weights: importance weight of each sample, [N]
+        mask: samples in the estimate, [N]
+        weighted: normalized by the total weight or the number of samples
+
+    Returns:
+        Tuple of logged averages, estimates and episodes with estimates, [E]
+    """
+    log_totals, log_counts = input.episode_totals(log_rewards, log_mask)
+    tgt_totals, tgt_counts = input.episode_totals(log_rewards * weights, mask)
+    acc_weights, _ = input.episode_totals(weights, mask)
+    estimates = tgt_totals / (acc_weights if weighted else tgt_counts)
+    return log_totals / log_counts, estimates, tgt_counts > 0
+
+
 class DMEstimator(Estimator):
     """
     Direct Method estimator
     """
 
     def evaluate(self, input: SlateEstimatorInput, *kwargs) -> EstimatorResults:
+        if isinstance(input, BatchedSlateEstimatorInput):
+            return self._evaluate_batch(input)
         input.validate()
         if input.tgt_model is None:
             logging.error("Target model is none, DM is not available")
@@ -786,6 +1367,33 @@ class DMEstimator(Estimator):
             self._append_estimate(log_avg.average, tgt_avg.average, gt_avg.average)
         return self.results
 
+    def _evaluate_batch(self, input: BatchedSlateEstimatorInput) -> EstimatorResults:
+        input.validate()
+        if input.tgt_item_rewards is None:
+            logging.error("Target model is none, DM is not available")
+            return self.results
+        available = input.tgt_expectations_available
+        if not available.all():
+            logging.warning(
+                f"Target slot expectations not available for "
+                f"{(~available).sum().item()} episodes"
+            )
+        log_rewards = input.log_metric_rewards()
+        log_totals, counts = input.episode_totals(
+            log_rewards, torch.ones_like(log_rewards, dtype=torch.bool)
+        )
+        # episodes without samples have all 0.0 averages
+        sampled = counts > 0
+        zeros = torch.zeros_like(log_totals)
+        self._append_estimates(
+            torch.where(sampled, log_totals / counts, zeros)[available],
+            torch.where(
+                sampled, input.expected_metric_rewards(input.tgt_item_rewards), zeros
+            )[available],
+            torch.where(sampled, input.ground_truths(), zeros)[available],
+        )
+        return self.results
+
 
 class IPSEstimator(Estimator):
     def __init__(
@@ -798,6 +1406,8 @@ class IPSEstimator(Estimator):
         self._weighted = weighted
 
     def evaluate(self, input: SlateEstimatorInput, *kwargs) -> EstimatorResults:
+        if isinstance(input, BatchedSlateEstimatorInput):
+            return self._evaluate_batch(input)
         input.validate()
         for episode in input.episodes:
             log_avg = RunningAverage()
@@ -841,6 +1451,34 @@ class IPSEstimator(Estimator):
                 self._append_estimate(log_avg.average, tgt_avg.average, gt_avg.average)
         return self.results
 
+    def _evaluate_batch(self, input: BatchedSlateEstimatorInput) -> EstimatorResults:
+        input.validate()
+        zeros = torch.zeros(
+            input.episode_ids.shape[0],
+            dtype=torch.double,
+            device=input.episode_ids.device,
+        )
+        log_probs = input.log_slate_probabilities
+        tgt_probs = input.tgt_slate_probabilities
+        log_probs = zeros if log_probs is None else log_probs
+        tgt_probs = zeros if tgt_probs is None else tgt_probs
+        mask = (log_probs > 0.0) & (tgt_probs > 0.0)
+        if not mask.all():
+            logging.warning(
+                f"Invalid log or target slate probabilities: "
+                f"{(~mask).sum().item()} samples"
+            )
+        weights = self._weight_clamper(
+            torch.where(mask, tgt_probs / log_probs, torch.zeros_like(log_probs))
+        )
+        logs, estimates, valid = _batched_ips_estimates(
+            input, input.log_metric_rewards(), mask, weights, mask, self._weighted
+        )
+        self._append_estimates(
+            logs[valid], estimates[valid], input.ground_truths()[valid]
+        )
+        return self.results
+
 
 class PseudoInverseEstimator(Estimator):
     """
@@ -857,6 +1495,8 @@ class PseudoInverseEstimator(Estimator):
         self._weighted = weighted
 
     def evaluate(self, input: SlateEstimatorInput, *kwargs) -> EstimatorResults:
+        if isinstance(input, BatchedSlateEstimatorInput):
+            return self._evaluate_batch(input)
         input.validate()
         for episode in input.episodes:
             log_avg = RunningAverage()
@@ -905,6 +1545,34 @@ class PseudoInverseEstimator(Estimator):
                 self._append_estimate(log_avg.average, tgt_avg.average, gt_avg.average)
         return self.results
 
+    def _evaluate_batch(self, input: BatchedSlateEstimatorInput) -> EstimatorResults:
+        input.validate()
+        available = input.log_expectations_available & input.tgt_expectations_available
+        if not available.all():
+            logging.warning(
+                f"Log or target slot distribution not available for "
+                f"{(~available).sum().item()} episodes"
+            )
+        # Gamma is the pseudo-inverse of the rank one matrix v v^T, v being the
+        # flattened log slot item expectations, i.e., v v^T / |v|^4
+        log_indicator = input.log_slot_item_expectations
+        tgt_indicator = input.tgt_slot_item_expectations
+        norms = (log_indicator ** 2).sum(dim=(1, 2)) ** 2
+        scales = (tgt_indicator * log_indicator).sum(dim=(1, 2)) / norms
+        scales = torch.where(norms > 0.0, scales, torch.zeros_like(scales))
+        weights = self._weight_clamper(
+            scales[input.episode_ids] * input.slot_item_values(log_indicator).sum(dim=1)
+        )
+        mask = available[input.episode_ids]
+        logs, estimates, valid = _batched_ips_estimates(
+            input, input.log_metric_rewards(), mask, weights, mask, self._weighted
+        )
+        valid &= available
+        self._append_estimates(
+            logs[valid], estimates[valid], input.ground_truths()[valid]
+        )
+        return self.results
+
 
 class PBMEstimator(Estimator):
     """
@@ -921,6 +1589,8 @@ class PBMEstimator(Estimator):
         self._weighted = weighted
 
     def evaluate(self, input: SlateEstimatorInput, *kwargs) -> EstimatorResults:
+        if isinstance(input, BatchedSlateEstimatorInput):
+            return self._evaluate_batch(input)
         input.validate()
         for episode in input.episodes:
             log_avg = RunningAverage()
@@ -980,3 +1650,28 @@ class PBMEstimator(Estimator):
             else:
                 self._append_estimate(log_avg.average, tgt_avg.average, gt_avg.average)
         return self.results
+
+    def _evaluate_batch(self, input: BatchedSlateEstimatorInput) -> EstimatorResults:
+        input.validate()
+        available = input.log_expectations_available & input.tgt_expectations_available
+        if not available.all():
+            logging.warning(
+                f"Log or target slot distribution not available for "
+                f"{(~available).sum().item()} episodes"
+            )
+        weights = input.slot_weights[input.episode_ids]
+        if input.slot_probabilities is not None:
+            weights = weights * input.slot_probabilities
+        h = input.slot_item_values(input.log_slot_item_expectations)
+        p = input.slot_item_values(input.tgt_slot_item_expectations)
+        ips = self._weight_clamper((h * weights).sum(dim=1) / (p * weights).sum(dim=1))
+        log_mask = available[input.episode_ids]
+        mask = log_mask & (ips > 0.0) & torch.isfinite(ips)
+        logs, estimates, valid = _batched_ips_estimates(
+            input, input.log_metric_rewards(), log_mask, ips, mask, self._weighted
+        )
+        valid &= available
+        self._append_estimates(
+            logs[valid], estimates[valid], input.ground_truths()[valid]
+        )
+        return self.results
@@ -6,9 +6,11 @@ from dataclasses import dataclass
 from functools import reduce
 from typing import (
     Generic,
+    List,
     Mapping,
     MutableMapping,
     MutableSequence,
+    Optional,
     Sequence,
     Tuple,
     TypeVar,
@@ -212,6 +214,14 @@ class Values(Generic[Type], ABC):
         self._unzip()
         return self._unzipped[1]
 
+    @property
+    def tensor(self) -> Tensor:
+        """
+        Values in index order, not copied, without listing the keys as
+        values does
+        """
+        return self._values
+
     def __repr__(self):
         return f"{self.__class__.__name__}{{values[{self._values}]}}"
 
@@ -306,6 +316,183 @@ class Values(Generic[Type], ABC):
             return sorted_keys[:size]
 
 
+class BatchedValues(Generic[Type], ABC):
+    """
+    Values of a batch of N contexts over the same keys, as a [N, num_keys]
+    tensor; keys are either indices, or a key list shared by all rows.
+    Sort, normalize, greedy and sample run on all rows at once and return
+    key indices, which keys_of() converts to keys
+
+    Attributes:
+        values: [N, num_keys] tensor
+        keys: list of keys
+    """
+
+    def __init__(
+        self,
+        values: Union[Sequence[Sequence[float]], np.ndarray, Tensor],
+        keys: Optional[Sequence[Type]] = None,
+    ):
+        if isinstance(values, Tensor):
+            self._values = values.to(dtype=torch.double)
+        elif isinstance(values, np.ndarray):
+            self._values = torch.as_tensor(values, dtype=torch.double)
+        elif isinstance(values, Sequence):
+            self._values = torch.tensor(values, dtype=torch.double)
+        else:
+            raise TypeError(f"Unsupported values type {type(values)}")
+        if self._values.dim() != 2:
+            raise ValueError(f"Values must be 2-D, got {self._values.shape}")
+        if keys is not None:
+            if len(keys) != self._values.shape[1]:
+                raise ValueError(
+                    f"Number of keys ({len(keys)}) doesn't match "
+                    f"values {self._values.shape}"
+                )
+            self._index_to_key = list(keys)
+            self._key_to_index = {k: i for i, k in enumerate(self._index_to_key)}
+        else:
+            self._index_to_key = None
+            self._key_to_index = None
+        self._probabilities = None
+        self._sorted = None
+
+    @abstractmethod
+    def _new_key(self, k: int) -> Type:
+        pass
+
+    @abstractmethod
+    def _new_values(self, values: Tensor) -> Values[Type]:
+        """
+        Scalar Values of one row
+        """
+        pass
+
+    @classmethod
+    def from_values(cls, values: Sequence[Values[Type]]) -> "BatchedValues[Type]":
+        """
+        Batch of scalar Values, all sequences or all with the same keys, in
+        the key order of the first one
+        """
+        if len(values) == 0:
+            raise ValueError("Cannot batch empty values")
+        if values[0].is_sequence:
+            return cls(torch.stack([v._values for v in values]))
+        keys = values[0]._index_to_key
+        rows = []
+        for v in values:
+            if v._index_to_key == keys:
+                rows.append(v._values)
+            else:
+                rows.append(v._values[[v._key_to_index[k] for k in keys]])
+        return cls(torch.stack(rows), keys)
+
+    def __getitem__(self, i: int) -> Values[Type]:
+        row = self._new_values(self._values[i].clone())
+        if self._index_to_key is not None:
+            # key maps aren't modified by Values, so they can be shared
+            row._key_to_index = self._key_to_index
+            row._index_to_key = self._index_to_key
+        return row
+
+    def to_values(self) -> List[Values[Type]]:
+        return [self[i] for i in range(len(self))]
+
+    def __len__(self) -> int:
+        return self._values.shape[0]
+
+    @property
+    def num_keys(self) -> int:
+        return self._values.shape[1]
+
+    @property
+    def is_sequence(self):
+        return self._key_to_index is None
+
+    @property
+    def values(self) -> Tensor:
+        return self._values
+
+    @property
+    def keys(self) -> Sequence[Type]:
+        if self._index_to_key is not None:
+            return self._index_to_key
+        return [self._new_key(i) for i in range(self._values.shape[1])]
+
+    def index_of(self, key: Type) -> int:
+        if self._key_to_index is None and isinstance(key.value, int):
+            if 0 <= key.value < self._values.shape[1]:
+                return key.value
+            else:
+                raise ValueError(f"{key} is not valid")
+        elif self._key_to_index is not None:
+            try:
+                return self._key_to_index[key]
+            except Exception:
+                raise ValueError(f"{key} is not valid")
+        else:
+            raise ValueError(f"{key} is not valid")
+
+    def keys_of(self, indices: Tensor) -> Union[List[Type], List[List[Type]]]:
+        """
+        Keys of key indices, e.g., from sort(), greedy() or sample()
+        """
+        if self._index_to_key is not None:
+            keys = self._index_to_key
+        else:
+            keys = [self._new_key(i) for i in range(self._values.shape[1])]
+        if indices.dim() == 1:
+            return [keys[i] for i in indices.tolist()]
+        return [[keys[i] for i in row] for row in indices.tolist()]
+
+    def sort(self, descending: bool = True) -> Tuple[Tensor, Tensor]:
+        """
+        Sort each row based on values
+
+        Args:
+            descending: sorting order
+
+        Returns:
+            Tuple of sorted key indices and values, [N, num_keys]
+        """
+        if self._sorted is None or self._sorted[0] != descending:
+            rs, ids = torch.sort(self._values.detach(), dim=1, descending=descending)
+            self._sorted = (descending, ids, rs)
+        return self._sorted[1], self._sorted[2]
+
+    @property
+    def probabilities(self) -> Tensor:
+        """
+        Values clamped at 0.0 and normalized in each row, as Values does
+        """
+        if self._probabilities is None:
+            dist = self._values.detach().clamp(min=0.0)
+            self._probabilities = dist / dist.sum(dim=1, keepdim=True)
+        return self._probabilities
+
+    def probability(self, key: Type) -> Tensor:
+        return self.probabilities[:, self.index_of(key)]
+
+    def greedy(self, size=1) -> Tensor:
+        """
+        Key indices of the size largest values of each row, [N], or
+        [N, size] if size > 1
+        """
+        ids, _ = self.sort()
+        return ids[:, 0] if size == 1 else ids[:, :size]
+
+    def sample(self, size=1, generator: Optional[torch.Generator] = None) -> Tensor:
+        """
+        Key indices sampled without replacement from each row's
+        probabilities, [N], or [N, size] if size > 1
+        """
+        ids = torch.multinomial(self.probabilities, size, generator=generator)
+        return ids[:, 0] if size == 1 else ids
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}{{values[{self._values}]}}"
+
+
 class Items(Generic[Type], ABC):
     """
     List of items
@@ -402,6 +589,14 @@ class ActionDistribution(Values[Action]):
         return Action(k)
 
 
+class BatchedActionDistribution(BatchedValues[Action]):
+    def _new_key(self, k: int) -> Action:
+        return Action(k)
+
+    def _new_values(self, values: Tensor) -> ActionDistribution:
+        return ActionDistribution(values)
+
+
 class ActionSpace(Items[Action]):
     def _new_item(self, i: int) -> Action:
         return Action(i)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""
+CPU benchmark of the DP backends, on square gridworlds with random walls:
+policy evaluation of a random policy in the noisy gridworld model, and
+policy iteration in the gridworld:
+
+    python -m reagent.ope.test.benchmark_dp_trainers --sizes 5 10 20 40
+
+Reports the max absolute difference of the state values w.r.t. LOOP.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from reagent.ope.estimators.sequential_estimators import RandomRLPolicy
+from reagent.ope.estimators.types import ActionSpace
+from reagent.ope.test.gridworld import GAMMA, GridWorld, NoiseGridWorldModel
+from reagent.ope.trainers.rl_tabular_trainers import (
+    DPBackend,
+    DPTrainer,
+    DPValueFunction,
+    TabularPolicy,
+)
+
+
+def make_gridworld(size: int, wall_prob: float = 0.1, seed: int = 0) -> GridWorld:
+    rng = random.Random(seed)
+    walls = [
+        (x, y)
+        for x in range(size)
+        for y in range(size)
+        if 0 < x + y < 2 * size - 2 and rng.random() < wall_prob
+    ]
+    return GridWorld((size, size), (0, 0), (size - 1, size - 1), walls=walls)
+
+
+def run_benchmark(sizes, threshold: float):
+    action_space = ActionSpace(4)
+    for size in sizes:
+        gridworld = make_gridworld(size)
+        model = NoiseGridWorldModel(gridworld, action_space, epsilon=0.3)
+        states = list(gridworld.states)
+        for name, run in [
+            (
+                "evaluation",
+                lambda backend: DPValueFunction(
+                    RandomRLPolicy(action_space), model, GAMMA, threshold, backend
+                ),
+            ),
+            (
+                "training",
+                lambda backend: DPTrainer(
+                    gridworld, TabularPolicy(action_space), backend
+                ).train(GAMMA, threshold),
+            ),
+        ]:
+            results = {}
+            for backend in DPBackend:
+                start = time.perf_counter()
+                valfunc = run(backend)
+                values = [valfunc(s) for s in states]
+                results[backend] = (time.perf_counter() - start, values)
+            loop_time, loop_values = results[DPBackend.LOOP]
+            print(
+                f"size={size:4d}, {name:>10}: "
+                + ", ".join(
+                    f"{backend.value} {t:8.3f}s (speedup {loop_time / t:.0f}x, "
+                    f"error {max(abs(a - b) for a, b in zip(values, loop_values)):.1e})"
+                    for backend, (t, values) in results.items()
+                )
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 10, 20, 40])
+    parser.add_argument("--threshold", type=float, default=0.0001)
+    args = parser.parse_args(sys.argv[1:])
+
+    run_benchmark(args.sizes, args.threshold)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""
+CPU benchmarks of the slot item expectations of SlateItemProbabilities.
+
+The Monte Carlo ones, one slate at a time (as it used to be) vs. batched:
+
+    python -m reagent.ope.test.benchmark_slot_expectations sampler \
+        --item-sizes 10 20 50 100 --slate-size 5 --num-samples 2000
+
+Run time and max absolute error of each expectation mode, w.r.t. ENUMERATE
+where it's run and to QUADRATURE otherwise, for (item size, slate size):
+
+    python -m reagent.ope.test.benchmark_slot_expectations modes \
+        --cases 5x3 10x4 18x5 46x4 100x5
+"""
+
+import argparse
+import math
+import sys
+import time
+
+import torch
+from reagent.ope.estimators.slate_estimators import (
+    SlateItemProbabilities,
+    SlateSlots,
+    SlotItemExpectationMode,
+)
+from reagent.ope.test.unit_tests.estimator_util import (
+    batched_sample_expectations,
+    loop_sample_expectations,
+)
+
+
+def make_probabilities(item_size: int, seed: int = 0) -> torch.Tensor:
+    generator = torch.Generator().manual_seed(seed)
+    weights = torch.rand(item_size, generator=generator, dtype=torch.double) + 0.1
+    return weights / weights.sum()
+
+
+def _best_time(fn, num_repeats: int = 3):
+    best = float("inf")
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(item_sizes, slate_size: int, num_samples: int):
+    for item_size in item_sizes:
+        probabilities = make_probabilities(item_size)
+        loop_time = _best_time(
+            lambda: loop_sample_expectations(probabilities, slate_size, num_samples)
+        )
+        batched_time = _best_time(
+            lambda: batched_sample_expectations(probabilities, slate_size, num_samples)
+        )
+        print(
+            f"item_size={item_size:4d}: "
+            f"loop {num_samples / loop_time:12.0f} slates/s, "
+            f"batched {num_samples / batched_time:12.0f} slates/s "
+            f"(speedup {loop_time / batched_time:.0f}x)"
+        )
+
+
+def run_mode_benchmark(cases, max_enumerate_slates: int, max_subsets: int):
+    for item_size, slate_size in cases:
+        probabilities = make_probabilities(item_size)
+        num_slates = math.factorial(item_size) // math.factorial(item_size - slate_size)
+        # C(item_size, slate_size - 1) * item_size
+        num_subsets = (
+            num_slates
+            // (math.factorial(slate_size - 1) * (item_size - slate_size + 1))
+            * item_size
+        )
+        results = {}
+        for mode in SlotItemExpectationMode:
+            if mode == SlotItemExpectationMode.AUTO or (
+                mode == SlotItemExpectationMode.ENUMERATE
+                and num_slates > max_enumerate_slates
+            ):
+                continue
+            if mode == SlotItemExpectationMode.SUBSET_DP and num_subsets > max_subsets:
+                continue
+            start = time.perf_counter()
+            dm = (
+                SlateItemProbabilities(probabilities, expectation_mode=mode)
+                .slot_item_expectations(SlateSlots(slate_size))
+                .values_tensor()
+            )
+            results[mode] = (time.perf_counter() - start, dm)
+        _, exact = results.get(
+            SlotItemExpectationMode.ENUMERATE,
+            results[SlotItemExpectationMode.QUADRATURE],
+        )
+        print(
+            f"item_size={item_size:4d}, slate_size={slate_size:3d}: "
+            + ", ".join(
+                f"{mode.value} {t:8.3f}s (error {(dm - exact).abs().max():.1e})"
+                for mode, (t, dm) in results.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark", choices=["sampler", "modes"])
+    parser.add_argument("--item-sizes", type=int, nargs="+", default=[10, 20, 50, 100])
+    parser.add_argument("--slate-size", type=int, default=5)
+    parser.add_argument("--num-samples", type=int, default=20000)
+    parser.add_argument(
+        "--cases", nargs="+", default=["5x3", "10x4", "18x5", "46x4", "100x5"]
+    )
+    parser.add_argument("--max-enumerate-slates", type=int, default=2000000)
+    parser.add_argument("--max-subsets", type=int, default=20000000)
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.benchmark == "sampler":
+        run_benchmark(args.item_sizes, args.slate_size, args.num_samples)
+    else:
+        cases = [tuple(int(x) for x in case.split("x")) for case in args.cases]
+        run_mode_benchmark(cases, args.max_enumerate_slates, args.max_subsets)
@@ -2,9 +2,11 @@
 
 import random
 from abc import abstractmethod
-from typing import Optional
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Optional, Sequence
 
-from reagent.ope.estimators.estimator import (
+import torch
+from reagent.ope.estimators.sequential_estimators import (
     Mdp,
     Model,
     RLPolicy,
@@ -12,6 +14,8 @@ from reagent.ope.estimators.estimator import (
     StateReward,
     Transition,
 )
+from reagent.ope.estimators.types import Action
+from torch import Tensor
 
 
 class Environment(Model):
@@ -95,3 +99,204 @@ class PolicyLogGenerator(object):
             transition = self._env.step(self._policy)
             mpd.append(transition)
         return mpd
+
+
+@dataclass(frozen=True)
+class Rollouts:
+    """
+    Episodes rolled out in lockstep, as [num_episodes, horizon] tensors
+    padded after the end of shorter episodes; states are indices in states
+    """
+
+    states: Sequence[State]
+    last_states: Tensor
+    actions: Tensor
+    action_probs: Tensor
+    next_states: Tensor
+    rewards: Tensor
+    # Transition.Status values, -1 for padding
+    statuses: Tensor
+    lengths: Tensor
+
+    def mdps(self) -> Sequence[Mdp]:
+        statuses = {status.value: status for status in Transition.Status}
+        columns = zip(
+            self.last_states.tolist(),
+            self.actions.tolist(),
+            self.action_probs.tolist(),
+            self.next_states.tolist(),
+            self.rewards.tolist(),
+            self.statuses.tolist(),
+            self.lengths.tolist(),
+        )
+        mdps = []
+        for ls, a, p, s, r, st, n in columns:
+            mdps.append(
+                [
+                    Transition(
+                        last_state=self.states[ls[j]],
+                        action=Action(a[j]),
+                        action_prob=p[j],
+                        state=self.states[s[j]],
+                        reward=r[j],
+                        status=statuses[st[j]],
+                    )
+                    for j in range(n)
+                ]
+            )
+        return mdps
+
+
+class BatchedPolicyLogGenerator(object):
+    """
+    Same logs as PolicyLogGenerator, for tabular environments (finite states
+    reachable from env.states) and stationary policies: the next state
+    distributions and action probabilities of all states are tabulated once,
+    then many episodes are stepped together, sampling actions and next
+    states in batch
+    """
+
+    def __init__(
+        self,
+        env: Environment,
+        policy: RLPolicy,
+        generator: Optional[torch.Generator] = None,
+    ):
+        self._env = env
+        self._policy = policy
+        self._generator = generator
+        self._state_index = {}
+        self._states = []
+        self._next_states = None
+        self._next_rewards = None
+        self._next_probs = None
+        self._action_probs = None
+        self._terminals = None
+
+    def _tabulate(self, init_states: Iterable[State]):
+        """
+        Index the states reachable from env.states and init_states, and
+        tabulate their actions and outcomes as [S, A] and [S, A, K] tensors,
+        K being the max number of next states of a state-action pair
+        """
+        state_index = {}
+        states = []
+
+        def index(state: State) -> int:
+            if state not in state_index:
+                state_index[state] = len(states)
+                states.append(state)
+            return state_index[state]
+
+        for state in self._env.states:
+            index(state)
+        for state in init_states:
+            index(state)
+        action_space = self._policy.action_space
+        outcomes = []
+        i = 0
+        while i < len(states):
+            state_outcomes = []
+            for action in action_space:
+                s_dist = self._env(states[i], action)
+                state_outcomes.append(
+                    [(index(s), rp.reward, rp.prob) for s, rp in s_dist.items()]
+                )
+            outcomes.append(state_outcomes)
+            i += 1
+        num_outcomes = max((len(o) for so in outcomes for o in so), default=1)
+        # padded with a 0.0 probability outcome
+        padding = [(0, 0.0, 0.0)]
+        next_states, next_rewards, next_probs = [], [], []
+        for state_outcomes in outcomes:
+            for action_outcomes in state_outcomes:
+                action_outcomes += padding * (num_outcomes - len(action_outcomes))
+                ss, rs, ps = zip(*action_outcomes)
+                next_states.append(ss)
+                next_rewards.append(rs)
+                next_probs.append(ps)
+        shape = (len(states), len(action_space), num_outcomes)
+        self._next_states = torch.tensor(next_states, dtype=torch.long).view(shape)
+        self._next_rewards = torch.tensor(next_rewards, dtype=torch.double).view(shape)
+        self._next_probs = torch.tensor(next_probs, dtype=torch.double).view(shape)
+        self._action_probs = self._policy.action_dists(states).to(dtype=torch.double)
+        self._terminals = torch.tensor([s.is_terminal for s in states])
+        self._state_index = state_index
+        self._states = states
+
+    def rollout(self, init_states: Sequence[State]) -> Rollouts:
+        """
+        Roll out one episode from each of init_states, till the next state
+        is terminal or the environment's max horizon is reached
+        """
+        if any(s not in self._state_index for s in init_states):
+            self._tabulate(init_states)
+        max_horizon = self._env._max_horizon
+        num_episodes = len(init_states)
+        current = torch.tensor(
+            [self._state_index[s] for s in init_states], dtype=torch.long
+        )
+        active = torch.arange(num_episodes)
+        steps = []
+        while active.shape[0] > 0:
+            s = current[active]
+            a = torch.multinomial(
+                self._action_probs[s], 1, generator=self._generator
+            ).squeeze(1)
+            k = torch.multinomial(
+                self._next_probs[s, a], 1, generator=self._generator
+            ).squeeze(1)
+            ns = self._next_states[s, a, k]
+            terminated = self._terminals[ns]
+            if 0 < max_horizon <= len(steps) + 1:
+                terminated = torch.ones_like(terminated)
+            statuses = torch.full_like(s, Transition.Status.NORMAL.value)
+            statuses[ns == s] = Transition.Status.NOOP.value
+            statuses[terminated] = Transition.Status.TERMINATED.value
+            steps.append(
+                (
+                    active,
+                    s,
+                    a,
+                    self._action_probs[s, a],
+                    ns,
+                    self._next_rewards[s, a, k],
+                    statuses,
+                )
+            )
+            current[active] = ns
+            active = active[~terminated]
+
+        def padded(i: int, dtype, fill=0) -> Tensor:
+            t = torch.full((num_episodes, len(steps)), fill, dtype=dtype)
+            for j, step in enumerate(steps):
+                t[step[0], j] = step[i]
+            return t
+
+        statuses = padded(6, torch.long, -1)
+        return Rollouts(
+            states=self._states,
+            last_states=padded(1, torch.long),
+            actions=padded(2, torch.long),
+            action_probs=padded(3, torch.double),
+            next_states=padded(4, torch.long),
+            rewards=padded(5, torch.double),
+            statuses=statuses,
+            lengths=statuses.ge(0).sum(1),
+        )
+
+    def generate_logs(
+        self, init_states: Iterable[State], num_episodes: int
+    ) -> Mapping[State, Sequence[Mdp]]:
+        """
+        num_episodes MDPs from each of init_states, as PolicyLogGenerator
+        generate_log() would, rolled out together
+        """
+        init_states = list(init_states)
+        mdps = self.rollout(
+            [s for s in init_states for _ in range(num_episodes)]
+        ).mdps()
+        return {
+            s: mdps[i * num_episodes : (i + 1) * num_episodes]
+            for i, s in enumerate(init_states)
+        }
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+"""
+Local OPE experiment runner: runs (episodes, estimator) jobs in a process
+pool and merges the results of each estimator, the same for any number of
+workers. Wall-clock scaling with the number of workers, on CPU:
+
+    python -m reagent.ope.test.experiment_runner gridworld \
+        --num-episodes 200 --num-workers 0 1 2 4
+    python -m reagent.ope.test.experiment_runner bandits \
+        --num-rows 20000 --num-logs 40 --num-workers 0 1 2 4
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+from dataclasses import dataclass, replace
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from reagent.ope.estimators.contextual_bandits_estimators import BanditsEstimatorInput
+from reagent.ope.estimators.estimator import Estimator, EstimatorResults, merge_results
+from reagent.ope.estimators.sequential_estimators import RLEstimatorInput
+from reagent.ope.estimators.slate_estimators import SlateEstimatorInput
+
+
+EstimatorInput = Union[BanditsEstimatorInput, SlateEstimatorInput, RLEstimatorInput]
+
+
+def num_episodes(input: EstimatorInput) -> int:
+    """
+    Number of episodes of an input, i.e., of estimates of an estimator: logs
+    of bandits, episodes of slates, and initial states of sequential inputs
+    """
+    if isinstance(input, BanditsEstimatorInput):
+        return len(input.logs)
+    elif isinstance(input, SlateEstimatorInput):
+        return len(input.episodes)
+    elif isinstance(input, RLEstimatorInput):
+        return len(input.log)
+    raise TypeError(f"Unsupported input type: {type(input)}")
+
+
+def slice_input(input: EstimatorInput, start: int, end: int) -> EstimatorInput:
+    """
+    The input of episodes [start, end), in the order of num_episodes()
+    """
+    if isinstance(input, BanditsEstimatorInput):
+        return replace(input, logs=input.logs[start:end])
+    elif isinstance(input, SlateEstimatorInput):
+        return replace(input, episodes=input.episodes[start:end])
+    elif isinstance(input, RLEstimatorInput):
+        states = list(input.log.keys())[start:end]
+        return replace(input, log={s: input.log[s] for s in states})
+    raise TypeError(f"Unsupported input type: {type(input)}")
+
+
+def _materialize(input: EstimatorInput) -> EstimatorInput:
+    # logs and episodes may be one pass iterables
+    if isinstance(input, BanditsEstimatorInput):
+        return replace(input, logs=list(input.logs))
+    elif isinstance(input, SlateEstimatorInput):
+        return replace(input, episodes=list(input.episodes))
+    return input
+
+
+def job_seed(seed: int, estimator_index: int, start: int) -> int:
+    """
+    Seed of a job, from its estimator and first episode only, so that
+    results don't depend on the number of workers or the job order
+    """
+    return int(
+        np.random.SeedSequence([seed, estimator_index, start]).generate_state(1)[0]
+    )
+
+
+@dataclass(frozen=True)
+class ExperimentJob:
+    estimator_index: int
+    start: int
+    end: int
+    seed: int
+
+
+# input and estimators of a worker, set once by _set_job_args()
+_input: Optional[EstimatorInput] = None
+_estimators: Sequence[Estimator] = ()
+_kwargs = {}
+
+
+def _set_job_args(input: EstimatorInput, estimators: Sequence[Estimator], kwargs):
+    global _input, _estimators, _kwargs
+    _input = input
+    _estimators = estimators
+    _kwargs = kwargs
+
+
+def _init_worker(input: EstimatorInput, estimators: Sequence[Estimator], kwargs):
+    _set_job_args(input, estimators, kwargs)
+    # one thread per worker, the pool being the parallelism
+    torch.set_num_threads(1)
+
+
+def _run_job(job: ExperimentJob) -> EstimatorResults:
+    random.seed(job.seed)
+    np.random.seed(job.seed)
+    torch.manual_seed(job.seed)
+    estimator = _estimators[job.estimator_index]
+    # estimators are reused across jobs, and not all of them reset in evaluate()
+    estimator.reset()
+    return estimator.evaluate(slice_input(_input, job.start, job.end), **_kwargs)
+
+
+def run_experiment(
+    input: EstimatorInput,
+    estimators: Sequence[Estimator],
+    num_workers: int = 0,
+    episodes_per_job: int = 1,
+    seed: int = 0,
+    mp_context: Optional[str] = None,
+    **kwargs,
+) -> Sequence[EstimatorResults]:
+    """
+    Evaluates each estimator on input, as jobs of episodes_per_job
+    consecutive episodes run in a pool of num_workers processes (in this
+    process if 0), each seeding random, numpy and torch with job_seed()
+
+    The input is passed to each worker once, by the pool initializer, not
+    with every job: forked workers inherit a copy-on-write copy of it, and
+    spawned ones unpickle their own copy of its logs or episodes; only its
+    raw tensors are moved to shared memory (torch.multiprocessing), so
+    memory grows with the number of workers
+    Args:
+        input: bandits, slate or sequential estimator input
+        estimators: estimators to evaluate
+        num_workers: number of worker processes
+        episodes_per_job: number of episodes of a job
+        seed: base seed of the jobs
+        mp_context: multiprocessing start method, the platform's default if
+            None
+        **kwargs: arguments of the estimators' evaluate()
+
+    Returns:
+        results of each estimator, as merge_results() of its jobs
+    """
+    input = _materialize(input)
+    n = num_episodes(input)
+    jobs = [
+        ExperimentJob(
+            i, start, min(start + episodes_per_job, n), job_seed(seed, i, start)
+        )
+        for i in range(len(estimators))
+        for start in range(0, max(n, 1), episodes_per_job)
+    ]
+    logging.info(
+        f"Running {len(jobs)} jobs of {len(estimators)} estimators on {n} "
+        f"episodes, {num_workers} workers"
+    )
+    if num_workers == 0:
+        _set_job_args(input, estimators, kwargs)
+        job_results = [_run_job(job) for job in jobs]
+    else:
+        context = mp.get_context(mp_context)
+        with context.Pool(
+            num_workers, initializer=_init_worker, initargs=(input, estimators, kwargs)
+        ) as pool:
+            job_results = pool.map(_run_job, jobs, chunksize=1)
+    results = [[] for _ in estimators]
+    for job, job_result in zip(jobs, job_results):
+        results[job.estimator_index].append(job_result)
+    return [merge_results(r) for r in results]
+
+
+def run_scaling(
+    input: EstimatorInput,
+    estimators: Sequence[Estimator],
+    worker_counts: Sequence[int],
+    episodes_per_job: int = 1,
+    **kwargs,
+):
+    """
+    Prints the wall-clock time of run_experiment() by number of workers,
+    and the max difference of the estimates w.r.t. the first run
+    """
+    base_time = None
+    base_results = None
+    for num_workers in worker_counts:
+        start = time.perf_counter()
+        results = run_experiment(
+            input, estimators, num_workers, episodes_per_job, **kwargs
+        )
+        elapsed = time.perf_counter() - start
+        if base_results is None:
+            base_time = elapsed
+            base_results = results
+        error = max(
+            (r.estimates - b.estimates).abs().max().item()
+            if len(b.estimates) > 0
+            else 0.0
+            for r, b in zip(results, base_results)
+        )
+        print(
+            f"workers={num_workers:3d}: {elapsed:8.3f}s "
+            f"(speedup {base_time / elapsed:.1f}x), max difference {error:.1e}",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("harness", choices=["gridworld", "bandits"])
+    parser.add_argument("--num-workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--episodes-per-job", type=int, default=1)
+    parser.add_argument("--num-episodes", type=int, default=200)
+    parser.add_argument("--max-horizon", type=int, default=100)
+    parser.add_argument("--num-rows", type=int, default=20000)
+    parser.add_argument("--num-actions", type=int, default=10)
+    parser.add_argument("--num-logs", type=int, default=40)
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.harness == "gridworld":
+        from reagent.ope.estimators.sequential_estimators import (
+            DMEstimator,
+            DREstimator,
+            IPSEstimator,
+            MAGICEstimator,
+        )
+        from reagent.ope.test.unit_tests.estimator_util import make_gridworld_input
+
+        input = make_gridworld_input(args.num_episodes, args.max_horizon)
+        estimators = [
+            DMEstimator(),
+            IPSEstimator(weighted=False),
+            IPSEstimator(weighted=True),
+            DREstimator(weighted=False),
+            DREstimator(weighted=True),
+            MAGICEstimator(),
+        ]
+        kwargs = {"num_resamples": 10, "loss_threhold": 0.0000001, "lr": 0.00001}
+    else:
+        from reagent.ope.estimators.contextual_bandits_estimators import (
+            DMEstimator,
+            DoublyRobustEstimator,
+            IPSEstimator,
+        )
+        from reagent.ope.test.unit_tests.estimator_util import make_multiclass_input
+
+        input = make_multiclass_input(args.num_rows, args.num_actions, args.num_logs)
+        estimators = [DMEstimator(), IPSEstimator(), DoublyRobustEstimator()]
+        kwargs = {}
+    run_scaling(input, estimators, args.num_workers, args.episodes_per_job, **kwargs)
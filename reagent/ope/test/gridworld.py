@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import logging
+import os
 import random
 from typing import Iterable, Optional, Sequence, Tuple
 
@@ -22,6 +23,7 @@ from reagent.ope.estimators.sequential_estimators import (
 )
 from reagent.ope.estimators.types import Action, ActionSpace
 from reagent.ope.test.envs import Environment, PolicyLogGenerator
+from reagent.ope.test.experiment_runner import run_experiment
 from reagent.ope.trainers.rl_tabular_trainers import (
     DPTrainer,
     DPValueFunction,
@@ -324,22 +326,22 @@ if __name__ == "__main__":
         ground_truth=ground_truth,
     )
 
-    DMEstimator(device=device).evaluate(estimator_input)
-
-    IPSEstimator(weight_clamper=None, weighted=False, device=device).evaluate(
-        estimator_input
-    )
-    IPSEstimator(weight_clamper=None, weighted=True, device=device).evaluate(
-        estimator_input
-    )
-
-    DREstimator(weight_clamper=None, weighted=False, device=device).evaluate(
-        estimator_input
-    )
-    DREstimator(weight_clamper=None, weighted=True, device=device).evaluate(
-        estimator_input
-    )
-
-    MAGICEstimator(device=device).evaluate(
-        estimator_input, num_resamples=10, loss_threhold=0.0000001, lr=0.00001
+    estimators = [
+        DMEstimator(device=device),
+        IPSEstimator(weight_clamper=None, weighted=False, device=device),
+        IPSEstimator(weight_clamper=None, weighted=True, device=device),
+        DREstimator(weight_clamper=None, weighted=False, device=device),
+        DREstimator(weight_clamper=None, weighted=True, device=device),
+        MAGICEstimator(device=device),
+    ]
+    # in parallel on CPU, one job per initial state
+    results = run_experiment(
+        estimator_input,
+        estimators,
+        num_workers=os.cpu_count() if device is None else 0,
+        num_resamples=10,
+        loss_threhold=0.0000001,
+        lr=0.00001,
     )
+    for estimator, result in zip(estimators, results):
+        logging.info(f"{estimator}: {result}")
@@ -169,6 +169,10 @@ class MultiClassModel(BanditsModel):
     def _action_rewards(self, context: MultiClassContext) -> ActionRewards:
         return ActionRewards(self._rewards[context.query_id])
 
+    def _batch_action_rewards(self, contexts, action_space: ActionSpace) -> Tensor:
+        query_ids = torch.tensor([c.query_id for c in contexts], dtype=torch.long)
+        return self._rewards[query_ids].to(dtype=torch.double)
+
 
 class MultiClassPolicy(Policy):
     def __init__(
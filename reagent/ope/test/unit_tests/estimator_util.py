@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+
+import logging
+import random
+import time
+from functools import reduce
+from itertools import count, zip_longest
+from typing import Iterable
+
+import torch
+from reagent.ope.estimators.contextual_bandits_estimators import (
+    BanditsEstimatorInput,
+    Log,
+    LogSample as BanditsLogSample,
+)
+from reagent.ope.estimators.estimator import EstimatorResults
+from reagent.ope.estimators.sequential_estimators import (
+    DREstimator,
+    EpsilonGreedyRLPolicy,
+    IPSEstimator,
+    MAGICEstimator,
+    RandomRLPolicy,
+    RLEstimatorInput,
+    RLPolicy,
+    Transition,
+)
+from reagent.ope.estimators.slate_estimators import (
+    LogEpisode,
+    LogSample,
+    NDCGSlateMetric,
+    SlateContext,
+    SlateEstimatorInput,
+    SlateItemProbabilities,
+    SlateItemValues,
+    SlateQuery,
+    SlateSlots,
+    SlateSlotValues,
+    sample_slates,
+    sample_slot_item_expectations,
+)
+from reagent.ope.estimators.types import ActionSpace
+from reagent.ope.test.envs import PolicyLogGenerator
+from reagent.ope.test.gridworld import GAMMA, GridWorld, NoiseGridWorldModel
+from reagent.ope.test.mslr_slate import GroundTruthModel, MSLRPolicy, TrainedModel
+from reagent.ope.test.multiclass_bandits import (
+    MultiClassContext,
+    MultiClassModel,
+    MultiClassPolicy,
+)
+from reagent.ope.test.yandex_web_search import MAX_POSITION
+from reagent.ope.trainers.rl_tabular_trainers import (
+    DPTrainer,
+    DPValueFunction,
+    TabularPolicy,
+)
+
+
+def loop_sample_expectations(
+    probabilities: torch.Tensor, slate_size: int, num_samples: int
+) -> torch.Tensor:
+    """ The former SlateItemProbabilities._sample_expectations """
+    item_size = probabilities.shape[0]
+    dm = torch.zeros((slate_size, item_size), dtype=torch.double)
+    ri = torch.arange(slate_size)
+    ws = probabilities.repeat((num_samples, 1))
+    samples = torch.multinomial(ws, slate_size)
+    for sample in samples:
+        dm[ri, sample] += 1
+    return dm / num_samples
+
+
+def batched_sample_expectations(
+    probabilities: torch.Tensor, slate_size: int, num_samples: int
+) -> torch.Tensor:
+    return sample_slot_item_expectations(
+        lambda n: sample_slates(probabilities, slate_size, n),
+        slate_size,
+        probabilities.shape[0],
+        num_samples,
+    )
+
+
+def make_mslr_input(
+    num_queries: int,
+    num_samples: int,
+    slate_size: int,
+    tgt_deterministic: bool = False,
+    seed: int = 0,
+) -> SlateEstimatorInput:
+    """
+    Same episodes as mslr_slate.evalute_all(), from random relevances and
+    model scores; the ground truth item rewards are the relevances
+    """
+    torch.manual_seed(seed)
+    counts = torch.randint(2 * slate_size, 8 * slate_size, (num_queries,))
+    offsets = torch.cumsum(counts, dim=0) - counts
+    queries = torch.stack([torch.arange(num_queries), offsets, counts], dim=1)
+    num_docs = counts.sum().item()
+    relevances = torch.randint(0, 5, (num_docs,)).double()
+    log_scores = relevances + torch.randn(num_docs, dtype=torch.double)
+    tgt_scores = relevances + 0.5 * torch.randn(num_docs, dtype=torch.double)
+    log_model = TrainedModel(log_scores)
+    log_policy = MSLRPolicy(log_scores, False, 1.0)
+    tgt_model = TrainedModel(tgt_scores)
+    tgt_policy = MSLRPolicy(tgt_scores, tgt_deterministic, 1.0)
+    gt_model = GroundTruthModel(relevances)
+    slots = SlateSlots(slate_size)
+    episodes = []
+    for q in queries:
+        context = SlateContext(SlateQuery(q), slots)
+        log_item_probs = log_policy(context)
+        log_item_rewards = log_model.item_rewards(context)
+        metric = NDCGSlateMetric(log_item_rewards)
+        samples = []
+        for _ in range(num_samples):
+            slate = log_item_probs.sample_slate(slots)
+            samples.append(LogSample(slate, slate.slot_values(log_item_rewards)))
+        episodes.append(
+            LogEpisode(
+                context,
+                metric,
+                samples,
+                None,
+                log_item_probs,
+                None,
+                tgt_policy(context),
+                gt_model.item_rewards(context),
+            )
+        )
+    return SlateEstimatorInput(episodes, tgt_model)
+
+
+def make_yandex_input(
+    num_queries: int, num_samples: int, seed: int = 0
+) -> SlateEstimatorInput:
+    """
+    Same episodes as the yandex_web_search test, from random relevances: the
+    logged slates of a query have between 1 and 2 * num_samples samples, and
+    each sample its slot examination probabilities
+    """
+    torch.manual_seed(seed)
+    slots = SlateSlots(MAX_POSITION)
+    examinations = 1.0 / torch.arange(1, MAX_POSITION + 1, dtype=torch.double)
+    episodes = []
+    for qid in range(num_queries):
+        context = SlateContext(SlateQuery((qid, qid)), slots)
+        item_size = torch.randint(MAX_POSITION, 3 * MAX_POSITION, (1,)).item()
+        gt_item_rewards = SlateItemValues(torch.rand(item_size, dtype=torch.double))
+        log_item_probs = SlateItemProbabilities(
+            gt_item_rewards.values + torch.rand(item_size, dtype=torch.double)
+        )
+        tgt_item_probs = SlateItemProbabilities(
+            gt_item_rewards.values + 0.5 * torch.rand(item_size, dtype=torch.double)
+        )
+        metric = NDCGSlateMetric(gt_item_rewards)
+        samples = []
+        for _ in range(torch.randint(1, 2 * num_samples, (1,)).item()):
+            slate = log_item_probs.sample_slate(slots)
+            samples.append(
+                LogSample(
+                    slate,
+                    slate.slot_values(gt_item_rewards),
+                    SlateSlotValues(
+                        examinations * torch.rand(MAX_POSITION, dtype=torch.double)
+                    ),
+                )
+            )
+        episodes.append(
+            LogEpisode(
+                context,
+                metric,
+                samples,
+                None,
+                log_item_probs,
+                None,
+                tgt_item_probs,
+                gt_item_rewards,
+            )
+        )
+    return SlateEstimatorInput(episodes)
+
+
+def make_multiclass_input(
+    num_rows: int, num_actions: int, num_logs: int, seed: int = 0
+) -> BanditsEstimatorInput:
+    """
+    Same logs as the multiclass bandits test: num_logs logs of num_rows / 5
+    random rows each
+    """
+    torch.manual_seed(seed)
+    features = torch.zeros((num_rows, 1))
+    labels = torch.randint(0, num_actions, (num_rows,))
+    one_hots = torch.nn.functional.one_hot(labels, num_actions).float()
+    log_probs = torch.softmax(torch.randn(num_rows, num_actions) + one_hots, dim=1)
+    tgt_probs = torch.softmax(
+        torch.randn(num_rows, num_actions) + 2.0 * one_hots, dim=1
+    )
+    action_space = ActionSpace(num_actions)
+    gt_model = MultiClassModel(features, one_hots)
+    log_model = MultiClassModel(features, log_probs)
+    log_policy = MultiClassPolicy(action_space, log_probs, 1.0)
+    target_model = MultiClassModel(features, tgt_probs)
+    target_policy = MultiClassPolicy(action_space, tgt_probs, 0.1)
+    logs = []
+    for _ in range(num_logs):
+        samples = []
+        for i in torch.randperm(num_rows)[: num_rows // 5].tolist():
+            context = MultiClassContext(i)
+            logged_action, logged_dist = log_policy(context)
+            logged_reward = log_model(context)[logged_action]
+            target_action, target_dist = target_policy(context)
+            samples.append(
+                BanditsLogSample(
+                    context,
+                    logged_action,
+                    logged_dist,
+                    logged_reward,
+                    target_action,
+                    target_dist,
+                )
+            )
+        logs.append(Log(samples))
+    return BanditsEstimatorInput(action_space, logs, target_model, gt_model)
+
+
+def make_gridworld_input(
+    num_episodes: int, max_horizon: int, seed: int = 0
+) -> RLEstimatorInput:
+    """ Same log as the gridworld test """
+    random.seed(seed)
+    torch.manual_seed(seed)
+    gridworld = GridWorld.from_grid(
+        [
+            ["s", "0", "0", "0", "0"],
+            ["0", "0", "0", "W", "0"],
+            ["0", "0", "0", "0", "0"],
+            ["0", "W", "0", "0", "0"],
+            ["0", "0", "0", "0", "g"],
+        ],
+        max_horizon=max_horizon,
+    )
+    action_space = ActionSpace(4)
+    opt_policy = TabularPolicy(action_space)
+    DPTrainer(gridworld, opt_policy).train(gamma=GAMMA)
+    behavior_policy = RandomRLPolicy(action_space)
+    target_policy = EpsilonGreedyRLPolicy(opt_policy, 0.3)
+    model = NoiseGridWorldModel(
+        gridworld, action_space, epsilon=0.3, max_horizon=max_horizon
+    )
+    value_func = DPValueFunction(target_policy, model, GAMMA)
+    ground_truth = DPValueFunction(target_policy, gridworld, GAMMA)
+    log_generator = PolicyLogGenerator(gridworld, behavior_policy)
+    log = {
+        state: [log_generator.generate_log(state) for _ in range(num_episodes)]
+        for state in gridworld.states
+    }
+    return RLEstimatorInput(
+        gamma=GAMMA,
+        log=log,
+        target_policy=target_policy,
+        value_function=value_func,
+        ground_truth=ground_truth,
+    )
+
+
+class LoopIPSEstimator(IPSEstimator):
+    """ The former IPSEstimator """
+
+    def _loop_calc_weights(
+        self,
+        episodes: int,
+        horizon: int,
+        mdp_transitions: Iterable[Iterable[Transition]],
+        policy: RLPolicy,
+    ) -> torch.Tensor:
+        pi_e = torch.ones((episodes, horizon))
+        pi_b = torch.ones((episodes, horizon))
+        mask = torch.ones((episodes, horizon))
+        j = 0
+        for ts in mdp_transitions:
+            i = 0
+            for t in ts:
+                if t is not None and t.action is not None and t.action_prob > 0.0:
+                    pi_e[i, j] = policy(t.last_state)[t.action]
+                    pi_b[i, j] = t.action_prob
+                else:
+                    mask[i, j] = 0.0
+                i += 1
+            j += 1
+        pi_e = pi_e.to(device=self._device)
+        pi_b = pi_b.to(device=self._device)
+        mask = mask.to(device=self._device)
+        rho = pi_e.div_(pi_b).cumprod(1).mul_(mask)
+        if self._weighted:
+            weight = rho.sum(0)
+        else:
+            weight = mask.sum(0)
+        weight.add_(weight.lt(1.0e-15) * episodes)
+        ws = rho / weight
+        return self._weight_clamper(ws)
+
+    def evaluate(self, input: RLEstimatorInput, **kwargs) -> EstimatorResults:
+        logging.info(f"{self}: start evaluating")
+        stime = time.process_time()
+        self.reset()
+        for state, mdps in input.log.items():
+            n = len(mdps)
+            horizon = len(reduce(lambda a, b: a if len(a) > len(b) else b, mdps))
+            weights = self._loop_calc_weights(
+                n, horizon, zip_longest(*mdps), input.target_policy
+            )
+            discount = torch.full((horizon,), input.gamma, device=self._device)
+            discount[0] = 1.0
+            discount = discount.cumprod(0)
+            rewards = torch.zeros((n, horizon))
+            j = 0
+            for ts in zip_longest(*mdps):
+                i = 0
+                for t in ts:
+                    if t is not None:
+                        rewards[i, j] = t.reward
+                    i += 1
+                j += 1
+            rewards = rewards.to(device=self._device)
+            estimate = weights.mul(rewards).sum(0).mul(discount).sum().item()
+            if input.ground_truth is not None:
+                ground_truth = input.ground_truth(state)
+            else:
+                ground_truth = None
+            self._append_estimate(
+                self._log_reward(input.gamma, mdps), estimate, ground_truth
+            )
+        logging.info(
+            f"{self}: finishing evaluating["
+            f"process_time={time.process_time() - stime}]"
+        )
+        return self.results
+
+
+class LoopDREstimator(LoopIPSEstimator):
+    """ The former DREstimator """
+
+    def evaluate(self, input: RLEstimatorInput, **kwargs) -> EstimatorResults:
+        logging.info(f"{self}: start evaluating")
+        stime = time.process_time()
+        self.reset()
+        for state, mdps in input.log.items():
+            n = len(mdps)
+            horizon = len(reduce(lambda a, b: a if len(a) > len(b) else b, mdps))
+            ws = self._loop_calc_weights(
+                n, horizon, zip_longest(*mdps), input.target_policy
+            )
+            last_ws = torch.zeros((n, horizon), device=self._device)
+            last_ws[:, 0] = 1.0 / n
+            last_ws[:, 1:] = ws[:, :-1]
+            discount = torch.full((horizon,), input.gamma, device=self._device)
+            discount[0] = 1.0
+            discount = discount.cumprod(0)
+            rs = torch.zeros((n, horizon))
+            vs = torch.zeros((n, horizon))
+            qs = torch.zeros((n, horizon))
+            for ts, j in zip(zip_longest(*mdps), count()):
+                for t, i in zip(ts, count()):
+                    if t is not None and t.action is not None:
+                        qs[i, j] = input.value_function(t.last_state, t.action)
+                        vs[i, j] = input.value_function(t.last_state)
+                        rs[i, j] = t.reward
+            vs = vs.to(device=self._device)
+            qs = qs.to(device=self._device)
+            rs = rs.to(device=self._device)
+            estimate = ((ws * (rs - qs) + last_ws * vs).sum(0) * discount).sum().item()
+            if input.ground_truth is not None:
+                ground_truth = input.ground_truth(state)
+            else:
+                ground_truth = None
+            self._append_estimate(
+                self._log_reward(input.gamma, mdps), estimate, ground_truth
+            )
+        logging.info(
+            f"{self}: finishing evaluating["
+            f"process_time={time.process_time() - stime}]"
+        )
+        return self.results
+
+
+class LoopMAGICEstimator(LoopIPSEstimator):
+    """ The former MAGICEstimator """
+
+    def __init__(self, weight_clamper=None, device=None):
+        super().__init__(weight_clamper, True, device)
+
+    def evaluate(self, input: RLEstimatorInput, **kwargs) -> EstimatorResults:
+        assert input.value_function is not None
+        logging.info(f"{self}: start evaluating")
+        stime = time.process_time()
+        self.reset()
+        num_resamples = kwargs["num_resamples"] if "num_resamples" in kwargs else 200
+        loss_threhold = (
+            kwargs["loss_threhold"] if "loss_threhold" in kwargs else 0.00001
+        )
+        lr = kwargs["lr"] if "lr" in kwargs else 0.0001
+        logging.info(
+            f"  params: num_resamples[{num_resamples}], "
+            f"loss_threshold[{loss_threhold}], "
+            f"lr[{lr}]"
+        )
+        for state, mdps in input.log.items():
+            n = len(mdps)
+            horizon = len(reduce(lambda a, b: a if len(a) > len(b) else b, mdps))
+            ws = self._loop_calc_weights(
+                n, horizon, zip_longest(*mdps), input.target_policy
+            )
+            last_ws = torch.zeros((n, horizon), device=self._device)
+            last_ws[:, 0] = 1.0 / n
+            last_ws[:, 1:] = ws[:, :-1]
+            discount = torch.full((horizon,), input.gamma, device=self._device)
+            discount[0] = 1.0
+            discount = discount.cumprod(0)
+            rs = torch.zeros((n, horizon))
+            vs = torch.zeros((n, horizon))
+            qs = torch.zeros((n, horizon))
+            for ts, j in zip(zip_longest(*mdps), count()):
+                for t, i in zip(ts, count()):
+                    if t is not None and t.action is not None:
+                        qs[i, j] = input.value_function(t.last_state, t.action)
+                        vs[i, j] = input.value_function(t.last_state)
+                        rs[i, j] = t.reward
+            vs = vs.to(device=self._device)
+            qs = qs.to(device=self._device)
+            rs = rs.to(device=self._device)
+            wdrs = ((ws * (rs - qs) + last_ws * vs) * discount).cumsum(1)
+            wdr = wdrs[:, -1].sum(0)
+            next_vs = torch.zeros((n, horizon), device=self._device)
+            next_vs[:, :-1] = vs[:, 1:]
+            gs = wdrs + ws * next_vs * discount
+            gs_normal = gs.sub(torch.mean(gs, 0))
+            omiga = n * torch.einsum("ij,ik->jk", gs_normal, gs_normal) / (n - 1.0)
+            resample_wdrs = torch.zeros((num_resamples,))
+            for i in range(num_resamples):
+                samples = random.choices(range(n), k=n)
+                sws = ws[samples, :]
+                last_sws = last_ws[samples, :]
+                srs = rs[samples, :]
+                svs = vs[samples, :]
+                sqs = qs[samples, :]
+                resample_wdrs[i] = (
+                    ((sws * (srs - sqs) + last_sws * svs).sum(0) * discount)
+                    .sum()
+                    .item()
+                )
+            resample_wdrs, _ = resample_wdrs.to(device=self._device).sort(0)
+            lb = torch.min(wdr, resample_wdrs[int(round(0.05 * num_resamples))])
+            ub = torch.max(wdr, resample_wdrs[int(round(0.95 * num_resamples)) - 1])
+            b = torch.tensor(
+                list(
+                    map(
+                        lambda a: a - ub if a > ub else (a - lb if a < lb else 0.0),
+                        gs.sum(0),
+                    )
+                ),
+                device=self._device,
+            )
+            b.unsqueeze_(0)
+            bb = b * b.t()
+            cov = omiga + bb
+            # x = torch.rand((1, horizon), device=self.device, requires_grad=True)
+            x = torch.zeros((1, horizon), device=self._device, requires_grad=True)
+            # using SGD to find min x
+            optimizer = torch.optim.SGD([x], lr=lr)
+            last_y = 0.0
+            for i in range(100):
+                x = torch.nn.functional.softmax(x, dim=1)
+                y = torch.mm(torch.mm(x, cov), x.t())
+                if abs(y.item() - last_y) < loss_threhold:
+                    print(f"{i}: {last_y} -> {y.item()}")
+                    break
+                last_y = y.item()
+                optimizer.zero_grad()
+                y.backward(retain_graph=True)
+                optimizer.step()
+            x = torch.nn.functional.softmax(x, dim=1)
+            estimate = torch.mm(x, gs.sum(0, keepdim=True).t())
+            if input.ground_truth is not None:
+                ground_truth = input.ground_truth(state)
+            else:
+                ground_truth = None
+            self._append_estimate(
+                self._log_reward(input.gamma, mdps), estimate, ground_truth
+            )
+        logging.info(
+            f"{self}: finishing evaluating["
+            f"process_time={time.process_time() - stime}]"
+        )
+        return self.results
+
+
+SEQUENTIAL_ESTIMATORS = [
+    (LoopIPSEstimator, IPSEstimator, {"weighted": False}),
+    (LoopIPSEstimator, IPSEstimator, {"weighted": True}),
+    (LoopDREstimator, DREstimator, {"weighted": False}),
+    (LoopDREstimator, DREstimator, {"weighted": True}),
+    (LoopMAGICEstimator, MAGICEstimator, {}),
+]
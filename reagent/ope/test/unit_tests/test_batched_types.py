@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import torch
+from reagent.ope.estimators.contextual_bandits_estimators import (
+    ActionRewards,
+    BatchedActionRewards,
+)
+from reagent.ope.estimators.types import (
+    Action,
+    ActionDistribution,
+    BatchedActionDistribution,
+)
+
+
+class TestBatchedValues(unittest.TestCase):
+    def setUp(self) -> None:
+        self._values = torch.tensor(
+            [[0.5, 2.0, -1.0, 1.5], [3.0, 0.0, 1.0, 0.0], [0.0, 0.0, 4.0, 4.0]],
+            dtype=torch.double,
+        )
+        self._dists = BatchedActionDistribution(self._values)
+
+    def test_conversions(self):
+        self.assertEqual(len(self._dists), 3)
+        self.assertEqual(self._dists.num_keys, 4)
+        self.assertTrue(self._dists.is_sequence)
+        self.assertEqual(self._dists.keys, [Action(i) for i in range(4)])
+        rows = self._dists.to_values()
+        for row, values in zip(rows, self._values):
+            self.assertIsInstance(row, ActionDistribution)
+            self.assertTrue(torch.equal(row.values, values))
+        # rows are copies
+        rows[0][Action(0)] = 10.0
+        self.assertEqual(self._dists.values[0, 0].item(), 0.5)
+        batched = BatchedActionDistribution.from_values(self._dists.to_values())
+        self.assertTrue(torch.equal(batched.values, self._values))
+        rewards = BatchedActionRewards(self._values.numpy())
+        self.assertIsInstance(rewards[1], ActionRewards)
+        self.assertEqual(rewards[1][Action(0)], 3.0)
+        with self.assertRaises(ValueError):
+            BatchedActionDistribution(self._values[0])
+
+    def test_keyed_conversions(self):
+        keys = [Action(10), Action(20), Action(30)]
+        rows = [
+            ActionRewards({keys[0]: 1.0, keys[1]: 2.0, keys[2]: 3.0}),
+            ActionRewards({keys[2]: 6.0, keys[0]: 4.0, keys[1]: 5.0}),
+        ]
+        batched = BatchedActionRewards.from_values(rows)
+        self.assertFalse(batched.is_sequence)
+        self.assertEqual(batched.keys, keys)
+        self.assertTrue(
+            torch.equal(
+                batched.values,
+                torch.tensor([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]], dtype=torch.double),
+            )
+        )
+        self.assertEqual(batched.index_of(keys[2]), 2)
+        self.assertTrue(
+            torch.equal(
+                batched.probability(keys[1]),
+                torch.tensor([2.0 / 6.0, 5.0 / 15.0], dtype=torch.double),
+            )
+        )
+        self.assertEqual(batched.keys_of(batched.greedy()), [keys[2], keys[2]])
+        row = batched[1]
+        self.assertEqual(row[keys[0]], 4.0)
+        self.assertEqual(row.greedy(), keys[2])
+
+    def test_vectorized_ops(self):
+        rows = self._dists.to_values()
+        ids, values = self._dists.sort()
+        for i, row in enumerate(rows):
+            keys, row_values = row.sort()
+            self.assertTrue(torch.equal(values[i], row_values))
+            self.assertEqual(self._dists.keys_of(ids[i]), keys)
+            self.assertEqual(self._dists.keys_of(self._dists.greedy())[i], row.greedy())
+            self.assertEqual(
+                self._dists.keys_of(self._dists.greedy(2))[i], row.greedy(2)
+            )
+            for k in range(4):
+                self.assertAlmostEqual(
+                    self._dists.probability(Action(k))[i].item(),
+                    row.probability(Action(k)),
+                )
+        ids, values = self._dists.sort(descending=False)
+        self.assertTrue(torch.equal(values, self._values.sort(dim=1)[0]))
+        self.assertTrue(
+            torch.allclose(self._dists.probabilities.sum(dim=1), torch.ones(3).double())
+        )
+
+    def test_sample(self):
+        generator = torch.Generator().manual_seed(0)
+        dists = BatchedActionDistribution(self._values.repeat(2000, 1))
+        samples = dists.sample(generator=generator)
+        self.assertEqual(samples.shape, (6000,))
+        frequencies = torch.stack(
+            [
+                torch.bincount(samples[i::3], minlength=4).double() / 2000
+                for i in range(3)
+            ]
+        )
+        self.assertTrue(torch.allclose(frequencies, dists.probabilities[:3], atol=0.05))
+        samples = dists.sample(2, generator)
+        self.assertEqual(samples.shape, (6000, 2))
+        # without replacement
+        self.assertTrue((samples[:, 0] != samples[:, 1]).all())
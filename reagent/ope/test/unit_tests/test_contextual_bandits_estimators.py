@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import numpy as np
+import torch
+from reagent.ope.estimators.contextual_bandits_estimators import (
+    ActionRewards,
+    BanditsEstimatorInput,
+    BanditsModel,
+    BatchedBanditsEstimatorInput,
+    DMEstimator,
+    DoublyRobustEstimator,
+    IPSEstimator,
+    Log,
+)
+from reagent.ope.test.multiclass_bandits import MultiClassContext
+from reagent.ope.test.unit_tests.estimator_util import make_multiclass_input
+from reagent.ope.estimators.types import Action, ActionSpace
+from reagent.ope.utils import Clamper
+
+
+class ContextRewardsModel(BanditsModel):
+    def __init__(self, rewards: torch.Tensor):
+        self._rewards = rewards
+
+    def _action_rewards(self, context: MultiClassContext) -> ActionRewards:
+        return ActionRewards(self._rewards[context.query_id])
+
+
+class KeyedRewardsModel(ContextRewardsModel):
+    """Rewards keyed by action, in reverse action order"""
+
+    def _action_rewards(self, context: MultiClassContext) -> ActionRewards:
+        rewards = self._rewards[context.query_id].tolist()
+        return ActionRewards(
+            {Action(a): rewards[a] for a in reversed(range(len(rewards)))}
+        )
+
+
+class TestContextualBanditsEstimators(unittest.TestCase):
+    def setUp(self) -> None:
+        self._input = make_multiclass_input(200, 4, 3)
+
+    def test_batch_action_rewards(self):
+        rewards = torch.rand(5, 3)
+        contexts = [MultiClassContext(i) for i in [4, 0, 0, 2]]
+        self.assertTrue(
+            torch.equal(
+                ContextRewardsModel(rewards).batch(contexts, ActionSpace(3)),
+                rewards[[4, 0, 0, 2]].double(),
+            )
+        )
+        self.assertTrue(
+            torch.allclose(
+                KeyedRewardsModel(rewards).batch(contexts, ActionSpace(3)),
+                rewards[[4, 0, 0, 2]].double(),
+            )
+        )
+
+    def test_batched_keyed_model(self):
+        rewards = torch.rand(200, 4)
+        input = BanditsEstimatorInput(
+            self._input.action_space,
+            self._input.logs,
+            KeyedRewardsModel(rewards),
+            KeyedRewardsModel(rewards.flip(1)),
+        )
+        batched_input = BatchedBanditsEstimatorInput.from_input(input)
+        for estimator_class in [DMEstimator, DoublyRobustEstimator]:
+            estimator = estimator_class()
+            batched_estimator = estimator_class()
+            estimator.evaluate(input)
+            batched_estimator.evaluate(batched_input)
+            for values, batched_values in [
+                (estimator.estimated_values, batched_estimator.estimated_values),
+                (estimator.ground_truth_values, batched_estimator.ground_truth_values),
+            ]:
+                self.assertTrue(
+                    np.allclose(values, batched_values, atol=1e-12),
+                    estimator_class.__name__,
+                )
+
+    def test_batched_input(self):
+        input = BatchedBanditsEstimatorInput.from_input(self._input)
+        self.assertEqual(input.num_logs, 3)
+        self.assertEqual(input.log_ids.shape, (120,))
+        self.assertEqual(input.target_propensities.shape, (120, 4))
+        sample = next(iter(self._input.logs[1].samples))
+        self.assertEqual(input.logged_actions[40].item(), sample.logged_action.value)
+        self.assertAlmostEqual(input.logged_rewards[40].item(), sample.logged_reward)
+        self.assertTrue(
+            torch.equal(
+                input.logged_propensities[40], sample.logged_propensities.values
+            )
+        )
+
+    def test_batched_estimators(self):
+        # an empty log in the middle
+        logs = list(self._input.logs)
+        input = BanditsEstimatorInput(
+            self._input.action_space,
+            logs[:1] + [Log([])] + logs[1:],
+            self._input.target_model,
+            self._input.ground_truth_model,
+        )
+        batched_input = BatchedBanditsEstimatorInput.from_input(input)
+        for estimator_class, kwargs in [
+            (DMEstimator, {}),
+            (IPSEstimator, {}),
+            (IPSEstimator, {"weight_clamper": Clamper(0.0, 1.5)}),
+            (DoublyRobustEstimator, {}),
+            (DoublyRobustEstimator, {"weight_clamper": Clamper(0.0, 1.5)}),
+        ]:
+            estimator = estimator_class(**kwargs)
+            batched_estimator = estimator_class(**kwargs)
+            estimator.evaluate(input)
+            batched_estimator.evaluate(batched_input)
+            for values, batched_values in [
+                (estimator.logged_values, batched_estimator.logged_values),
+                (estimator.estimated_values, batched_estimator.estimated_values),
+                (estimator.ground_truth_values, batched_estimator.ground_truth_values),
+            ]:
+                self.assertEqual(len(values), 4)
+                self.assertTrue(
+                    np.allclose(values, batched_values, atol=1e-12),
+                    estimator_class.__name__,
+                )
+
+    def test_batched_empty_input(self):
+        input = BanditsEstimatorInput(
+            self._input.action_space,
+            [Log([]), Log([])],
+            self._input.target_model,
+            self._input.ground_truth_model,
+        )
+        batched_input = BatchedBanditsEstimatorInput.from_input(input)
+        self.assertEqual(batched_input.target_rewards.shape, (0, 4))
+        self.assertEqual(batched_input.ground_truth_rewards.shape, (0, 4))
+        for estimator_class in [DMEstimator, IPSEstimator, DoublyRobustEstimator]:
+            estimator = estimator_class()
+            batched_estimator = estimator_class()
+            estimator.evaluate(input)
+            batched_estimator.evaluate(batched_input)
+            self.assertEqual(batched_estimator.logged_values, estimator.logged_values)
+            self.assertEqual(
+                batched_estimator.estimated_values, estimator.estimated_values
+            )
+            self.assertEqual(
+                batched_estimator.ground_truth_values, estimator.ground_truth_values
+            )
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+from collections import Counter
+
+import torch
+from reagent.ope.estimators.sequential_estimators import (
+    RandomRLPolicy,
+    State,
+    Transition,
+)
+from reagent.ope.estimators.types import ActionSpace
+from reagent.ope.test.envs import BatchedPolicyLogGenerator, PolicyLogGenerator
+from reagent.ope.test.gridworld import GridWorld, NoiseGridWorldModel
+
+
+def _total_variation(a: Counter, b: Counter) -> float:
+    na = sum(a.values())
+    nb = sum(b.values())
+    return 0.5 * sum(abs(a[k] / na - b[k] / nb) for k in set(a) | set(b))
+
+
+class TestEnvs(unittest.TestCase):
+    def setUp(self) -> None:
+        random.seed(0)
+        torch.manual_seed(0)
+        self._gridworld = GridWorld.from_grid(
+            [
+                ["s", "0", "0", "0", "0"],
+                ["0", "0", "0", "W", "0"],
+                ["0", "0", "0", "0", "0"],
+                ["0", "W", "0", "0", "0"],
+                ["0", "0", "0", "0", "g"],
+            ],
+            max_horizon=10,
+        )
+        self._action_space = ActionSpace(4)
+        self._policy = RandomRLPolicy(self._action_space)
+        self._envs = [
+            self._gridworld,
+            NoiseGridWorldModel(
+                self._gridworld, self._action_space, epsilon=0.3, max_horizon=10
+            ),
+        ]
+
+    def test_rollouts(self):
+        for env in self._envs:
+            states = list(env.states)
+            log = BatchedPolicyLogGenerator(env, self._policy).generate_logs(states, 20)
+            self.assertEqual(list(log.keys()), states)
+            for state, mdps in log.items():
+                self.assertEqual(len(mdps), 20)
+                for mdp in mdps:
+                    self.assertEqual(mdp[0].last_state, state)
+                    self.assertLessEqual(len(mdp), 10)
+                    self.assertEqual(mdp[-1].status, Transition.Status.TERMINATED)
+                    if len(mdp) < 10:
+                        self.assertTrue(mdp[-1].state.is_terminal)
+                    for t, next_t in zip(mdp, mdp[1:]):
+                        self.assertEqual(t.state, next_t.last_state)
+                        self.assertEqual(
+                            t.status,
+                            Transition.Status.NOOP
+                            if t.state == t.last_state
+                            else Transition.Status.NORMAL,
+                        )
+                    for t in mdp:
+                        self.assertEqual(t.action_prob, 0.25)
+                        rp = env(t.last_state, t.action)[t.state]
+                        self.assertGreater(rp.prob, 0.0)
+                        self.assertEqual(t.reward, rp.reward)
+
+    def test_distributions(self):
+        num_episodes = 2000
+        start = State(self._gridworld.start)
+        for env in self._envs:
+            generator = PolicyLogGenerator(env, self._policy)
+            mdps = [generator.generate_log(start) for _ in range(num_episodes)]
+            batched_mdps = BatchedPolicyLogGenerator(env, self._policy).generate_logs(
+                [start], num_episodes
+            )[start]
+            # first step vs. the exact distribution
+            first_steps = Counter((t.action, t.state) for t, *_ in batched_mdps)
+            for (action, state), count in first_steps.items():
+                self.assertAlmostEqual(
+                    count / num_episodes,
+                    0.25 * env(start, action)[state].prob,
+                    delta=0.03,
+                )
+            # state visits and episode lengths vs. PolicyLogGenerator
+            visits, batched_visits = [
+                Counter(t.state for mdp in log for t in mdp)
+                for log in (mdps, batched_mdps)
+            ]
+            self.assertLess(_total_variation(visits, batched_visits), 0.05)
+            lengths, batched_lengths = [
+                Counter(len(mdp) for mdp in log) for log in (mdps, batched_mdps)
+            ]
+            self.assertLess(_total_variation(lengths, batched_lengths), 0.05)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import torch
+from reagent.ope.estimators.estimator import (
+    Estimator,
+    EstimatorResults,
+    ResultDiffs,
+    merge_results,
+)
+
+
+class AppendingEstimator(Estimator):
+    def evaluate(self, input, **kwargs) -> EstimatorResults:
+        self.reset()
+        logs, estimates, ground_truths = input
+        for i in range(0, logs.shape[0], 2):
+            self._append_estimate(logs[i], estimates[i], ground_truths[i])
+        self._append_estimates(logs[1::2], estimates[1::2], ground_truths[1::2])
+        return self.results
+
+
+class TestEstimator(unittest.TestCase):
+    def setUp(self) -> None:
+        self._input = (torch.rand(101), torch.rand(101), torch.rand(101))
+        self._input[1][7] = float("nan")
+        self._input[1][8] = float("inf")
+
+    def _assert_same_diffs(self, diffs: ResultDiffs, expected: ResultDiffs):
+        self.assertEqual(diffs.samples, expected.samples)
+        for a, b in [
+            (diffs.rmse, expected.rmse),
+            (diffs.bias, expected.bias),
+            (diffs.variance, expected.variance),
+        ]:
+            self.assertAlmostEqual(a.item(), b.item(), places=5)
+
+    def test_results(self):
+        results = AppendingEstimator().evaluate(self._input)
+        logs, estimates, ground_truths = self._input
+        valid = torch.isfinite(estimates)
+        self.assertEqual(results.estimates.shape[0], 99)
+        self._assert_same_diffs(
+            results.estimate_gt_diffs, ResultDiffs(estimates[valid] - logs[valid]),
+        )
+        self._assert_same_diffs(
+            results.estimate_log_diffs, ResultDiffs(logs[valid] - ground_truths[valid]),
+        )
+        self.assertTrue(
+            torch.equal(results.estimates.sort()[0], estimates[valid].float().sort()[0])
+        )
+
+    def test_retain(self):
+        estimator = AppendingEstimator()
+        results = estimator.evaluate(self._input)
+        retained_estimator = AppendingEstimator().retain(10, seed=0)
+        retained_results = retained_estimator.evaluate(self._input)
+        self.assertEqual(retained_results.estimates.shape[0], 10)
+        self.assertEqual(len(retained_estimator.logged_values), 10)
+        self.assertEqual(len(retained_estimator.ground_truth_values), 10)
+        self.assertEqual(retained_estimator.estimate_stats.count, 99)
+        self.assertAlmostEqual(
+            retained_estimator.estimate_stats.mean, estimator.estimate_stats.mean
+        )
+        self._assert_same_diffs(
+            retained_results.estimate_gt_diffs, results.estimate_gt_diffs
+        )
+        self._assert_same_diffs(
+            retained_results.estimate_log_diffs, results.estimate_log_diffs
+        )
+        # merged from the stats, not the retained values
+        merged = merge_results([retained_results, retained_results])
+        self.assertEqual(merged.estimates.shape[0], 20)
+        self.assertEqual(merged.estimate_gt_diffs.samples, 198)
+        self.assertAlmostEqual(
+            merged.estimate_gt_diffs.bias.item(),
+            results.estimate_gt_diffs.bias.item(),
+            places=5,
+        )
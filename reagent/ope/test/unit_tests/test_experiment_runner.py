@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import torch
+from reagent.ope.estimators.contextual_bandits_estimators import (
+    DMEstimator,
+    DoublyRobustEstimator,
+    IPSEstimator,
+)
+from reagent.ope.estimators.estimator import merge_results
+from reagent.ope.estimators.sequential_estimators import MAGICEstimator
+from reagent.ope.estimators.slate_estimators import (
+    IPSEstimator as SlateIPSEstimator,
+    PBMEstimator,
+)
+from reagent.ope.test.experiment_runner import (
+    job_seed,
+    num_episodes,
+    run_experiment,
+    slice_input,
+)
+from reagent.ope.test.unit_tests.estimator_util import (
+    make_gridworld_input,
+    make_multiclass_input,
+    make_mslr_input,
+)
+
+
+class TestExperimentRunner(unittest.TestCase):
+    def test_merge_results(self):
+        estimator = IPSEstimator()
+        input = make_multiclass_input(300, 4, 6)
+        results = estimator.evaluate(input)
+        merged = merge_results(
+            [
+                IPSEstimator().evaluate(slice_input(input, 0, 4)),
+                IPSEstimator().evaluate(slice_input(input, 4, 6)),
+            ]
+        )
+        self.assertTrue(torch.equal(results.logs, merged.logs))
+        self.assertTrue(torch.equal(results.estimates, merged.estimates))
+        self.assertTrue(torch.equal(results.ground_truths, merged.ground_truths))
+        self.assertAlmostEqual(
+            results.estimate_gt_diffs.rmse.item(), merged.estimate_gt_diffs.rmse.item()
+        )
+
+    def _check_run_experiment(self, input, estimators):
+        expected = [estimator.evaluate(input) for estimator in estimators]
+        for num_workers, episodes_per_job in [(0, 1), (2, 1), (2, 3)]:
+            results = run_experiment(input, estimators, num_workers, episodes_per_job)
+            for r, e in zip(results, expected):
+                self.assertEqual(len(r.estimates), num_episodes(input))
+                self.assertTrue(torch.allclose(r.estimates, e.estimates))
+                self.assertTrue(torch.allclose(r.ground_truths, e.ground_truths))
+
+    def test_run_experiment(self):
+        input = make_multiclass_input(600, 4, 7)
+        self.assertEqual(num_episodes(input), 7)
+        self._check_run_experiment(
+            input, [DMEstimator(), IPSEstimator(), DoublyRobustEstimator()]
+        )
+
+    def test_run_slate_experiment(self):
+        input = make_mslr_input(4, 5, 3)
+        self.assertEqual(num_episodes(input), 4)
+        # slate estimators don't reset in evaluate()
+        self._check_run_experiment(input, [SlateIPSEstimator(), PBMEstimator()])
+
+    def test_num_threads(self):
+        # only pool workers are limited to one thread, not this process
+        num_threads = torch.get_num_threads()
+        torch.set_num_threads(2)
+        try:
+            run_experiment(make_multiclass_input(300, 4, 2), [IPSEstimator()])
+            self.assertEqual(torch.get_num_threads(), 2)
+        finally:
+            torch.set_num_threads(num_threads)
+
+    def test_job_seeds(self):
+        self.assertEqual(job_seed(0, 1, 2), job_seed(0, 1, 2))
+        self.assertNotEqual(job_seed(0, 1, 2), job_seed(0, 2, 1))
+        # MAGIC resamples with random, seeded per job
+        input = make_gridworld_input(num_episodes=4, max_horizon=10)
+        results = [
+            run_experiment(input, [MAGICEstimator()], num_workers, num_resamples=10)[0]
+            for num_workers in [0, 2]
+        ]
+        self.assertEqual(len(results[0].estimates), len(input.log))
+        self.assertTrue(torch.equal(results[0].estimates, results[1].estimates))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import torch
+from reagent.ope.estimators.sequential_estimators import RandomRLPolicy, State
+from reagent.ope.estimators.types import ActionSpace
+from reagent.ope.test.gridworld import GAMMA, GridWorld, NoiseGridWorldModel
+from reagent.ope.trainers.rl_tabular_trainers import (
+    DPBackend,
+    DPTrainer,
+    DPValueFunction,
+    TabularModel,
+    TabularPolicy,
+)
+
+
+class TestRLTabularTrainers(unittest.TestCase):
+    def setUp(self) -> None:
+        self._gridworld = GridWorld.from_grid(
+            [
+                ["s", "0", "0", "0", "0"],
+                ["0", "0", "0", "W", "0"],
+                ["0", "0", "0", "0", "0"],
+                ["0", "W", "0", "0", "0"],
+                ["0", "0", "0", "0", "g"],
+            ]
+        )
+        self._action_space = ActionSpace(4)
+        self._model = NoiseGridWorldModel(
+            self._gridworld, self._action_space, epsilon=0.3
+        )
+
+    def test_tabular_model(self):
+        dense = TabularModel.from_model(
+            self._model, self._gridworld.states, self._action_space
+        )
+        sparse = TabularModel.from_model(
+            self._model, self._gridworld.states, self._action_space, sparse=True
+        )
+        self.assertEqual(len(dense.states), 22)
+        self.assertTrue(torch.equal(dense.rewards, sparse.rewards))
+        self.assertTrue(
+            torch.equal(
+                dense.transitions, sparse.transitions.to_dense().view(22, 4, 22)
+            )
+        )
+        # (3, 4) moves down into the goal, a terminal state
+        i = dense.state_index[State((3, 4))]
+        self.assertAlmostEqual(dense.rewards[i, 0].item(), 0.7)
+        self.assertAlmostEqual(dense.transitions[i, 0].sum().item(), 0.3)
+        values = torch.rand(22, dtype=torch.double)
+        self.assertTrue(
+            torch.allclose(
+                dense.action_values(values, GAMMA), sparse.action_values(values, GAMMA)
+            )
+        )
+
+    def test_dp_value_function(self):
+        states = list(self._gridworld.states)
+        values = {}
+        for backend in DPBackend:
+            valfunc = DPValueFunction(
+                RandomRLPolicy(self._action_space),
+                self._model,
+                GAMMA,
+                threshold=1.0e-10,
+                backend=backend,
+            )
+            values[backend] = torch.tensor([valfunc(s) for s in states])
+        for backend in [DPBackend.DENSE, DPBackend.SPARSE]:
+            self.assertTrue(
+                torch.allclose(values[backend], values[DPBackend.LOOP], atol=1.0e-8),
+                backend,
+            )
+
+    def test_dp_trainer(self):
+        states = list(self._gridworld.states)
+        policies = {}
+        values = {}
+        for backend in DPBackend:
+            policy = TabularPolicy(self._action_space)
+            valfunc = DPTrainer(self._gridworld, policy, backend).train(GAMMA)
+            policies[backend] = policy.action_dists(states)
+            values[backend] = torch.tensor([valfunc(s) for s in states])
+        for backend in [DPBackend.DENSE, DPBackend.SPARSE]:
+            self.assertTrue(torch.equal(policies[backend], policies[DPBackend.LOOP]))
+            self.assertTrue(
+                torch.allclose(values[backend], values[DPBackend.LOOP], atol=1.0e-8),
+                backend,
+            )
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+
+import numpy as np
+import torch
+from reagent.ope.estimators.sequential_estimators import (
+    DMEstimator,
+    PaddedTrajectories,
+    RandomRLPolicy,
+    RLPolicy,
+    State,
+    Transition,
+)
+from reagent.ope.estimators.types import Action, ActionDistribution, ActionSpace
+from reagent.ope.test.unit_tests.estimator_util import (
+    SEQUENTIAL_ESTIMATORS,
+    make_gridworld_input,
+)
+
+
+class KeyedRLPolicy(RLPolicy):
+    """Probability a / 6 of action a, keyed in reverse action order"""
+
+    def action_dist(self, state: State) -> ActionDistribution:
+        return ActionDistribution(
+            {Action(a): a / 6.0 for a in reversed(range(len(self.action_space)))}
+        )
+
+
+class TestSequentialEstimators(unittest.TestCase):
+    def test_padded_trajectories(self):
+        s0, s1, s2 = State(0), State(1), State(2)
+        log = {
+            s0: [
+                [
+                    Transition(s0, Action(1), 0.5, s1, 1.0),
+                    Transition(s1, Action(0), 0.25, s2, 2.0),
+                ],
+                [Transition(s0, Action(1), 0.5, s2, 3.0)],
+            ],
+            s2: [
+                [
+                    Transition(s2, Action(2), 0.75, s1, 4.0),
+                    Transition(s1, Action(0), 0.25, s0, 5.0),
+                    Transition(s0, None, 0.0, s0, 6.0),
+                ]
+            ],
+        }
+        trajectories = PaddedTrajectories.from_log(log)
+        self.assertEqual(trajectories.groups, [(s0, 0, 2, 2), (s2, 2, 3, 3)])
+        self.assertEqual(trajectories.states, [s0, s1, s2])
+        self.assertTrue(
+            torch.equal(
+                trajectories.mask,
+                torch.tensor([[1, 1, 0], [1, 0, 0], [1, 1, 1]], dtype=torch.bool),
+            )
+        )
+        self.assertTrue(
+            torch.equal(
+                trajectories.action_mask,
+                torch.tensor([[1, 1, 0], [1, 0, 0], [1, 1, 0]], dtype=torch.bool),
+            )
+        )
+        self.assertTrue(
+            torch.equal(
+                trajectories.rewards,
+                torch.tensor(
+                    [[1.0, 2.0, 0.0], [3.0, 0.0, 0.0], [4.0, 5.0, 6.0]],
+                    dtype=torch.double,
+                ),
+            )
+        )
+        self.assertTrue(
+            torch.equal(
+                trajectories.state_ids, torch.tensor([[0, 1, 0], [0, 0, 0], [2, 1, 0]])
+            )
+        )
+        self.assertTrue(
+            torch.equal(
+                trajectories.actions, torch.tensor([[1, 0, 0], [1, 0, 0], [2, 0, 0]])
+            )
+        )
+        probs = trajectories.target_probabilities(
+            RandomRLPolicy(ActionSpace(4)), trajectories.action_mask
+        )
+        self.assertTrue(
+            torch.equal(
+                probs,
+                torch.tensor(
+                    [[0.25, 0.25, 1.0], [0.25, 1.0, 1.0], [0.25, 0.25, 1.0]],
+                    dtype=torch.double,
+                ),
+            )
+        )
+
+    def test_action_dists(self):
+        policy = RandomRLPolicy(ActionSpace(4))
+        self.assertTrue(
+            torch.equal(
+                policy.action_dists([State(0), State(1)]), torch.full((2, 4), 0.25)
+            )
+        )
+        policy = KeyedRLPolicy(ActionSpace(4))
+        states = [State(0), State(1)]
+        dists = policy.action_dists(states)
+        self.assertTrue(
+            torch.allclose(dists, torch.tensor([0.0, 1.0, 2.0, 3.0]).repeat(2, 1) / 6)
+        )
+        for state, row in zip(states, dists):
+            dist = policy(state)
+            for a in policy.action_space:
+                self.assertAlmostEqual(row[a.value].item(), dist[a], places=6)
+
+    def test_vectorized_estimators(self):
+        input = make_gridworld_input(num_episodes=5, max_horizon=20)
+        for loop_class, estimator_class, kwargs in SEQUENTIAL_ESTIMATORS:
+            estimator = loop_class(**kwargs)
+            vectorized_estimator = estimator_class(**kwargs)
+            # same resamples for MAGIC
+            random.seed(0)
+            estimator.evaluate(input, num_resamples=10)
+            random.seed(0)
+            vectorized_estimator.evaluate(input, num_resamples=10)
+            for values, vectorized_values in [
+                (estimator.logged_values, vectorized_estimator.logged_values),
+                (estimator.estimated_values, vectorized_estimator.estimated_values),
+                (
+                    estimator.ground_truth_values,
+                    vectorized_estimator.ground_truth_values,
+                ),
+            ]:
+                self.assertEqual(len(values), len(input.log))
+                self.assertTrue(
+                    np.allclose(
+                        [float(v) for v in values],
+                        [float(v) for v in vectorized_values],
+                        atol=1e-6,
+                    ),
+                    repr(vectorized_estimator),
+                )
+        # DM shares the logged values
+        dm_estimator = DMEstimator()
+        dm_estimator.evaluate(input)
+        self.assertTrue(
+            np.allclose(dm_estimator.logged_values, vectorized_estimator.logged_values)
+        )
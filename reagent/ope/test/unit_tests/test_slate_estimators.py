@@ -2,19 +2,69 @@
 
 import random
 import unittest
+from collections import Counter
 from functools import reduce
+from itertools import permutations
 
+import numpy as np
 import torch
 from reagent.ope.estimators.slate_estimators import (
+    BatchedSlateEstimatorInput,
     DCGSlateMetric,
+    DMEstimator,
+    IPSEstimator,
+    LogEpisode,
+    LogSample,
     NDCGSlateMetric,
+    PBMEstimator,
+    PseudoInverseEstimator,
     Slate,
+    SlateContext,
+    SlateEstimatorInput,
     SlateItem,
     SlateItemProbabilities,
     SlateItemValues,
+    SlateModel,
+    SlateQuery,
     SlateSlotItemProbabilities,
     SlateSlots,
+    SlateSlotValues,
+    SlotItemExpectationMode,
+    quadrature_slot_item_expectations,
+    sample_slates,
+    sample_slot_item_slates,
+    slate_probabilities,
+    slot_item_counts,
+    subset_dp_slot_item_expectations,
 )
+from reagent.ope.test.unit_tests.estimator_util import (
+    batched_sample_expectations,
+    loop_sample_expectations,
+    make_mslr_input,
+    make_yandex_input,
+)
+from scipy.stats import chi2_contingency
+
+
+def enumerate_slot_item_expectations(slot_probs: torch.Tensor) -> torch.Tensor:
+    """ Exact expectations, enumerating all slates of sequential sampling """
+    slate_size, item_size = slot_probs.shape
+    expectations = torch.zeros(slate_size, item_size, dtype=torch.double)
+    for slate in permutations(range(item_size), slate_size):
+        p = 1.0
+        for slot, item in enumerate(slate):
+            probs = slot_probs[slot]
+            p *= (probs[item] / (probs.sum() - probs[list(slate[:slot])].sum())).item()
+        expectations[range(slate_size), slate] += p
+    return expectations
+
+
+class QueryItemRewardsModel(SlateModel):
+    def __init__(self, item_rewards):
+        self._item_rewards = item_rewards
+
+    def item_rewards(self, context: SlateContext) -> SlateItemValues:
+        return SlateItemValues(self._item_rewards[context.query.value])
 
 
 class TestEstimator(unittest.TestCase):
@@ -55,12 +105,115 @@ class TestEstimator(unittest.TestCase):
         slot_rewards = slot_item_expectations.expected_rewards(
             SlateItemValues(self._item_rewards)
         )
-        diff = slot_rewards.values - torch.tensor([1.818, 2.449, 4.353])
+        diff = slot_rewards.values - torch.tensor([1.81818, 2.58645, 4.41642])
         self.assertAlmostEqual(diff.sum().item(), 0, places=5)
         for d in slot_item_expectations.items:
             sum = reduce(lambda a, b: a + b, d.values)
             self.assertAlmostEqual(sum.item(), 1.0)
 
+    def test_slot_item_counts(self):
+        samples = torch.tensor([[0, 2], [2, 0], [0, 1]])
+        self.assertEqual(slot_item_counts(samples, 3).tolist(), [[2, 0, 1], [1, 1, 1]])
+
+    def test_sample_slates(self):
+        probs = torch.tensor(self._item_relevances, dtype=torch.double)
+        probs /= probs.sum()
+        num_samples = 20000
+        samples = sample_slates(probs, self._slate_size, num_samples)
+        self.assertEqual(samples.shape, (num_samples, self._slate_size))
+        reference = torch.multinomial(probs.repeat((num_samples, 1)), self._slate_size)
+        # Same distribution of slates as the sequential sampler
+        counts = [Counter(tuple(x) for x in s.tolist()) for s in [samples, reference]]
+        slates = sorted(set(counts[0]) | set(counts[1]))
+        _, p_value, _, _ = chi2_contingency(
+            np.array([[c[slate] for slate in slates] for c in counts])
+        )
+        self.assertGreater(p_value, 0.001)
+        # Same slot item expectations as the former sampler, and as the
+        # exact ones
+        expectations = [
+            f(probs, self._slate_size, num_samples)
+            for f in [batched_sample_expectations, loop_sample_expectations]
+        ]
+        exact = enumerate_slot_item_expectations(probs.repeat((self._slate_size, 1)))
+        for e in expectations:
+            self.assertTrue(torch.allclose(e, exact, atol=0.015))
+            self.assertTrue(torch.allclose(e.sum(dim=1), torch.ones(3).double()))
+
+    def test_sample_slot_item_slates(self):
+        probs = SlateSlotItemProbabilities(
+            [SlateItemValues(vs) for vs in self._slot_item_relevances]
+        )
+        samples = sample_slot_item_slates(probs.values_tensor(), 20000)
+        self.assertTrue(
+            all(len(set(slate)) == self._slate_size for slate in samples.tolist())
+        )
+        exact = enumerate_slot_item_expectations(probs.values_tensor())
+        self.assertTrue(
+            torch.allclose(slot_item_counts(samples, 5) / 20000, exact, atol=0.015)
+        )
+        probs._sample_expectations(20000)
+        self.assertTrue(
+            torch.allclose(
+                probs._slot_item_expectations.values_tensor(), exact, atol=0.015
+            )
+        )
+
+    def test_exact_slot_item_expectations(self):
+        for item_size, slate_size in [(5, 1), (5, 3), (6, 6), (8, 4)]:
+            weights = torch.rand(item_size, dtype=torch.double) + 0.01
+            # from uniform to very skewed probabilities
+            for scale in [0.0, 1.0, 10.0]:
+                probs = (weights * scale).exp()
+                exact = enumerate_slot_item_expectations(probs.repeat((slate_size, 1)))
+                self.assertTrue(
+                    torch.allclose(
+                        subset_dp_slot_item_expectations(probs.repeat((slate_size, 1))),
+                        exact,
+                        atol=1e-12,
+                    )
+                )
+                self.assertTrue(
+                    torch.allclose(
+                        quadrature_slot_item_expectations(probs, slate_size),
+                        exact,
+                        atol=1e-10,
+                    )
+                )
+            slot_probs = torch.rand(slate_size, item_size, dtype=torch.double)
+            self.assertTrue(
+                torch.allclose(
+                    subset_dp_slot_item_expectations(slot_probs),
+                    enumerate_slot_item_expectations(slot_probs),
+                    atol=1e-12,
+                )
+            )
+        # Items with zero probability are never in the slates
+        dm = subset_dp_slot_item_expectations(
+            torch.tensor([[0.0, 1.0, 2.0, 0.0, 3.0]] * 3)
+        )
+        self.assertEqual(dm[:, [0, 3]].abs().sum().item(), 0.0)
+        self.assertTrue(torch.allclose(dm.sum(dim=1), torch.ones(3).double()))
+
+    def test_expectation_modes(self):
+        slots = SlateSlots(self._slate_size)
+        expectations = {
+            mode: SlateItemProbabilities(self._item_relevances, expectation_mode=mode)
+            .slot_item_expectations(slots)
+            .values_tensor()
+            for mode in SlotItemExpectationMode
+        }
+        exact = expectations[SlotItemExpectationMode.ENUMERATE]
+        for mode, dm in expectations.items():
+            atol = 0.015 if mode == SlotItemExpectationMode.SAMPLE else 1e-10
+            self.assertTrue(torch.allclose(dm, exact, atol=atol), mode)
+        # Large item sets
+        probs = SlateItemProbabilities(torch.rand(60).tolist())
+        dm = probs.slot_item_expectations(SlateSlots(8)).values_tensor()
+        self.assertEqual(dm.shape, (8, 60))
+        self.assertTrue(torch.allclose(dm.sum(dim=1), torch.ones(8).double()))
+        self.assertTrue((dm.sum(dim=0) <= 1.0 + 1e-10).all())
+
     def test_metrics(self):
         dcg = DCGSlateMetric()
         ndcg = NDCGSlateMetric(SlateItemValues([1.0, 2.5, 2.0, 3.0, 1.5, 0.0]))
@@ -75,3 +228,107 @@ class TestEstimator(unittest.TestCase):
         self.assertAlmostEqual(reward, 7.463857073)
         reward = ndcg(slate.slots, slate.slot_values(item_rewards))
         self.assertAlmostEqual(reward, 0.652540703)
+
+    def test_slate_probabilities(self):
+        probs = SlateItemProbabilities(self._item_relevances)
+        slates = [probs.sample_slate(self._slots) for _ in range(10)]
+        item_probs = torch.tensor(
+            [[probs.probability(i) for i in slate.items] for slate in slates]
+        )
+        expected = torch.tensor([probs.slate_probability(s) for s in slates])
+        self.assertTrue(torch.allclose(slate_probabilities(item_probs), expected))
+        # padding slots
+        slot_mask = torch.tensor([[True, True, False]] * len(slates))
+        expected = torch.tensor(
+            [probs.slate_probability(Slate(s.items[:2])) for s in slates]
+        )
+        self.assertTrue(
+            torch.allclose(slate_probabilities(item_probs, slot_mask), expected)
+        )
+
+    def _assert_same_results(self, input: SlateEstimatorInput):
+        batched_input = BatchedSlateEstimatorInput.from_input(input)
+        for estimator_class in [
+            DMEstimator,
+            IPSEstimator,
+            PseudoInverseEstimator,
+            PBMEstimator,
+        ]:
+            for weighted in [True, False] if estimator_class != DMEstimator else [None]:
+                kwargs = {} if weighted is None else {"weighted": weighted}
+                estimator = estimator_class(**kwargs)
+                batched_estimator = estimator_class(**kwargs)
+                estimator.evaluate(input)
+                batched_estimator.evaluate(batched_input)
+                for values, batched_values in [
+                    (estimator.logged_values, batched_estimator.logged_values),
+                    (estimator.estimated_values, batched_estimator.estimated_values),
+                    (
+                        estimator.ground_truth_values,
+                        batched_estimator.ground_truth_values,
+                    ),
+                ]:
+                    self.assertEqual(len(values), len(batched_values))
+                    self.assertTrue(
+                        np.allclose(
+                            [float(v) for v in values], batched_values, atol=1e-12
+                        ),
+                        estimator_class.__name__,
+                    )
+
+    def test_batched_estimators(self):
+        self._assert_same_results(make_mslr_input(6, 20, 3))
+        self._assert_same_results(make_mslr_input(4, 10, 2, tgt_deterministic=True))
+        self._assert_same_results(make_yandex_input(4, 10))
+        # different slate and item sizes, slot item probabilities (not
+        # batched), logged slate probabilities, missing target distribution
+        # and ground truth, and an episode without samples
+        log_probs = SlateSlotItemProbabilities(
+            [SlateItemValues(vs) for vs in self._slot_item_relevances]
+        )
+        small_probs = SlateItemProbabilities([1.0, 3.0, 2.0, 0.5])
+        slots = SlateSlots(2)
+        small_slates = [small_probs.sample_slate(slots) for _ in range(5)]
+        episodes = [
+            LogEpisode(
+                SlateContext(SlateQuery(0), self._slots),
+                DCGSlateMetric(),
+                [
+                    LogSample(
+                        slate,
+                        slate.slot_values(SlateItemValues(self._item_rewards)),
+                        SlateSlotValues([1.0, 0.5, 0.2]),
+                    )
+                    for slate in [log_probs.sample_slate(self._slots) for _ in range(5)]
+                ],
+                _log_slot_item_probabilities=log_probs,
+                _tgt_item_probabilities=SlateItemProbabilities(self._item_relevances),
+                gt_item_rewards=SlateItemValues(self._item_rewards),
+            ),
+            LogEpisode(
+                SlateContext(SlateQuery(1), slots),
+                NDCGSlateMetric(SlateItemValues([1.0, 2.0, 0.0, 1.0])),
+                [
+                    LogSample(
+                        slate,
+                        SlateSlotValues([1.0, 0.0]),
+                        log_slate_probability=0.9
+                        * small_probs.slate_probability(slate),
+                        tgt_slate_probability=0.1,
+                    )
+                    for slate in small_slates
+                ],
+                _log_item_probabilities=small_probs,
+            ),
+            LogEpisode(
+                SlateContext(SlateQuery(1), slots),
+                NDCGSlateMetric(SlateItemValues([1.0, 2.0, 0.0, 1.0])),
+                [],
+                _log_item_probabilities=small_probs,
+                _tgt_item_probabilities=SlateItemProbabilities([1.0, 1.0, 1.0, 1.0]),
+            ),
+        ]
+        tgt_model = QueryItemRewardsModel(
+            {0: [2.0, 1.0, 0.0, 1.0, 3.0], 1: [0.5, 1.0, 1.5, 2.0]}
+        )
+        self._assert_same_results(SlateEstimatorInput(episodes, tgt_model))
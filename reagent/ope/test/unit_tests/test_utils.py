@@ -4,7 +4,7 @@ import unittest
 
 import numpy as np
 import torch
-from reagent.ope.utils import Clamper, RunningAverage
+from reagent.ope.utils import Clamper, Reservoir, RunningAverage, RunningStats
 
 
 class TestUtils(unittest.TestCase):
@@ -15,6 +15,36 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(ra.average, 2.5)
         self.assertEqual(ra.total, 10.0)
 
+    def test_running_stats(self):
+        values = torch.randn(101, dtype=torch.double) * 3.0 + 1.0
+        stats = RunningStats()
+        for v in values[:50]:
+            stats.add(v)
+        stats.merge(RunningStats().add_batch(values[50:80]))
+        stats.add_batch(values[80:])
+        self.assertEqual(stats.count, 101)
+        self.assertAlmostEqual(stats.mean, values.mean().item())
+        self.assertAlmostEqual(stats.variance, values.var().item())
+        self.assertAlmostEqual(stats.rms, values.pow(2).mean().sqrt().item())
+        self.assertTrue(np.isnan(RunningStats().mean))
+        self.assertTrue(np.isnan(RunningStats().add(1.0).variance))
+
+    def test_reservoir(self):
+        reservoir = Reservoir()
+        for i in range(10):
+            reservoir.add(i)
+        self.assertEqual(reservoir.values, list(range(10)))
+        # each value is retained with probability size / count
+        counts = np.zeros(10)
+        for seed in range(2000):
+            reservoir = Reservoir(3, seed)
+            for i in range(10):
+                reservoir.add(i)
+            self.assertEqual(reservoir.count, 10)
+            self.assertEqual(len(reservoir.values), 3)
+            counts[reservoir.values] += 1
+        self.assertTrue(np.allclose(counts / 2000, 0.3, atol=0.05))
+
     def test_clamper(self):
         with self.assertRaises(ValueError):
             clamper = Clamper(1.0, 0.0)
@@ -1,20 +1,21 @@
 #!/usr/bin/env python3
 
 import pickle
+from dataclasses import dataclass
+from enum import Enum
 from functools import reduce
-from typing import Mapping, Sequence
+from typing import Iterable, Mapping, Sequence
 
 import torch
-from reagent.ope.estimators.estimator import (
-    Action,
-    ActionDistribution,
-    ActionSpace,
+from reagent.ope.estimators.sequential_estimators import (
     Model,
     RLPolicy,
     State,
     ValueFunction,
 )
+from reagent.ope.estimators.types import Action, ActionDistribution, ActionSpace
 from reagent.ope.test.envs import Environment, PolicyLogGenerator
+from torch import Tensor
 
 
 class TabularPolicy(RLPolicy):
@@ -100,6 +101,87 @@ class TabularValueFunction(ValueFunction):
         pass
 
 
+class DPBackend(Enum):
+    # sweeps over dicts of states, one state, action and next state at a time
+    LOOP = "loop"
+    # batched matrix products over [S, A, S] transition tensors
+    DENSE = "dense"
+    # same as DENSE, with a sparse [S * A, S] matrix, for large state spaces
+    SPARSE = "sparse"
+
+
+@dataclass(frozen=True)
+class TabularModel:
+    """
+    A model over enumerated states as tensors: expected rewards, [S, A], and
+    transition probabilities, [S, A, S] dense or [S * A, S] sparse. Next
+    states which are terminal or not enumerated are left out of the
+    transitions, their values being 0.0 in DP
+    """
+
+    states: Sequence[State]
+    state_index: Mapping[State, int]
+    rewards: Tensor
+    transitions: Tensor
+
+    @staticmethod
+    def from_model(
+        model: Model,
+        states: Iterable[State],
+        action_space: ActionSpace,
+        sparse: bool = False,
+    ) -> "TabularModel":
+        states = list(states)
+        state_index = {s: i for i, s in enumerate(states)}
+        num_actions = len(action_space)
+        rewards = []
+        rows, cols, probs = [], [], []
+        for i, state in enumerate(states):
+            state_rewards = [0.0] * num_actions
+            for action in action_space:
+                for s, rp in model(state, action).items():
+                    state_rewards[action.value] += rp.prob * rp.reward
+                    if s is None or s.is_terminal or s not in state_index:
+                        continue
+                    rows.append(i * num_actions + action.value)
+                    cols.append(state_index[s])
+                    probs.append(rp.prob)
+            rewards.append(state_rewards)
+        transitions = torch.sparse_coo_tensor(
+            torch.tensor([rows, cols], dtype=torch.long).view(2, -1),
+            torch.tensor(probs, dtype=torch.double),
+            (len(states) * num_actions, len(states)),
+        ).coalesce()
+        if not sparse:
+            transitions = transitions.to_dense().view(
+                len(states), num_actions, len(states)
+            )
+        return TabularModel(
+            states,
+            state_index,
+            torch.tensor(rewards, dtype=torch.double).view(len(states), num_actions),
+            transitions,
+        )
+
+    def action_values(self, state_values: Tensor, gamma: float) -> Tensor:
+        """
+        Expected reward plus discounted next state value of each state-action
+        Args:
+            state_values: values of the states, [S]
+            gamma: discount
+
+        Returns:
+            state-action values, [S, A]
+        """
+        if self.transitions.is_sparse:
+            next_values = torch.sparse.mm(
+                self.transitions, state_values.unsqueeze(1)
+            ).view(self.rewards.shape)
+        else:
+            next_values = torch.matmul(self.transitions, state_values)
+        return self.rewards + gamma * next_values
+
+
 class DPValueFunction(TabularValueFunction):
     def __init__(
         self,
@@ -107,11 +189,25 @@ class DPValueFunction(TabularValueFunction):
         env: Environment,
         gamma: float = 0.99,
         threshold: float = 0.0001,
+        backend: DPBackend = DPBackend.LOOP,
     ):
         super().__init__(policy, env, gamma)
         self._env = env
         self._threshold = threshold
         self._evaluated = False
+        self._backend = backend
+        self._tabular_model = None
+
+    @property
+    def tabular_model(self) -> TabularModel:
+        if self._tabular_model is None:
+            self._tabular_model = TabularModel.from_model(
+                self._model,
+                self._env.states,
+                self._policy.action_space,
+                self._backend == DPBackend.SPARSE,
+            )
+        return self._tabular_model
 
     def state_value(self, state: State, horizon: int = -1) -> float:
         if not self._evaluated:
@@ -124,6 +220,31 @@ class DPValueFunction(TabularValueFunction):
             self._state_values.clear()
 
     def _evaluate(self):
+        if self._backend == DPBackend.LOOP:
+            self._evaluate_loop()
+        else:
+            self._evaluate_tabular()
+
+    def _evaluate_tabular(self):
+        """
+        Same as _evaluate_loop(), except that a sweep updates all states at
+        once from the previous values
+        """
+        model = self.tabular_model
+        if len(model.states) > 0:
+            probs = self._policy.action_dists(model.states).to(dtype=torch.double)
+            values = torch.tensor(
+                [self._state_value(s) for s in model.states], dtype=torch.double
+            )
+            delta = float("inf")
+            while delta >= self._threshold:
+                new_values = (probs * model.action_values(values, self._gamma)).sum(1)
+                delta = (new_values - values).abs().max().item()
+                values = new_values
+            self._state_values.update(zip(model.states, values.tolist()))
+        self._evaluated = True
+
+    def _evaluate_loop(self):
         delta = float("inf")
         while delta >= self._threshold:
             delta = 0.0
@@ -145,17 +266,48 @@ class DPValueFunction(TabularValueFunction):
 
 
 class DPTrainer(object):
-    def __init__(self, env: Environment, policy: TabularPolicy):
+    def __init__(
+        self,
+        env: Environment,
+        policy: TabularPolicy,
+        backend: DPBackend = DPBackend.LOOP,
+    ):
         self._env = env
         self._policy = policy
+        self._backend = backend
 
     @staticmethod
     def _state_value(state: State, state_values: Mapping[State, float]) -> float:
         return 0.0 if state not in state_values else state_values[state]
 
     def train(self, gamma: float = 0.9, threshold: float = 0.0001):
+        valfunc = DPValueFunction(
+            self._policy, self._env, gamma, threshold, self._backend
+        )
+        if self._backend == DPBackend.LOOP:
+            self._train_loop(valfunc, gamma)
+        else:
+            self._train_tabular(valfunc, gamma)
+        return valfunc
+
+    def _train_tabular(self, valfunc: DPValueFunction, gamma: float):
+        model = valfunc.tabular_model
+        stable = False
+        while not stable:
+            stable = True
+            action_values = model.action_values(
+                valfunc.state_values(model.states), gamma
+            )
+            # uniform over the actions of max value
+            greedy = action_values.eq(action_values.max(1, keepdim=True)[0]).double()
+            greedy /= greedy.sum(1, keepdim=True)
+            for state, actions in zip(model.states, greedy.tolist()):
+                if self._policy.update(state, actions) >= 1.0e-6:
+                    stable = False
+            valfunc.reset()
+
+    def _train_loop(self, valfunc: DPValueFunction, gamma: float):
         stable = False
-        valfunc = DPValueFunction(self._policy, self._env, gamma, threshold)
         while not stable:
             stable = True
             for state in self._env.states:
@@ -180,7 +332,6 @@ class DPTrainer(object):
                 if self._policy.update(state, actions) >= 1.0e-6:
                     stable = False
             valfunc.reset()
-        return valfunc
 
 
 class MonteCarloValueFunction(TabularValueFunction):
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
+import math
+import random
 from collections import OrderedDict
-from typing import Sequence, Union
+from typing import Any, List, Optional, Sequence, Union
 
 import numpy as np
 import torch
@@ -64,6 +66,103 @@ class RunningAverage:
         return self._average * self._count
 
 
+class RunningStats:
+    """
+    Count, mean and sum of squared deviations of a stream of values, updated
+    one value at a time (Welford) or a batch at a time (Chan et al.)
+    """
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self._count = count
+        self._mean = mean
+        self._m2 = m2
+
+    def add(self, value) -> "RunningStats":
+        value = float(value)
+        self._count += 1
+        delta = value - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (value - self._mean)
+        return self
+
+    def add_batch(self, values: torch.Tensor) -> "RunningStats":
+        if values.numel() == 0:
+            return self
+        values = values.double()
+        mean = values.mean()
+        return self.merge(
+            RunningStats(
+                values.numel(), mean.item(), (values - mean).pow(2).sum().item()
+            )
+        )
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        count = self._count + other._count
+        if count > 0:
+            delta = other._mean - self._mean
+            self._m2 += other._m2 + delta * delta * self._count * other._count / count
+            self._mean += delta * other._count / count
+            self._count = count
+        return self
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self._count > 0 else float("nan")
+
+    @property
+    def variance(self) -> float:
+        """ Unbiased, as torch.var() """
+        return self._m2 / (self._count - 1) if self._count > 1 else float("nan")
+
+    @property
+    def rms(self) -> float:
+        """ Root mean square """
+        if self._count == 0:
+            return float("nan")
+        return math.sqrt(max(self._m2 / self._count + self._mean * self._mean, 0.0))
+
+
+class Reservoir:
+    """
+    Uniform random sample of at most size values of a stream (algorithm R),
+    or all of them if size is None
+    """
+
+    def __init__(self, size: Optional[int] = None, seed: Optional[int] = None):
+        self._size = size
+        self._count = 0
+        self._values = []
+        # not the global random, which estimators may be seeded with
+        self._random = random.Random(seed)
+
+    def add(self, value: Any) -> "Reservoir":
+        self._count += 1
+        if self._size is None or len(self._values) < self._size:
+            self._values.append(value)
+        else:
+            i = self._random.randrange(self._count)
+            if i < self._size:
+                self._values[i] = value
+        return self
+
+    def clear(self):
+        self._count = 0
+        self._values.clear()
+
+    @property
+    def values(self) -> List[Any]:
+        return self._values
+
+    @property
+    def count(self) -> int:
+        """ Number of values added """
+        return self._count
+
+
 class Clamper:
     def __init__(self, min: float = None, max: float = None):
         self._min = min if min is not None else float("-inf")
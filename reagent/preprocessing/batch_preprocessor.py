@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from typing import Dict
+from typing import Dict, List, Tuple
 
 import torch
 import torch.nn.functional as F
@@ -54,22 +54,59 @@ def batch_to_device(batch: Dict[str, torch.Tensor], device: torch.device):
     return out
 
 
+def preprocess_stacked(
+    preprocessor: Preprocessor, inputs: List[Tuple[torch.Tensor, torch.Tensor]]
+) -> List[torch.Tensor]:
+    """
+    Runs `preprocessor` once on the (value, presence) inputs concatenated along
+    the batch dimension and splits the output back. `Preprocessor` is
+    row-wise, so this is equivalent to one call per input.
+    """
+    if len(inputs) == 1:
+        return [preprocessor(*inputs[0])]
+    values = torch.cat([value for value, _ in inputs])
+    presence = torch.cat([presence for _, presence in inputs])
+    output = preprocessor(values, presence)
+    return list(torch.split(output, [value.shape[0] for value, _ in inputs]))
+
+
+def preprocess_all(
+    preprocessor: Preprocessor,
+    inputs: List[Tuple[torch.Tensor, torch.Tensor]],
+    stack: bool,
+) -> List[torch.Tensor]:
+    if stack:
+        return preprocess_stacked(preprocessor, inputs)
+    return [preprocessor(value, presence) for value, presence in inputs]
+
+
 class DiscreteDqnBatchPreprocessor(BatchPreprocessor):
     def __init__(
-        self, num_actions: int, state_preprocessor: Preprocessor, use_gpu: bool
+        self,
+        num_actions: int,
+        state_preprocessor: Preprocessor,
+        use_gpu: bool,
+        stack_preprocessing: bool = False,
     ):
+        """
+        If `stack_preprocessing` is set, state and next state are preprocessed
+        in a single call on a 2B-row batch.
+        """
         self.num_actions = num_actions
         self.state_preprocessor = state_preprocessor
         self.device = torch.device("cuda") if use_gpu else torch.device("cpu")
+        self.stack_preprocessing = stack_preprocessing
 
     # TODO: remove type ignore after converting rest of BatchPreprocessors to Dict input
     def __call__(self, batch: Dict[str, torch.Tensor]) -> rlt.DiscreteDqnInput:
         batch = batch_to_device(batch, self.device)
-        preprocessed_state = self.state_preprocessor(
-            batch["state_features"], batch["state_features_presence"]
-        )
-        preprocessed_next_state = self.state_preprocessor(
-            batch["next_state_features"], batch["next_state_features_presence"]
+        preprocessed_state, preprocessed_next_state = preprocess_all(
+            self.state_preprocessor,
+            [
+                (batch["state_features"], batch["state_features_presence"]),
+                (batch["next_state_features"], batch["next_state_features_presence"]),
+            ],
+            self.stack_preprocessing,
         )
         # not terminal iff at least one possible for next action
         not_terminal = batch["possible_next_actions_mask"].max(dim=1)[0].float()
@@ -99,46 +136,58 @@ class DiscreteDqnBatchPreprocessor(BatchPreprocessor):
 
 class ParametricDqnBatchPreprocessor(BatchPreprocessor):
     def __init__(
-        self, state_preprocessor: Preprocessor, action_preprocessor: Preprocessor
+        self,
+        state_preprocessor: Preprocessor,
+        action_preprocessor: Preprocessor,
+        stack_preprocessing: bool = False,
     ):
+        """
+        If `stack_preprocessing` is set, all the states (resp. actions) are
+        preprocessed in a single call on the stacked batch.
+        """
         self.state_preprocessor = state_preprocessor
         self.action_preprocessor = action_preprocessor
+        self.stack_preprocessing = stack_preprocessing
 
     def __call__(self, batch: rlt.RawTrainingBatch) -> rlt.PreprocessedTrainingBatch:
         training_input = batch.training_input
         assert isinstance(
             training_input, rlt.RawParametricDqnInput
         ), "Wrong Type: {}".format(str(type(training_input)))
-        preprocessed_state = self.state_preprocessor(
-            training_input.state.float_features.value,
-            training_input.state.float_features.presence,
-        )
-        preprocessed_next_state = self.state_preprocessor(
-            training_input.next_state.float_features.value,
-            training_input.next_state.float_features.presence,
-        )
         assert isinstance(training_input.action, rlt.RawFeatureData)
-        preprocessed_action = self.action_preprocessor(
-            training_input.action.float_features.value,
-            training_input.action.float_features.presence,
-        )
-
-        assert isinstance(training_input, rlt.RawParametricDqnInput)
-        preprocessed_tiled_next_state = self.state_preprocessor(
-            training_input.tiled_next_state.float_features.value,
-            training_input.tiled_next_state.float_features.presence,
-        )
-        preprocessed_next_action = self.action_preprocessor(
-            training_input.next_action.float_features.value,
-            training_input.next_action.float_features.presence,
-        )
-        preprocessed_possible_actions = self.action_preprocessor(
-            training_input.possible_actions.float_features.value,
-            training_input.possible_actions.float_features.presence,
-        )
-        preprocessed_possible_next_actions = self.action_preprocessor(
-            training_input.possible_next_actions.float_features.value,
-            training_input.possible_next_actions.float_features.presence,
+        (
+            preprocessed_state,
+            preprocessed_next_state,
+            preprocessed_tiled_next_state,
+        ) = preprocess_all(
+            self.state_preprocessor,
+            [
+                (f.float_features.value, f.float_features.presence)
+                for f in (
+                    training_input.state,
+                    training_input.next_state,
+                    training_input.tiled_next_state,
+                )
+            ],
+            self.stack_preprocessing,
+        )
+        (
+            preprocessed_action,
+            preprocessed_next_action,
+            preprocessed_possible_actions,
+            preprocessed_possible_next_actions,
+        ) = preprocess_all(
+            self.action_preprocessor,
+            [
+                (f.float_features.value, f.float_features.presence)
+                for f in (
+                    training_input.action,
+                    training_input.next_action,
+                    training_input.possible_actions,
+                    training_input.possible_next_actions,
+                )
+            ],
+            self.stack_preprocessing,
         )
         return batch.preprocess(
             training_input=training_input.preprocess_tensors(
@@ -159,25 +208,35 @@ class PolicyNetworkBatchPreprocessor(BatchPreprocessor):
         state_preprocessor: Preprocessor,
         action_preprocessor: Preprocessor,
         use_gpu: bool,
+        stack_preprocessing: bool = False,
     ):
+        """
+        If `stack_preprocessing` is set, state and next state (resp. action and
+        next action) are preprocessed in a single call on a 2B-row batch.
+        """
         self.state_preprocessor = state_preprocessor
         self.action_preprocessor = action_preprocessor
         self.device = torch.device("cuda") if use_gpu else torch.device("cpu")
+        self.stack_preprocessing = stack_preprocessing
 
     # TODO: remove type ignore after converting rest of BatchPreprocessors to Dict input
     def __call__(self, batch: Dict[str, torch.Tensor]) -> rlt.PolicyNetworkInput:
         batch = batch_to_device(batch, self.device)
-        preprocessed_state = self.state_preprocessor(
-            batch["state_features"], batch["state_features_presence"]
-        )
-        preprocessed_next_state = self.state_preprocessor(
-            batch["next_state_features"], batch["next_state_features_presence"]
-        )
-        preprocessed_action = self.action_preprocessor(
-            batch["action"], batch["action_presence"]
-        )
-        preprocessed_next_action = self.action_preprocessor(
-            batch["next_action"], batch["next_action_presence"]
+        preprocessed_state, preprocessed_next_state = preprocess_all(
+            self.state_preprocessor,
+            [
+                (batch["state_features"], batch["state_features_presence"]),
+                (batch["next_state_features"], batch["next_state_features_presence"]),
+            ],
+            self.stack_preprocessing,
+        )
+        preprocessed_action, preprocessed_next_action = preprocess_all(
+            self.action_preprocessor,
+            [
+                (batch["action"], batch["action_presence"]),
+                (batch["next_action"], batch["next_action_presence"]),
+            ],
+            self.stack_preprocessing,
         )
         return rlt.PolicyNetworkInput(
             state=rlt.FeatureData(preprocessed_state),
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from reagent.preprocessing.identify_types import (
+    BINARY,
+    BOXCOX,
+    CONTINUOUS,
+    CONTINUOUS_ACTION,
+    DO_NOT_PREPROCESS,
+    ENUM,
+    FEATURE_TYPES,
+    PROBABILITY,
+    QUANTILE,
+)
+from reagent.preprocessing.normalization import (
+    EPS,
+    MAX_FEATURE_VALUE,
+    MIN_FEATURE_VALUE,
+    NormalizationParameters,
+    sort_features_by_normalization,
+)
+from torch.nn import Module, Parameter
+
+
+logger = logging.getLogger(__name__)
+
+
+class FastPreprocessor(Module):
+    """
+    Single-pass, TorchScript-compatible equivalent of `Preprocessor`.
+
+    Takes the same inputs (a JxF matrix with columns sorted by feature type, and
+    its presence mask) and produces the same output, but:
+        - all ENUM features are one-hot encoded with a single gather + compare;
+        - QUANTILE uses `torch.searchsorted` instead of a dense JxFxB comparison,
+          so memory is O(J*F) instead of O(J*F*B);
+        - every feature type writes into one preallocated output, and presence
+          is applied once through a precomputed output -> input permutation.
+
+    The module can be passed to `torch.jit.script()`.
+    """
+
+    __constants__ = ["eps", "min_feature_value", "max_feature_value"]
+
+    def __init__(
+        self,
+        normalization_parameters: Dict[int, NormalizationParameters],
+        device: Optional[torch.device] = None,
+    ) -> None:
+        super().__init__()
+        self.device = device or torch.device("cpu")
+        self.eps = EPS
+        self.min_feature_value = MIN_FEATURE_VALUE
+        self.max_feature_value = MAX_FEATURE_VALUE
+        self.sorted_features, feature_starts = sort_features_by_normalization(
+            normalization_parameters
+        )
+        norm_params = [normalization_parameters[f] for f in self.sorted_features]
+        self.num_input_features = len(norm_params)
+
+        def _type_range(feature_type: str) -> Tuple[int, int]:
+            i = FEATURE_TYPES.index(feature_type)
+            end = (
+                feature_starts[i + 1]
+                if i + 1 < len(FEATURE_TYPES)
+                else self.num_input_features
+            )
+            return feature_starts[i], end
+
+        self.binary_begin, self.binary_end = _type_range(BINARY)
+        self.probability_begin, self.probability_end = _type_range(PROBABILITY)
+        self.continuous_begin, self.continuous_end = _type_range(CONTINUOUS)
+        self.boxcox_begin, self.boxcox_end = _type_range(BOXCOX)
+        self.enum_begin, self.enum_end = _type_range(ENUM)
+        self.quantile_begin, self.quantile_end = _type_range(QUANTILE)
+        self.continuous_action_begin, self.continuous_action_end = _type_range(
+            CONTINUOUS_ACTION
+        )
+        self.do_not_preprocess_begin, self.do_not_preprocess_end = _type_range(
+            DO_NOT_PREPROCESS
+        )
+
+        # Output column -> input column. ENUM features expand into one column
+        # per possible value; every other feature maps to exactly one column.
+        output_to_input: List[int] = []
+        enum_values: List[float] = []
+        for i, p in enumerate(norm_params):
+            if p.feature_type == ENUM:
+                assert p.possible_values is not None
+                output_to_input.extend([i] * len(p.possible_values))
+                enum_values.extend(float(v) for v in p.possible_values)
+            else:
+                output_to_input.append(i)
+        self.num_output_features = len(output_to_input)
+        # Everything after the ENUM block is shifted by the one-hot expansion
+        self.enum_output_end = self.enum_begin + len(enum_values)
+        self.enum_shift = self.enum_output_end - self.enum_end
+
+        # Continuous features may be in range (-inf, inf), so they aren't checked
+        checked_output_ranges = []
+        for feature_type in FEATURE_TYPES:
+            if feature_type in (BOXCOX, CONTINUOUS):
+                continue
+            begin, end = _type_range(feature_type)
+            if feature_type == ENUM:
+                end = self.enum_output_end
+            elif begin >= self.enum_end:
+                begin, end = begin + self.enum_shift, end + self.enum_shift
+            if end > begin:
+                checked_output_ranges.append((feature_type, begin, end))
+        self.checked_output_ranges = checked_output_ranges
+
+        self.output_to_input = self._create_parameter(
+            torch.tensor(output_to_input, dtype=torch.long)
+        )
+        self.enum_feature_index = self._create_parameter(
+            torch.tensor(
+                output_to_input[self.enum_begin : self.enum_output_end],
+                dtype=torch.long,
+            )
+        )
+        self.enum_values = self._create_parameter(
+            torch.tensor(enum_values, dtype=torch.float).unsqueeze(0)
+        )
+
+        continuous_params = norm_params[self.continuous_begin : self.continuous_end]
+        self.continuous_means = self._create_parameter(
+            torch.tensor([p.mean for p in continuous_params]).unsqueeze(0)
+        )
+        self.continuous_stddevs = self._create_parameter(
+            torch.tensor([p.stddev for p in continuous_params]).unsqueeze(0)
+        )
+
+        boxcox_params = norm_params[self.boxcox_begin : self.boxcox_end]
+        for p in boxcox_params:
+            assert (
+                # pyre-fixme[16]: `Optional` has no attribute `__abs__`.
+                abs(p.boxcox_lambda)
+                > 1e-6
+            ), "Invalid value for boxcox lambda: " + str(p.boxcox_lambda)
+        self.boxcox_shifts = self._create_parameter(
+            torch.tensor([p.boxcox_shift for p in boxcox_params]).unsqueeze(0)
+        )
+        self.boxcox_lambdas = self._create_parameter(
+            torch.tensor([p.boxcox_lambda for p in boxcox_params]).unsqueeze(0)
+        )
+        self.boxcox_means = self._create_parameter(
+            torch.tensor([p.mean for p in boxcox_params]).unsqueeze(0)
+        )
+        self.boxcox_stddevs = self._create_parameter(
+            torch.tensor([p.stddev for p in boxcox_params]).unsqueeze(0)
+        )
+
+        quantile_params = norm_params[self.quantile_begin : self.quantile_end]
+        # FxB boundaries, padded with the last boundary so rows stay sorted
+        max_num_boundaries = max(
+            # pyre-fixme[6]: Expected `Sized` for 1st param but got
+            #  `Optional[List[float]]`.
+            [len(p.quantiles) for p in quantile_params],
+            default=1,
+        )
+        quantile_boundaries = torch.zeros(len(quantile_params), max_num_boundaries)
+        for i, p in enumerate(quantile_params):
+            # pyre-fixme[16]: `Optional` has no attribute `__getitem__`.
+            quantile_boundaries[i, :] = p.quantiles[-1]
+            # pyre-fixme[6]: Expected `Sized` for 1st param but got
+            #  `Optional[List[float]]`.
+            quantile_boundaries[i, : len(p.quantiles)] = torch.tensor(p.quantiles)
+        self.quantile_boundaries = self._create_parameter(quantile_boundaries)
+        self.num_quantiles = self._create_parameter(
+            # pyre-fixme[6]: Expected `Sized` for 1st param but got
+            #  `Optional[List[float]]`.
+            torch.tensor([[float(len(p.quantiles)) - 1 for p in quantile_params]])
+        )
+        self.min_quantile_boundaries = self._create_parameter(
+            # pyre-fixme[6]: Expected `Iterable[Variable[_T]]` for 1st param but got
+            #  `Optional[List[float]]`.
+            torch.tensor([[min(p.quantiles) for p in quantile_params]])
+        )
+        self.max_quantile_boundaries = self._create_parameter(
+            # pyre-fixme[6]: Expected `Iterable[Variable[_T]]` for 1st param but got
+            #  `Optional[List[float]]`.
+            torch.tensor([[max(p.quantiles) for p in quantile_params]])
+        )
+
+        continuous_action_params = norm_params[
+            self.continuous_action_begin : self.continuous_action_end
+        ]
+        self.min_serving_values = self._create_parameter(
+            torch.tensor([p.min_value for p in continuous_action_params]).unsqueeze(0)
+        )
+        self.scaling_factors = self._create_parameter(
+            (
+                (torch.ones(len(continuous_action_params)) - EPS)
+                * 2
+                / torch.tensor(
+                    # pyre-fixme[16]: `Optional` has no attribute `__sub__`.
+                    [p.max_value - p.min_value for p in continuous_action_params]
+                )
+            ).unsqueeze(0)
+        )
+
+    def _create_parameter(self, t: torch.Tensor) -> Parameter:
+        return Parameter(t.to(self.device), requires_grad=False)
+
+    def input_prototype(self) -> Tuple[torch.Tensor, torch.Tensor]:
+        return (
+            torch.randn(1, self.num_input_features, device=self.device),
+            torch.ones(
+                1, self.num_input_features, dtype=torch.uint8, device=self.device
+            ),
+        )
+
+    def forward(
+        self, input: torch.Tensor, input_presence_byte: torch.Tensor
+    ) -> torch.Tensor:
+        """ Preprocess the input matrix in a single pass
+        :param input tensor
+        """
+        output = torch.empty(
+            input.shape[0],
+            self.num_output_features,
+            dtype=torch.float,
+            device=input.device,
+        )
+
+        b, e = self.binary_begin, self.binary_end
+        if e > b:
+            output[:, b:e] = 1.0 - (input[:, b:e] == 0.0).float()
+
+        b, e = self.probability_begin, self.probability_end
+        if e > b:
+            clamped_input = torch.clamp(input[:, b:e], 0.01, 0.99)
+            output[:, b:e] = -1.0 * ((1.0 / clamped_input) - 1.0).log()
+
+        b, e = self.continuous_begin, self.continuous_end
+        if e > b:
+            output[:, b:e] = (
+                input[:, b:e] - self.continuous_means
+            ) / self.continuous_stddevs
+
+        b, e = self.boxcox_begin, self.boxcox_end
+        if e > b:
+            boxcox_output = (
+                torch.pow(
+                    torch.clamp(input[:, b:e] + self.boxcox_shifts, 1e-6),
+                    self.boxcox_lambdas,
+                )
+                - 1.0
+            ) / self.boxcox_lambdas
+            output[:, b:e] = (boxcox_output - self.boxcox_means) / self.boxcox_stddevs
+
+        if self.enum_end > self.enum_begin:
+            enum_input = input.index_select(1, self.enum_feature_index)
+            output[:, self.enum_begin : self.enum_output_end] = (
+                enum_input == self.enum_values
+            ).float()
+
+        b, e = self.quantile_begin, self.quantile_end
+        if e > b:
+            output[:, b + self.enum_shift : e + self.enum_shift] = self._quantile(
+                input[:, b:e]
+            )
+
+        b, e = self.continuous_action_begin, self.continuous_action_end
+        if e > b:
+            continuous_action = (
+                input[:, b:e] - self.min_serving_values
+            ) * self.scaling_factors + (-1 + self.eps)
+            output[:, b + self.enum_shift : e + self.enum_shift] = torch.clamp(
+                continuous_action, -1 + self.eps, 1 - self.eps
+            )
+
+        b, e = self.do_not_preprocess_begin, self.do_not_preprocess_end
+        if e > b:
+            output[:, b + self.enum_shift : e + self.enum_shift] = input[:, b:e]
+
+        # NB: converting to float prevent ASAN heap-buffer-overflow
+        output = output * input_presence_byte.float().index_select(
+            1, self.output_to_input
+        )
+        if self.training and not torch.jit.is_scripting():
+            self._check_preprocessing_output(output)
+        return torch.clamp(output, self.min_feature_value, self.max_feature_value)
+
+    def _quantile(self, input: torch.Tensor) -> torch.Tensor:
+        """
+        Replace the value with its percentile in the range [0,1], interpolating
+        linearly between the two surrounding quantile boundaries.
+        """
+        num_boundaries = self.quantile_boundaries.shape[1]
+        # Number of boundaries <= input, FxJ
+        num_left = torch.searchsorted(
+            self.quantile_boundaries, input.t().contiguous(), right=True
+        )
+        left_index = torch.clamp(num_left - 1, 0, num_boundaries - 1)
+        right_index = torch.clamp(num_left, 0, num_boundaries - 1)
+        interpolate_left = torch.gather(self.quantile_boundaries, 1, left_index).t()
+        interpolate_right = torch.gather(self.quantile_boundaries, 1, right_index).t()
+        left_start = num_left.t().float() - 1.0
+        interpolated_values = (
+            left_start
+            + (
+                (input - interpolate_left)
+                # Add a small amount to interpolate_right to avoid div-0
+                / ((interpolate_right + self.eps) - interpolate_left)
+            )
+        ) / self.num_quantiles
+
+        set_to_max = input >= self.max_quantile_boundaries
+        set_to_min = input <= self.min_quantile_boundaries
+        interpolated_values = torch.where(
+            set_to_min | set_to_max,
+            torch.zeros_like(interpolated_values),
+            interpolated_values,
+        )
+        return set_to_max.float() + interpolated_values
+
+    @torch.jit.unused
+    def _check_preprocessing_output(self, output: torch.Tensor) -> None:
+        """
+        Check that preprocessed features fall within range of valid output.
+        Mirrors `Preprocessor._check_preprocessing_output`.
+        """
+        for feature_type, begin, end in self.checked_output_ranges:
+            self._check_range(feature_type, output[:, begin:end])
+
+    @torch.jit.unused
+    def _check_range(self, feature_type: str, batch: torch.Tensor) -> None:
+        min_value, max_value = batch.min(), batch.max()
+        if max_value.item() > MAX_FEATURE_VALUE:
+            raise Exception(
+                f"A {feature_type} feature type has max value {max_value} which is >"
+                f" than accepted post pre-processing max of {MAX_FEATURE_VALUE}"
+            )
+        elif min_value.item() < MIN_FEATURE_VALUE:
+            raise Exception(
+                f"A {feature_type} feature type has min value {min_value} which is <"
+                f" accepted post pre-processing min of {MIN_FEATURE_VALUE}"
+            )
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+Mergeable per-feature sketches for identifying normalization parameters.
+
+A `FeatureSketch` summarizes an unbounded stream of values for one feature in
+bounded memory: exact count/min/max and running central moments up to the 4th,
+a bounded set of unique values (for BINARY/ENUM detection) and a KLL quantile
+sketch. Sketches built independently (e.g., one per Spark partition or Parquet
+file) can be merged, so the raw values never need to be collected in one place.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from reagent.parameters import NormalizationParameters
+from reagent.preprocessing import identify_types
+from reagent.preprocessing.identify_types import DEFAULT_MAX_UNIQUE_ENUM
+from reagent.preprocessing.normalization import (
+    BOX_COX_MARGIN,
+    BOX_COX_MAX_STDDEV,
+    DEFAULT_MAX_QUANTILE_SIZE,
+    DEFAULT_NUM_SAMPLES,
+    DEFAULT_QUANTILE_K2_THRESHOLD,
+    MINIMUM_SAMPLES_TO_IDENTIFY,
+    identify_parameter,
+    no_op_feature,
+)
+from scipy import special, stats
+from scipy.stats.mstats import mquantiles
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_KLL_K = 400
+# Seed of the KLL compactions when none is given, so that sketches are
+# reproducible
+DEFAULT_SEED = 0
+
+
+def normaltest_from_moments(
+    count: int, skewness: float, kurtosis: float
+) -> Tuple[float, float]:
+    """
+    `scipy.stats.normaltest` (D'Agostino-Pearson K2 and its p-value) of
+    `count` values with the given (biased) skewness and Pearson kurtosis,
+    following scipy's `skewtest` and `kurtosistest`
+    """
+    n = float(count)
+    # skewtest
+    y = skewness * np.sqrt(((n + 1) * (n + 3)) / (6.0 * (n - 2)))
+    beta2 = (
+        3.0
+        * (n ** 2 + 27 * n - 70)
+        * (n + 1)
+        * (n + 3)
+        / ((n - 2.0) * (n + 5) * (n + 7) * (n + 9))
+    )
+    w2 = -1 + np.sqrt(2 * (beta2 - 1))
+    delta = 1 / np.sqrt(0.5 * np.log(w2))
+    alpha = np.sqrt(2.0 / (w2 - 1))
+    if y == 0:
+        y = 1
+    z_skew = delta * np.log(y / alpha + np.sqrt((y / alpha) ** 2 + 1))
+    # kurtosistest
+    mean = 3.0 * (n - 1) / (n + 1)
+    var = 24.0 * n * (n - 2) * (n - 3) / ((n + 1) * (n + 1.0) * (n + 3) * (n + 5))
+    x = (kurtosis - mean) / np.sqrt(var)
+    sqrtbeta1 = (
+        6.0
+        * (n * n - 5 * n + 2)
+        / ((n + 7) * (n + 9))
+        * np.sqrt((6.0 * (n + 3) * (n + 5)) / (n * (n - 2) * (n - 3)))
+    )
+    a = 6.0 + 8.0 / sqrtbeta1 * (2.0 / sqrtbeta1 + np.sqrt(1 + 4.0 / (sqrtbeta1 ** 2)))
+    term1 = 1 - 2 / (9.0 * a)
+    denom = 1 + x * np.sqrt(2 / (a - 4.0))
+    if denom == 0:
+        term2 = np.nan
+    else:
+        term2 = np.sign(denom) * np.power((1 - 2.0 / a) / np.abs(denom), 1 / 3.0)
+    z_kurtosis = (term1 - term2) / np.sqrt(2 / (9.0 * a))
+    k2 = float(z_skew ** 2 + z_kurtosis ** 2)
+    return k2, float(special.chdtrc(2, k2))
+
+
+def _weighted_moments(
+    values: np.ndarray, weights: np.ndarray
+) -> Tuple[float, float, float, float]:
+    """ Mean, variance, skewness and Pearson kurtosis (all biased) """
+    weights = weights / np.sum(weights)
+    mean = float(np.sum(weights * values))
+    deviations = values - mean
+    m2 = float(np.sum(weights * deviations ** 2))
+    m3 = float(np.sum(weights * deviations ** 3))
+    m4 = float(np.sum(weights * deviations ** 4))
+    return mean, m2, m3 / m2 ** 1.5, m4 / m2 ** 2
+
+
+class KllSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Level `h` holds items of weight 2**h. When a level exceeds its capacity it is
+    sorted and every other item (random offset) is promoted to the next level.
+    The offsets are drawn with `seed`, `DEFAULT_SEED` if None.
+    """
+
+    def __init__(self, k: int = DEFAULT_KLL_K, seed: Optional[int] = None) -> None:
+        self.k = k
+        self.count = 0
+        self.compactors: List[np.ndarray] = [np.empty(0)]
+        self.rng = np.random.RandomState(DEFAULT_SEED if seed is None else seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(int(np.ceil(self.k * (2.0 / 3.0) ** depth)), 2)
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+                items = np.sort(items)
+                # Leave one item behind if the level has an odd number of items
+                num_leftover = len(items) % 2
+                offset = self.rng.randint(2)
+                promoted = items[num_leftover + offset :: 2]
+                self.compactors[level] = items[:num_leftover]
+                self.compactors[level + 1] = np.concatenate(
+                    [self.compactors[level + 1], promoted]
+                )
+            level += 1
+
+    def update(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.count += len(values)
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self._compress()
+
+    def merge(self, other: "KllSketch") -> "KllSketch":
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for level, items in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def weighted_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ The retained items and their weights, which sum to about `count` """
+        assert self.count > 0, "Can't query an empty sketch"
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate(
+            [np.full(len(c), 2.0 ** h) for h, c in enumerate(self.compactors)]
+        )
+        return items, weights
+
+    def quantiles(self, qs: np.ndarray) -> np.ndarray:
+        """ Returns the (approximate) values at the given ranks in [0, 1] """
+        items, weights = self.weighted_items()
+        order = np.argsort(items, kind="mergesort")
+        items = items[order]
+        cumulative_weights = np.cumsum(weights[order])
+        ranks = np.asarray(qs, dtype=np.float64) * cumulative_weights[-1]
+        idx = np.searchsorted(cumulative_weights, ranks, side="left")
+        return items[np.clip(idx, 0, len(items) - 1)]
+
+
+class FeatureSketch:
+    """
+    Mergeable, fixed-memory summary of the values of a single feature.
+    """
+
+    def __init__(
+        self,
+        max_unique_values: int = DEFAULT_MAX_UNIQUE_ENUM,
+        kll_k: int = DEFAULT_KLL_K,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.max_unique_values = max_unique_values
+        self.count = 0
+        self.mean = 0.0
+        # sums of the 2nd, 3rd and 4th powers of the deviations from the mean
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min_value = np.inf
+        self.max_value = -np.inf
+        self.all_integer = True
+        self.all_binary = True
+        # None once there are more than `max_unique_values` unique values
+        self.unique_values: Optional[np.ndarray] = np.empty(0)
+        self.quantile_sketch = KllSketch(kll_k, seed)
+
+    def _merge_unique_values(self, unique_values: Optional[np.ndarray]) -> None:
+        if self.unique_values is None or unique_values is None:
+            self.unique_values = None
+            return
+        merged = np.union1d(self.unique_values, unique_values)
+        self.unique_values = merged if len(merged) <= self.max_unique_values else None
+
+    def _merge_moments(
+        self, count: int, mean: float, m2: float, m3: float, m4: float
+    ) -> None:
+        # Pebay's pairwise update of the central moments, extending Chan et
+        # al.'s for the variance
+        n_a, n_b = self.count, count
+        n = n_a + n_b
+        delta = mean - self.mean
+        self.m4 += (
+            m4
+            + delta ** 4 * n_a * n_b * (n_a * n_a - n_a * n_b + n_b * n_b) / n ** 3
+            + 6 * delta ** 2 * (n_a * n_a * m2 + n_b * n_b * self.m2) / n ** 2
+            + 4 * delta * (n_a * m3 - n_b * self.m3) / n
+        )
+        self.m3 += (
+            m3
+            + delta ** 3 * n_a * n_b * (n_a - n_b) / n ** 2
+            + 3 * delta * (n_a * m2 - n_b * self.m2) / n
+        )
+        self.m2 += m2 + delta * delta * n_a * n_b / n
+        self.mean += delta * n_b / n
+        self.count = n
+
+    def update(self, values: np.ndarray) -> "FeatureSketch":
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return self
+        assert not (np.any(np.isinf(values))), "Feature values contain infinity"
+        assert not (
+            np.any(np.isnan(values))
+        ), "Feature values contain nan (are there nulls in the feature values?)"
+        mean = float(np.mean(values))
+        deviations = values - mean
+        self._merge_moments(
+            len(values),
+            mean,
+            float(np.sum(deviations ** 2)),
+            float(np.sum(deviations ** 3)),
+            float(np.sum(deviations ** 4)),
+        )
+        self.min_value = min(self.min_value, float(np.min(values)))
+        self.max_value = max(self.max_value, float(np.max(values)))
+        self.all_integer = self.all_integer and bool(
+            np.all(np.equal(np.mod(values, 1), 0))
+        )
+        self.all_binary = self.all_binary and bool(
+            np.all(np.logical_or(values == 0, values == 1))
+        )
+        if self.unique_values is not None:
+            self._merge_unique_values(np.unique(values))
+        self.quantile_sketch.update(values)
+        return self
+
+    def merge(self, other: "FeatureSketch") -> "FeatureSketch":
+        if other.count == 0:
+            return self
+        self._merge_moments(other.count, other.mean, other.m2, other.m3, other.m4)
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        self.all_integer = self.all_integer and other.all_integer
+        self.all_binary = self.all_binary and other.all_binary
+        self._merge_unique_values(other.unique_values)
+        self.quantile_sketch.merge(other.quantile_sketch)
+        return self
+
+    @property
+    def stddev(self) -> float:
+        return float(np.sqrt(self.m2 / (self.count - 1)))
+
+    def normaltest(self) -> Tuple[float, float]:
+        """ `scipy.stats.normaltest` of the values, from the exact moments """
+        m2 = self.m2 / self.count
+        return normaltest_from_moments(
+            self.count, self.m3 / self.count / m2 ** 1.5, self.m4 / self.count / m2 ** 2
+        )
+
+    @property
+    def num_unique_values(self) -> Optional[int]:
+        return None if self.unique_values is None else len(self.unique_values)
+
+    def identify_type(self, enum_threshold: int = DEFAULT_MAX_UNIQUE_ENUM) -> str:
+        """ Same decision as `identify_types.identify_type`, from the summary """
+        if self.all_binary or self.min_value == self.max_value:
+            return identify_types.BINARY
+        elif self.min_value >= 0 and self.max_value <= 1:
+            return identify_types.PROBABILITY
+        elif (
+            self.min_value >= 0
+            and self.num_unique_values is not None
+            and self.num_unique_values <= enum_threshold
+            and self.all_integer
+        ):
+            return identify_types.ENUM
+        return identify_types.CONTINUOUS
+
+    def representative_sample(self, num_samples: int) -> np.ndarray:
+        """
+        Returns `num_samples` evenly spaced quantiles of the feature. The first
+        and last values are the exact min and max.
+        """
+        num_samples = min(num_samples, self.count)
+        qs = (np.arange(num_samples, dtype=np.float64) + 0.5) / num_samples
+        sample = self.quantile_sketch.quantiles(qs)
+        sample[0] = self.min_value
+        sample[-1] = self.max_value
+        return sample.astype(np.float32)
+
+
+def build_feature_sketches(
+    feature_names: np.ndarray,
+    feature_values: np.ndarray,
+    max_unique_values: int = DEFAULT_MAX_UNIQUE_ENUM,
+    kll_k: int = DEFAULT_KLL_K,
+    seed: Optional[int] = None,
+) -> Dict[int, FeatureSketch]:
+    """
+    Builds one sketch per feature from a flat (feature_name, feature_value) pair
+    of arrays, e.g., the keys and items of an exploded map column.
+    """
+    sketches: Dict[int, FeatureSketch] = {}
+    if len(feature_names) == 0:
+        return sketches
+    order = np.argsort(feature_names, kind="mergesort")
+    feature_names = np.asarray(feature_names)[order]
+    feature_values = np.asarray(feature_values, dtype=np.float64)[order]
+    names, starts = np.unique(feature_names, return_index=True)
+    ends = np.append(starts[1:], len(feature_names))
+    for name, start, end in zip(names.tolist(), starts, ends):
+        sketches[name] = FeatureSketch(max_unique_values, kll_k, seed).update(
+            feature_values[start:end]
+        )
+    return sketches
+
+
+def merge_feature_sketches(
+    a: Dict[int, FeatureSketch], b: Dict[int, FeatureSketch]
+) -> Dict[int, FeatureSketch]:
+    """ Merges `b` into `a`; both map feature name to sketch """
+    for name, sketch in b.items():
+        if name in a:
+            a[name].merge(sketch)
+        else:
+            a[name] = sketch
+    return a
+
+
+def identify_parameter_from_sketch(
+    feature_name,
+    sketch: FeatureSketch,
+    max_unique_enum_values=DEFAULT_MAX_UNIQUE_ENUM,
+    quantile_size=DEFAULT_MAX_QUANTILE_SIZE,
+    quantile_k2_threshold=DEFAULT_QUANTILE_K2_THRESHOLD,
+    skip_box_cox=False,
+    skip_quantiles=False,
+    feature_type=None,
+    num_samples=DEFAULT_NUM_SAMPLES,
+):
+    """
+    Sketch counterpart of `normalization.identify_parameter`.
+
+    BINARY/PROBABILITY/ENUM/CONTINUOUS are decided from the exact summary.
+    For CONTINUOUS features, the normality test of the values is computed
+    from their exact moments, and that of their Box-Cox transform from the
+    weighted items of the quantile sketch, both for the full count, so the
+    CONTINUOUS/BOXCOX/QUANTILE choice follows the raw path's. The Box-Cox
+    lambda and the quantiles are fit on a representative sample drawn from
+    the quantile sketch. Min/max, ENUM values and the mean/stddev of
+    linearly normalized features come from the exact statistics.
+    """
+    if feature_type is None:
+        feature_type = sketch.identify_type(max_unique_enum_values)
+    if feature_type == identify_types.CONTINUOUS:
+        return _identify_continuous_parameter_from_sketch(
+            feature_name,
+            sketch,
+            quantile_size,
+            quantile_k2_threshold,
+            skip_box_cox,
+            skip_quantiles,
+            num_samples,
+        )
+    sample = sketch.representative_sample(num_samples)
+    params = identify_parameter(
+        feature_name,
+        sample,
+        max_unique_enum_values,
+        quantile_size,
+        quantile_k2_threshold,
+        skip_box_cox,
+        skip_quantiles,
+        feature_type,
+    )
+    if params is None or params.min_value is None:
+        # No-op feature
+        return params
+    if params.feature_type == identify_types.ENUM:
+        assert sketch.unique_values is not None, (
+            f"Feature {feature_name} has more than {sketch.max_unique_values} "
+            "unique values and can't be an ENUM"
+        )
+        params = params._replace(
+            possible_values=sketch.unique_values.astype(int).tolist()
+        )
+    elif params.feature_type in (
+        identify_types.CONTINUOUS,
+        identify_types.CONTINUOUS_ACTION,
+        identify_types.DO_NOT_PREPROCESS,
+    ):
+        params = params._replace(mean=sketch.mean, stddev=max(sketch.stddev, 1.0))
+    return params._replace(min_value=sketch.min_value, max_value=sketch.max_value)
+
+
+def _identify_continuous_parameter_from_sketch(
+    feature_name,
+    sketch: FeatureSketch,
+    quantile_size: int,
+    quantile_k2_threshold: float,
+    skip_box_cox: bool,
+    skip_quantiles: bool,
+    num_samples: int,
+):
+    """ The CONTINUOUS branch of `normalization.identify_parameter` """
+    assert (
+        sketch.count >= MINIMUM_SAMPLES_TO_IDENTIFY
+    ), "insufficient information to identify parameter"
+    if sketch.min_value == sketch.max_value:
+        return no_op_feature()
+    k2_original, p_original = sketch.normaltest()
+
+    boxcox_shift = -sketch.min_value
+    sample = sketch.representative_sample(num_samples).astype(np.float64)
+    candidate_sample, lambda_ = stats.boxcox(
+        np.maximum(sample + boxcox_shift, BOX_COX_MARGIN)
+    )
+    items, weights = sketch.quantile_sketch.weighted_items()
+    candidate_items = stats.boxcox(
+        np.maximum(items + boxcox_shift, BOX_COX_MARGIN), lmbda=lambda_
+    )
+    boxcox_mean, boxcox_variance, skewness, kurtosis = _weighted_moments(
+        candidate_items, weights
+    )
+    k2_boxcox, p_boxcox = normaltest_from_moments(sketch.count, skewness, kurtosis)
+    logger.info(
+        "Feature stats.  Original K2: {} P: {} Boxcox K2: {} P: {}".format(
+            k2_original, p_original, k2_boxcox, p_boxcox
+        )
+    )
+    # Moments of the values normalization is fit on, as in the raw path
+    mean, stddev = sketch.mean, sketch.stddev
+    transformed = False
+    boxcox_lambda = None
+    if lambda_ < 0.9 or lambda_ > 1.1:
+        if k2_original > k2_boxcox * 10 and k2_boxcox <= quantile_k2_threshold:
+            boxcox_stddev = float(
+                np.sqrt(boxcox_variance * sketch.count / (sketch.count - 1))
+            )
+            if (
+                np.isfinite(boxcox_stddev)
+                and boxcox_stddev < BOX_COX_MAX_STDDEV
+                and not np.isclose(boxcox_stddev, 0)
+            ):
+                transformed = True
+                mean, stddev = boxcox_mean, boxcox_stddev
+                boxcox_lambda = float(lambda_)
+    if boxcox_lambda is None or skip_box_cox:
+        boxcox_shift = None
+        boxcox_lambda = None
+
+    feature_type = identify_types.CONTINUOUS
+    quantiles = None
+    if boxcox_lambda is not None:
+        feature_type = identify_types.BOXCOX
+    if (
+        boxcox_lambda is None
+        and k2_original > quantile_k2_threshold
+        and (not skip_quantiles)
+    ):
+        feature_type = identify_types.QUANTILE
+        # The raw path fits the quantiles on the Box-Cox transformed values
+        # when skip_box_cox drops the transform
+        quantile_sample = candidate_sample if transformed else sample
+        quantiles = (
+            np.unique(
+                mquantiles(
+                    quantile_sample,
+                    np.arange(quantile_size + 1, dtype=np.float64)
+                    / float(quantile_size),
+                    alphap=0.0,
+                    betap=1.0,
+                )
+            )
+            .astype(float)
+            .tolist()
+        )
+        logger.info("Feature is non-normal, using quantiles: {}".format(quantiles))
+
+    if feature_type in (identify_types.CONTINUOUS, identify_types.BOXCOX):
+        if not np.isfinite(stddev):
+            logger.info("Std. dev not finite for feature {}".format(feature_name))
+            return None
+        stddev = max(stddev, 1.0)
+    else:
+        mean, stddev = 0.0, 1.0
+    return NormalizationParameters(
+        feature_type,
+        boxcox_lambda,
+        boxcox_shift,
+        mean,
+        stddev,
+        None,
+        quantiles,
+        sketch.min_value,
+        sketch.max_value,
+    )
+
+
+def get_feature_norm_metadata_from_sketch(feature_name, sketch, norm_params):
+    """ Sketch counterpart of `normalization.get_feature_norm_metadata` """
+    logger.info("Got feature sketch: {}".format(feature_name))
+    if sketch.count < MINIMUM_SAMPLES_TO_IDENTIFY:
+        return None
+
+    feature_override = None
+    if norm_params["feature_overrides"] is not None:
+        feature_override = norm_params["feature_overrides"].get(feature_name, None)
+
+    normalization_parameters = identify_parameter_from_sketch(
+        feature_name,
+        sketch,
+        norm_params["max_unique_enum_values"],
+        norm_params["quantile_size"],
+        norm_params["quantile_k2_threshold"],
+        norm_params["skip_box_cox"],
+        norm_params["skip_quantiles"],
+        feature_override,
+        norm_params.get("num_samples", DEFAULT_NUM_SAMPLES),
+    )
+    logger.info(
+        "Feature {} normalization: {}".format(feature_name, normalization_parameters)
+    )
+    return normalization_parameters
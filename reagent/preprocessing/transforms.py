@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
 
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import torch
 from reagent.parameters import NormalizationParameters
+from reagent.preprocessing.batch_preprocessor import preprocess_stacked
 from reagent.preprocessing.preprocessor import Preprocessor
 
 
@@ -22,6 +23,36 @@ class Compose:
         transforms = "\n    ".join([repr(t) for t in self.transforms])
         return f"{self.__class__.__name__}(\n{transforms}\n)"
 
+    def compile(self) -> "Compose":
+        """
+        Returns an equivalent `Compose` with nested `Compose` flattened and
+        each run of consecutive `DenseNormalization` over disjoint keys fused
+        into one `FusedDenseNormalization`, so that all the keys sharing
+        normalization parameters are preprocessed in a single call.
+        """
+        transforms = []
+        for t in _flatten(self.transforms):
+            if isinstance(t, DenseNormalization):
+                if not (
+                    transforms
+                    and isinstance(transforms[-1], FusedDenseNormalization)
+                    and transforms[-1].add(t)
+                ):
+                    fused = FusedDenseNormalization()
+                    fused.add(t)
+                    transforms.append(fused)
+            else:
+                transforms.append(t)
+        return Compose(*transforms)
+
+
+def _flatten(transforms):
+    for t in transforms:
+        if isinstance(t, Compose):
+            yield from _flatten(t.transforms)
+        else:
+            yield t
+
 
 class ValuePresence:
     """
@@ -82,6 +113,81 @@ class DenseNormalization:
         return data
 
 
+class FusedDenseNormalization:
+    """
+    Several `DenseNormalization` in one. Keys with equal normalization
+    parameters and device form a group; the (value, presence) of a group are
+    concatenated along the batch dimension and go through the group's
+    `Preprocessor` once. This is built by `Compose.compile()`.
+    """
+
+    def __init__(self):
+        # (keys, normalization_parameters, device)
+        self.groups: List[
+            Tuple[List[str], Dict[int, NormalizationParameters], torch.device]
+        ] = []
+        # Delay the initialization of the preprocessors so this class
+        # is pickleable
+        self._preprocessors: Optional[List[Preprocessor]] = None
+
+    @property
+    def keys(self) -> List[str]:
+        return [k for keys, _, _ in self.groups for k in keys]
+
+    def add(self, transform: DenseNormalization) -> bool:
+        """
+        Fuses `transform` into this one. Returns False, leaving this one
+        unchanged, if `transform` normalizes a key this one already does; the
+        order of the two would matter then.
+        """
+        if set(transform.keys) & set(self.keys):
+            return False
+        for keys, normalization_parameters, device in self.groups:
+            if (
+                device == transform.device
+                and normalization_parameters == transform.normalization_parameters
+            ):
+                keys.extend(transform.keys)
+                break
+        else:
+            self.groups.append(
+                (
+                    list(transform.keys),
+                    transform.normalization_parameters,
+                    transform.device,
+                )
+            )
+        self._preprocessors = None
+        return True
+
+    def __call__(self, data):
+        if self._preprocessors is None:
+            self._preprocessors = [
+                Preprocessor(normalization_parameters, device=device)
+                for _, normalization_parameters, device in self.groups
+            ]
+
+        for (keys, _, device), preprocessor in zip(self.groups, self._preprocessors):
+            outputs = preprocess_stacked(
+                preprocessor,
+                [
+                    (value.to(device), presence.to(device))
+                    for value, presence in (data[k] for k in keys)
+                ],
+            )
+            for k, output in zip(keys, outputs):
+                data[k] = output
+
+        return data
+
+    def __repr__(self):
+        groups = ", ".join(
+            f"({keys}, {len(normalization_parameters)} features, {device})"
+            for keys, normalization_parameters, device in self.groups
+        )
+        return f"{self.__class__.__name__}({groups})"
+
+
 class ColumnVector:
     """
     Ensure that the keys are column vectors
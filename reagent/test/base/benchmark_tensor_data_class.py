@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+Micro-benchmark of TensorDataClass tensor-method dispatch: the closure-based
+`__getattr__` path vs. the flattened tensor tree (`tree_map`).
+
+    python -m reagent.test.base.benchmark_tensor_data_class \
+        --batch-size 32 --num-iters 2000
+"""
+
+import argparse
+import sys
+import timeit
+
+import torch
+from reagent.test.base.utils import INPUT_BUILDERS, closure_dispatch
+
+
+def _time(fns, num_iters: int, num_repeats: int = 7):
+    """ Best-of-`num_repeats` seconds per call; repeats are interleaved """
+    best = [float("inf")] * len(fns)
+    for _ in range(num_repeats):
+        for i, fn in enumerate(fns):
+            best[i] = min(best[i], timeit.timeit(fn, number=num_iters) / num_iters)
+    return best
+
+
+def run_benchmark(batch_size: int, num_iters: int):
+    ops = {
+        # a no-op for contiguous tensors; isolates the dispatch overhead
+        "contiguous": (
+            lambda x: closure_dispatch(x, "contiguous"),
+            lambda x: x.tree_map(torch.Tensor.contiguous),
+        ),
+        "to(float64)": (
+            lambda x: closure_dispatch(x, "to", torch.float64),
+            lambda x: x.to(torch.float64),
+        ),
+        "detach": (lambda x: closure_dispatch(x, "detach"), lambda x: x.detach()),
+        "float": (lambda x: closure_dispatch(x, "float"), lambda x: x.float()),
+    }
+    for name, builder in INPUT_BUILDERS.items():
+        batch = builder(batch_size)
+        for op_name, (closure_fn, tree_fn) in ops.items():
+            closure_time, tree_time = _time(
+                [lambda: closure_fn(batch), lambda: tree_fn(batch)], num_iters
+            )
+            print(
+                f"{name:>25s} {op_name:>12s}: "
+                f"closure {closure_time * 1e6:8.1f}us, "
+                f"tree {tree_time * 1e6:8.1f}us "
+                f"(speedup {closure_time / tree_time:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-iters", type=int, default=2000)
+    args = parser.parse_args(sys.argv[1:])
+
+    run_benchmark(args.batch_size, args.num_iters)
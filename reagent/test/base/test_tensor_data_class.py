@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import unittest
+
+import torch
+from reagent import types as rlt
+from reagent.test.base.utils import INPUT_BUILDERS, closure_dispatch
+
+
+def assert_same_tree(test_case, a, b):
+    test_case.assertIs(type(a), type(b))
+    leaves_a, spec_a = a.tree_flatten()
+    leaves_b, spec_b = b.tree_flatten()
+    test_case.assertEqual(spec_a, spec_b)
+    test_case.assertEqual(len(leaves_a), len(leaves_b))
+    for leaf_a, leaf_b in zip(leaves_a, leaves_b):
+        test_case.assertEqual(leaf_a.dtype, leaf_b.dtype)
+        test_case.assertEqual(leaf_a.device, leaf_b.device)
+        test_case.assertTrue(torch.equal(leaf_a, leaf_b))
+
+
+class TestTensorDataClass(unittest.TestCase):
+    def test_flatten_unflatten(self):
+        for name, builder in INPUT_BUILDERS.items():
+            batch = builder()
+            leaves, spec = batch.tree_flatten()
+            self.assertTrue(all(isinstance(t, torch.Tensor) for t in leaves), name)
+            rebuilt = spec.unflatten(leaves)
+            self.assertEqual(rebuilt, batch)
+            for leaf, rebuilt_leaf in zip(leaves, rebuilt.tree_flatten()[0]):
+                self.assertIs(leaf, rebuilt_leaf)
+
+    def test_matches_closure_dispatch(self):
+        for batch in [builder() for builder in INPUT_BUILDERS.values()]:
+            assert_same_tree(
+                self,
+                batch.to(torch.float64),
+                closure_dispatch(batch, "to", torch.float64),
+            )
+            assert_same_tree(self, batch.float(), closure_dispatch(batch, "float"))
+            assert_same_tree(self, batch.cpu(), closure_dispatch(batch, "cpu"))
+            assert_same_tree(self, batch.detach(), closure_dispatch(batch, "detach"))
+
+    def test_non_tensor_fields(self):
+        batch = INPUT_BUILDERS["DiscreteDqnInput"]()
+        mapped = batch.to(torch.float64)
+        self.assertEqual(mapped.extras.max_num_actions, batch.extras.max_num_actions)
+        self.assertIs(mapped.state.id_list_features, batch.state.id_list_features)
+        self.assertIsNone(INPUT_BUILDERS["PreprocessedSlateQInput"]().float().step)
+
+    def test_detach(self):
+        batch = INPUT_BUILDERS["DiscreteDqnInput"]()
+        batch = batch._replace(reward=batch.reward.requires_grad_())
+        self.assertTrue(batch.reward.requires_grad)
+        self.assertFalse(batch.detach().reward.requires_grad)
+
+    def test_getattr_fallback_validates(self):
+        batch = rlt.FeatureData(float_features=torch.ones(3, 2))
+        self.assertEqual(batch.double().float_features.dtype, torch.float64)
+        with self.assertRaises(ValueError):
+            # FeatureData.__post_init__ rejects 1D float_features
+            batch.flatten()
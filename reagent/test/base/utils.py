@@ -250,3 +250,95 @@ class NumpyFeatureProcessor(object):
         return np.array(
             [[ex[f] for f in features] for ex in preprocessed_values], dtype=np.float32
         )
+
+
+def make_discrete_dqn_input(batch_size: int = 32, state_dim: int = 10, num_actions=4):
+    def features():
+        return rlt.FeatureData(float_features=torch.randn(batch_size, state_dim))
+
+    return rlt.DiscreteDqnInput(
+        state=features(),
+        next_state=features(),
+        action=torch.zeros(batch_size, num_actions),
+        next_action=torch.zeros(batch_size, num_actions),
+        reward=torch.randn(batch_size, 1),
+        time_diff=torch.ones(batch_size, 1),
+        step=torch.ones(batch_size, 1),
+        not_terminal=torch.ones(batch_size, 1),
+        possible_actions_mask=torch.ones(batch_size, num_actions),
+        possible_next_actions_mask=torch.ones(batch_size, num_actions),
+        extras=rlt.ExtraData(
+            mdp_id=torch.arange(batch_size).unsqueeze(1),
+            sequence_number=torch.arange(batch_size).unsqueeze(1),
+            action_probability=torch.rand(batch_size, 1),
+            max_num_actions=num_actions,
+        ),
+    )
+
+
+def make_ranking_input(
+    batch_size: int = 32, state_dim: int = 10, candidate_dim: int = 8, src_len=5
+):
+    tgt_len = src_len
+    return rlt.PreprocessedRankingInput.from_tensors(
+        state=torch.randn(batch_size, state_dim),
+        src_seq=torch.randn(batch_size, src_len, candidate_dim),
+        src_src_mask=torch.ones(batch_size, src_len, src_len),
+        tgt_in_seq=torch.randn(batch_size, tgt_len, candidate_dim),
+        tgt_out_seq=torch.randn(batch_size, tgt_len, candidate_dim),
+        tgt_tgt_mask=torch.ones(batch_size, tgt_len, tgt_len),
+        slate_reward=torch.randn(batch_size),
+        position_reward=torch.randn(batch_size, tgt_len),
+        src_in_idx=torch.arange(src_len + 2).repeat(batch_size, 1),
+        tgt_in_idx=torch.arange(tgt_len).repeat(batch_size, 1),
+        tgt_out_idx=torch.arange(tgt_len).repeat(batch_size, 1),
+        tgt_out_probs=torch.rand(batch_size),
+    )
+
+
+def make_slate_q_input(
+    batch_size: int = 32, state_dim: int = 10, item_dim: int = 8, slate_size=5
+):
+    def slate():
+        return rlt.PreprocessedSlateFeatureVector(
+            float_features=torch.randn(batch_size, slate_size, item_dim),
+            item_mask=torch.ones(batch_size, slate_size),
+            item_probability=torch.rand(batch_size, slate_size),
+        )
+
+    return rlt.PreprocessedSlateQInput(
+        state=rlt.FeatureData(float_features=torch.randn(batch_size, state_dim)),
+        next_state=rlt.FeatureData(float_features=torch.randn(batch_size, state_dim)),
+        action=slate(),
+        next_action=slate(),
+        reward=torch.randn(batch_size, slate_size),
+        reward_mask=torch.ones(batch_size, slate_size),
+        time_diff=torch.ones(batch_size, 1),
+        step=None,
+        not_terminal=torch.ones(batch_size, 1),
+        extras=rlt.ExtraData(mdp_id=torch.arange(batch_size).unsqueeze(1)),
+    )
+
+
+INPUT_BUILDERS = {
+    "DiscreteDqnInput": make_discrete_dqn_input,
+    "PreprocessedRankingInput": make_ranking_input,
+    "PreprocessedSlateQInput": make_slate_q_input,
+}
+
+
+def closure_dispatch(obj, attr: str, *args, **kwargs):
+    """ The previous `TensorDataClass.__getattr__` implementation """
+
+    def f(obj):
+        values = {}
+        for k, v in obj.__dict__.items():
+            if isinstance(v, torch.Tensor):
+                values[k] = getattr(v, attr)(*args, **kwargs)
+            elif isinstance(v, rlt.TensorDataClass):
+                values[k] = f(v)
+            else:
+                values[k] = v
+        return type(obj)(**values)
+
+    return f(obj)
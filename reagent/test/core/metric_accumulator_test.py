@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import unittest
+
+import numpy as np
+import torch
+import torch.nn as nn
+from reagent.core.metric_accumulator import MetricAccumulator
+from reagent.core.observers import ValueListObserver
+from reagent.evaluation.world_model_evaluator import LossEvaluator
+from reagent.models.seq2slate import BaselineNet, Seq2SlateMode
+from reagent.models.world_model import MemoryNetwork
+from reagent.parameters import (
+    BaselineParameters,
+    LearningMethod,
+    MDNRNNTrainerParameters,
+    Seq2SlateTransformerParameters,
+    TransformerParameters,
+)
+from reagent.training.ranking.seq2slate_trainer import Seq2SlateTrainer
+from reagent.training.world_model.mdnrnn_trainer import MDNRNNTrainer
+from reagent.types import (
+    FeatureData,
+    PreprocessedMemoryNetworkInput,
+    PreprocessedRankingInput,
+    PreprocessedTrainingBatch,
+    RankingOutput,
+)
+
+
+SEQ_LEN = 3
+BATCH_SIZE = 8
+STATE_DIM = 4
+ACTION_DIM = 2
+LOSS_KEYS = ["loss", "gmm", "bce", "mse"]
+
+
+def make_trainer(**kwargs):
+    torch.manual_seed(0)
+    params = MDNRNNTrainerParameters(hidden_size=16, num_gaussians=3)
+    return MDNRNNTrainer(
+        MemoryNetwork(
+            state_dim=STATE_DIM,
+            action_dim=ACTION_DIM,
+            num_hiddens=params.hidden_size,
+            num_hidden_layers=params.num_hidden_layers,
+            num_gaussians=params.num_gaussians,
+        ),
+        params,
+        **kwargs,
+    )
+
+
+def make_batches(num_batches):
+    torch.manual_seed(1)
+    return [
+        PreprocessedMemoryNetworkInput(
+            state=FeatureData(torch.randn(SEQ_LEN, BATCH_SIZE, STATE_DIM)),
+            action=torch.eye(ACTION_DIM)[
+                torch.randint(ACTION_DIM, (SEQ_LEN, BATCH_SIZE))
+            ],
+            next_state=FeatureData(torch.randn(SEQ_LEN, BATCH_SIZE, STATE_DIM)),
+            reward=torch.randn(SEQ_LEN, BATCH_SIZE),
+            time_diff=torch.ones(SEQ_LEN, BATCH_SIZE),
+            not_terminal=torch.ones(SEQ_LEN, BATCH_SIZE),
+            step=None,
+        )
+        for _ in range(num_batches)
+    ]
+
+
+SEQ2SLATE_LOSS_KEYS = ["obj_rl_loss", "ips_rl_loss", "baseline_loss"]
+
+
+class PerSeqLogProbNet(nn.Module):
+    """ Log probability of the logged slate from the state only """
+
+    def __init__(self, state_dim):
+        super().__init__()
+        self.linear = nn.Linear(state_dim, 1)
+
+    def forward(self, input, mode):
+        assert mode == Seq2SlateMode.PER_SEQ_LOG_PROB_MODE
+        return RankingOutput(
+            log_probs=nn.functional.logsigmoid(self.linear(input.state.float_features))
+        )
+
+
+def make_seq2slate_trainer(**kwargs):
+    torch.manual_seed(0)
+    params = Seq2SlateTransformerParameters(
+        transformer=TransformerParameters(
+            num_heads=1, dim_model=4, dim_feedforward=4, num_stacked_layers=1
+        ),
+        baseline=BaselineParameters(dim_feedforward=4, num_stacked_layers=1),
+        on_policy=False,
+        learning_method=LearningMethod.REINFORCEMENT_LEARNING,
+        importance_sampling_clamp_max=2.0,
+    )
+    return Seq2SlateTrainer(
+        PerSeqLogProbNet(STATE_DIM),
+        params,
+        minibatch_size=BATCH_SIZE,
+        baseline_net=BaselineNet(STATE_DIM, 4, 1),
+        **kwargs,
+    )
+
+
+def make_ranking_batches(num_batches):
+    torch.manual_seed(1)
+    return [
+        PreprocessedTrainingBatch(
+            training_input=PreprocessedRankingInput(
+                state=FeatureData(torch.randn(BATCH_SIZE, STATE_DIM)),
+                src_seq=FeatureData(torch.randn(BATCH_SIZE, 3, STATE_DIM)),
+                src_src_mask=torch.ones(BATCH_SIZE, 3, 3),
+                slate_reward=torch.randn(BATCH_SIZE, 1),
+                tgt_out_probs=torch.rand(BATCH_SIZE, 1) * 0.5 + 0.1,
+            )
+        )
+        for _ in range(num_batches)
+    ]
+
+
+class TestMetricAccumulator(unittest.TestCase):
+    def assert_interval_means(self, observers, per_step_values, flush_interval):
+        """ The observed values are the means of the values of each interval """
+        for key, observer in observers.items():
+            values = [v[key] for v in per_step_values]
+            expected = [
+                np.mean(values[i : i + flush_interval])
+                for i in range(0, len(values), flush_interval)
+            ]
+            self.assertEqual(len(observer.values), len(expected), key)
+            for value, expected_value in zip(observer.values, expected):
+                self.assertAlmostEqual(value, expected_value, places=5, msg=key)
+
+    def test_flush(self):
+        observer = ValueListObserver("a")
+        accumulator = MetricAccumulator([observer], flush_interval=2)
+        accumulator.add(a=torch.tensor(1.0), b=torch.tensor([3.0]))
+        self.assertEqual(observer.values, [])
+        accumulator.add(a=torch.tensor(2.0), b=None)
+        self.assertEqual(observer.values, [1.5])
+        accumulator.add(a=4.0, b=1.0)
+        self.assertEqual(accumulator.flush(), {"a": 4.0, "b": 1.0})
+        self.assertEqual(observer.values, [1.5, 4.0])
+        self.assertEqual(accumulator.flush(), {})
+        self.assertEqual(observer.values, [1.5, 4.0])
+
+    def test_mdnrnn_trainer(self):
+        batches = make_batches(7)
+        trainer = make_trainer()
+        per_step_losses = [trainer.train(batch) for batch in batches]
+
+        flush_interval = 3
+        observers = {key: ValueListObserver(key) for key in LOSS_KEYS}
+        accumulator = MetricAccumulator(observers.values(), flush_interval)
+        trainer = make_trainer(metric_accumulator=accumulator)
+        for batch in batches:
+            losses = trainer.train(batch)
+            self.assertIsInstance(losses["loss"], torch.Tensor)
+            self.assertFalse(losses["loss"].requires_grad)
+        # epoch end
+        accumulator.flush()
+        self.assert_interval_means(observers, per_step_losses, flush_interval)
+
+    def test_loss_evaluator(self):
+        batches = make_batches(5)
+        trainer = make_trainer()
+        evaluator = LossEvaluator(trainer, STATE_DIM)
+        per_step_losses = [evaluator.evaluate(batch) for batch in batches]
+
+        observers = {key: ValueListObserver(key) for key in LOSS_KEYS}
+        evaluator = LossEvaluator(
+            trainer, STATE_DIM, metric_accumulator=MetricAccumulator(observers.values())
+        )
+        for batch in batches:
+            evaluator.evaluate(batch)
+        evaluator.metric_accumulator.flush()
+        self.assert_interval_means(observers, per_step_losses, len(batches))
+        self.assertTrue(trainer.memory_network.mdnrnn.training)
+
+    def test_seq2slate_trainer(self):
+        batches = make_ranking_batches(5)
+        trainer = make_seq2slate_trainer()
+        per_step_losses = [trainer.train(batch) for batch in batches]
+
+        flush_interval = 2
+        observers = {key: ValueListObserver(key) for key in SEQ2SLATE_LOSS_KEYS}
+        accumulator = MetricAccumulator(observers.values(), flush_interval)
+        trainer = make_seq2slate_trainer(metric_accumulator=accumulator)
+        for batch in batches:
+            losses = trainer.train(batch)
+            for key in SEQ2SLATE_LOSS_KEYS:
+                self.assertIsInstance(losses[key], torch.Tensor)
+                self.assertFalse(losses[key].requires_grad)
+        accumulator.flush()
+        self.assert_interval_means(observers, per_step_losses, flush_interval)
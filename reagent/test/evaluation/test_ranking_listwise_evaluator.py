@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+import numpy.testing as npt
+import torch
+import torch.nn as nn
+from reagent.core.observers import ValueListObserver
+from reagent.evaluation.ranking_listwise_evaluator import (
+    RankingListwiseEvaluator,
+    batch_average_precision_score,
+    batch_dcg_score,
+    batch_ndcg_score,
+)
+from reagent.models.seq2slate import Seq2SlateMode
+from reagent.types import RankingOutput
+from sklearn.metrics import average_precision_score, dcg_score, ndcg_score
+
+
+BATCH_SIZE = 32
+SLATE_SIZE = 6
+
+
+def random_permutations(batch_size, slate_size):
+    return torch.argsort(torch.rand(batch_size, slate_size), dim=1)
+
+
+class FixedRankingNet(nn.Module):
+    """ Returns the given scores & rankings, whatever the input """
+
+    def __init__(self, encoder_scores, ranked_tgt_out_idx):
+        super().__init__()
+        self.encoder_scores = encoder_scores
+        self.ranked_tgt_out_idx = ranked_tgt_out_idx
+
+    def forward(self, input, mode):
+        if mode == Seq2SlateMode.ENCODER_SCORE_MODE:
+            return RankingOutput(encoder_scores=self.encoder_scores)
+        assert mode == Seq2SlateMode.RANK_MODE
+        return RankingOutput(ranked_tgt_out_idx=self.ranked_tgt_out_idx)
+
+
+class TestRankingListwiseEvaluator(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        # Binary relevance; make sure some rows have none
+        self.y_true = (torch.rand(BATCH_SIZE, SLATE_SIZE) > 0.7).double()
+        self.y_true[:2] = 0
+        self.y_score = torch.rand(BATCH_SIZE, SLATE_SIZE).double()
+
+    def test_dcg_ndcg_match_sklearn(self):
+        for y_true in [self.y_true, torch.rand(BATCH_SIZE, SLATE_SIZE).double()]:
+            dcg = batch_dcg_score(y_true, self.y_score)
+            ndcg = batch_ndcg_score(y_true, self.y_score)
+            for i in range(BATCH_SIZE):
+                row_true = y_true[i : i + 1].numpy()
+                row_score = self.y_score[i : i + 1].numpy()
+                self.assertAlmostEqual(dcg[i].item(), dcg_score(row_true, row_score))
+                self.assertAlmostEqual(ndcg[i].item(), ndcg_score(row_true, row_score))
+
+    def test_average_precision_matches_sklearn(self):
+        mean_ap = batch_average_precision_score(self.y_true, self.y_score)
+        # Rows without relevant items score 0
+        expected = [
+            average_precision_score(self.y_true[i].numpy(), self.y_score[i].numpy())
+            if self.y_true[i].sum() > 0
+            else 0.0
+            for i in range(BATCH_SIZE)
+        ]
+        npt.assert_allclose(mean_ap.numpy(), np.array(expected))
+
+    def test_evaluate(self):
+        # Some rows have no relevant item, and score 0 in MAP
+        position_reward = (torch.rand(BATCH_SIZE, SLATE_SIZE) > 0.7).float()
+        position_reward[:2] = 0
+        logged_idx = random_permutations(BATCH_SIZE, SLATE_SIZE)
+        ranked_idx = random_permutations(BATCH_SIZE, SLATE_SIZE)
+        evaluator = RankingListwiseEvaluator(
+            FixedRankingNet(torch.randn(BATCH_SIZE, SLATE_SIZE), ranked_idx + 2),
+            slate_size=SLATE_SIZE,
+            calc_cpe=True,
+        )
+        observers = {k: ValueListObserver(k) for k in ["dcg", "ndcg", "mean_ap"]}
+        for observer in observers.values():
+            evaluator.add_observer(observer)
+        evaluator.evaluate(
+            SimpleNamespace(
+                training_input=SimpleNamespace(
+                    position_reward=position_reward, tgt_out_idx=logged_idx + 2
+                )
+            )
+        )
+
+        # Row by row, with sklearn
+        score_bar = np.arange(SLATE_SIZE, 0, -1)
+        expected = {k: [] for k in observers}
+        for i in range(BATCH_SIZE):
+            ranked_scores = np.zeros(SLATE_SIZE)
+            ranked_scores[ranked_idx[i].numpy()] = score_bar
+            truth_scores = np.zeros(SLATE_SIZE)
+            truth_scores[logged_idx[i].numpy()] = position_reward[i].numpy()
+            expected["mean_ap"].append(
+                average_precision_score(truth_scores, ranked_scores)
+                if truth_scores.sum() > 0
+                else 0.0
+            )
+            expected["dcg"].append(dcg_score([truth_scores], [ranked_scores]))
+            expected["ndcg"].append(ndcg_score([truth_scores], [ranked_scores]))
+        for k, observer in observers.items():
+            (value,) = observer.values
+            self.assertEqual(value.shape, (1,))
+            self.assertAlmostEqual(value.item(), np.mean(expected[k]), msg=k)
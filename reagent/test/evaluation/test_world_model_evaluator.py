@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import unittest
+
+import numpy.testing as npt
+import torch
+from reagent.evaluation.world_model_evaluator import (
+    BatchedFeatureImportanceEvaluator,
+    BatchedFeatureSensitivityEvaluator,
+    FeatureImportanceEvaluator,
+    FeatureSensitivityEvaluator,
+)
+from reagent.models.world_model import MemoryNetwork
+from reagent.parameters import MDNRNNTrainerParameters
+from reagent.training.world_model.mdnrnn_trainer import MDNRNNTrainer
+from reagent.types import FeatureData, PreprocessedMemoryNetworkInput
+
+
+SEQ_LEN = 3
+BATCH_SIZE = 8
+# The second state feature is a 3-component enum
+STATE_DIM = 5
+STATE_FEATURE_START_INDICES = [0, 1, 4]
+ACTION_DIM = 3
+
+
+class TestWorldModelEvaluator(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        params = MDNRNNTrainerParameters(hidden_size=16, num_gaussians=3)
+        self.trainer = MDNRNNTrainer(
+            MemoryNetwork(
+                state_dim=STATE_DIM,
+                action_dim=ACTION_DIM,
+                num_hiddens=params.hidden_size,
+                num_hidden_layers=params.num_hidden_layers,
+                num_gaussians=params.num_gaussians,
+            ),
+            params,
+        )
+
+        def state():
+            state = torch.randn(SEQ_LEN, BATCH_SIZE, STATE_DIM)
+            state[:, :, 1:4] = torch.eye(3)[torch.randint(3, (SEQ_LEN, BATCH_SIZE))]
+            return FeatureData(float_features=state)
+
+        self.batch = PreprocessedMemoryNetworkInput(
+            state=state(),
+            action=torch.eye(ACTION_DIM)[
+                torch.randint(ACTION_DIM, (SEQ_LEN, BATCH_SIZE))
+            ],
+            next_state=state(),
+            reward=torch.randn(SEQ_LEN, BATCH_SIZE),
+            time_diff=torch.ones(SEQ_LEN, BATCH_SIZE),
+            not_terminal=torch.ones(SEQ_LEN, BATCH_SIZE),
+            step=None,
+        )
+
+    def _feature_importance(self, evaluator_cls, discrete_action, **kwargs):
+        evaluator = evaluator_cls(
+            self.trainer,
+            discrete_action=discrete_action,
+            state_feature_num=len(STATE_FEATURE_START_INDICES),
+            action_feature_num=ACTION_DIM,
+            sorted_action_feature_start_indices=list(range(ACTION_DIM)),
+            sorted_state_feature_start_indices=STATE_FEATURE_START_INDICES,
+            **kwargs,
+        )
+        return evaluator.evaluate(self.batch)["feature_loss_increase"]
+
+    def test_batched_feature_importance(self):
+        for discrete_action in [True, False]:
+            expected = self._feature_importance(
+                FeatureImportanceEvaluator, discrete_action
+            )
+            # All at once, in chunks of 3 variants and one variant at a time
+            for max_batch_size in [None, 3 * BATCH_SIZE, 1]:
+                npt.assert_allclose(
+                    self._feature_importance(
+                        BatchedFeatureImportanceEvaluator,
+                        discrete_action,
+                        max_batch_size=max_batch_size,
+                    ),
+                    expected,
+                    rtol=1e-4,
+                    atol=1e-5,
+                )
+        self.assertTrue(self.trainer.memory_network.mdnrnn.training)
+
+    def test_batched_feature_sensitivity(self):
+        results = []
+        for evaluator_cls in [
+            FeatureSensitivityEvaluator,
+            BatchedFeatureSensitivityEvaluator,
+        ]:
+            evaluator = evaluator_cls(
+                self.trainer,
+                state_feature_num=len(STATE_FEATURE_START_INDICES),
+                sorted_state_feature_start_indices=STATE_FEATURE_START_INDICES,
+            )
+            # Same shuffling of the actions
+            torch.manual_seed(1)
+            results.append(evaluator.evaluate(self.batch)["feature_sensitivity"])
+        npt.assert_allclose(results[1], results[0], rtol=1e-5)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+CPU benchmark of EmbeddingBagConcat with one EmbeddingBag per id-list
+feature vs. the fused lookup.
+
+    python -m reagent.test.models.benchmark_embedding_bag_concat \
+        --num-features 10 50 --batch-sizes 32 256
+
+The forward pass gains the most; the backward pass is dominated by the dense
+gradient of the tables, which is the same either way.
+"""
+
+import argparse
+import sys
+import timeit
+
+import torch
+from reagent.models.embedding_bag_concat import EmbeddingBagConcat
+from reagent.test.models.test_utils import make_model_feature_config, make_state
+
+
+def _time(fns, num_iters: int, num_repeats: int = 7):
+    """ Best-of-`num_repeats` seconds per call; repeats are interleaved """
+    best = [float("inf")] * len(fns)
+    for _ in range(num_repeats):
+        for i, fn in enumerate(fns):
+            best[i] = min(best[i], timeit.timeit(fn, number=num_iters) / num_iters)
+    return best
+
+
+def run_benchmark(
+    num_features_list, batch_sizes, num_ids: int, embedding_dim: int, num_iters: int
+):
+    state_dim = 10
+    for num_features in num_features_list:
+        config = make_model_feature_config(num_features, num_ids)
+        separate, fused = [
+            EmbeddingBagConcat(state_dim, config, embedding_dim, fused=fused)
+            for fused in [False, True]
+        ]
+        for batch_size in batch_sizes:
+            state = make_state(config, state_dim, batch_size)
+            with torch.no_grad():
+                forward_times = _time(
+                    [lambda: separate(state), lambda: fused(state)], num_iters
+                )
+            backward_times = _time(
+                [
+                    lambda: separate(state).sum().backward(),
+                    lambda: fused(state).sum().backward(),
+                ],
+                num_iters,
+            )
+            for name, (separate_time, fused_time) in [
+                ("forward", forward_times),
+                ("forward+backward", backward_times),
+            ]:
+                print(
+                    f"num_features={num_features:4d} batch_size={batch_size:5d} "
+                    f"{name:>16s}: separate {separate_time * 1e3:7.3f}ms, "
+                    f"fused {fused_time * 1e3:7.3f}ms "
+                    f"(speedup {separate_time / fused_time:.2f}x)"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-features", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 256])
+    parser.add_argument("--num-ids", type=int, default=1000)
+    parser.add_argument("--embedding-dim", type=int, default=32)
+    parser.add_argument("--num-iters", type=int, default=100)
+    args = parser.parse_args(sys.argv[1:])
+
+    run_benchmark(
+        args.num_features,
+        args.batch_sizes,
+        args.num_ids,
+        args.embedding_dim,
+        args.num_iters,
+    )
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import unittest
+
+import torch
+from reagent.models.embedding_bag_concat import EmbeddingBagConcat
+from reagent.test.models.test_utils import make_model_feature_config, make_state
+
+
+STATE_DIM = 4
+EMBEDDING_DIM = 8
+
+
+class TestFusedEmbeddingBag(unittest.TestCase):
+    def setUp(self):
+        self.config = make_model_feature_config(num_features=5, num_ids=20)
+        models = []
+        for fused in [False, True]:
+            # Same initialization
+            torch.manual_seed(0)
+            models.append(
+                EmbeddingBagConcat(STATE_DIM, self.config, EMBEDDING_DIM, fused=fused)
+            )
+        self.separate, self.fused = models
+
+    def test_same_output_and_gradients(self):
+        state = make_state(self.config, STATE_DIM, batch_size=16)
+        # Some bags are empty
+        self.assertTrue(
+            any(
+                (offsets[1:] == offsets[:-1]).any()
+                for offsets, _ in state.id_list_features.values()
+            )
+        )
+        output = self.separate(state)
+        fused_output = self.fused(state)
+        self.assertTrue(torch.equal(output, fused_output))
+
+        grad = torch.randn_like(output)
+        output.backward(grad)
+        fused_output.backward(grad)
+        for name, embedding_bag in self.separate.embedding_bags.items():
+            self.assertTrue(
+                torch.allclose(
+                    embedding_bag.weight.grad,
+                    self.fused.embedding_bags.weight.grad[self._table_rows(name)],
+                )
+            )
+
+    def _table_rows(self, name):
+        bags = self.fused.embedding_bags
+        start = bags.table_offsets[bags.feature_names.index(name)]
+        return slice(start, start + bags.num_embeddings[name])
+
+    def test_trace(self):
+        traced = torch.jit.trace(
+            self.fused.embedding_bags,
+            (make_state(self.config, STATE_DIM, batch_size=3).id_list_features,),
+        )
+        # The trace doesn't bake in the batch size nor the number of ids
+        state = make_state(self.config, STATE_DIM, batch_size=11, seed=1)
+        self.assertTrue(
+            torch.equal(
+                traced(state.id_list_features), self.separate(state)[:, :-STATE_DIM],
+            )
+        )
@@ -3,8 +3,10 @@
 
 import logging
 
+import numpy as np
 import torch
 import numpy.testing as npt
+from reagent import types as rlt
 
 
 logger = logging.getLogger(__name__)
@@ -30,3 +32,46 @@ def check_save_load(
     #     self.assertEqual(x, y)
 
     pass
+
+
+def make_model_feature_config(num_features: int, num_ids: int):
+    return rlt.ModelFeatureConfig(
+        float_feature_infos=[],
+        id_list_feature_configs=[
+            rlt.IdListFeatureConfig(
+                name=f"f{i}", feature_id=100 + i, id_mapping_name=f"m{i}"
+            )
+            for i in range(num_features)
+        ],
+        id_mapping_config={
+            f"m{i}": rlt.IdMapping(ids=list(range(num_ids)))
+            for i in range(num_features)
+        },
+    )
+
+
+def make_state(
+    model_feature_config: rlt.ModelFeatureConfig,
+    state_dim: int,
+    batch_size: int,
+    max_ids_per_bag: int = 5,
+    seed: int = 0,
+):
+    """ Random bags (some empty) of uniform ids for each feature """
+    rng = np.random.RandomState(seed)
+    id_list_features = {}
+    for config in model_feature_config.id_list_feature_configs:
+        num_ids = len(
+            model_feature_config.id_mapping_config[config.id_mapping_name].ids
+        )
+        lengths = rng.randint(max_ids_per_bag + 1, size=batch_size)
+        ids = rng.randint(num_ids, size=lengths.sum())
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        id_list_features[config.name] = (
+            torch.from_numpy(offsets).long(),
+            torch.from_numpy(ids).long(),
+        )
+    return rlt.FeatureData(
+        float_features=torch.randn(batch_size, state_dim),
+        id_list_features=id_list_features,
+    )
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+CPU benchmark of the batch preprocessors with and without stacked
+state/next_state preprocessing.
+
+    python -m reagent.test.preprocessing.benchmark_batch_preprocessor \
+        --num-features 200 --batch-sizes 64 256 1024 4096
+
+Stacking saves the per-call overhead of the Preprocessor (one op per feature
+type instead of two), so the gain is largest at small batch sizes; at large
+batch sizes preprocessing is compute bound (e.g., QUANTILE features) and the
+extra concatenation about cancels out.
+"""
+
+import argparse
+import sys
+import timeit
+
+import torch
+from reagent.preprocessing.batch_preprocessor import DiscreteDqnBatchPreprocessor
+from reagent.preprocessing.preprocessor import Preprocessor
+from reagent.test.preprocessing.preprocessing_util import (
+    DISTRIBUTIONS,
+    make_discrete_dqn_batch,
+    make_normalization_parameters,
+)
+
+
+def run_benchmark(num_features: int, batch_sizes, num_iters: int):
+    normalization_parameters = make_normalization_parameters(num_features)
+    preprocessor = Preprocessor(normalization_parameters, False)
+    for batch_size in batch_sizes:
+        batch = make_discrete_dqn_batch(normalization_parameters, batch_size)
+        timings = {}
+        for stack in [False, True]:
+            batch_preprocessor = DiscreteDqnBatchPreprocessor(
+                num_actions=4,
+                state_preprocessor=preprocessor,
+                use_gpu=False,
+                stack_preprocessing=stack,
+            )
+            with torch.no_grad():
+                timings[stack] = (
+                    min(
+                        timeit.repeat(
+                            lambda: batch_preprocessor(batch),
+                            number=num_iters,
+                            repeat=5,
+                        )
+                    )
+                    / num_iters
+                )
+        print(
+            f"batch_size={batch_size:6d}: "
+            f"separate {batch_size / timings[False]:10.0f} rows/s, "
+            f"stacked {batch_size / timings[True]:10.0f} rows/s "
+            f"(speedup {timings[False] / timings[True]:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-features", type=int, default=200)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[64, 256, 1024, 4096]
+    )
+    parser.add_argument(
+        "--distributions", nargs="+", choices=DISTRIBUTIONS, default=DISTRIBUTIONS
+    )
+    parser.add_argument("--num-iters", type=int, default=20)
+    args = parser.parse_args(sys.argv[1:])
+
+    DISTRIBUTIONS[:] = args.distributions
+    run_benchmark(args.num_features, args.batch_sizes, args.num_iters)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+CPU benchmark of FastPreprocessor vs. Preprocessor on synthetic mixed
+features (CONTINUOUS, BOXCOX, QUANTILE, ENUM and BINARY), eager, and
+scripted for FastPreprocessor:
+
+    python -m reagent.test.preprocessing.benchmark_fast_preprocessor \
+        --num-features 1200 --batch-sizes 64 512 4096
+
+Reports the max absolute difference of the outputs w.r.t. Preprocessor.
+"""
+
+import argparse
+import sys
+import timeit
+
+import numpy as np
+import torch
+from reagent.preprocessing.fast_preprocessor import FastPreprocessor
+from reagent.preprocessing.preprocessor import Preprocessor
+from reagent.test.preprocessing.preprocessing_util import (
+    DISTRIBUTIONS,
+    make_features,
+    make_normalization_parameters,
+)
+
+
+def run_benchmark(num_features: int, batch_sizes, num_iters: int):
+    normalization_parameters = make_normalization_parameters(num_features)
+    preprocessors = {
+        "Preprocessor": Preprocessor(normalization_parameters, False),
+        "FastPreprocessor": FastPreprocessor(normalization_parameters),
+    }
+    # Preprocessor iterates over module-level globals, which TorchScript
+    # doesn't support, so only FastPreprocessor is also scripted
+    preprocessors["scripted FastPreprocessor"] = torch.jit.script(
+        FastPreprocessor(normalization_parameters).eval()
+    )
+    for batch_size in batch_sizes:
+        value, presence = make_features(
+            normalization_parameters, batch_size, np.random.RandomState(0)
+        )
+        with torch.no_grad():
+            expected = preprocessors["Preprocessor"](value, presence)
+            results = {}
+            for name, preprocessor in preprocessors.items():
+                error = (preprocessor(value, presence) - expected).abs().max().item()
+                elapsed = (
+                    min(
+                        timeit.repeat(
+                            lambda: preprocessor(value, presence),
+                            number=num_iters,
+                            repeat=5,
+                        )
+                    )
+                    / num_iters
+                )
+                results[name] = (elapsed, error)
+        base_time = results["Preprocessor"][0]
+        print(
+            f"batch_size={batch_size:6d}: "
+            + ", ".join(
+                f"{name} {elapsed * 1000:8.3f}ms "
+                f"(speedup {base_time / elapsed:.1f}x, error {error:.1e})"
+                for name, (elapsed, error) in results.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-features", type=int, default=1200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[64, 512, 4096])
+    parser.add_argument(
+        "--distributions", nargs="+", choices=DISTRIBUTIONS, default=DISTRIBUTIONS
+    )
+    parser.add_argument("--num-iters", type=int, default=10)
+    args = parser.parse_args(sys.argv[1:])
+
+    DISTRIBUTIONS[:] = args.distributions
+    run_benchmark(args.num_features, args.batch_sizes, args.num_iters)
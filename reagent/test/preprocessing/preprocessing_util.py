@@ -1,7 +1,17 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
 
+from typing import Dict
+
 import numpy as np
+import torch
+from reagent.preprocessing import transforms
+from reagent.preprocessing.normalization import (
+    MISSING_VALUE,
+    NormalizationParameters,
+    identify_parameter,
+)
+from reagent.preprocessing.preprocessor import Preprocessor
 from scipy import stats
 
 
@@ -70,3 +80,131 @@ def read_data():
     ).astype(np.float32)
 
     return feature_value_map
+
+
+# Distributions of the synthetic features; feature `i` is drawn from
+# DISTRIBUTIONS[i % len(DISTRIBUTIONS)]. They identify as CONTINUOUS, BOXCOX,
+# QUANTILE, ENUM and BINARY.
+DISTRIBUTIONS = ["normal", "exponential", "heavy_tailed", "enum", "binary"]
+
+
+def synthetic_values(feature: int, size: int, rng) -> np.ndarray:
+    distribution = DISTRIBUTIONS[feature % len(DISTRIBUTIONS)]
+    if distribution == "normal":
+        values = rng.normal(size=size)
+    elif distribution == "exponential":
+        values = rng.exponential(size=size)
+    elif distribution == "heavy_tailed":
+        values = rng.standard_cauchy(size=size)
+    elif distribution == "enum":
+        values = rng.randint(5, size=size) * 10
+    else:
+        values = rng.randint(2, size=size)
+    return values.astype(np.float32)
+
+
+def make_normalization_parameters(
+    num_features: int, seed: int = 0
+) -> Dict[int, NormalizationParameters]:
+    rng = np.random.RandomState(seed)
+    return {
+        i: identify_parameter(
+            i, synthetic_values(i, 1000, rng), max_unique_enum_values=10
+        )
+        for i in range(num_features)
+    }
+
+
+def make_features(
+    normalization_parameters: Dict[int, NormalizationParameters], batch_size: int, rng,
+):
+    """ (value, presence) in the sorted feature order of the Preprocessor """
+    preprocessor = Preprocessor(normalization_parameters, False)
+    columns = [
+        synthetic_values(f, batch_size, rng) for f in preprocessor.sorted_features
+    ]
+    value = torch.from_numpy(np.stack(columns, axis=1))
+    # Knock out some values to exercise the presence mask
+    value[torch.from_numpy(rng.rand(*value.shape) < 0.1)] = MISSING_VALUE
+    return value, value != MISSING_VALUE
+
+
+def make_discrete_dqn_batch(
+    normalization_parameters: Dict[int, NormalizationParameters],
+    batch_size: int,
+    num_actions: int = 4,
+    seed: int = 0,
+) -> Dict[str, torch.Tensor]:
+    rng = np.random.RandomState(seed)
+    state, state_presence = make_features(normalization_parameters, batch_size, rng)
+    next_state, next_state_presence = make_features(
+        normalization_parameters, batch_size, rng
+    )
+    return {
+        "state_features": state,
+        "state_features_presence": state_presence,
+        "next_state_features": next_state,
+        "next_state_features_presence": next_state_presence,
+        "action": torch.randint(num_actions, (batch_size,)),
+        "next_action": torch.randint(num_actions + 1, (batch_size,)),
+        "possible_actions_mask": torch.ones(batch_size, num_actions),
+        "possible_next_actions_mask": torch.ones(batch_size, num_actions),
+        "reward": torch.randn(batch_size),
+        "time_diff": torch.ones(batch_size),
+        "step": torch.ones(batch_size),
+        "not_terminal": torch.ones(batch_size),
+        "mdp_id": torch.arange(batch_size),
+        "sequence_number": torch.arange(batch_size),
+        "action_probability": torch.rand(batch_size),
+    }
+
+
+def make_batch_dict(
+    state_normalization_parameters: Dict[int, NormalizationParameters],
+    action_normalization_parameters: Dict[int, NormalizationParameters],
+    batch_size: int,
+    seed: int = 0,
+):
+    """ The dict of a parametric timeline batch, before ValuePresence """
+    rng = np.random.RandomState(seed)
+    data = {}
+    for name, normalization_parameters in [
+        ("state_features", state_normalization_parameters),
+        ("next_state_features", state_normalization_parameters),
+        ("action", action_normalization_parameters),
+        ("next_action", action_normalization_parameters),
+    ]:
+        data[name], data[f"{name}_presence"] = make_features(
+            normalization_parameters, batch_size, rng
+        )
+    data.update(
+        {
+            "reward": torch.randn(batch_size),
+            "time_diff": torch.ones(batch_size),
+            "step": torch.ones(batch_size),
+            "not_terminal": torch.ones(batch_size),
+            "action_probability": torch.rand(batch_size),
+        }
+    )
+    return data
+
+
+def make_pipeline(
+    state_normalization_parameters: Dict[int, NormalizationParameters],
+    action_normalization_parameters: Dict[int, NormalizationParameters],
+) -> transforms.Compose:
+    return transforms.Compose(
+        transforms.ValuePresence(),
+        transforms.DenseNormalization(
+            ["state_features"], state_normalization_parameters
+        ),
+        transforms.DenseNormalization(
+            ["next_state_features"], state_normalization_parameters
+        ),
+        transforms.DenseNormalization(
+            ["action", "next_action"], action_normalization_parameters
+        ),
+        transforms.ColumnVector(
+            ["reward", "time_diff", "step", "not_terminal", "action_probability"]
+        ),
+    )
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import unittest
+
+import numpy as np
+import torch
+from reagent import types as rlt
+from reagent.preprocessing.batch_preprocessor import (
+    DiscreteDqnBatchPreprocessor,
+    ParametricDqnBatchPreprocessor,
+    PolicyNetworkBatchPreprocessor,
+)
+from reagent.preprocessing.fast_preprocessor import FastPreprocessor
+from reagent.preprocessing.preprocessor import Preprocessor
+from reagent.test.preprocessing.preprocessing_util import (
+    make_discrete_dqn_batch,
+    make_features,
+    make_normalization_parameters,
+)
+
+
+BATCH_SIZE = 64
+
+
+class TestBatchPreprocessor(unittest.TestCase):
+    def setUp(self):
+        self.state_normalization_parameters = make_normalization_parameters(20)
+        self.action_normalization_parameters = make_normalization_parameters(7, seed=1)
+        self.state_preprocessor = Preprocessor(
+            self.state_normalization_parameters, False
+        )
+        self.action_preprocessor = Preprocessor(
+            self.action_normalization_parameters, False
+        )
+
+    def assert_same_output(self, expected, output):
+        self.assertIs(type(expected), type(output))
+        expected_leaves, expected_spec = expected.tree_flatten()
+        leaves, spec = output.tree_flatten()
+        self.assertEqual(expected_spec, spec)
+        for expected_leaf, leaf in zip(expected_leaves, leaves):
+            self.assertTrue(torch.equal(expected_leaf, leaf))
+
+    def test_discrete_dqn_stacked(self):
+        batch = make_discrete_dqn_batch(self.state_normalization_parameters, BATCH_SIZE)
+        outputs = [
+            DiscreteDqnBatchPreprocessor(
+                num_actions=4,
+                state_preprocessor=self.state_preprocessor,
+                use_gpu=False,
+                stack_preprocessing=stack,
+            )(batch)
+            for stack in [False, True]
+        ]
+        self.assert_same_output(*outputs)
+
+    def test_discrete_dqn_fast_preprocessor(self):
+        # FastPreprocessor is a drop-in state preprocessor, see
+        # DiscreteDQNBase.use_fast_preprocessor
+        batch = make_discrete_dqn_batch(self.state_normalization_parameters, BATCH_SIZE)
+        outputs = [
+            DiscreteDqnBatchPreprocessor(
+                num_actions=4, state_preprocessor=state_preprocessor, use_gpu=False
+            )(batch)
+            for state_preprocessor in [
+                self.state_preprocessor,
+                FastPreprocessor(self.state_normalization_parameters),
+            ]
+        ]
+        self.assert_same_output(*outputs)
+
+    def test_policy_network_stacked(self):
+        rng = np.random.RandomState(1)
+        batch = make_discrete_dqn_batch(self.state_normalization_parameters, BATCH_SIZE)
+        for name in ["action", "next_action"]:
+            batch[name], batch[f"{name}_presence"] = make_features(
+                self.action_normalization_parameters, BATCH_SIZE, rng
+            )
+        outputs = [
+            PolicyNetworkBatchPreprocessor(
+                state_preprocessor=self.state_preprocessor,
+                action_preprocessor=self.action_preprocessor,
+                use_gpu=False,
+                stack_preprocessing=stack,
+            )(batch)
+            for stack in [False, True]
+        ]
+        self.assert_same_output(*outputs)
+
+    def test_parametric_dqn_stacked(self):
+        rng = np.random.RandomState(2)
+        max_num_actions = 3
+
+        def feature_data(normalization_parameters, batch_size):
+            value, presence = make_features(normalization_parameters, batch_size, rng)
+            return rlt.RawFeatureData(
+                float_features=rlt.ValuePresence(value=value, presence=presence)
+            )
+
+        def state(batch_size=BATCH_SIZE):
+            return feature_data(self.state_normalization_parameters, batch_size)
+
+        def action(batch_size=BATCH_SIZE):
+            return feature_data(self.action_normalization_parameters, batch_size)
+
+        batch = rlt.RawTrainingBatch(
+            training_input=rlt.RawParametricDqnInput(
+                state=state(),
+                next_state=state(),
+                # Tiled/possible inputs have a different number of rows
+                tiled_next_state=state(BATCH_SIZE * max_num_actions),
+                action=action(),
+                next_action=action(),
+                possible_actions=action(BATCH_SIZE * max_num_actions),
+                possible_next_actions=action(BATCH_SIZE * max_num_actions),
+                possible_actions_mask=torch.ones(BATCH_SIZE, max_num_actions),
+                possible_next_actions_mask=torch.ones(BATCH_SIZE, max_num_actions),
+                reward=torch.randn(BATCH_SIZE, 1),
+                time_diff=torch.ones(BATCH_SIZE, 1),
+                step=torch.ones(BATCH_SIZE, 1),
+                not_terminal=torch.ones(BATCH_SIZE, 1),
+            ),
+            extras=rlt.ExtraData(),
+        )
+        outputs = [
+            ParametricDqnBatchPreprocessor(
+                state_preprocessor=self.state_preprocessor,
+                action_preprocessor=self.action_preprocessor,
+                stack_preprocessing=stack,
+            )(batch)
+            for stack in [False, True]
+        ]
+        self.assert_same_output(*outputs)
+        self.assertEqual(
+            outputs[1].training_input.possible_actions.float_features.shape[0],
+            BATCH_SIZE * max_num_actions,
+        )
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+import torch
+from reagent.preprocessing import identify_types, normalization
+from reagent.preprocessing.fast_preprocessor import FastPreprocessor
+from reagent.preprocessing.normalization import (
+    MISSING_VALUE,
+    NormalizationParameters,
+    sort_features_by_normalization,
+)
+from reagent.preprocessing.preprocessor import Preprocessor
+from reagent.test.preprocessing.preprocessing_util import id_to_type, read_data
+
+
+class TestFastPreprocessor(unittest.TestCase):
+    def _get_normalization_and_input(self):
+        feature_value_map = read_data()
+        normalization_parameters = {}
+        for name, values in feature_value_map.items():
+            feature_type = None
+            if id_to_type(name) == identify_types.CONTINUOUS_ACTION:
+                feature_type = identify_types.CONTINUOUS_ACTION
+            normalization_parameters[name] = normalization.identify_parameter(
+                name, values, 10, feature_type=feature_type
+            )
+        sorted_features, _ = sort_features_by_normalization(normalization_parameters)
+        input_matrix = torch.zeros([10000, len(sorted_features)])
+        for i, feature in enumerate(sorted_features):
+            input_matrix[:, i] = torch.from_numpy(feature_value_map[feature])
+        # Knock out some values to exercise the presence mask
+        input_matrix[::7, :] = MISSING_VALUE
+        return normalization_parameters, input_matrix
+
+    def test_matches_preprocessor(self):
+        normalization_parameters, input_matrix = self._get_normalization_and_input()
+        feature_types = {p.feature_type for p in normalization_parameters.values()}
+        self.assertEqual(
+            feature_types,
+            set(identify_types.FEATURE_TYPES) - {identify_types.DO_NOT_PREPROCESS},
+        )
+        presence = input_matrix != MISSING_VALUE
+
+        preprocessor = Preprocessor(normalization_parameters, False)
+        fast_preprocessor = FastPreprocessor(normalization_parameters)
+        expected = preprocessor(input_matrix, presence)
+        output = fast_preprocessor(input_matrix, presence)
+        self.assertEqual(output.shape, expected.shape)
+        npt.assert_allclose(output.numpy(), expected.numpy(), rtol=1e-5, atol=1e-5)
+
+        scripted = torch.jit.script(fast_preprocessor.eval())
+        npt.assert_allclose(
+            scripted(input_matrix, presence).numpy(),
+            expected.numpy(),
+            rtol=1e-5,
+            atol=1e-5,
+        )
+
+    def test_enum_and_do_not_preprocess(self):
+        normalization_parameters = {
+            1: NormalizationParameters(
+                identify_types.ENUM, None, None, None, None, [12, 4, 2], None, None
+            ),
+            2: NormalizationParameters(
+                identify_types.CONTINUOUS, None, 0, 0, 1, None, None, None
+            ),
+            3: NormalizationParameters(
+                identify_types.ENUM, None, None, None, None, [15, 3], None, None
+            ),
+            4: NormalizationParameters(
+                identify_types.DO_NOT_PREPROCESS, None, None, 0, 1, None, None, None
+            ),
+        }
+        inputs = torch.tensor(
+            [
+                [1.0, 12, 15, 0.5],
+                [2.0, 4, 3, 1.5],
+                [3.0, 2, 15, 2.5],
+                [3.0, 2, MISSING_VALUE, 7.0],
+            ]
+        )
+        fast_preprocessor = FastPreprocessor(normalization_parameters).eval()
+        output = fast_preprocessor(inputs, inputs != MISSING_VALUE)
+        npt.assert_allclose(
+            output.numpy(),
+            np.array(
+                [
+                    [1.0, 1, 0, 0, 1, 0, 0.5],
+                    [2.0, 0, 1, 0, 0, 1, 1.5],
+                    [3.0, 0, 0, 1, 1, 0, 2.5],
+                    # Missing values should go to all 0; output is clamped
+                    [3.0, 0, 0, 1, 0, 0, 6.0],
+                ]
+            ),
+        )
+
+    def test_quantile_boundary_logic(self):
+        """Test quantile logic when feaure value == quantile boundary."""
+        input = torch.tensor([[-5.0], [0.0], [40.0], [80.0], [100.0], [150.0]])
+        norm_params = NormalizationParameters(
+            feature_type=identify_types.QUANTILE,
+            boxcox_lambda=None,
+            boxcox_shift=None,
+            mean=0,
+            stddev=1,
+            possible_values=None,
+            quantiles=[0.0, 80.0, 100.0],
+            min_value=0.0,
+            max_value=100.0,
+        )
+        output = FastPreprocessor({1: norm_params})(input, torch.ones_like(input))
+        expected_output = torch.tensor([[0.0], [0.0], [0.25], [0.5], [1.0], [1.0]])
+        npt.assert_allclose(output.numpy(), expected_output.numpy(), atol=1e-5)
+
+    def test_range_check_in_training(self):
+        norm_params = NormalizationParameters(
+            identify_types.DO_NOT_PREPROCESS, None, None, 0, 1, None, None, None
+        )
+        fast_preprocessor = FastPreprocessor({1: norm_params})
+        fast_preprocessor.train()
+        with self.assertRaises(Exception):
+            fast_preprocessor(torch.tensor([[10.0]]), torch.ones(1, 1))
+        fast_preprocessor.eval()
+        output = fast_preprocessor(torch.tensor([[10.0]]), torch.ones(1, 1))
+        self.assertEqual(output.item(), normalization.MAX_FEATURE_VALUE)
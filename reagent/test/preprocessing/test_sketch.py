@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+from reagent.preprocessing import identify_types, normalization
+from scipy import stats
+from reagent.preprocessing.sketch import (
+    FeatureSketch,
+    KllSketch,
+    build_feature_sketches,
+    identify_parameter_from_sketch,
+    merge_feature_sketches,
+)
+from reagent.test.preprocessing.preprocessing_util import (
+    BOXCOX_FEATURE_ID,
+    CONTINUOUS_FEATURE_ID,
+    ENUM_FEATURE_ID,
+    QUANTILE_FEATURE_ID,
+    read_data,
+)
+
+
+class TestSketch(unittest.TestCase):
+    def test_kll_quantiles(self):
+        np.random.seed(0)
+        values = np.random.exponential(size=200000)
+        sketch = KllSketch(seed=0)
+        for chunk in np.array_split(values, 7):
+            sketch.update(chunk)
+        self.assertLess(sum(len(c) for c in sketch.compactors), 2000)
+        qs = np.linspace(0.01, 0.99, 99)
+        ranks = np.searchsorted(np.sort(values), sketch.quantiles(qs)) / len(values)
+        self.assertLess(np.max(np.abs(ranks - qs)), 0.01)
+
+    def test_merge_matches_single_pass(self):
+        np.random.seed(0)
+        values = np.random.normal(loc=3.0, scale=2.0, size=10000)
+        single = FeatureSketch().update(values)
+        merged = FeatureSketch()
+        for chunk in np.array_split(values, 5):
+            merged.merge(FeatureSketch().update(chunk))
+        self.assertEqual(merged.count, single.count)
+        self.assertAlmostEqual(merged.mean, np.mean(values))
+        self.assertAlmostEqual(merged.stddev, np.std(values, ddof=1))
+        self.assertEqual(merged.min_value, np.min(values))
+        self.assertEqual(merged.max_value, np.max(values))
+        self.assertIsNone(merged.unique_values)
+        for sketch_values in [values, np.exp(values / 2)]:
+            sketch = FeatureSketch()
+            for chunk in np.array_split(sketch_values, 5):
+                sketch.merge(FeatureSketch().update(chunk))
+            npt.assert_allclose(
+                sketch.normaltest(), stats.normaltest(sketch_values), rtol=1e-8
+            )
+
+    def test_seed(self):
+        np.random.seed(0)
+        values = np.random.exponential(size=20000)
+        quantiles = [
+            FeatureSketch(seed=seed).update(values).representative_sample(50)
+            for seed in [None, 0, 1]
+        ]
+        # None is the default seed
+        npt.assert_array_equal(quantiles[0], quantiles[1])
+        self.assertFalse(np.array_equal(quantiles[1], quantiles[2]))
+
+    def test_build_feature_sketches(self):
+        names = np.array([2, 1, 2, 1, 2])
+        values = np.array([1.0, 3.0, 0.0, 4.0, 1.0])
+        sketches = build_feature_sketches(names, values)
+        self.assertEqual(sorted(sketches.keys()), [1, 2])
+        self.assertEqual(sketches[1].unique_values.tolist(), [3.0, 4.0])
+        self.assertTrue(sketches[2].all_binary)
+        merged = merge_feature_sketches(
+            sketches, build_feature_sketches(np.array([1]), np.array([5.5]))
+        )
+        self.assertEqual(merged[1].count, 3)
+        self.assertFalse(merged[1].all_integer)
+
+    def test_identify_parameter_from_sketch(self):
+        feature_value_map = read_data()
+        for seed in range(5):
+            for name, values in feature_value_map.items():
+                self._check_identify_parameter_from_sketch(name, values, seed)
+
+    def _check_identify_parameter_from_sketch(self, name, values, seed):
+        sketch = FeatureSketch(seed=seed)
+        for chunk in np.array_split(values, 4):
+            sketch.merge(FeatureSketch(seed=seed).update(chunk))
+        self.assertEqual(sketch.identify_type(), identify_types.identify_type(values))
+        expected = normalization.identify_parameter(name, values, 10)
+        params = identify_parameter_from_sketch(name, sketch, 10)
+        msg = f"feature {name}, seed {seed}"
+        self.assertEqual(params.feature_type, expected.feature_type, msg)
+        self.assertEqual(params.possible_values, expected.possible_values)
+        npt.assert_allclose(params.min_value, expected.min_value, rtol=1e-6)
+        npt.assert_allclose(params.max_value, expected.max_value, rtol=1e-6)
+        if name == CONTINUOUS_FEATURE_ID:
+            npt.assert_allclose(params.mean, expected.mean, atol=1e-5)
+            npt.assert_allclose(params.stddev, expected.stddev, rtol=1e-5)
+        elif name == BOXCOX_FEATURE_ID:
+            self.assertEqual(params.boxcox_shift, expected.boxcox_shift)
+            npt.assert_allclose(params.boxcox_lambda, expected.boxcox_lambda, atol=0.02)
+            npt.assert_allclose(params.mean, expected.mean, atol=0.01)
+            npt.assert_allclose(params.stddev, expected.stddev, rtol=0.01)
+        elif name == QUANTILE_FEATURE_ID:
+            # KLL bounds the rank error of the quantiles, not their value
+            self.assertEqual(len(params.quantiles), len(expected.quantiles))
+            ranks = np.searchsorted(np.sort(values), params.quantiles) / len(values)
+            expected_ranks = np.searchsorted(np.sort(values), expected.quantiles) / len(
+                values
+            )
+            npt.assert_allclose(ranks, expected_ranks, atol=0.01)
+            npt.assert_allclose(
+                [params.quantiles[0], params.quantiles[-1]],
+                [expected.quantiles[0], expected.quantiles[-1]],
+                rtol=1e-6,
+            )
+        elif name == ENUM_FEATURE_ID:
+            self.assertEqual(params.possible_values, list(range(0, 10000, 1000)))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import pickle
+import unittest
+
+import torch
+from reagent.preprocessing import transforms
+from reagent.test.preprocessing.preprocessing_util import (
+    make_batch_dict,
+    make_normalization_parameters,
+    make_pipeline,
+)
+
+
+class TestCompiledTransforms(unittest.TestCase):
+    def setUp(self):
+        self.state_normalization_parameters = make_normalization_parameters(20)
+        self.action_normalization_parameters = make_normalization_parameters(7, seed=1)
+        self.pipeline = make_pipeline(
+            self.state_normalization_parameters, self.action_normalization_parameters
+        )
+
+    def assert_same_output(self, pipeline, compiled):
+        batch = make_batch_dict(
+            self.state_normalization_parameters,
+            self.action_normalization_parameters,
+            batch_size=32,
+        )
+        expected = pipeline(dict(batch))
+        output = compiled(dict(batch))
+        self.assertEqual(set(expected.keys()), set(output.keys()))
+        for k, v in expected.items():
+            # Keys not consumed by the pipeline stay (value, presence) tuples
+            for expected_tensor, tensor in zip(
+                v if isinstance(v, tuple) else (v,),
+                output[k] if isinstance(output[k], tuple) else (output[k],),
+            ):
+                self.assertEqual(expected_tensor.dtype, tensor.dtype, k)
+                self.assertTrue(torch.equal(expected_tensor, tensor), k)
+
+    def test_compile(self):
+        compiled = self.pipeline.compile()
+        fused = [
+            t
+            for t in compiled.transforms
+            if isinstance(t, transforms.FusedDenseNormalization)
+        ]
+        self.assertEqual(len(fused), 1)
+        self.assertEqual(
+            [keys for keys, _, _ in fused[0].groups],
+            [["state_features", "next_state_features"], ["action", "next_action"]],
+        )
+        self.assert_same_output(self.pipeline, compiled)
+        # Preprocessors are created lazily, after unpickling
+        self.assert_same_output(self.pipeline, pickle.loads(pickle.dumps(compiled)))
+
+    def test_nested_and_overlapping_keys(self):
+        normalize_state = transforms.DenseNormalization(
+            ["state_features"], self.state_normalization_parameters
+        )
+        pipeline = transforms.Compose(
+            transforms.Compose(transforms.ValuePresence(), normalize_state),
+            transforms.MaskByPresence(["action"]),
+        )
+        compiled = transforms.Compose(
+            pipeline, transforms.Compose(normalize_state)
+        ).compile()
+        # The second normalization of state_features can't be fused
+        self.assertEqual(
+            [type(t) for t in compiled.transforms],
+            [
+                transforms.ValuePresence,
+                transforms.FusedDenseNormalization,
+                transforms.MaskByPresence,
+                transforms.FusedDenseNormalization,
+            ],
+        )
+        compiled = pipeline.compile()
+        self.assertEqual(len(compiled.transforms), 3)
+        self.assert_same_output(pipeline, compiled)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+CPU benchmark of the simulated training inputs of Seq2SlateSimulationTrainer
+over several epochs of the same data, with and without a SlateRewardCache.
+
+    python -m reagent.test.training.benchmark_reward_cache \
+        --num-epochs 10 --num-batches 20 --batch-size 256
+
+With few candidates and short slates, the same (query, slate) pairs come
+back in later epochs and are looked up instead of going through the reward
+network again; the saving grows with the hit rate, while an epoch with few
+hits is slightly slower with the cache (hashing). The reward network is run
+once at every batch size the cache may use before timing, since TorchScript
+re-optimizes the first times it sees a new shape.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import torch
+from reagent.test.training.seq2slate_util import (
+    CANDIDATE_DIM,
+    make_trainer,
+    make_training_input,
+    save_reward_net,
+)
+from reagent.training.ranking.seq2slate_sim_trainer import (
+    SlateRewardCache,
+    _load_reward_net,
+    sample_permutations,
+)
+
+
+def warm_up(trainer, training_input) -> None:
+    """ Runs the reward net at the batch sizes the cache may use """
+    trainer.reward_net = _load_reward_net(trainer.reward_net_path, trainer.use_gpu)
+    batch_size = training_input.state.float_features.shape[0]
+    sizes = {batch_size}
+    size = 1
+    while size < batch_size:
+        sizes.add(size)
+        size *= 2
+    for size in sorted(sizes):
+        sim_tgt_out_idx = (
+            sample_permutations(
+                size, trainer.max_src_seq_len, trainer.max_tgt_seq_len, trainer.device
+            )
+            + 2
+        )
+        with torch.no_grad():
+            for _ in range(2):
+                trainer.reward_net(
+                    training_input.state.float_features[:size],
+                    training_input.src_seq.float_features[:size],
+                    torch.zeros(size, trainer.max_tgt_seq_len, CANDIDATE_DIM),
+                    training_input.src_src_mask[:size],
+                    sim_tgt_out_idx,
+                )
+
+
+def run_epochs(trainer, batches, num_epochs: int):
+    """ Seconds spent in each epoch """
+    warm_up(trainer, batches[0])
+    torch.manual_seed(0)
+    timings = []
+    for _ in range(num_epochs):
+        start = time.perf_counter()
+        for training_input in batches:
+            batch_size = training_input.state.float_features.shape[0]
+            sim_tgt_out_idx = (
+                sample_permutations(
+                    batch_size,
+                    trainer.max_src_seq_len,
+                    trainer.max_tgt_seq_len,
+                    trainer.device,
+                )
+                + 2
+            )
+            with torch.no_grad():
+                trainer._simulated_training_input(
+                    training_input, sim_tgt_out_idx, None, trainer.device
+                )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_benchmark(
+    num_epochs: int,
+    num_batches: int,
+    batch_size: int,
+    max_src_seq_len: int,
+    max_tgt_seq_len: int,
+    cache_size: int,
+):
+    batches = [
+        make_training_input(batch_size, max_src_seq_len, seed=i)
+        for i in range(num_batches)
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reward_net_path = os.path.join(tmp_dir, "reward_net.pt")
+        save_reward_net(reward_net_path, max_src_seq_len, max_tgt_seq_len)
+        reward_cache = SlateRewardCache(cache_size)
+        timings = {
+            name: run_epochs(
+                make_trainer(reward_net_path, max_src_seq_len, max_tgt_seq_len, cache),
+                batches,
+                num_epochs,
+            )
+            for name, cache in [("uncached", None), ("cached", reward_cache)]
+        }
+    for epoch in range(num_epochs):
+        uncached, cached = timings["uncached"][epoch], timings["cached"][epoch]
+        print(
+            f"epoch {epoch}: uncached {uncached:7.3f}s, cached {cached:7.3f}s "
+            f"(speedup {uncached / cached:.2f}x)"
+        )
+    uncached, cached = sum(timings["uncached"]), sum(timings["cached"])
+    print(
+        f"total: uncached {uncached:7.3f}s, cached {cached:7.3f}s "
+        f"(speedup {uncached / cached:.2f}x), "
+        f"hit rate {reward_cache.hit_rate:.2f}, "
+        f"{len(reward_cache.rewards)} cached rewards"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-epochs", type=int, default=10)
+    parser.add_argument("--num-batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-src-seq-len", type=int, default=3)
+    parser.add_argument("--max-tgt-seq-len", type=int, default=2)
+    parser.add_argument("--cache-size", type=int, default=100000)
+    args = parser.parse_args(sys.argv[1:])
+
+    run_benchmark(
+        args.num_epochs,
+        args.num_batches,
+        args.batch_size,
+        args.max_src_seq_len,
+        args.max_tgt_seq_len,
+        args.cache_size,
+    )
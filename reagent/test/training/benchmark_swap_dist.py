@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+CPU benchmark of `swap_dist` over a list of slates, one at a time in Python
+vs. batched on a tensor.
+
+    python -m reagent.test.training.benchmark_swap_dist \
+        --slate-sizes 5 10 20 --num-slates 2000
+"""
+
+import argparse
+import sys
+import time
+
+import torch
+from reagent.training.ranking.seq2slate_sim_trainer import (
+    batch_swap_dist,
+    sample_permutations,
+    swap_dist,
+)
+
+
+def _best_time(fn, num_repeats: int = 3):
+    best = float("inf")
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(slate_sizes, num_slates: int, num_candidates: int):
+    for slate_size in slate_sizes:
+        idx = sample_permutations(
+            num_slates, max(num_candidates, slate_size), slate_size, torch.device("cpu")
+        )
+        rows = [x.tolist() for x in idx]
+        python_time = _best_time(lambda: [swap_dist(x) for x in rows])
+        batched_time = _best_time(lambda: batch_swap_dist(idx))
+        print(
+            f"slate_size={slate_size:3d}: "
+            f"python {num_slates / python_time:12.0f} slates/s, "
+            f"batched {num_slates / batched_time:12.0f} slates/s "
+            f"(speedup {python_time / batched_time:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slate-sizes", type=int, nargs="+", default=[5, 10, 15, 20])
+    parser.add_argument("--num-slates", type=int, default=2000)
+    parser.add_argument("--num-candidates", type=int, default=30)
+    args = parser.parse_args(sys.argv[1:])
+
+    run_benchmark(args.slate_sizes, args.num_slates, args.num_candidates)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import reagent.types as rlt
+import torch
+from reagent.models.seq2slate import Seq2SlateTransformerNet
+from reagent.models.seq2slate_reward import (
+    Seq2SlateRewardNet,
+    Seq2SlateRewardNetJITWrapper,
+)
+from reagent.parameters import (
+    LearningMethod,
+    Seq2SlateTransformerParameters,
+    TransformerParameters,
+)
+from reagent.training.ranking.seq2slate_sim_trainer import Seq2SlateSimulationTrainer
+
+
+STATE_DIM = 3
+CANDIDATE_DIM = 4
+
+
+def save_reward_net(
+    path: str,
+    max_src_seq_len: int,
+    max_tgt_seq_len: int,
+    dim_model: int = 128,
+    num_stacked_layers: int = 4,
+) -> None:
+    """ Saves a traced Seq2SlateRewardNet, as the trainer expects it """
+    torch.manual_seed(0)
+    reward_net = Seq2SlateRewardNetJITWrapper(
+        Seq2SlateRewardNet(
+            STATE_DIM,
+            CANDIDATE_DIM,
+            num_stacked_layers,
+            num_heads=2,
+            dim_model=dim_model,
+            dim_feedforward=dim_model,
+            max_src_seq_len=max_src_seq_len,
+            max_tgt_seq_len=max_tgt_seq_len,
+        )
+    ).eval()
+    torch.jit.trace(reward_net, reward_net.input_prototype(), check_trace=False).save(
+        path
+    )
+
+
+def make_trainer(
+    reward_net_path: str, max_src_seq_len: int, max_tgt_seq_len: int, reward_cache=None,
+) -> Seq2SlateSimulationTrainer:
+    seq2slate_net = Seq2SlateTransformerNet(
+        STATE_DIM,
+        CANDIDATE_DIM,
+        num_stacked_layers=1,
+        num_heads=2,
+        dim_model=8,
+        dim_feedforward=8,
+        max_src_seq_len=max_src_seq_len,
+        max_tgt_seq_len=max_tgt_seq_len,
+        encoder_only=False,
+    )
+    parameters = Seq2SlateTransformerParameters(
+        transformer=TransformerParameters(
+            num_heads=2, dim_model=8, dim_feedforward=8, num_stacked_layers=1
+        ),
+        baseline=None,
+        on_policy=True,
+        learning_method=LearningMethod.SIMULATION,
+    )
+    return Seq2SlateSimulationTrainer(
+        seq2slate_net,
+        parameters,
+        minibatch_size=1,
+        reward_net_path=reward_net_path,
+        reward_cache=reward_cache,
+    )
+
+
+def make_training_input(
+    batch_size: int, max_src_seq_len: int, seed: int = 0
+) -> rlt.PreprocessedRankingInput:
+    generator = torch.Generator().manual_seed(seed)
+    return rlt.PreprocessedRankingInput.from_tensors(
+        state=torch.randn(batch_size, STATE_DIM, generator=generator),
+        src_seq=torch.randn(
+            batch_size, max_src_seq_len, CANDIDATE_DIM, generator=generator
+        ),
+        src_src_mask=torch.ones(batch_size, max_src_seq_len, max_src_seq_len),
+    )
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import os
+import tempfile
+import unittest
+from collections import Counter
+from itertools import permutations
+
+import numpy as np
+import torch
+from reagent.core.observers import ValueListObserver
+from reagent.test.training.seq2slate_util import (
+    make_trainer,
+    make_training_input,
+    save_reward_net,
+)
+from reagent.training.ranking.seq2slate_sim_trainer import (
+    SlateRewardCache,
+    batch_swap_dist,
+    batch_swap_dist_in_slate,
+    batch_swap_dist_out_slate,
+    max_swap_dist,
+    sample_permutations,
+    swap_dist,
+    swap_dist_in_slate,
+    swap_dist_out_slate,
+)
+from scipy.stats import chisquare
+
+
+class TestSeq2SlateSimulationSampling(unittest.TestCase):
+    def test_batch_swap_dist(self):
+        for src_seq_len, tgt_seq_len in [(4, 4), (5, 3), (6, 1)]:
+            idx = torch.tensor(list(permutations(range(src_seq_len), tgt_seq_len)))
+            expected = [swap_dist(x.tolist()) for x in idx]
+            self.assertEqual(batch_swap_dist(idx).tolist(), expected)
+            self.assertEqual(max_swap_dist(src_seq_len, tgt_seq_len), max(expected))
+        self.assertEqual(batch_swap_dist(torch.tensor([[0, 1, 5, 2]])).item(), 3)
+
+    def test_batch_swap_dist_large_slates(self):
+        torch.manual_seed(0)
+        for tgt_seq_len in [1, 5, 20]:
+            idx = sample_permutations(100, 30, tgt_seq_len, torch.device("cpu"))
+            rows = [x.tolist() for x in idx]
+            self.assertEqual(
+                batch_swap_dist_in_slate(idx, chunk_size=7).tolist(),
+                [swap_dist_in_slate(x) for x in rows],
+            )
+            self.assertEqual(
+                batch_swap_dist_out_slate(idx).tolist(),
+                [swap_dist_out_slate(x) for x in rows],
+            )
+        self.assertEqual(batch_swap_dist(torch.zeros(0, 4).long()).shape, (0,))
+
+    def test_sample_permutations_uniform(self):
+        torch.manual_seed(0)
+        src_seq_len, tgt_seq_len, num_samples = 5, 2, 20000
+        samples = sample_permutations(
+            num_samples, src_seq_len, tgt_seq_len, torch.device("cpu")
+        )
+        self.assertEqual(samples.shape, (num_samples, tgt_seq_len))
+        # Every row is a partial permutation
+        self.assertTrue(
+            (samples.sort(dim=1)[0][:, 1:] != samples.sort(dim=1)[0][:, :-1]).all()
+        )
+        counts = Counter(tuple(x) for x in samples.tolist())
+        all_permutations = list(permutations(range(src_seq_len), tgt_seq_len))
+        self.assertEqual(set(counts), set(all_permutations))
+        _, p_value = chisquare(np.array([counts[p] for p in all_permutations]))
+        self.assertGreater(p_value, 0.001)
+
+
+class TestSlateRewardCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.reward_net_path = os.path.join(self.tmp_dir.name, "reward_net.pt")
+        save_reward_net(self.reward_net_path, 3, 2, dim_model=8, num_stacked_layers=1)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def simulated_rewards(self, trainer, training_input, sim_tgt_out_idx):
+        with torch.no_grad():
+            return trainer._simulated_training_input(
+                training_input, sim_tgt_out_idx, None, trainer.device
+            ).slate_reward
+
+    def test_same_rewards(self):
+        torch.manual_seed(0)
+        reward_cache = SlateRewardCache(1000)
+        observers = {
+            key: ValueListObserver(key)
+            for key in ["reward_cache_hits", "reward_cache_misses"]
+        }
+        reward_cache.add_observers(list(observers.values()))
+        trainer = make_trainer(self.reward_net_path, 3, 2)
+        cached_trainer = make_trainer(self.reward_net_path, 3, 2, reward_cache)
+        training_input = make_training_input(20, 3)
+        for _ in range(3):
+            sim_tgt_out_idx = sample_permutations(20, 3, 2, trainer.device) + 2
+            expected = self.simulated_rewards(trainer, training_input, sim_tgt_out_idx)
+            rewards = self.simulated_rewards(
+                cached_trainer, training_input, sim_tgt_out_idx
+            )
+            self.assertEqual(rewards.shape, (20, 1))
+            self.assertTrue(torch.allclose(rewards, expected, atol=1e-6))
+
+        hits = observers["reward_cache_hits"].values
+        misses = observers["reward_cache_misses"].values
+        self.assertEqual(len(hits), 3)
+        self.assertEqual([h + m for h, m in zip(hits, misses)], [20, 20, 20])
+        # 20 queries, 6 slates each
+        self.assertEqual(sum(misses), len(reward_cache.rewards))
+        self.assertGreater(sum(hits), 0)
+        self.assertEqual(reward_cache.hits, sum(hits))
+        self.assertAlmostEqual(reward_cache.hit_rate, sum(hits) / 60)
+
+    def test_keys(self):
+        reward_cache = SlateRewardCache(10, quantization=1e-2)
+        training_input = make_training_input(4, 3)
+        state = training_input.state.float_features
+        src_seq = training_input.src_seq.float_features
+        src_src_mask = training_input.src_src_mask
+        tgt_out_idx = torch.tensor([[2, 3], [2, 3], [3, 2], [2, 3]])
+        keys = reward_cache.keys(state, src_seq, src_src_mask, tgt_out_idx)
+        self.assertEqual(len(set(keys)), 4)
+        # Below the quantization, the keys don't change
+        self.assertEqual(
+            reward_cache.keys(state + 1e-4, src_seq, src_src_mask, tgt_out_idx), keys
+        )
+        # Same query and slate in two rows
+        state[1], src_seq[1] = state[0], src_seq[0]
+        keys = reward_cache.keys(state, src_seq, src_src_mask, tgt_out_idx)
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+
+    def test_lru_eviction(self):
+        reward_cache = SlateRewardCache(3)
+        num_calls = []
+
+        def rewards(queries):
+            # The reward of query i is 10 * i
+            state = torch.tensor(queries, dtype=torch.float).unsqueeze(1)
+            batch_size = len(queries)
+
+            def reward_fn(rows):
+                num_calls.append(len(rows))
+                return state[rows] * 10
+
+            return (
+                reward_cache(
+                    reward_fn,
+                    state,
+                    torch.zeros(batch_size, 1, 1),
+                    torch.ones(batch_size, 1, 1),
+                    torch.full((batch_size, 1), 2, dtype=torch.long),
+                )
+                .squeeze(1)
+                .tolist()
+            )
+
+        self.assertEqual(rewards([0, 1, 2]), [0, 10, 20])
+        self.assertEqual(rewards([0]), [0])
+        # 1 is the least recently used
+        self.assertEqual(rewards([3, 3]), [30, 30])
+        self.assertEqual(len(reward_cache.rewards), 3)
+        self.assertEqual(rewards([0, 2, 3]), [0, 20, 30])
+        self.assertEqual((reward_cache.hits, reward_cache.misses), (5, 4))
+        self.assertEqual(rewards([1]), [10])
+        self.assertEqual(reward_cache.misses, 5)
+        # The misses are padded up to a power of 2, at most the batch size
+        self.assertEqual(num_calls, [3, 1, 1])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+Benchmark serial vs. process-parallel normalization fitting on synthetic data.
+
+    python -m reagent.test.workflow.benchmark_identify_types_flow \
+        --num-features 300 --num-samples 100000 --num-workers 1 2 4 8
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+from reagent.workflow.identify_types_flow import normalization_helper
+
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_rows(num_features: int, num_samples: int, seed: int = 0):
+    """ Continuous features, half of them skewed enough to go through Box-Cox """
+    rng = np.random.RandomState(seed)
+    rows = []
+    for i in range(num_features):
+        if i % 2 == 0:
+            values = rng.normal(loc=i, scale=1 + i % 5, size=num_samples)
+        else:
+            values = rng.exponential(scale=1 + i % 5, size=num_samples)
+        rows.append({"feature_name": i, "feature_values": values.astype(np.float32)})
+    return rows
+
+
+def run_benchmark(num_features: int, num_samples: int, num_workers_list, chunk_size):
+    rows = synthetic_rows(num_features, num_samples)
+    results = {}
+    timings = {}
+    for num_workers in num_workers_list:
+        process = normalization_helper(
+            max_unique_enum_values=10,
+            quantile_size=20,
+            quantile_k2_threshold=1000.0,
+            num_workers=num_workers,
+            chunk_size=chunk_size,
+        )
+        start = time.perf_counter()
+        results[num_workers] = process(rows)
+        timings[num_workers] = time.perf_counter() - start
+
+    baseline = num_workers_list[0]
+    for num_workers in num_workers_list:
+        assert results[num_workers] == results[baseline], "Results differ"
+        print(
+            f"num_workers={num_workers:3d}: {timings[num_workers]:8.2f}s "
+            f"(speedup {timings[baseline] / timings[num_workers]:.2f}x)"
+        )
+    return timings
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("reagent").setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-features", type=int, default=300)
+    parser.add_argument("--num-samples", type=int, default=100000)
+    parser.add_argument("--num-workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk-size", type=int, default=16)
+    args = parser.parse_args(sys.argv[1:])
+
+    run_benchmark(
+        args.num_features, args.num_samples, args.num_workers, args.chunk_size
+    )
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import unittest
+
+from reagent.preprocessing.sketch import FeatureSketch
+from reagent.test.preprocessing.preprocessing_util import read_data
+from reagent.workflow.identify_types_flow import normalization_helper
+
+
+class TestIdentifyTypesFlow(unittest.TestCase):
+    def _get_rows(self):
+        feature_value_map = read_data()
+        rows = [
+            {"feature_name": name, "feature_values": values.tolist()}
+            for name, values in feature_value_map.items()
+        ]
+        # Too few samples to identify
+        rows.append({"feature_name": 100, "feature_values": [1.0, 2.0]})
+        rows.append(
+            {
+                "feature_name": 101,
+                "feature_sketch": FeatureSketch(seed=0).update(
+                    feature_value_map[max(feature_value_map)]
+                ),
+            }
+        )
+        return rows
+
+    def test_parallel_matches_serial(self):
+        rows = self._get_rows()
+        kwargs = {
+            "max_unique_enum_values": 10,
+            "quantile_size": 20,
+            "quantile_k2_threshold": 1000.0,
+            "skip_quantiles": False,
+            "feature_overrides": {9: "CONTINUOUS_ACTION", 10: "CONTINUOUS_ACTION"},
+        }
+        serial = normalization_helper(**kwargs)(rows)
+        self.assertNotIn(100, serial)
+        self.assertIn(101, serial)
+        for num_workers, chunk_size in [(2, 1), (3, 4)]:
+            parallel = normalization_helper(
+                num_workers=num_workers, chunk_size=chunk_size, **kwargs
+            )(rows)
+            self.assertEqual(list(parallel.keys()), list(serial.keys()))
+            self.assertEqual(parallel, serial)
+
+    def test_parallel_whitelist(self):
+        rows = self._get_rows()
+        whitelist_features = [row["feature_name"] for row in rows[:3]]
+        process = normalization_helper(
+            max_unique_enum_values=10,
+            quantile_size=20,
+            quantile_k2_threshold=1000.0,
+            whitelist_features=whitelist_features,
+            num_workers=2,
+        )
+        self.assertEqual(set(process(rows).keys()), set(whitelist_features))
+        with self.assertRaises(AssertionError):
+            process(rows[:2])
+
+    def test_empty(self):
+        process = normalization_helper(
+            max_unique_enum_values=10,
+            quantile_size=20,
+            quantile_k2_threshold=1000.0,
+            num_workers=2,
+        )
+        self.assertEqual(process([]), {})
+        params = process([{"feature_name": 1, "feature_values": [0.0, 1.0] * 20}])
+        self.assertEqual(params[1].feature_type, "BINARY")
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import os
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+import numpy.testing as npt
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
+from reagent.preprocessing import identify_types
+from reagent.preprocessing.batch_preprocessor import DiscreteDqnBatchPreprocessor
+from reagent.preprocessing.normalization import NormalizationParameters
+from reagent.preprocessing.preprocessor import Preprocessor
+from reagent.workflow.local_data_fetcher import (
+    MAX_UINT32,
+    LocalDataLoader,
+    query_data_local,
+)
+
+
+ACTIONS = ["L", "R", "U", "D"]
+STATE_MAP = pa.map_(pa.int64(), pa.float64())
+METRICS_MAP = pa.map_(pa.string(), pa.float64())
+
+
+def _timeline_table(multi_steps: bool, discrete: bool = True) -> pa.Table:
+    # Same MDP as test_query_data / test_query_data_parametric:
+    # state: 0, action: 'L' / {7: 1}, reward: 0,
+    # state: 1, action: 'R' / {8: 1}, reward: 1,
+    # state: 4, action: 'U' / {9: 1}, reward: 4,
+    # state: 5, action: 'D' / {10: 1}, reward: 5,
+    # state: 6 (terminal)
+    def action(a):
+        return a if discrete else [(7 + ACTIONS.index(a), 1.0)] if a else []
+
+    action_type = pa.string() if discrete else STATE_MAP
+    states = [[(0, 1.0)], [(1, 1.0)], [(4, 1.0)], [(5, 1.0)]]
+    if multi_steps:
+        rewards = [[0.0, 1.0], [1.0, 4.0], [4.0, 5.0], [5.0]]
+        metrics = [
+            [[("reward", 0.0)], [("reward", 1.0)]],
+            [[("reward", 1.0)], [("reward", 4.0)]],
+            [[("reward", 4.0)], [("reward", 5.0)]],
+            [[("reward", 5.0)]],
+        ]
+        next_states = [states[1:3], states[2:4], [states[3], [(6, 1.0)]], [[(6, 1.0)]]]
+        next_actions = [["R", "U"], ["U", "D"], ["D", ""], [""]]
+        possible_next_actions = [
+            [["R", "U"], ["U", "D"]],
+            [["U", "D"], ["D"]],
+            [["D"], [""]],
+            [[""]],
+        ]
+        time_diffs = [[1, 1], [1, 1], [1, 1], [1]]
+        reward_type = pa.list_(pa.float64())
+        metrics_type = pa.list_(METRICS_MAP)
+        next_state_type = pa.list_(STATE_MAP)
+        next_action_type = pa.list_(action_type)
+        possible_next_actions_type = pa.list_(pa.list_(pa.string()))
+        time_diff_type = pa.list_(pa.int64())
+        next_actions = [[action(a) for a in na] for na in next_actions]
+    else:
+        rewards = [0.0, 1.0, 4.0, 5.0]
+        metrics = [[("reward", r)] for r in rewards]
+        next_states = states[1:] + [[(6, 1.0)]]
+        next_actions = [action(a) for a in ["R", "U", "D", ""]]
+        possible_next_actions = [["R", "U"], ["U", "D"], ["D"], [""]]
+        time_diffs = [1, 3, 1, 1]
+        reward_type = pa.float64()
+        metrics_type = METRICS_MAP
+        next_state_type = STATE_MAP
+        next_action_type = action_type
+        possible_next_actions_type = pa.list_(pa.string())
+        time_diff_type = pa.int64()
+
+    columns = {
+        "mdp_id": pa.array(["0"] * 4),
+        "sequence_number": pa.array([0, 1, 4, 5], type=pa.int64()),
+        "sequence_number_ordinal": pa.array([1, 2, 3, 4], type=pa.int64()),
+        "state_features": pa.array(states, type=STATE_MAP),
+        "action": pa.array([action(a) for a in ACTIONS], type=action_type),
+        "action_probability": pa.array([0.3, 0.4, 0.5, 0.6]),
+        "reward": pa.array(rewards, type=reward_type),
+        "next_state_features": pa.array(next_states, type=next_state_type),
+        "next_action": pa.array(next_actions, type=next_action_type),
+        "time_diff": pa.array(time_diffs, type=time_diff_type),
+        "metrics": pa.array(metrics, type=metrics_type),
+    }
+    if discrete:
+        columns["possible_actions"] = pa.array(
+            [["L", "R"], ["R", "U"], ["U", "D"], ["D"]], type=pa.list_(pa.string())
+        )
+        columns["possible_next_actions"] = pa.array(
+            possible_next_actions, type=possible_next_actions_type
+        )
+    return pa.Table.from_pydict(columns)
+
+
+def _eye_rows(rows, width=5):
+    return np.eye(width, dtype=np.float32)[rows]
+
+
+class TestLocalDataFetcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, table: pa.Table, name: str = "timeline"):
+        path = os.path.join(self.tmp_dir.name, f"{name}.parquet")
+        pq.write_table(table, path)
+        return [path]
+
+    def _read_all(self, dataset):
+        chunks = list(dataset)
+        return {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+
+    def _verify_discrete_common(self, df):
+        npt.assert_equal(df["sequence_number"], np.array([1, 2, 3, 4]))
+        npt.assert_equal(df["state_features_presence"], _eye_rows([0, 1, 2, 3]) > 0)
+        npt.assert_equal(df["state_features"], _eye_rows([0, 1, 2, 3]))
+        npt.assert_equal(df["action"], np.array([0, 1, 2, 3]))
+        npt.assert_allclose(
+            df["action_probability"], np.array([0.3, 0.4, 0.5, 0.6], dtype="float32")
+        )
+        npt.assert_equal(
+            df["possible_actions_mask"],
+            np.array([[1, 1, 0, 0], [0, 1, 1, 0], [0, 0, 1, 1], [0, 0, 0, 1]]),
+        )
+        npt.assert_equal(df["mdp_id"], np.full(4, zlib.crc32(b"0")))
+
+    def test_query_data_local(self):
+        paths = self._write(_timeline_table(multi_steps=False))
+        df = self._read_all(
+            query_data_local(paths, discrete_action=True, actions=ACTIONS)
+        )
+        self._verify_discrete_common(df)
+        npt.assert_equal(df["reward"], np.array([0.0, 1.0, 4.0, 5.0], dtype="float32"))
+        npt.assert_equal(df["not_terminal"], np.array([1, 1, 1, 0], dtype="bool"))
+        npt.assert_equal(df["next_state_features"], _eye_rows([1, 2, 3, 4]))
+        npt.assert_equal(df["next_action"], np.array([1, 2, 3, 4]))
+        npt.assert_equal(df["time_diff"], np.array([1, 3, 1, 1]))
+        npt.assert_equal(df["step"], np.array([1, 1, 1, 1]))
+        npt.assert_equal(
+            df["possible_next_actions_mask"],
+            np.array([[0, 1, 1, 0], [0, 0, 1, 1], [0, 0, 0, 1], [0, 0, 0, 0]]),
+        )
+        npt.assert_equal(df["metrics"], np.array([[0.0], [1.0], [4.0], [5.0]]))
+
+        # reward := reward^3 + 10
+        df = self._read_all(
+            query_data_local(
+                paths,
+                discrete_action=True,
+                actions=ACTIONS,
+                custom_reward_expression="reward ** 3 + 10",
+            )
+        )
+        self._verify_discrete_common(df)
+        npt.assert_equal(
+            df["reward"], np.array([10.0, 11.0, 74.0, 135.0], dtype="float32")
+        )
+
+    def test_query_data_local_multi_steps(self):
+        gamma = 0.9
+        paths = self._write(_timeline_table(multi_steps=True))
+        df = self._read_all(
+            query_data_local(
+                paths, discrete_action=True, actions=ACTIONS, multi_steps=2, gamma=gamma
+            )
+        )
+        self._verify_discrete_common(df)
+        npt.assert_allclose(
+            df["reward"],
+            np.array(
+                [gamma * 1, 1 * 1.0 + gamma * 4, 1 * 4.0 + gamma * 5, 1 * 5.0],
+                dtype="float32",
+            ),
+        )
+        npt.assert_equal(df["not_terminal"], np.array([1, 1, 0, 0], dtype="bool"))
+        npt.assert_equal(df["next_state_features"], _eye_rows([2, 3, 4, 4]))
+        npt.assert_equal(df["next_action"], np.array([2, 3, 4, 4]))
+        npt.assert_equal(df["time_diff"], np.array([1, 1, 1, 1]))
+        npt.assert_equal(df["step"], np.array([2, 2, 2, 1]))
+        npt.assert_equal(
+            df["possible_next_actions_mask"],
+            np.array([[0, 0, 1, 1], [0, 0, 0, 1], [0, 0, 0, 0], [0, 0, 0, 0]]),
+        )
+        npt.assert_equal(df["metrics"], np.array([[1.0], [4.0], [5.0], [5.0]]))
+
+    def test_query_data_local_parametric(self):
+        paths = self._write(_timeline_table(multi_steps=False, discrete=False))
+        df = self._read_all(
+            query_data_local(
+                paths, discrete_action=False, include_possible_actions=False
+            )
+        )
+        npt.assert_equal(df["action_presence"], np.eye(4, dtype=bool))
+        npt.assert_equal(df["action"], np.eye(4, dtype=np.float32))
+        npt.assert_equal(df["next_action_presence"][:3], np.eye(4, dtype=bool)[1:])
+        self.assertFalse(df["next_action_presence"][3].any())
+        npt.assert_equal(df["not_terminal"], np.array([1, 1, 1, 0], dtype="bool"))
+
+    def test_sample_range(self):
+        mdp_ids = [str(i) for i in range(100)]
+        table = _timeline_table(multi_steps=False)
+        tables = [
+            table.set_column(0, "mdp_id", pa.array([mdp_id] * 4)) for mdp_id in mdp_ids
+        ]
+        paths = self._write(pa.concat_tables(tables))
+        sample_range = (10.0, 60.0)
+        dataset = query_data_local(
+            paths, discrete_action=True, actions=ACTIONS, sample_range=sample_range
+        )
+        hashes = np.array([zlib.crc32(m.encode()) for m in mdp_ids])
+        expected = hashes[
+            (sample_range[0] / 100 * MAX_UINT32 <= hashes)
+            & (hashes <= sample_range[1] / 100 * MAX_UINT32)
+        ]
+        df = self._read_all(dataset)
+        self.assertEqual(set(df["mdp_id"].tolist()), set(expected.tolist()))
+        self.assertEqual(len(dataset), 4 * len(expected))
+
+    def test_local_data_loader(self):
+        table = _timeline_table(multi_steps=False)
+        paths = self._write(pa.concat_tables([table] * 5))
+        dataset = query_data_local(paths, discrete_action=True, actions=ACTIONS)
+        # Read in record batches that don't line up with the training batches
+        dataset.read_batch_size = 7
+        batches = list(dataset.batches(batch_size=3))
+        self.assertEqual([len(b["reward"]) for b in batches], [3] * 6 + [2])
+        npt.assert_equal(
+            torch.cat([b["action"] for b in batches]).numpy(), np.tile([0, 1, 2, 3], 5)
+        )
+
+        normalization_parameters = {
+            feature: NormalizationParameters(
+                identify_types.CONTINUOUS, None, 0, 0, 1, None, None, None
+            )
+            for feature in dataset.states
+        }
+        loader = LocalDataLoader(
+            dataset,
+            batch_size=4,
+            batch_preprocessor=DiscreteDqnBatchPreprocessor(
+                num_actions=len(ACTIONS),
+                state_preprocessor=Preprocessor(normalization_parameters, False),
+                use_gpu=False,
+            ),
+            use_gpu=False,
+        )
+        self.assertEqual(len(loader), 5)
+        for batch in loader:
+            npt.assert_equal(batch.action.numpy(), np.eye(4))
+            npt.assert_equal(batch.not_terminal.numpy(), np.array([[1], [1], [1], [0]]))
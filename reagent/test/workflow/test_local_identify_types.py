@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from reagent.preprocessing.identify_types import CONTINUOUS, ENUM
+from reagent.workflow.local_identify_types_flow import (
+    identify_normalization_parameters_from_parquet,
+)
+from reagent.workflow.types import PreprocessingOptions
+
+
+NUM_ROWS = 10000
+NUM_FILES = 4
+COL_NAME = "states"
+
+
+class TestLocalIdentifyTypes(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        rows_per_file = NUM_ROWS // NUM_FILES
+        for i in range(NUM_FILES):
+            states = [
+                [
+                    (0, float(np.random.normal(loc=0, scale=1))),
+                    (1, float(np.random.normal(loc=4, scale=3))),
+                    (2, float(np.random.randint(5) * 10)),
+                ]
+                for _ in range(rows_per_file)
+            ]
+            table = pa.Table.from_arrays(
+                [pa.array(states, type=pa.map_(pa.int64(), pa.float64()))],
+                names=[COL_NAME],
+            )
+            path = os.path.join(self.tmp_dir.name, f"part-{i}.parquet")
+            pq.write_table(table, path, row_group_size=rows_per_file // 2)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_identify_normalization_parameters_from_parquet(self):
+        preprocessing_options = PreprocessingOptions(
+            num_samples=NUM_ROWS // 2, whitelist_features=[0, 1, 2]
+        )
+        for num_workers in [0, 2]:
+            normalization_params = identify_normalization_parameters_from_parquet(
+                self.paths, COL_NAME, preprocessing_options, num_workers=num_workers
+            )
+            self.assertEqual(set(normalization_params.keys()), {0, 1, 2})
+            for k, (mean, stddev) in {0: (0, 1), 1: (4, 3)}.items():
+                self.assertEqual(normalization_params[k].feature_type, CONTINUOUS)
+                self.assertLess(abs(normalization_params[k].mean - mean), 0.1)
+                self.assertLess(abs(normalization_params[k].stddev - stddev), 0.1)
+            self.assertEqual(normalization_params[2].feature_type, ENUM)
+            self.assertEqual(
+                normalization_params[2].possible_values, [0, 10, 20, 30, 40]
+            )
@@ -26,6 +26,13 @@ class TestPreprocessing(ReagentSQLTestBase):
 
     @pytest.mark.serial
     def test_preprocessing(self):
+        self._test_preprocessing(use_sketches=False)
+
+    @pytest.mark.serial
+    def test_preprocessing_sketches(self):
+        self._test_preprocessing(use_sketches=True)
+
+    def _test_preprocessing(self, use_sketches: bool):
         distributions = {}
         distributions["0"] = {"mean": 0, "stddev": 1}
         distributions["1"] = {"mean": 4, "stddev": 3}
@@ -43,7 +50,9 @@ class TestPreprocessing(ReagentSQLTestBase):
         df.createOrReplaceTempView(TABLE_NAME)
 
         num_samples = NUM_ROWS // 2
-        preprocessing_options = PreprocessingOptions(num_samples=num_samples)
+        preprocessing_options = PreprocessingOptions(
+            num_samples=num_samples, use_sketches=use_sketches
+        )
 
         table_spec = TableSpec(table_name=TABLE_NAME)
 
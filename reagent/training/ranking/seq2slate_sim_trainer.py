@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+import hashlib
 import logging
-from itertools import permutations
-from typing import List, Optional
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
 
 import numpy as np
 import reagent.types as rlt
 import torch
+from reagent.core.tracker import observable
 from reagent.models.seq2slate import (
     DECODER_START_SYMBOL,
     BaselineNet,
@@ -56,6 +59,173 @@ def swap_dist(idx: List[int]):
     return swap_dist_in_slate(idx) + swap_dist_out_slate(idx)
 
 
+def batch_swap_dist_in_slate(idx: torch.Tensor, chunk_size: int = 4096) -> torch.Tensor:
+    """
+    `swap_dist_in_slate` of each row of the (N, k) tensor `idx`, i.e., the
+    number of pairs i < j with idx[i] > idx[j]. The pairwise comparisons are
+    done `chunk_size` rows at a time to bound the memory to
+    O(chunk_size * k^2).
+    """
+    tgt_seq_len = idx.shape[1]
+    i, j = torch.triu_indices(tgt_seq_len, tgt_seq_len, offset=1, device=idx.device)
+    if idx.shape[0] == 0 or len(i) == 0:
+        return torch.zeros(idx.shape[0], dtype=torch.long, device=idx.device)
+    return torch.cat(
+        [(chunk[:, i] > chunk[:, j]).sum(dim=1) for chunk in idx.split(chunk_size)]
+    )
+
+
+def batch_swap_dist_out_slate(idx: torch.Tensor) -> torch.Tensor:
+    """ `swap_dist_out_slate` of each row of the (N, k) tensor `idx` """
+    tgt_seq_len = idx.shape[1]
+    return idx.sum(dim=1) - tgt_seq_len * (tgt_seq_len - 1) // 2
+
+
+def batch_swap_dist(idx: torch.Tensor, chunk_size: int = 4096) -> torch.Tensor:
+    """
+    `swap_dist` of each row of `idx`, a (N, k) tensor of partial permutations
+    """
+    return batch_swap_dist_in_slate(idx, chunk_size) + batch_swap_dist_out_slate(idx)
+
+
+def max_swap_dist(src_seq_len: int, tgt_seq_len: int) -> int:
+    """
+    The largest `swap_dist` of a partial permutation of length `tgt_seq_len`
+    of `src_seq_len` items; it's reached by the last `tgt_seq_len` items in
+    reverse order.
+    """
+    return tgt_seq_len * (src_seq_len - 1) - tgt_seq_len * (tgt_seq_len - 1) // 2
+
+
+def sample_permutations(
+    batch_size: int, src_seq_len: int, tgt_seq_len: int, device: torch.device
+) -> torch.Tensor:
+    """
+    Draws `batch_size` partial permutations of length `tgt_seq_len` of
+    `src_seq_len` items uniformly at random, as the first `tgt_seq_len`
+    positions of the argsort of i.i.d. uniform keys
+    """
+    keys = torch.rand(batch_size, src_seq_len, device=device)
+    return torch.argsort(keys, dim=1)[:, :tgt_seq_len]
+
+
+@observable(reward_cache_hits=int, reward_cache_misses=int, reward_net_latency=float)
+class SlateRewardCache:
+    """
+    LRU cache of the rewards predicted by the (deterministic) reward network,
+    keyed on a hash of the state, the candidates and the slate. The float
+    inputs are quantized to multiples of `quantization` before hashing. At
+    most `max_size` rewards are kept.
+
+    For every batch, the numbers of hits & misses and the seconds spent in
+    the reward network are sent to the observers; the totals are kept in
+    `hits`, `misses` and `reward_net_latency`.
+    """
+
+    def __init__(self, max_size: int, quantization: float = 1e-4) -> None:
+        assert max_size > 0, f"max_size must be > 0, got {max_size}"
+        self.max_size = max_size
+        self.quantization = quantization
+        # Rewards of one row, on the host
+        self.rewards: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.reward_net_latency = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def keys(
+        self,
+        state: torch.Tensor,
+        src_seq: torch.Tensor,
+        src_src_mask: torch.Tensor,
+        tgt_out_idx: torch.Tensor,
+    ) -> List[bytes]:
+        batch_size = state.shape[0]
+        quantized = [
+            torch.round(x.reshape(batch_size, -1) / self.quantization).long()
+            for x in [state, src_seq, src_src_mask]
+        ]
+        # The shapes go in the key too
+        shapes = torch.tensor(
+            [state.shape[1], src_seq.shape[1], tgt_out_idx.shape[1]],
+            device=state.device,
+        ).repeat(batch_size, 1)
+        rows = torch.cat(quantized + [tgt_out_idx.long(), shapes], dim=1)
+        return [
+            hashlib.blake2b(row.tobytes(), digest_size=16).digest()
+            for row in rows.cpu().numpy()
+        ]
+
+    def __call__(
+        self,
+        reward_fn: Callable[[torch.Tensor], torch.Tensor],
+        state: torch.Tensor,
+        src_seq: torch.Tensor,
+        src_src_mask: torch.Tensor,
+        tgt_out_idx: torch.Tensor,
+    ) -> torch.Tensor:
+        """
+        Returns the rewards of the batch; `reward_fn(rows)` predicts the
+        rewards of the given rows of the batch, which are the cache misses.
+        """
+        keys = self.keys(state, src_seq, src_src_mask, tgt_out_idx)
+        rewards: List[Optional[np.ndarray]] = []
+        missing_rows = []
+        missing_keys = {}
+        for i, key in enumerate(keys):
+            reward = self.rewards.get(key)
+            if reward is not None:
+                self.rewards.move_to_end(key)
+            elif key in missing_keys:
+                # Duplicate in the batch; predicted once
+                pass
+            else:
+                missing_keys[key] = len(missing_rows)
+                missing_rows.append(i)
+            rewards.append(reward)
+
+        latency = 0.0
+        if missing_rows:
+            # The misses are padded, repeating the last one, up to a power of
+            # 2 (at most the batch size), so that the reward net sees a few
+            # distinct batch sizes; TorchScript re-optimizes on new shapes.
+            num_rows = min(1 << (len(missing_rows) - 1).bit_length(), len(keys))
+            rows = missing_rows + missing_rows[-1:] * (num_rows - len(missing_rows))
+            start_time = time.perf_counter()
+            missing_rewards = (
+                reward_fn(torch.tensor(rows, device=state.device))
+                .detach()
+                .cpu()
+                .numpy()
+            )
+            latency = time.perf_counter() - start_time
+            for key, row in missing_keys.items():
+                # Copied so the batch isn't kept alive by the rows
+                self.rewards[key] = missing_rewards[row].copy()
+            while len(self.rewards) > self.max_size:
+                self.rewards.popitem(last=False)
+            rewards = [
+                missing_rewards[missing_keys[key]] if reward is None else reward
+                for key, reward in zip(keys, rewards)
+            ]
+
+        num_misses = len(missing_rows)
+        self.hits += len(keys) - num_misses
+        self.misses += num_misses
+        self.reward_net_latency += latency
+        # pyre-fixme[16]: `SlateRewardCache` has no attribute `notify_observers`.
+        self.notify_observers(
+            reward_cache_hits=len(keys) - num_misses,
+            reward_cache_misses=num_misses,
+            reward_net_latency=latency,
+        )
+        return torch.from_numpy(np.stack(rewards)).to(state.device)
+
+
 class Seq2SlateSimulationTrainer(Trainer):
     """
     Seq2Slate learned with simulation data, with the action
@@ -70,38 +240,36 @@ class Seq2SlateSimulationTrainer(Trainer):
         reward_net_path: str,
         baseline_net: Optional[BaselineNet] = None,
         use_gpu: bool = False,
+        reward_cache: Optional[SlateRewardCache] = None,
     ) -> None:
+        """
+        Args:
+            reward_cache: if set, the rewards of the (state, candidates, slate)
+                seen before are looked up instead of predicted again
+        """
         self.reward_net_path = reward_net_path
+        self.reward_cache = reward_cache
         # loaded when used
         self.reward_net = None
         self.parameters = parameters
         self.minibatch_size = minibatch_size
         self.use_gpu = use_gpu
         self.device = torch.device("cuda") if use_gpu else torch.device("cpu")
-        self.permutation_index = torch.tensor(
-            list(
-                permutations(
-                    # pyre-fixme[6]: Expected `Iterable[Variable[itertools._T]]` for
-                    #  1st param but got `Tensor`.
-                    torch.arange(seq2slate_net.max_src_seq_len),
-                    seq2slate_net.max_tgt_seq_len,
-                )
-            ),
-            device=self.device,
-        ).long()
+        self.max_src_seq_len = seq2slate_net.max_src_seq_len
+        self.max_tgt_seq_len = seq2slate_net.max_tgt_seq_len
+        # Permutations are sampled on the fly, each with the probability of
+        # 1 / (number of partial permutations)
+        num_permutations = 1.0
+        for i in range(self.max_tgt_seq_len):
+            num_permutations *= self.max_src_seq_len - i
+        self.permutation_prob = 1.0 / num_permutations
 
         if self.parameters.simulation_distance_penalty is not None:
             # pyre-fixme[16]: `Optional` has no attribute `__gt__`.
             assert self.parameters.simulation_distance_penalty > 0
-            self.permutation_distance = (
-                torch.tensor(
-                    [swap_dist(x.tolist()) for x in self.permutation_index],
-                    device=self.device,
-                )
-                .unsqueeze(1)
-                .float()
+            self.MAX_DISTANCE = float(
+                max_swap_dist(self.max_src_seq_len, self.max_tgt_seq_len)
             )
-            self.MAX_DISTANCE = torch.max(self.permutation_distance)
 
         self.trainer = Seq2SlateTrainer(
             seq2slate_net, parameters, minibatch_size, baseline_net, use_gpu
@@ -151,18 +319,37 @@ class Seq2SlateSimulationTrainer(Trainer):
             ].view(batch_size, max_tgt_seq_len, candidate_feat_dim)
         )
         sim_tgt_out_probs = torch.tensor(
-            [1.0 / len(self.permutation_index)], device=self.device
+            [self.permutation_prob], device=self.device
         ).repeat(batch_size)
 
         if self.reward_net is None:
             self.reward_net = _load_reward_net(self.reward_net_path, self.use_gpu)
-        slate_reward = self.reward_net(
-            training_input.state.float_features,
-            training_input.src_seq.float_features,
-            sim_tgt_out_seq.float_features,
-            training_input.src_src_mask,
-            sim_tgt_out_idx,
-        ).detach()
+        state = training_input.state.float_features
+        src_seq = training_input.src_seq.float_features
+        src_src_mask = training_input.src_src_mask
+
+        def predict_reward(rows):
+            # pyre-fixme[29]: `None` is not a function.
+            return self.reward_net(
+                state[rows],
+                src_seq[rows],
+                sim_tgt_out_seq.float_features[rows],
+                src_src_mask[rows],
+                sim_tgt_out_idx[rows],
+            ).detach()
+
+        if self.reward_cache is None:
+            slate_reward = self.reward_net(
+                state,
+                src_seq,
+                sim_tgt_out_seq.float_features,
+                src_src_mask,
+                sim_tgt_out_idx,
+            ).detach()
+        else:
+            slate_reward = self.reward_cache(
+                predict_reward, state, src_seq, src_src_mask, sim_tgt_out_idx
+            )
         if slate_reward.ndim == 1:
             logger.warning(f"Slate reward should be 2-D tensor, unsqueezing")
             slate_reward = slate_reward.unsqueeze(1)
@@ -206,10 +393,12 @@ class Seq2SlateSimulationTrainer(Trainer):
         batch_size = training_input.state.float_features.shape[0]
 
         # randomly pick a permutation for every slate
-        random_indices = torch.randint(0, len(self.permutation_index), (batch_size,))
-        sim_tgt_out_idx = self.permutation_index[random_indices] + 2
+        permutation = sample_permutations(
+            batch_size, self.max_src_seq_len, self.max_tgt_seq_len, self.device
+        )
+        sim_tgt_out_idx = permutation + 2
         if self.parameters.simulation_distance_penalty is not None:
-            sim_distance = self.permutation_distance[random_indices]
+            sim_distance = batch_swap_dist(permutation).unsqueeze(1).float()
         else:
             sim_distance = None
 
@@ -6,6 +6,7 @@ from typing import Optional
 import numpy as np
 import reagent.types as rlt
 import torch
+from reagent.core.metric_accumulator import MetricAccumulator
 from reagent.models.seq2slate import BaselineNet, Seq2SlateMode, Seq2SlateTransformerNet
 from reagent.parameters import Seq2SlateTransformerParameters
 from reagent.training.trainer import Trainer
@@ -22,8 +23,16 @@ class Seq2SlateTrainer(Trainer):
         minibatch_size: int,
         baseline_net: Optional[BaselineNet] = None,
         use_gpu: bool = False,
+        metric_accumulator: Optional[MetricAccumulator] = None,
     ) -> None:
+        """
+        Args:
+            metric_accumulator: if set, `train()` records obj_rl_loss,
+                ips_rl_loss and baseline_loss in it and returns tensors,
+                without waiting for the device
+        """
         self.parameters = parameters
+        self.metric_accumulator = metric_accumulator
         self.use_gpu = use_gpu
         self.seq2slate_net = seq2slate_net
         self.baseline_net = baseline_net
@@ -143,14 +152,24 @@ class Seq2SlateTrainer(Trainer):
         # obj_rl_loss is used to get gradient becaue it is in the logarithmic form
         # thus more stable.
         # ips_rl_loss is more useful as an offline evaluation metric
-        obj_rl_loss = rl_loss.detach().cpu().numpy()
-        ips_rl_loss = (
-            (-1.0 / batch_size * torch.sum(importance_sampling * reward)).cpu().numpy()
-        )
-        baseline_loss = baseline_loss.detach().cpu().numpy().item()
-
-        advantage = (reward - b).detach().cpu().numpy()
-        log_probs = log_probs.detach().cpu().numpy()
+        obj_rl_loss = rl_loss.detach()
+        ips_rl_loss = -1.0 / batch_size * torch.sum(importance_sampling * reward)
+        baseline_loss = baseline_loss.detach()
+        advantage = (reward - b).detach()
+        log_probs = log_probs.detach()
+        if self.metric_accumulator is not None:
+            self.metric_accumulator.add(
+                obj_rl_loss=obj_rl_loss,
+                ips_rl_loss=ips_rl_loss,
+                baseline_loss=baseline_loss,
+            )
+            per_seq_probs = torch.exp(log_probs)
+        else:
+            obj_rl_loss = obj_rl_loss.cpu().numpy()
+            ips_rl_loss = ips_rl_loss.cpu().numpy()
+            baseline_loss = baseline_loss.cpu().numpy().item()
+            advantage = advantage.cpu().numpy()
+            per_seq_probs = np.exp(log_probs.cpu().numpy())
 
         self.minibatch += 1
         if self.minibatch % 10 == 0:
@@ -167,7 +186,7 @@ class Seq2SlateTrainer(Trainer):
             )
 
         return {
-            "per_seq_probs": np.exp(log_probs),
+            "per_seq_probs": per_seq_probs,
             "advantage": advantage,
             "obj_rl_loss": obj_rl_loss,
             "ips_rl_loss": ips_rl_loss,
@@ -8,6 +8,7 @@ from typing import Deque, Optional
 import reagent.types as rlt
 import torch
 import torch.nn.functional as F
+from reagent.core.metric_accumulator import MetricAccumulator
 from reagent.models.mdn_rnn import gmm_loss
 from reagent.models.world_model import MemoryNetwork
 from reagent.parameters import MDNRNNTrainerParameters
@@ -24,7 +25,14 @@ class MDNRNNTrainer:
         memory_network: MemoryNetwork,
         params: MDNRNNTrainerParameters,
         cum_loss_hist: int = 100,
+        metric_accumulator: Optional[MetricAccumulator] = None,
     ):
+        """
+        Args:
+            metric_accumulator: if set, `train()` records the losses in it and
+                returns them as detached tensors, without waiting for the
+                device; the `cum_*` histories are then not updated
+        """
         self.memory_network = memory_network
         self.params = params
         self.optimizer = torch.optim.Adam(
@@ -35,6 +43,7 @@ class MDNRNNTrainer:
         self.cum_bce: Deque[float] = deque([], maxlen=cum_loss_hist)
         self.cum_gmm: Deque[float] = deque([], maxlen=cum_loss_hist)
         self.cum_mse: Deque[float] = deque([], maxlen=cum_loss_hist)
+        self.metric_accumulator = metric_accumulator
 
     def train(self, training_batch: rlt.PreprocessedMemoryNetworkInput):
         self.minibatch += 1
@@ -47,6 +56,11 @@ class MDNRNNTrainer:
         losses["loss"].backward()
         self.optimizer.step()
 
+        if self.metric_accumulator is not None:
+            detached_losses = {k: loss.detach() for k, loss in losses.items()}
+            self.metric_accumulator.add(**detached_losses)
+            return detached_losses
+
         detached_losses = {k: loss.cpu().detach().item() for k, loss in losses.items()}
         self.cum_loss.append(detached_losses["loss"])
         self.cum_gmm.append(detached_losses["gmm"])
@@ -86,6 +100,83 @@ class MDNRNNTrainer:
         :returns: dictionary of losses, containing the gmm, the mse, the bce and
             the averaged loss.
         """
+        (
+            next_state,
+            not_terminal,
+            reward,
+            mus,
+            sigmas,
+            logpi,
+            nts,
+            rs,
+        ) = self._forward_for_loss(training_batch)
+        gmm = (
+            gmm_loss(next_state, mus, sigmas, logpi)
+            * self.params.next_state_loss_weight
+        )
+        bce = (
+            F.binary_cross_entropy_with_logits(nts, not_terminal)
+            * self.params.not_terminal_loss_weight
+        )
+        mse = F.mse_loss(rs, reward) * self.params.reward_loss_weight
+        if state_dim is not None:
+            loss = gmm / (state_dim + 2) + bce + mse
+        else:
+            loss = gmm + bce + mse
+        return {"gmm": gmm, "bce": bce, "mse": mse, "loss": loss}
+
+    def get_grouped_loss(
+        self,
+        training_batch: rlt.PreprocessedMemoryNetworkInput,
+        num_groups: int,
+        state_dim: Optional[int] = None,
+    ):
+        """
+        Same losses as `get_loss()`, for a batch made of `num_groups`
+        equal-sized groups of examples concatenated along the batch dimension.
+        Every loss is a (NUM_GROUPS,) tensor holding the loss of each group
+        as if it was passed to `get_loss()` on its own.
+        """
+        (
+            next_state,
+            not_terminal,
+            reward,
+            mus,
+            sigmas,
+            logpi,
+            nts,
+            rs,
+        ) = self._forward_for_loss(training_batch)
+        seq_len = reward.shape[0]
+
+        def group_mean(x):
+            return x.reshape(seq_len, num_groups, -1).mean(dim=(0, 2))
+
+        gmm = (
+            group_mean(gmm_loss(next_state, mus, sigmas, logpi, reduce=False))
+            * self.params.next_state_loss_weight
+        )
+        bce = (
+            group_mean(
+                F.binary_cross_entropy_with_logits(nts, not_terminal, reduction="none")
+            )
+            * self.params.not_terminal_loss_weight
+        )
+        mse = (
+            group_mean(F.mse_loss(rs, reward, reduction="none"))
+            * self.params.reward_loss_weight
+        )
+        if state_dim is not None:
+            loss = gmm / (state_dim + 2) + bce + mse
+        else:
+            loss = gmm + bce + mse
+        return {"gmm": gmm, "bce": bce, "mse": mse, "loss": loss}
+
+    def _forward_for_loss(self, training_batch: rlt.PreprocessedMemoryNetworkInput):
+        """
+        Runs the memory network; returns the targets and the predictions the
+        losses are computed on
+        """
         assert isinstance(training_batch, rlt.PreprocessedMemoryNetworkInput)
         # mdnrnn's input should have seq_len as the first dimension
 
@@ -111,18 +202,4 @@ class MDNRNNTrainer:
                     (next_state, not_terminal, reward, mus, sigmas, logpi, nts, rs),
                 )
             )
-
-        gmm = (
-            gmm_loss(next_state, mus, sigmas, logpi)
-            * self.params.next_state_loss_weight
-        )
-        bce = (
-            F.binary_cross_entropy_with_logits(nts, not_terminal)
-            * self.params.not_terminal_loss_weight
-        )
-        mse = F.mse_loss(rs, reward) * self.params.reward_loss_weight
-        if state_dim is not None:
-            loss = gmm / (state_dim + 2) + bce + mse
-        else:
-            loss = gmm + bce + mse
-        return {"gmm": gmm, "bce": bce, "mse": mse, "loss": loss}
+        return next_state, not_terminal, reward, mus, sigmas, logpi, nts, rs
@@ -6,7 +6,18 @@ import logging
 
 # The dataclasses in this file should be vanilla dataclass to have minimal overhead
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Tuple, Union, cast
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
 
 import torch
 from reagent.core.dataclasses import dataclass as pydantic_dataclass
@@ -41,6 +52,93 @@ class BaseDataClass:
         return cast(type(self), dataclasses.replace(self, **kwargs))
 
 
+# Per-class names of the dataclass fields passed to __init__
+_INIT_FIELD_NAMES: Dict[type, Tuple[str, ...]] = {}
+
+
+def _init_field_names(cls) -> Tuple[str, ...]:
+    names = _INIT_FIELD_NAMES.get(cls)
+    if names is None:
+        names = tuple(f.name for f in dataclasses.fields(cls) if f.init)
+        _INIT_FIELD_NAMES[cls] = names
+    return names
+
+
+# Per-class functions generated by _tree_map_fn
+_TREE_MAP_FNS: Dict[type, Callable] = {}
+
+
+def _tree_map_fn(cls) -> Callable:
+    """
+    Generates, once per class, `tree_map` unrolled over the init fields (the
+    way `dataclasses` generates `__init__`), so mapping a batch doesn't loop
+    over `__dict__` or build a kwargs dict.
+    """
+    fn = _TREE_MAP_FNS.get(cls)
+    if fn is not None:
+        return fn
+    lines = [
+        "def tree_map(self, fn):",
+        "    d = self.__dict__",
+        "    out = new(cls)",
+        "    out_d = out.__dict__",
+    ]
+    for name in _init_field_names(cls):
+        lines += [
+            f"    v = d[{name!r}]",
+            "    if isinstance(v, Tensor):",
+            f"        out_d[{name!r}] = fn(v)",
+            "    elif isinstance(v, TensorDataClass):",
+            f"        out_d[{name!r}] = v.tree_map(fn)",
+            "    else:",
+            f"        out_d[{name!r}] = v",
+        ]
+    lines.append("    return out")
+    namespace = {
+        "new": cls.__new__,
+        "cls": cls,
+        "Tensor": torch.Tensor,
+        "TensorDataClass": TensorDataClass,
+    }
+    exec("\n".join(lines), namespace)
+    fn = _TREE_MAP_FNS[cls] = namespace["tree_map"]
+    return fn
+
+
+class TensorTreeConstant(NamedTuple):
+    """ A non-tensor field value in a TensorTreeSpec """
+
+    value: Any
+
+
+class TensorTreeSpec(NamedTuple):
+    """
+    Structure of a flattened TensorDataClass. `fields` holds, for every init
+    field, either `None` (a tensor leaf), a nested `TensorTreeSpec` or a
+    `TensorTreeConstant`.
+    """
+
+    cls: type
+    fields: Tuple[Any, ...]
+
+    def unflatten(self, leaves: List[torch.Tensor]) -> "TensorDataClass":
+        """ Rebuilds the object; skips __init__/__post_init__ like copy.copy """
+        return self._unflatten(iter(leaves))
+
+    def _unflatten(self, leaves: Iterator[torch.Tensor]) -> "TensorDataClass":
+        cls = self.cls
+        obj = cls.__new__(cls)
+        d = obj.__dict__
+        for name, field_spec in zip(_init_field_names(cls), self.fields):
+            if field_spec is None:
+                d[name] = next(leaves)
+            elif isinstance(field_spec, TensorTreeConstant):
+                d[name] = field_spec.value
+            else:
+                d[name] = field_spec._unflatten(leaves)
+        return obj
+
+
 @dataclass
 class TensorDataClass(BaseDataClass):
     def __getattr__(self, attr):
@@ -52,8 +150,11 @@ class TensorDataClass(BaseDataClass):
             raise AttributeError(f"torch.Tensor doesn't have {attr} method")
 
         def f(*args, **kwargs):
+            # Arbitrary methods can change shapes, so go through __init__ to
+            # run the __post_init__ checks
             values = {}
-            for k, v in self.__dict__.items():  # noqa F402
+            for k in _init_field_names(type(self)):  # noqa F402
+                v = self.__dict__[k]
                 if isinstance(v, (torch.Tensor, TensorDataClass)):
                     values[k] = getattr(v, attr)(*args, **kwargs)
                 else:
@@ -62,17 +163,52 @@ class TensorDataClass(BaseDataClass):
 
         return f
 
-    def cuda(self, *args, **kwargs):
-        cuda_tensor = {}
-        for k, v in self.__dict__.items():  # noqa F402
+    def tree_flatten(self) -> Tuple[List[torch.Tensor], TensorTreeSpec]:
+        """ Tensor leaves in depth-first field order and the structure """
+        leaves: List[torch.Tensor] = []
+        return leaves, self._tree_flatten(leaves)
+
+    def _tree_flatten(self, leaves: List[torch.Tensor]) -> TensorTreeSpec:
+        d = self.__dict__
+        fields = []
+        for name in _init_field_names(type(self)):
+            v = d[name]
             if isinstance(v, torch.Tensor):
-                kwargs["non_blocking"] = kwargs.get("non_blocking", True)
-                cuda_tensor[k] = v.cuda(*args, **kwargs)
+                leaves.append(v)
+                fields.append(None)
             elif isinstance(v, TensorDataClass):
-                cuda_tensor[k] = v.cuda(*args, **kwargs)
+                fields.append(v._tree_flatten(leaves))
             else:
-                cuda_tensor[k] = v
-        return type(self)(**cuda_tensor)
+                fields.append(TensorTreeConstant(v))
+        return TensorTreeSpec(type(self), tuple(fields))
+
+    def tree_map(self, fn: Callable[[torch.Tensor], torch.Tensor]):
+        """
+        Applies `fn` once to every tensor leaf and rebuilds the same structure
+        without re-running __init__. `fn` must preserve shapes.
+        """
+        return _tree_map_fn(type(self))(self, fn)
+
+    # Shape-preserving methods used on every training step bypass __getattr__
+
+    def to(self, *args, **kwargs):
+        return self.tree_map(lambda t: t.to(*args, **kwargs))
+
+    def detach(self):
+        return self.tree_map(torch.Tensor.detach)
+
+    def pin_memory(self):
+        return self.tree_map(torch.Tensor.pin_memory)
+
+    def cpu(self):
+        return self.tree_map(torch.Tensor.cpu)
+
+    def float(self):
+        return self.tree_map(torch.Tensor.float)
+
+    def cuda(self, *args, **kwargs):
+        kwargs["non_blocking"] = kwargs.get("non_blocking", True)
+        return self.tree_map(lambda t: t.cuda(*args, **kwargs))
 
 
 #####
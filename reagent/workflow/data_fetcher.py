@@ -4,15 +4,26 @@ from typing import List, Optional, Tuple
 
 # pyre-fixme[21]: Could not find `pyspark`.
 # pyre-fixme[21]: Could not find `pyspark`.
-from pyspark.sql.functions import col, crc32, explode, map_keys, udf
+from pyspark.sql.functions import (
+    array,
+    array_contains,
+    col,
+    crc32,
+    explode,
+    expr,
+    least,
+    lit,
+    map_keys,
+    size,
+    when,
+)
 from pyspark.sql.types import (
     ArrayType,
     BooleanType,
     FloatType,
     LongType,
     MapType,
-    StructField,
-    StructType,
+    StringType,
 )
 from reagent.workflow.spark_utils import get_spark_session, get_table_url
 from reagent.workflow.types import Dataset, TableSpec
@@ -90,89 +101,85 @@ def hash_mdp_id_and_subsample(df, sample_range: Optional[Tuple[float, float]] =
 def make_sparse2dense(df, col_name: str, possible_keys: List):
     """ Given a list of possible keys, convert sparse map to dense array.
         In our example, both value_type is assumed to be a float.
+        Uses the built-in `transform` higher-order function over the possible
+        keys, so rows are never serialized to Python workers.
     """
-    output_type = StructType(
-        [
-            StructField("presence", ArrayType(BooleanType()), False),
-            StructField("dense", ArrayType(FloatType()), False),
-        ]
+    keys_col_name = f"_tmp_{col_name}_possible_keys"
+    key_type = df.schema[col_name].dataType.keyType
+    df = df.withColumn(
+        keys_col_name,
+        array(*[lit(key) for key in possible_keys]).cast(ArrayType(key_type)),
     )
-
-    def sparse2dense(map_col):
-        assert isinstance(
-            map_col, dict
-        ), f"{map_col} has type {type(map_col)} and is not a dict."
-        presence = []
-        dense = []
-        for key in possible_keys:
-            val = map_col.get(key, None)
-            if val is not None:
-                presence.append(True)
-                dense.append(float(val))
-            else:
-                presence.append(False)
-                dense.append(0.0)
-        return presence, dense
-
-    sparse2dense_udf = udf(sparse2dense, output_type)
-    df = df.withColumn(col_name, sparse2dense_udf(col_name))
-    df = df.withColumn(f"{col_name}_presence", col(f"{col_name}.presence"))
-    df = df.withColumn(col_name, col(f"{col_name}.dense"))
-    return df
+    df = df.withColumn(
+        f"{col_name}_presence",
+        expr(f"transform({keys_col_name}, k -> `{col_name}`[k] IS NOT NULL)"),
+    )
+    df = df.withColumn(
+        col_name,
+        expr(
+            f"transform({keys_col_name}, "
+            f"k -> COALESCE(CAST(`{col_name}`[k] AS FLOAT), FLOAT(0)))"
+        ),
+    )
+    return df.drop(keys_col_name)
 
 
 #################################################
 # Below are some UDFs we use for preprocessing. #
 #################################################
+# They are built from Spark SQL expressions (rows never leave the JVM) and
+# return a function from column to Column, like a registered UDF would.
 
 
 def make_get_step_udf(multi_steps: Optional[int]):
     """ Get step count by taking length of next_states_features array. """
 
-    def get_step(col: List):
-        return 1 if multi_steps is None else min(len(col), multi_steps)
+    def get_step(col_name: str):
+        if multi_steps is None:
+            return lit(1).cast(LongType())
+        return least(size(col_name), lit(multi_steps)).cast(LongType())
 
-    return udf(get_step, LongType())
+    return get_step
 
 
 def make_next_udf(multi_steps: Optional[int], return_type):
-    """ Generic udf to get next (after multi_steps) item, provided item type. """
+    """ Generic expression to get next (after multi_steps) item, provided item type. """
 
-    def get_next(next_col):
-        return (
-            next_col
-            if multi_steps is None
-            else next_col[min(len(next_col), multi_steps) - 1]
-        )
+    def get_next(col_name: str):
+        if multi_steps is None:
+            return col(col_name).cast(return_type)
+        # element_at is 1-indexed
+        return expr(
+            f"element_at(`{col_name}`, LEAST(size(`{col_name}`), {multi_steps}))"
+        ).cast(return_type)
 
-    return udf(get_next, return_type)
+    return get_next
 
 
 def make_where_udf(arr: List[str]):
     """ Return index of item in arr, and len(arr) if not found. """
 
-    def find(item: str):
-        for i, arr_item in enumerate(arr):
-            if arr_item == item:
-                return i
-        return len(arr)
+    def find(item):
+        if isinstance(item, str):
+            item = col(item)
+        # the first matching branch wins, same as the first index in arr
+        index = lit(len(arr))
+        for i, arr_item in reversed(list(enumerate(arr))):
+            index = when(item == arr_item, i).otherwise(index)
+        return index.cast(LongType())
 
-    return udf(find, LongType())
+    return find
 
 
 def make_existence_bitvector_udf(arr: List[str]):
     """ one-hot encode elements of target depending on their existence in arr. """
 
-    default = [0] * len(arr)
-
-    def encode(target: List[str]):
-        bitvec = default.copy()
-        for i, arr_item in enumerate(arr):
-            if arr_item in target:
-                bitvec[i] = 1
-        return bitvec
+    def encode(target):
+        return array(
+            *[array_contains(target, arr_item).cast(LongType()) for arr_item in arr]
+        )
 
-    return udf(encode, ArrayType(LongType()))
+    return encode
 
 
 def misc_column_preprocessing(df, multi_steps: Optional[int]):
@@ -205,7 +212,8 @@ def state_and_metrics_sparse2dense(
     """
     next_map_udf = make_next_udf(multi_steps, MapType(LongType(), FloatType()))
     df = df.withColumn("next_state_features", next_map_udf("next_state_features"))
-    df = df.withColumn("metrics", next_map_udf("metrics"))
+    next_metrics_udf = make_next_udf(multi_steps, MapType(StringType(), FloatType()))
+    df = df.withColumn("metrics", next_metrics_udf("metrics"))
     df = make_sparse2dense(df, "state_features", states)
     df = make_sparse2dense(df, "next_state_features", states)
     df = make_sparse2dense(df, "metrics", metrics)
@@ -230,29 +238,21 @@ def discrete_action_preprocessing(
     # turn string actions into indices
     where_udf = make_where_udf(actions)
     df = df.withColumn("action", where_udf("action"))
-    next_long_udf = make_next_udf(multi_steps, LongType())
-    df = df.withColumn("next_action", where_udf(next_long_udf("next_action")))
-
-    def make_not_terminal_udf(actions: List[str]):
-        """ Return true iff next_action is terminal (i.e. idx = len(actions)). """
-
-        def get_not_terminal(next_action):
-            return next_action < len(actions)
+    next_str_udf = make_next_udf(multi_steps, StringType())
+    df = df.withColumn("next_action", where_udf(next_str_udf("next_action")))
 
-        return udf(get_not_terminal, BooleanType())
-
-    not_terminal_udf = make_not_terminal_udf(actions)
-    df = df.withColumn("not_terminal", not_terminal_udf("next_action"))
+    # not terminal iff next_action isn't terminal (i.e. idx = len(actions))
+    df = df.withColumn("not_terminal", col("next_action") < len(actions))
 
     # turn List[str] possible_actions into existence bitvectors
-    next_long_arr_udf = make_next_udf(multi_steps, ArrayType(LongType()))
+    next_str_arr_udf = make_next_udf(multi_steps, ArrayType(StringType()))
     existence_bitvector_udf = make_existence_bitvector_udf(actions)
     df = df.withColumn(
         "possible_actions_mask", existence_bitvector_udf("possible_actions")
     )
     df = df.withColumn(
         "possible_next_actions_mask",
-        existence_bitvector_udf(next_long_arr_udf("possible_next_actions")),
+        existence_bitvector_udf(next_str_arr_udf("possible_next_actions")),
     )
     return df
 
@@ -270,16 +270,8 @@ def parametric_action_preprocessing(
     next_map_udf = make_next_udf(multi_steps, MapType(LongType(), FloatType()))
     df = df.withColumn("next_action", next_map_udf("next_action"))
 
-    def make_not_terminal_udf():
-        """ Return true iff next_action is an empty map """
-
-        def get_not_terminal(next_action):
-            return len(next_action) > 0
-
-        return udf(get_not_terminal, BooleanType())
-
-    not_terminal_udf = make_not_terminal_udf()
-    df = df.withColumn("not_terminal", not_terminal_udf("next_action"))
+    # not terminal iff next_action isn't an empty map
+    df = df.withColumn("not_terminal", size("next_action") > 0)
 
     df = make_sparse2dense(df, "action", actions)
     df = make_sparse2dense(df, "next_action", actions)
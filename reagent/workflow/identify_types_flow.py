@@ -1,15 +1,29 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
 
+import ctypes
+from itertools import islice
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray
 from typing import Dict, List, Optional
 
+import numpy as np
+
 # pyre-fixme[21]: Could not find `pyspark`.
 # pyre-fixme[21]: Could not find `pyspark`.
 from pyspark.sql.functions import col, collect_list, explode
 from reagent.preprocessing.normalization import (
+    DEFAULT_NUM_SAMPLES,
     NormalizationParameters,
     get_feature_norm_metadata,
 )
+from reagent.preprocessing.sketch import (
+    DEFAULT_KLL_K,
+    FeatureSketch,
+    build_feature_sketches,
+    get_feature_norm_metadata_from_sketch,
+    merge_feature_sketches,
+)
 from reagent.workflow.spark_utils import get_spark_session
 from reagent.workflow.types import PreprocessingOptions, TableSpec
 
@@ -23,9 +37,16 @@ def normalization_helper(
     feature_overrides: Optional[Dict[int, str]] = None,
     whitelist_features: Optional[List[int]] = None,
     assert_whitelist_feature_coverage: bool = True,
+    num_samples: int = DEFAULT_NUM_SAMPLES,
+    num_workers: int = 1,
+    chunk_size: int = 16,
 ):
     """ Construct a preprocessing closure to obtain normalization parameters
-    from rows of feature_name and a sample of feature_values.
+    from rows of feature_name and either a sample of feature_values or a
+    feature_sketch (see `reagent.preprocessing.sketch`).
+
+    With num_workers > 1, features are fit in a process pool, chunk_size
+    features per task; results are identical to the serial path.
     """
 
     norm_params = {
@@ -35,6 +56,7 @@ def normalization_helper(
         "skip_box_cox": skip_box_cox,
         "skip_quantiles": skip_quantiles,
         "feature_overrides": feature_overrides,
+        "num_samples": num_samples,
     }
     # pyre-fixme[9]: whitelist_features has type `Optional[List[int]]`; used as
     #  `Set[int]`.
@@ -56,13 +78,20 @@ def normalization_helper(
         )
 
     def process(rows: List) -> Dict[int, NormalizationParameters]:
-        params = {}
         for row in rows:
             assert "feature_name" in row
-            assert "feature_values" in row
-            norm_metdata = get_feature_norm_metadata(
-                row["feature_name"], row["feature_values"], norm_params
+            assert "feature_sketch" in row or "feature_values" in row
+        if num_workers > 1:
+            norm_metadata_list = get_norm_metadata_parallel(
+                rows, norm_params, num_workers, chunk_size
             )
+        else:
+            norm_metadata_list = [
+                get_row_norm_metadata(row, norm_params) for row in rows
+            ]
+
+        params = {}
+        for row, norm_metdata in zip(rows, norm_metadata_list):
             if norm_metdata is not None and (
                 not whitelist_features or row["feature_name"] in whitelist_features
             ):
@@ -75,6 +104,79 @@ def normalization_helper(
     return process
 
 
+def get_row_norm_metadata(row, norm_params) -> Optional[NormalizationParameters]:
+    if "feature_sketch" in row:
+        return get_feature_norm_metadata_from_sketch(
+            row["feature_name"], row["feature_sketch"], norm_params
+        )
+    return get_feature_norm_metadata(
+        row["feature_name"], row["feature_values"], norm_params
+    )
+
+
+# Read-only state of each fitting worker, set by _init_fitting_worker()
+_worker_feature_values: Optional[np.ndarray] = None
+_worker_norm_params: Optional[Dict] = None
+
+
+def _init_fitting_worker(feature_values_buffer, norm_params) -> None:
+    global _worker_feature_values, _worker_norm_params
+    _worker_feature_values = np.frombuffer(feature_values_buffer, dtype=np.float32)
+    _worker_norm_params = norm_params
+
+
+def _fit_feature_chunk(chunk: List) -> List[Optional[NormalizationParameters]]:
+    """ chunk is a list of (feature_name, begin, end, feature_sketch) """
+    results = []
+    for feature_name, begin, end, feature_sketch in chunk:
+        if feature_sketch is not None:
+            row = {"feature_name": feature_name, "feature_sketch": feature_sketch}
+        else:
+            # pyre-fixme[16]: `Optional` has no attribute `__getitem__`.
+            feature_values = _worker_feature_values[begin:end]
+            row = {"feature_name": feature_name, "feature_values": feature_values}
+        results.append(get_row_norm_metadata(row, _worker_norm_params))
+    return results
+
+
+def get_norm_metadata_parallel(
+    rows: List, norm_params, num_workers: int, chunk_size: int
+) -> List[Optional[NormalizationParameters]]:
+    """
+    Fits every row in a process pool and returns the results in row order.
+    Feature samples are packed once into a shared float32 buffer that the
+    workers read without copying; tasks only carry offsets into it.
+    """
+    tasks = []
+    offset = 0
+    for row in rows:
+        if "feature_sketch" in row:
+            tasks.append((row["feature_name"], 0, 0, row["feature_sketch"]))
+        else:
+            num_values = len(row["feature_values"])
+            tasks.append((row["feature_name"], offset, offset + num_values, None))
+            offset += num_values
+
+    # RawArray can't be empty
+    feature_values_buffer = RawArray(ctypes.c_float, max(offset, 1))
+    feature_values = np.frombuffer(feature_values_buffer, dtype=np.float32)
+    for row, (_, begin, end, feature_sketch) in zip(rows, tasks):
+        if feature_sketch is None:
+            # Same float32 conversion as get_feature_norm_metadata
+            feature_values[begin:end] = np.array(
+                row["feature_values"], dtype=np.float32
+            )
+
+    chunks = [tasks[i : i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    with Pool(
+        num_workers,
+        initializer=_init_fitting_worker,
+        initargs=(feature_values_buffer, norm_params),
+    ) as pool:
+        chunk_results = pool.map(_fit_feature_chunk, chunks, chunksize=1)
+    return [result for chunk_result in chunk_results for result in chunk_result]
+
+
 def identify_normalization_parameters(
     table_spec: TableSpec,
     column_name: str,
@@ -84,10 +186,19 @@ def identify_normalization_parameters(
     """ Get normalization parameters """
     sqlCtx = get_spark_session()
     df = sqlCtx.sql(f"SELECT * FROM {table_spec.table_name}")
-    df = create_normalization_spec_spark(
-        df, column_name, preprocessing_options.num_samples, seed
-    )
-    rows = df.collect()
+    if preprocessing_options.use_sketches:
+        sketches = create_normalization_sketches_spark(
+            df, column_name, preprocessing_options.max_unique_enum_values, seed
+        )
+        rows = [
+            {"feature_name": name, "feature_sketch": sketch}
+            for name, sketch in sketches.items()
+        ]
+    else:
+        df = create_normalization_spec_spark(
+            df, column_name, preprocessing_options.num_samples, seed
+        )
+        rows = df.collect()
 
     normalization_processor = normalization_helper(
         max_unique_enum_values=preprocessing_options.max_unique_enum_values,
@@ -98,6 +209,8 @@ def identify_normalization_parameters(
         feature_overrides=preprocessing_options.feature_overrides,
         whitelist_features=preprocessing_options.whitelist_features,
         assert_whitelist_feature_coverage=preprocessing_options.assert_whitelist_feature_coverage,
+        num_samples=preprocessing_options.num_samples,
+        num_workers=preprocessing_options.num_workers,
     )
     return normalization_processor(rows)
 
@@ -126,3 +239,44 @@ def create_normalization_spec_spark(
         collect_list("feature_value").alias("feature_values")
     )
     return df
+
+
+def create_normalization_sketches_spark(
+    df,
+    column,
+    max_unique_enum_values: int,
+    seed: Optional[int] = None,
+    kll_k: int = DEFAULT_KLL_K,
+    chunk_size: int = 1000000,
+) -> Dict[int, FeatureSketch]:
+    """Returns one mergeable sketch per feature of the map column of df.
+
+    Sketches are built on the executors, one per partition, and merged with a
+    tree reduction; raw values are never collected to the driver.
+    """
+
+    # assumes column has a type of map
+    df = df.select(
+        explode(col(column).alias("features")).alias("feature_name", "feature_value")
+    )
+
+    def sketch_partition(rows):
+        sketches: Dict[int, FeatureSketch] = {}
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            names, values = zip(*chunk)
+            merge_feature_sketches(
+                sketches,
+                build_feature_sketches(
+                    np.array(names),
+                    np.array(values, dtype=np.float64),
+                    max_unique_values=max_unique_enum_values,
+                    kll_k=kll_k,
+                    seed=seed,
+                ),
+            )
+        yield sketches
+
+    return df.rdd.mapPartitions(sketch_partition).treeReduce(merge_feature_sketches)
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+Local (single node) counterpart of `data_fetcher.query_data`.
+
+Timeline-format Parquet files are read with `pyarrow.dataset` and every
+`data_fetcher` transform (reward calculation, mdp_id hashing and subsampling,
+next-step selection, sparse-to-dense, action encoding) runs as vectorized
+Arrow/NumPy compute on whole record batches. The resulting columns are
+streamed straight into `BatchPreprocessor` inputs, so neither a Spark session
+nor Petastorm is needed.
+"""
+
+import logging
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import torch
+from reagent.preprocessing.batch_preprocessor import BatchPreprocessor
+
+
+logger = logging.getLogger(__name__)
+
+# for normalizing crc32 output; same as `data_fetcher.MAX_UINT32`, which can't
+# be imported without pyspark
+MAX_UINT32 = 4294967295
+
+# number of rows per record batch read from Parquet
+DEFAULT_READ_BATCH_SIZE = 65536
+
+
+def _list_offsets(arr: pa.Array) -> np.ndarray:
+    """ Offsets (into the flattened child) of a list or map array """
+    return arr.offsets.to_numpy().astype(np.int64)
+
+
+def _row_ids(offsets: np.ndarray) -> np.ndarray:
+    """ Row index of every element of the flattened child """
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def calc_reward_multi_steps(reward: pa.Array, gamma: float) -> np.ndarray:
+    """ Computes r_0 + gamma * (r_1 + gamma * (r_2 + ... )) for every row """
+    offsets = _list_offsets(reward)
+    rows = _row_ids(offsets)
+    values = offsets[0] + np.arange(len(rows))
+    position = values - offsets[rows]
+    flat = reward.values.to_numpy(zero_copy_only=False)[values].astype(np.float64)
+    discounted = np.nan_to_num(flat) * np.power(gamma, position)
+    return np.bincount(rows, weights=discounted, minlength=len(reward)).astype(
+        np.float32
+    )
+
+
+def calc_custom_reward(table: pa.Table, custom_reward_expression: str) -> np.ndarray:
+    """
+    Evaluates `custom_reward_expression` over the scalar columns of `table`.
+    The expression uses pandas syntax (e.g., "reward ** 3 + 10") rather than
+    Spark SQL; nulls become 0 like the COALESCE in `data_fetcher`.
+    """
+    scalar_columns = [
+        field.name
+        for field in table.schema
+        if not pa.types.is_nested(field.type) and not pa.types.is_string(field.type)
+    ]
+    df = table.select(scalar_columns).to_pandas()
+    reward = pd.Series(df.eval(custom_reward_expression), index=df.index)
+    return reward.fillna(0).to_numpy(dtype=np.float32)
+
+
+def hash_mdp_id(mdp_id: pa.Array) -> np.ndarray:
+    """
+    crc32 of every mdp_id, identical to Spark's `crc32`. Each distinct mdp_id
+    is hashed once.
+    """
+    encoded = pc.dictionary_encode(mdp_id.cast(pa.string()))
+    hashes = np.array(
+        [zlib.crc32(s.encode("utf-8")) for s in encoded.dictionary.to_pylist()],
+        dtype=np.int64,
+    )
+    return hashes[encoded.indices.to_numpy(zero_copy_only=False)]
+
+
+def subsample_mask(
+    hashed_mdp_id: np.ndarray, sample_range: Optional[Tuple[float, float]]
+) -> Optional[np.ndarray]:
+    """ Rows to keep for `sample_range` (in percent), see `data_fetcher` """
+    if not sample_range:
+        return None
+    assert (
+        0.0 <= sample_range[0]
+        and sample_range[0] <= sample_range[1]
+        and sample_range[1] <= 100.0
+    ), f"{sample_range} is invalid."
+    lower_bound = sample_range[0] / 100.0 * MAX_UINT32
+    upper_bound = sample_range[1] / 100.0 * MAX_UINT32
+    return (lower_bound <= hashed_mdp_id) & (hashed_mdp_id <= upper_bound)
+
+
+def get_step(next_col: pa.Array, multi_steps: Optional[int]) -> np.ndarray:
+    """ Step count by taking length of next_state_features array. """
+    if multi_steps is None:
+        return np.ones(len(next_col), dtype=np.int64)
+    lengths = np.diff(_list_offsets(next_col))
+    return np.minimum(lengths, multi_steps)
+
+
+def take_next(next_col: pa.Array, multi_steps: Optional[int]) -> pa.Array:
+    """ Next (after multi_steps) item of every list in `next_col` """
+    if multi_steps is None:
+        return next_col
+    offsets = _list_offsets(next_col)
+    lengths = np.diff(offsets)
+    assert np.all(lengths > 0), "next columns must not be empty in multi-step mode"
+    indices = offsets[:-1] + np.minimum(lengths, multi_steps) - 1
+    return next_col.values.take(pa.array(indices))
+
+
+def sparse2dense(
+    map_col: pa.Array, possible_keys: List
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Dense (presence, value) representation of a map column over
+    `possible_keys`; keys outside `possible_keys` and null values are absent.
+    """
+    num_rows = len(map_col)
+    presence = np.zeros((num_rows, len(possible_keys)), dtype=np.bool_)
+    dense = np.zeros((num_rows, len(possible_keys)), dtype=np.float32)
+    if num_rows == 0 or len(possible_keys) == 0:
+        return presence, dense
+    offsets = _list_offsets(map_col)
+    rows = _row_ids(offsets)
+    entries = offsets[0] + np.arange(len(rows))
+    keys = map_col.keys.take(pa.array(entries))
+    items = map_col.items.take(pa.array(entries))
+    columns = pc.index_in(keys, value_set=pa.array(possible_keys, type=keys.type))
+    valid = np.logical_and(
+        columns.is_valid().to_numpy(zero_copy_only=False),
+        items.is_valid().to_numpy(zero_copy_only=False),
+    )
+    rows = rows[valid]
+    columns = columns.filter(pa.array(valid)).to_numpy(zero_copy_only=False)
+    presence[rows, columns] = True
+    dense[rows, columns] = (
+        items.filter(pa.array(valid)).to_numpy(zero_copy_only=False).astype(np.float32)
+    )
+    return presence, dense
+
+
+def where(col: pa.Array, arr: List[str]) -> np.ndarray:
+    """ Index of every item in arr, and len(arr) if not found. """
+    indices = pc.index_in(col, value_set=pa.array(arr, type=col.type))
+    return (
+        pc.fill_null(indices, len(arr)).to_numpy(zero_copy_only=False).astype(np.int64)
+    )
+
+
+def existence_bitvector(col: pa.Array, arr: List[str]) -> np.ndarray:
+    """ one-hot encode elements of arr depending on their existence in col. """
+    bitvec = np.zeros((len(col), len(arr)), dtype=np.int64)
+    offsets = _list_offsets(col)
+    rows = _row_ids(offsets)
+    entries = col.values.take(pa.array(offsets[0] + np.arange(len(rows))))
+    columns = pc.index_in(entries, value_set=pa.array(arr, type=entries.type))
+    valid = columns.is_valid().to_numpy(zero_copy_only=False)
+    bitvec[rows[valid], columns.filter(columns.is_valid()).to_numpy()] = 1
+    return bitvec
+
+
+def _distinct_map_keys(map_col: pa.Array, is_col_arr_map: bool) -> set:
+    if is_col_arr_map:
+        offsets = _list_offsets(map_col)
+        map_col = map_col.values.take(pa.array(np.arange(offsets[0], offsets[-1])))
+    offsets = _list_offsets(map_col)
+    keys = map_col.keys.take(pa.array(np.arange(offsets[0], offsets[-1])))
+    return set(pc.unique(keys).to_pylist())
+
+
+class LocalTimelineDataset:
+    """
+    Streams a timeline-format Parquet dataset through the `query_data`
+    transforms. Arguments have the same meaning as in `data_fetcher.query_data`;
+    `states`, `metrics` and parametric `actions` are inferred from the data
+    (one pass over the key columns) when not given.
+    """
+
+    def __init__(
+        self,
+        paths: List[str],
+        discrete_action: bool,
+        actions: Optional[List[str]] = None,
+        include_possible_actions: bool = True,
+        custom_reward_expression: Optional[str] = None,
+        sample_range: Optional[Tuple[float, float]] = None,
+        multi_steps: Optional[int] = None,
+        gamma: Optional[float] = None,
+        states: Optional[List[int]] = None,
+        metrics: Optional[List[str]] = None,
+        read_batch_size: int = DEFAULT_READ_BATCH_SIZE,
+    ):
+        if discrete_action:
+            assert include_possible_actions
+            assert actions is not None, "in discrete case, actions must be given."
+        elif include_possible_actions:
+            raise NotImplementedError(
+                "currently we don't support include_possible_actions"
+            )
+        if custom_reward_expression is None and multi_steps is not None:
+            assert gamma is not None
+        self.dataset = ds.dataset(paths, format="parquet")
+        self.discrete_action = discrete_action
+        self.include_possible_actions = include_possible_actions
+        self.custom_reward_expression = custom_reward_expression
+        self.sample_range = sample_range
+        self.multi_steps = multi_steps
+        self.gamma = gamma
+        self.read_batch_size = read_batch_size
+        self._num_rows: Optional[int] = None
+
+        # next_* and metrics columns are arrays of maps in multi-step mode
+        is_col_arr_map = multi_steps is not None
+        if states is None:
+            states = self._infer_keys(
+                {"state_features": False, "next_state_features": is_col_arr_map}
+            )
+        if metrics is None:
+            metrics = self._infer_keys({"metrics": is_col_arr_map})
+        if not discrete_action and actions is None:
+            actions = self._infer_keys({"action": False, "next_action": is_col_arr_map})
+        self.states = states
+        self.metrics = metrics
+        self.actions = actions
+
+    def _record_batches(self, columns: Optional[List[str]] = None):
+        for batch in self.dataset.to_batches(
+            columns=columns, batch_size=self.read_batch_size
+        ):
+            if batch.num_rows == 0:
+                continue
+            table = pa.Table.from_batches([batch])
+            mdp_id = hash_mdp_id(table.column("mdp_id").chunk(0))
+            mask = subsample_mask(mdp_id, self.sample_range)
+            if mask is not None:
+                table = table.filter(pa.array(mask))
+                mdp_id = mdp_id[mask]
+            if table.num_rows > 0:
+                yield table.combine_chunks(), mdp_id
+
+    def _infer_keys(self, columns: Dict[str, bool]) -> List:
+        """ Distinct keys of the map (or array of maps) columns """
+        keys: set = set()
+        for table, _ in self._record_batches(["mdp_id"] + list(columns)):
+            for column, is_col_arr_map in columns.items():
+                keys |= _distinct_map_keys(
+                    table.column(column).chunk(0), is_col_arr_map
+                )
+        return sorted(keys)
+
+    def __len__(self) -> int:
+        if self._num_rows is None:
+            if self.sample_range:
+                self._num_rows = sum(
+                    len(mdp_id) for _, mdp_id in self._record_batches(["mdp_id"])
+                )
+            else:
+                self._num_rows = self.dataset.count_rows()
+        return self._num_rows
+
+    def _transform(self, table: pa.Table, mdp_id: np.ndarray) -> Dict[str, np.ndarray]:
+        def column(name):
+            return table.column(name).chunk(0)
+
+        if self.custom_reward_expression is not None:
+            reward = calc_custom_reward(table, self.custom_reward_expression)
+        elif self.multi_steps is not None:
+            # pyre-fixme[6]: Expected `float` for 2nd param but got `Optional[float]`.
+            reward = calc_reward_multi_steps(column("reward"), self.gamma)
+        else:
+            reward = column("reward").to_numpy(zero_copy_only=False)
+
+        state_presence, state = sparse2dense(column("state_features"), self.states)
+        next_state_presence, next_state = sparse2dense(
+            take_next(column("next_state_features"), self.multi_steps), self.states
+        )
+        metrics_presence, metrics = sparse2dense(
+            take_next(column("metrics"), self.multi_steps), self.metrics
+        )
+        out = {
+            "reward": reward.astype(np.float32),
+            "state_features": state,
+            "state_features_presence": state_presence,
+            "next_state_features": next_state,
+            "next_state_features_presence": next_state_presence,
+            "action_probability": column("action_probability")
+            .to_numpy(zero_copy_only=False)
+            .astype(np.float32),
+            "mdp_id": mdp_id,
+            "sequence_number": column("sequence_number_ordinal")
+            .to_numpy(zero_copy_only=False)
+            .astype(np.int64),
+            "step": get_step(column("next_state_features"), self.multi_steps),
+            "time_diff": take_next(column("time_diff"), self.multi_steps)
+            .to_numpy(zero_copy_only=False)
+            .astype(np.int64),
+            "metrics": metrics,
+            "metrics_presence": metrics_presence,
+        }
+
+        actions = self.actions
+        assert actions is not None
+        next_action = take_next(column("next_action"), self.multi_steps)
+        if self.discrete_action:
+            out["action"] = where(column("action"), actions)
+            out["next_action"] = where(next_action, actions)
+            out["not_terminal"] = out["next_action"] < len(actions)
+            out["possible_actions_mask"] = existence_bitvector(
+                column("possible_actions"), actions
+            )
+            out["possible_next_actions_mask"] = existence_bitvector(
+                take_next(column("possible_next_actions"), self.multi_steps), actions
+            )
+        else:
+            out["not_terminal"] = np.diff(_list_offsets(next_action)) > 0
+            out["action_presence"], out["action"] = sparse2dense(
+                column("action"), actions
+            )
+            out["next_action_presence"], out["next_action"] = sparse2dense(
+                next_action, actions
+            )
+        return out
+
+    def __iter__(self) -> Iterator[Dict[str, np.ndarray]]:
+        """ Yields the transformed columns of every record batch """
+        for table, mdp_id in self._record_batches():
+            yield self._transform(table, mdp_id)
+
+    def batches(
+        self, batch_size: int, drop_last: bool = False
+    ) -> Iterator[Dict[str, torch.Tensor]]:
+        """
+        Re-chunks the record batches into `batch_size` rows and yields them
+        as the dict of tensors that `BatchPreprocessor`s consume.
+        """
+        pending: Optional[Dict[str, np.ndarray]] = None
+        for chunk in self:
+            if pending is not None:
+                chunk = {k: np.concatenate([pending[k], v]) for k, v in chunk.items()}
+            num_rows = len(chunk["reward"])
+            num_full = num_rows - num_rows % batch_size
+            for start in range(0, num_full, batch_size):
+                yield {
+                    k: torch.from_numpy(v[start : start + batch_size])
+                    for k, v in chunk.items()
+                }
+            pending = {k: v[num_full:] for k, v in chunk.items()}
+        if pending is not None and len(pending["reward"]) > 0 and not drop_last:
+            yield {k: torch.from_numpy(v) for k, v in pending.items()}
+
+
+class LocalDataLoader:
+    """
+    Drop-in replacement for the Petastorm `DataLoader` built by
+    `get_petastorm_dataloader`; yields preprocessed batches.
+    """
+
+    def __init__(
+        self,
+        dataset: LocalTimelineDataset,
+        batch_size: int,
+        batch_preprocessor: BatchPreprocessor,
+        use_gpu: bool,
+    ):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.batch_preprocessor = batch_preprocessor
+        self.use_gpu = use_gpu
+
+    def __iter__(self):
+        for batch in self.dataset.batches(self.batch_size):
+            preprocessed_batch = self.batch_preprocessor(batch)
+            if self.use_gpu:
+                preprocessed_batch = preprocessed_batch.cuda()
+            yield preprocessed_batch
+
+    def __len__(self) -> int:
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+
+def query_data_local(
+    paths: List[str],
+    discrete_action: bool,
+    actions: Optional[List[str]] = None,
+    include_possible_actions=True,
+    custom_reward_expression: Optional[str] = None,
+    sample_range: Optional[Tuple[float, float]] = None,
+    multi_steps: Optional[int] = None,
+    gamma: Optional[float] = None,
+) -> LocalTimelineDataset:
+    """ Local counterpart of `data_fetcher.query_data` """
+    return LocalTimelineDataset(
+        paths,
+        discrete_action=discrete_action,
+        actions=actions,
+        include_possible_actions=include_possible_actions,
+        custom_reward_expression=custom_reward_expression,
+        sample_range=sample_range,
+        multi_steps=multi_steps,
+        gamma=gamma,
+    )
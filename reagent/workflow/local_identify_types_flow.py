@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+
+"""
+Identify normalization parameters from local Parquet files, without a Spark
+session.
+
+Each file is summarized into per-feature sketches in a worker process; the
+sketches are then merged and turned into `NormalizationParameters` with the
+same options and whitelist handling as `identify_types_flow`.
+"""
+
+import logging
+from functools import partial, reduce
+from multiprocessing import Pool
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow.parquet as pq
+from reagent.preprocessing.normalization import NormalizationParameters
+from reagent.preprocessing.sketch import (
+    DEFAULT_KLL_K,
+    FeatureSketch,
+    build_feature_sketches,
+    merge_feature_sketches,
+)
+from reagent.workflow.identify_types_flow import normalization_helper
+from reagent.workflow.types import PreprocessingOptions
+
+
+logger = logging.getLogger(__name__)
+
+
+def sketch_parquet_file(
+    path: str,
+    column_name: str,
+    max_unique_enum_values: int,
+    seed: Optional[int] = None,
+    kll_k: int = DEFAULT_KLL_K,
+) -> Dict[int, FeatureSketch]:
+    """ Sketches every feature of a map column in one Parquet file """
+    sketches: Dict[int, FeatureSketch] = {}
+    parquet_file = pq.ParquetFile(path)
+    for row_group in range(parquet_file.num_row_groups):
+        column = parquet_file.read_row_group(row_group, columns=[column_name]).column(
+            column_name
+        )
+        for chunk in column.chunks:
+            names = chunk.keys.to_numpy(zero_copy_only=False)
+            values = chunk.items.to_numpy(zero_copy_only=False).astype(np.float64)
+            merge_feature_sketches(
+                sketches,
+                build_feature_sketches(
+                    names,
+                    values,
+                    max_unique_values=max_unique_enum_values,
+                    kll_k=kll_k,
+                    seed=seed,
+                ),
+            )
+    return sketches
+
+
+def create_normalization_sketches_parquet(
+    paths: List[str],
+    column_name: str,
+    max_unique_enum_values: int,
+    seed: Optional[int] = None,
+    num_workers: Optional[int] = None,
+    kll_k: int = DEFAULT_KLL_K,
+) -> Dict[int, FeatureSketch]:
+    """ Sketches Parquet files in parallel (one file per task) and merges them """
+    sketch_fn = partial(
+        sketch_parquet_file,
+        column_name=column_name,
+        max_unique_enum_values=max_unique_enum_values,
+        seed=seed,
+        kll_k=kll_k,
+    )
+    if num_workers == 0:
+        per_file_sketches = [sketch_fn(path) for path in paths]
+    else:
+        with Pool(num_workers) as pool:
+            per_file_sketches = pool.map(sketch_fn, paths)
+    return reduce(merge_feature_sketches, per_file_sketches, {})
+
+
+def identify_normalization_parameters_from_parquet(
+    paths: List[str],
+    column_name: str,
+    preprocessing_options: PreprocessingOptions,
+    seed: Optional[int] = None,
+    num_workers: Optional[int] = None,
+) -> Dict[int, NormalizationParameters]:
+    """ Get normalization parameters from local Parquet files """
+    sketches = create_normalization_sketches_parquet(
+        paths,
+        column_name,
+        preprocessing_options.max_unique_enum_values,
+        seed=seed,
+        num_workers=num_workers,
+    )
+    normalization_processor = normalization_helper(
+        max_unique_enum_values=preprocessing_options.max_unique_enum_values,
+        quantile_size=preprocessing_options.quantile_size,
+        quantile_k2_threshold=preprocessing_options.quantile_k2_threshold,
+        skip_box_cox=preprocessing_options.skip_box_cox,
+        skip_quantiles=preprocessing_options.skip_quantiles,
+        feature_overrides=preprocessing_options.feature_overrides,
+        whitelist_features=preprocessing_options.whitelist_features,
+        assert_whitelist_feature_coverage=preprocessing_options.assert_whitelist_feature_coverage,
+        num_samples=preprocessing_options.num_samples,
+        num_workers=preprocessing_options.num_workers,
+    )
+    return normalization_processor(
+        [
+            {"feature_name": name, "feature_sketch": sketch}
+            for name, sketch in sketches.items()
+        ]
+    )
@@ -3,6 +3,7 @@
 import logging
 from typing import Dict, List, Optional, Tuple
 
+import torch
 from reagent import types as rlt
 from reagent.core.dataclasses import dataclass, field
 from reagent.evaluation.evaluator import Evaluator, get_metrics_to_score
@@ -22,6 +23,7 @@ from reagent.preprocessing.batch_preprocessor import (
     DiscreteDqnBatchPreprocessor,
     InputColumn,
 )
+from reagent.preprocessing.fast_preprocessor import FastPreprocessor
 from reagent.preprocessing.preprocessor import Preprocessor
 from reagent.workflow.data_fetcher import query_data
 from reagent.workflow.identify_types_flow import identify_normalization_parameters
@@ -58,6 +60,8 @@ class DiscreteDQNBase(ModelManager):
     )
     preprocessing_options: Optional[PreprocessingOptions] = None
     reader_options: Optional[ReaderOptions] = None
+    # Preprocess training batches with FastPreprocessor instead of Preprocessor
+    use_fast_preprocessor: bool = False
 
     def __post_init_post_parse__(self):
         super().__init__()
@@ -162,13 +166,20 @@ class DiscreteDQNBase(ModelManager):
         return self.rl_parameters.multi_steps
 
     def build_batch_preprocessor(self) -> BatchPreprocessor:
+        if self.use_fast_preprocessor:
+            state_preprocessor = FastPreprocessor(
+                normalization_parameters=self.state_normalization_parameters,
+                device=torch.device("cuda" if self.use_gpu else "cpu"),
+            )
+        else:
+            state_preprocessor = Preprocessor(
+                normalization_parameters=self.state_normalization_parameters,
+                use_gpu=self.use_gpu,
+            )
         return DiscreteDqnBatchPreprocessor(
             # pyre-fixme[16]: `DiscreteDQNBase` has no attribute `action_names`.
             num_actions=len(self.action_names),
-            state_preprocessor=Preprocessor(
-                normalization_parameters=self.state_normalization_parameters,
-                use_gpu=self.use_gpu,
-            ),
+            state_preprocessor=state_preprocessor,
             use_gpu=self.use_gpu,
         )
 
@@ -59,6 +59,11 @@ class PreprocessingOptions(BaseDataClass):
     set_missing_value_to_zero: Optional[bool] = False
     whitelist_features: Optional[List[int]] = None
     assert_whitelist_feature_coverage: bool = True
+    # Identify parameters from mergeable per-feature sketches instead of
+    # collecting num_samples raw values per feature to the driver
+    use_sketches: bool = False
+    # Number of processes fitting per-feature parameters; 1 fits serially
+    num_workers: int = 1
 
 
 @PublishingResult.fill_union()